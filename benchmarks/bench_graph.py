@@ -0,0 +1,218 @@
+from __future__ import annotations
+# End-to-end graph benchmark on synthetic buggy repos with a stubbed LLM.
+#
+#   python benchmarks/bench_graph.py [--files 10,1000,20000] [--suites small,large] [--tickets 3]
+#                                    [--wrong-fixes 0] [--llm-latency 0] [--async]
+#                                    [--json out.json] [--compare baseline.json --tolerance 0.25]
+#
+# For every (repo size, test suite) pair a template repo with one seeded bug is generated
+# (synthetic_repo.py); a fresh worker process then runs --tickets tickets through the full
+# graph, each on its own copy, with StubLLM replaying the file selection and the fix. Reported:
+# per-node latency (from the node.<name>.wall_sec metrics), iterations, peak RSS and tickets/hour.
+# --compare exits 1 when a scenario's mean ticket time regressed by more than --tolerance.
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+from synthetic_repo import Scenario, build_repo
+
+SUITES = {"small": 20, "large": 2000}
+
+
+def _peak_rss_mb():
+    # (this process, largest child) in MB; resource is POSIX-only
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    scale = 1 / 1024 if sys.platform != "darwin" else 1 / (1024 * 1024)  # KB on Linux, bytes on macOS
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+def _node_times(metrics):
+    out = {}
+    for key, value in metrics.items():
+        parts = key.split(".")
+        if len(parts) == 3 and parts[0] == "node" and parts[2] == "wall_sec":
+            out[parts[1]] = value
+    return out
+
+
+def run_tickets(template: str, tickets: int, use_async: bool, latency: float, timeout: int):
+    # Worker side: imports the package here so the parent's memory does not count
+    from stub_llm import StubLLM
+    from se_assistant.checkpoint import ainvoke_ticket, async_sqlite_checkpointer, invoke_ticket
+    from se_assistant.graph import build_graph
+    from se_assistant.state import TicketState
+    from se_assistant.trace import configure_logging
+
+    configure_logging()  # stderr; the parent reads the JSON result from stdout
+    scenario = Scenario.load(os.path.join(template, "scenario.json"))
+    work = os.path.join(template, "..", "work")
+    results = []
+    for t in range(tickets):
+        repo = os.path.join(work, f"ticket_{t}")
+        shutil.rmtree(repo, ignore_errors=True)
+        shutil.copytree(scenario.repo, repo, symlinks=True)
+        stub = StubLLM.for_scenario(scenario, latency)
+        stub.install()
+        state = TicketState(run_id=f"bench-{uuid.uuid4().hex[:8]}", repo_ref=repo,
+                            task_prompt="Fix failing pytest tests.", llm_cache=False, fix_kb=False, timeout_sec=timeout)
+
+        t0 = time.perf_counter()
+        if use_async:
+            async def main():
+                async with async_sqlite_checkpointer() as cp:
+                    return await ainvoke_ticket(build_graph(async_nodes=True, checkpointer=cp), state)
+            final = asyncio.run(main())
+        else:
+            final = invoke_ticket(build_graph(), state)
+        wall = time.perf_counter() - t0
+
+        results.append({
+            "wall_sec": wall,
+            "status": final.get("final_status"),
+            "iterations": final["iteration"].count,
+            "llm_calls": dict(stub.calls),
+            "nodes": _node_times(final.get("metrics", {})),
+        })
+        shutil.rmtree(repo, ignore_errors=True)
+    rss_self, rss_child = _peak_rss_mb()
+    return {"tickets": results, "peak_rss_mb": rss_self, "peak_child_rss_mb": rss_child}
+
+
+def _summary(files: int, suite: str, n_tests: int, setup_sec: float, worker: dict) -> dict:
+    runs = worker["tickets"]
+    walls = [r["wall_sec"] for r in runs]
+    nodes = sorted({n for r in runs for n in r["nodes"]})
+    return {
+        "scenario": f"{files}/{suite}",
+        "files": files, "tests": n_tests, "setup_sec": setup_sec,
+        "tickets": len(runs),
+        "success": sum(r["status"] == "success" for r in runs),
+        "ticket_sec_mean": statistics.mean(walls),
+        "ticket_sec_p50": statistics.median(walls),
+        "tickets_per_hour": 3600 * len(walls) / sum(walls),
+        "iterations_mean": statistics.mean(r["iterations"] for r in runs),
+        "peak_rss_mb": worker["peak_rss_mb"],
+        "peak_child_rss_mb": worker["peak_child_rss_mb"],
+        "node_sec_mean": {n: statistics.mean(r["nodes"].get(n, 0.0) for r in runs) for n in nodes},
+    }
+
+def _mb(v):
+    return f"{v:.0f}" if v is not None else "-"
+
+def print_report(rows: list) -> None:
+    print(f"{'scenario':<14} {'tests':>6} {'ok':>5} {'iters':>5} {'ticket s':>9} {'p50 s':>7} "
+          f"{'tickets/h':>10} {'RSS MB':>7} {'child MB':>8} {'setup s':>8}")
+    for r in rows:
+        print(f"{r['scenario']:<14} {r['tests']:>6} {r['success']:>2}/{r['tickets']:<2} {r['iterations_mean']:>5.1f} "
+              f"{r['ticket_sec_mean']:>9.2f} {r['ticket_sec_p50']:>7.2f} {r['tickets_per_hour']:>10.0f} "
+              f"{_mb(r['peak_rss_mb']):>7} {_mb(r['peak_child_rss_mb']):>8} {r['setup_sec']:>8.1f}")
+
+    nodes = sorted({n for r in rows for n in r["node_sec_mean"]},
+                   key=lambda n: -max(r["node_sec_mean"].get(n, 0.0) for r in rows))
+    print("\nmean seconds per ticket, by node")
+    print(f"{'node':<14}" + "".join(f" {r['scenario']:>14}" for r in rows))
+    for n in nodes:
+        print(f"{n:<14}" + "".join(f" {r['node_sec_mean'].get(n, 0.0):>14.3f}" for r in rows))
+
+def compare(rows: list, baseline_path: str, tolerance: float) -> int:
+    with open(baseline_path, "r", encoding="utf-8") as fp:
+        baseline = {r["scenario"]: r for r in json.load(fp)["results"]}
+    failed = 0
+    print(f"\nvs. {baseline_path} (tolerance {tolerance:.0%})")
+    for r in rows:
+        base = baseline.get(r["scenario"])
+        if base is None:
+            continue
+        ratio = r["ticket_sec_mean"] / max(base["ticket_sec_mean"], 1e-9)
+        regressed = ratio > 1 + tolerance or r["success"] < base["success"]
+        failed += regressed
+        print(f"{r['scenario']:<14} {base['ticket_sec_mean']:>8.2f}s -> {r['ticket_sec_mean']:>8.2f}s "
+              f"({ratio:.2f}x){'  REGRESSION' if regressed else ''}")
+    return 1 if failed else 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--files", default="10,1000,20000", help="comma-separated source file counts")
+    ap.add_argument("--suites", default="small,large", help=f"test suite sizes: {SUITES}")
+    ap.add_argument("--tickets", type=int, default=3, help="tickets per scenario")
+    ap.add_argument("--wrong-fixes", type=int, default=0, help="wrong patches the stub tries before the fix")
+    ap.add_argument("--llm-latency", type=float, default=0.0, help="seconds each stub LLM call sleeps")
+    ap.add_argument("--timeout", type=int, default=300, help="TicketState.timeout_sec")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--async", dest="use_async", action="store_true", help="run the async graph")
+    ap.add_argument("--no-git", action="store_true", help="plain directories instead of git repos")
+    ap.add_argument("--json", help="write the results here")
+    ap.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--keep", action="store_true", help="keep the generated repos")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        out = run_tickets(args.worker, args.tickets, args.use_async, args.llm_latency, args.timeout)
+        print(json.dumps(out))
+        return 0
+
+    root = tempfile.mkdtemp(prefix="se_bench_graph_")
+    rows = []
+    try:
+        for files in [int(f) for f in args.files.split(",")]:
+            for suite in args.suites.split(","):
+                base = os.path.join(root, f"{files}_{suite}")
+                template = os.path.join(base, "template")
+                t0 = time.perf_counter()
+                scenario = build_repo(os.path.join(template, "repo"), files, SUITES[suite], seed=args.seed,
+                                      wrong_fixes=args.wrong_fixes, git=not args.no_git)
+                scenario.save(os.path.join(template, "scenario.json"))
+                setup = time.perf_counter() - t0
+                print(f"{files}/{suite}: {files} files, {scenario.n_tests} tests, bug in {scenario.bug_path} "
+                      f"({scenario.bug_tests} failing), setup {setup:.1f}s", file=sys.stderr)
+
+                # own cache dir (checkpoints, artifacts, response cache) and own process (peak RSS)
+                env = {**os.environ, "SE_ASSISTANT_CACHE_DIR": os.path.join(base, "cache"),
+                       "SE_ASSISTANT_LOG_LEVEL": os.environ.get("SE_ASSISTANT_LOG_LEVEL", "WARNING"),
+                       "SE_ASSISTANT_TRACE": os.environ.get("SE_ASSISTANT_TRACE", "0")}
+                cmd = [sys.executable, os.path.abspath(__file__), "--worker", template,
+                       "--tickets", str(args.tickets), "--llm-latency", str(args.llm_latency),
+                       "--timeout", str(args.timeout)] + (["--async"] if args.use_async else [])
+                proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, text=True)
+                if proc.returncode != 0:
+                    print(f"{files}/{suite}: worker failed (exit {proc.returncode})", file=sys.stderr)
+                    continue
+                worker = json.loads(proc.stdout.strip().splitlines()[-1])
+                rows.append(_summary(files, suite, scenario.n_tests, setup, worker))
+                if not args.keep:
+                    shutil.rmtree(base, ignore_errors=True)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+        else:
+            print(f"repos kept in {root}", file=sys.stderr)
+
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fp:
+            json.dump({"args": vars(args), "results": rows}, fp, indent=2)
+    if args.compare:
+        return compare(rows, args.compare, args.tolerance)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
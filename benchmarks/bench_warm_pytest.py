@@ -0,0 +1,102 @@
+from __future__ import annotations
+# Cold vs. warm pytest latency per repair iteration.
+#
+#   python benchmarks/bench_warm_pytest.py [--iterations 5] [--import-cost 1.0]
+#
+# Builds a throwaway sandbox whose source imports a slow third-party package (outside the
+# repo, so the warm worker keeps it loaded), then for each iteration "patches" the source
+# file and times a cold `python -m pytest -q` against a request to the warm worker.
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from se_assistant.tools import run_cmd
+from se_assistant.warm_runner import run_warm, shutdown_workers
+
+HEAVY_DEP = '''import time
+import json, decimal, email.parser, http.client, xml.dom.minidom, asyncio, sqlite3
+time.sleep({cost})
+def scale(x):
+    return x
+'''
+
+SOURCE = '''from heavydep import scale
+
+def apply_discount(price, pct):
+    # iteration {it}
+    return scale(round(price * (1 - pct), 2))
+'''
+
+TEST = '''from sandbox.pricing import apply_discount
+
+def test_apply_discount_{i}():
+    assert apply_discount(10.0, 0.1) == 9.0
+'''
+
+
+def build_sandbox(root: str, import_cost: float, n_tests: int) -> str:
+    repo = os.path.join(root, "repo")
+    deps = os.path.join(root, "site")
+    os.makedirs(os.path.join(repo, "src", "sandbox"))
+    os.makedirs(os.path.join(repo, "tests"))
+    os.makedirs(os.path.join(deps, "heavydep"))
+    with open(os.path.join(deps, "heavydep", "__init__.py"), "w") as fp:
+        fp.write(HEAVY_DEP.format(cost=import_cost))
+    with open(os.path.join(repo, "pyproject.toml"), "w") as fp:
+        fp.write('[tool.pytest.ini_options]\npythonpath = ["src"]\n')
+    open(os.path.join(repo, "src", "sandbox", "__init__.py"), "w").close()
+    for i in range(n_tests):
+        with open(os.path.join(repo, "tests", f"test_pricing_{i}.py"), "w") as fp:
+            fp.write(TEST.format(i=i))
+    os.environ["PYTHONPATH"] = deps + os.pathsep + os.environ.get("PYTHONPATH", "")
+    return repo
+
+def patch_source(repo: str, it: int) -> None:
+    path = os.path.join(repo, "src", "sandbox", "pricing.py")
+    with open(path, "w") as fp:
+        fp.write(SOURCE.format(it=it))
+    # make sure the mtime moves even on coarse-grained filesystems
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + it))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iterations", type=int, default=5)
+    ap.add_argument("--import-cost", type=float, default=1.0, help="seconds the fake third-party import takes")
+    ap.add_argument("--tests", type=int, default=20)
+    args = ap.parse_args()
+
+    root = tempfile.mkdtemp(prefix="se_bench_warm_")
+    try:
+        repo = build_sandbox(root, args.import_cost, args.tests)
+        py = sys.executable
+        changed = ["src/sandbox/pricing.py"]
+        cold, warm = [], []
+        print(f"{'iter':>4}  {'cold_s':>8}  {'warm_s':>8}  warm_reused  exit(cold/warm)")
+        for it in range(args.iterations):
+            patch_source(repo, it)
+            c = run_cmd(repo, f'"{py}" -m pytest -q -p no:cacheprovider', timeout_sec=300)
+            w = run_warm(py, repo, ["-q", "-p", "no:cacheprovider"], changed=changed, timeout_sec=300)
+            cold.append(c["duration_sec"])
+            warm.append(w["duration_sec"])
+            print(f"{it:>4}  {c['duration_sec']:>8.3f}  {w['duration_sec']:>8.3f}  {str(w.get('warm')):>11}  {c['exit_code']}/{w['exit_code']}")
+        # iteration 0 pays the worker start-up; steady state is what a repair loop sees
+        steady = warm[1:] or warm
+        print()
+        print(f"cold mean: {statistics.mean(cold):.3f}s")
+        print(f"warm mean (excluding first start-up): {statistics.mean(steady):.3f}s")
+        print(f"speed-up: {statistics.mean(cold) / max(statistics.mean(steady), 1e-9):.1f}x")
+    finally:
+        shutdown_workers()
+        shutil.rmtree(root, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+from __future__ import annotations
+# Deterministic stand-in for the Ollama chat model: replays canned JSON answers per node so a
+# benchmark measures the graph (repo scan, pytest, patch transactions, checkpoints), not the model.
+#
+#   stub = StubLLM.for_scenario(scenario, latency=0.0)
+#   stub.install()   # se_assistant.llm.chat_model now returns stub clients
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, List
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+# first system-prompt line that identifies the calling node
+FILE_SELECT_MARKER = "select the smallest set of files"
+
+
+class StubLLM:
+    def __init__(self, script: Dict[str, List[str]], latency: float = 0.0):
+        # script: node ("file_select" / "patch") -> answers in call order; the last one repeats
+        self.script = script
+        self.latency = latency
+        self.calls: Dict[str, int] = {node: 0 for node in script}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_scenario(cls, scenario: Any, latency: float = 0.0) -> "StubLLM":
+        select = json.dumps({"files": [scenario.bug_path], "confidence": 0.9,
+                             "rationale": "traceback points at the failing module"})
+        patches = [json.dumps({"edits": [{"path": scenario.bug_path, "start_line": 2,
+                                          "search": search, "replace": replace}]})
+                   for search, replace in scenario.fixes]
+        return cls({"file_select": [select], "patch": patches}, latency)
+
+    def answer(self, messages: List[Any]) -> str:
+        system = next((m.content for m in messages if getattr(m, "type", "") == "system"), "")
+        node = "file_select" if FILE_SELECT_MARKER in system else "patch"
+        with self._lock:
+            n = self.calls[node]
+            self.calls[node] = n + 1
+        answers = self.script[node]
+        return answers[min(n, len(answers) - 1)]
+
+    def install(self) -> None:
+        import se_assistant.llm as llm
+        llm.chat_model = lambda temperature=0.0, model="stub", backend=None, format=None: StubChatModel(self, temperature, model, format)
+
+
+class StubChatModel:
+    # The parts of ChatOllama that CachedLLM touches: invoke/ainvoke, stream/astream (structured
+    # output) and the cache-key params
+    def __init__(self, stub: StubLLM, temperature: float = 0.0, model: str = "stub", format: Any = None):
+        self.stub = stub
+        self.model = model
+        self.temperature = temperature
+        self.format = format
+
+    def invoke(self, messages: List[Any], *args: Any, **kwargs: Any) -> AIMessage:
+        if self.stub.latency:
+            time.sleep(self.stub.latency)
+        return AIMessage(content=self.stub.answer(messages))
+
+    async def ainvoke(self, messages: List[Any], *args: Any, **kwargs: Any) -> AIMessage:
+        if self.stub.latency:
+            await asyncio.sleep(self.stub.latency)
+        return AIMessage(content=self.stub.answer(messages))
+
+    def stream(self, messages: List[Any], *args: Any, **kwargs: Any):
+        yield AIMessageChunk(content=self.invoke(messages).content)
+
+    async def astream(self, messages: List[Any], *args: Any, **kwargs: Any):
+        yield AIMessageChunk(content=(await self.ainvoke(messages)).content)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+# Synthetic sandbox repos with one seeded bug, for the graph benchmark.
+#
+#   repo/
+#     pyproject.toml                      pytest pythonpath = ["src"]
+#     .venv/Scripts/python.exe            -> the benchmark's interpreter (what sandbox_python expects)
+#     src/sandbox/pkg_NNN/mod_NNNNN.py    n_files modules, 100 per package (patch_agent only edits src/sandbox/)
+#     tests/test_part_NNN.py              n_tests tests, 50 per file, spread over the modules
+#
+# Every module has value_<i>(x) == x + k; in the bug module it returns x - k instead, so the
+# tests of that module fail. The fixes the stub LLM replays are part of the returned Scenario.
+from dataclasses import asdict, dataclass, field
+from typing import List
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import venv
+
+MODULES_PER_PKG = 100
+TESTS_PER_FILE = 50
+
+MODULE = '''def value_{i}(x):
+    return x {op} {k}
+
+
+def label_{i}(x):
+    return "m{i}:" + str(x)
+'''
+
+TEST_HEADER = "{imports}\n\n"
+
+TEST = '''def test_value_{i}_{t}():
+    assert value_{i}({t}) == {t} + {k}
+
+'''
+
+
+@dataclass
+class Scenario:
+    repo: str
+    n_files: int
+    n_tests: int
+    bug_path: str
+    bug_tests: int
+    # (search, replace) per patch the stub LLM returns, in order; the last one is the real fix
+    fixes: List[List[str]] = field(default_factory=list)
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(asdict(self), fp, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "Scenario":
+        with open(path, "r", encoding="utf-8") as fp:
+            return cls(**json.load(fp))
+
+
+def _k(i: int) -> int:
+    return i % 7 + 1
+
+def _module_path(i: int) -> str:
+    return f"src/sandbox/pkg_{i // MODULES_PER_PKG:03d}/mod_{i:05d}.py"
+
+def _module_name(i: int) -> str:
+    return f"sandbox.pkg_{i // MODULES_PER_PKG:03d}.mod_{i:05d}"
+
+def _write(repo: str, rel_path: str, content: str) -> None:
+    path = os.path.join(repo, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write(content)
+
+def _link_interpreter(repo: str) -> None:
+    # test_agent runs <repo>/.venv/Scripts/python.exe; point it at this interpreter (pytest included)
+    if os.name == "nt":
+        venv.create(os.path.join(repo, ".venv"), system_site_packages=True)
+        return
+    target = os.path.join(repo, ".venv", "Scripts", "python.exe")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.symlink(sys.executable, target)
+
+def _git_init(repo: str) -> None:
+    if shutil.which("git") is None:
+        return
+    env = {**os.environ, "GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@example.com",
+           "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@example.com"}
+    for cmd in (["git", "init", "-q"], ["git", "add", "-A"], ["git", "commit", "-q", "-m", "synthetic repo"]):
+        subprocess.run(cmd, cwd=repo, env=env, check=True, capture_output=True)
+
+
+def build_repo(repo: str, n_files: int, n_tests: int, seed: int = 0,
+               wrong_fixes: int = 0, git: bool = True) -> Scenario:
+    rng = random.Random(seed)
+    n_files = max(n_files, 1)
+    n_tests = max(n_tests, 1)
+    # test t exercises module targets[t]; the bug goes into one of the tested modules
+    targets = [t * n_files // n_tests for t in range(n_tests)]
+    bug = rng.choice(targets)
+
+    _write(repo, "pyproject.toml", '[tool.pytest.ini_options]\npythonpath = ["src"]\n')
+    _write(repo, ".gitignore", ".venv/\n.pytest_cache/\n__pycache__/\n")
+    _write(repo, "src/sandbox/__init__.py", "")
+    for p in range((n_files - 1) // MODULES_PER_PKG + 1):
+        _write(repo, f"src/sandbox/pkg_{p:03d}/__init__.py", "")
+    for i in range(n_files):
+        _write(repo, _module_path(i), MODULE.format(i=i, k=_k(i), op="-" if i == bug else "+"))
+
+    for start in range(0, n_tests, TESTS_PER_FILE):
+        chunk = range(start, min(start + TESTS_PER_FILE, n_tests))
+        mods = sorted({targets[t] for t in chunk})
+        imports = "\n".join(f"from {_module_name(i)} import value_{i}" for i in mods)
+        body = "".join(TEST.format(i=targets[t], t=t, k=_k(targets[t])) for t in chunk)
+        _write(repo, f"tests/test_part_{start // TESTS_PER_FILE:03d}.py", TEST_HEADER.format(imports=imports) + body)
+
+    _link_interpreter(repo)
+    if git:
+        _git_init(repo)
+
+    # wrong fixes keep the same tests red (x + k + 1, x + k + 2, ...) and force extra iterations
+    k = _k(bug)
+    lines = [f"    return x - {k}"] + [f"    return x + {k + w + 1}" for w in range(wrong_fixes)] + [f"    return x + {k}"]
+    return Scenario(repo=repo, n_files=n_files, n_tests=n_tests, bug_path=_module_path(bug),
+                    bug_tests=targets.count(bug), fixes=[[a, b] for a, b in zip(lines, lines[1:])])
@@ -1,8 +1,11 @@
 from __future__ import annotations
+import asyncio
+import sys
 import uuid
 from se_assistant.graph import build_graph
 from se_assistant.state import TicketState
-from pprint import pprint
+from se_assistant.trace import configure_logging
+from se_assistant.checkpoint import thread_config, continue_after_review, acontinue_after_review, async_sqlite_checkpointer
 
 def safe_get(obj, name, default=None):
     # Works for dicts and objects
@@ -10,14 +13,54 @@ def safe_get(obj, name, default=None):
         return obj.get(name, default)
     return getattr(obj, name, default)
 
+def print_step(state_snapshot):
+    print("---- step ----")
+
+    hitl = safe_get(state_snapshot, "hitl", None)
+    if hitl is not None:
+        print("hitl_required:", safe_get(hitl, "required", False))
+        reason = safe_get(hitl, "reason", None)
+        if reason:
+            print("hitl_reason:", reason)
+    else:
+        print("hitl_required:", False)
+
+    print("selected_files:", safe_get(state_snapshot, "selected_files", None))
+
+    tool_runs = safe_get(state_snapshot, "tool_runs", []) or []
+    if tool_runs:
+        last = tool_runs[-1]
+        print("last_run:", safe_get(last, "run_type", None),
+            safe_get(last, "status", None),
+            safe_get(last, "exit_code", None))
+
+def _arg(name, default=None):
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else default
+
+def finished(saved):
+    # A finished run is not started again (its list channels would append to the old history)
+    print(f"Run {safe_get(saved.values, 'run_id')} already finished; showing its saved state. "
+          "Use a new --run-id to start over.")
+    return saved.values
+
+async def astream_ticket(app, state, inp):
+    final = None
+    async for state_snapshot in app.astream(inp, thread_config(state.run_id), stream_mode="values"):
+        print_step(state_snapshot)
+        final = state_snapshot
+    return final
+
 if __name__ == "__main__":
+    configure_logging()
     # IMPORTANT: set this to your sandbox repo folder path
     SANDBOX_PATH = r"C:\Users\naeem\Desktop\LangGraph\Multi-Agent_Software_Engineering_Assistant\sandbox_repo"
-
-    app = build_graph()
+    USE_ASYNC = "--async" in sys.argv
+    # --run-id X: resume run X from its last checkpoint; add --approve to continue it after a HITL stop
+    RUN_ID = _arg("--run-id") or str(uuid.uuid4())[:8]
+    APPROVE = "--approve" in sys.argv
 
     state = TicketState(
-        run_id=str(uuid.uuid4())[:8],
+        run_id=RUN_ID,
         repo_ref=SANDBOX_PATH,
         task_prompt="Fix failing pytest tests.",
         task_type="bugfix",
@@ -25,33 +68,34 @@ if __name__ == "__main__":
         timeout_sec=30,
     )
 
-    print("Starting graph...\n")
+    print(f"Starting graph (run {RUN_ID})...\n")
 
     final = None
-    for state_snapshot in app.stream(state, stream_mode="values"):
-        print("---- step ----")
-
-        patches = safe_get(state_snapshot, "patches", []) or []
-
-        hitl = safe_get(state_snapshot, "hitl", None)
-        if hitl is not None:
-            print("hitl_required:", safe_get(hitl, "required", False))
-            reason = safe_get(hitl, "reason", None)
-            if reason:
-                print("hitl_reason:", reason)
+    if USE_ASYNC:
+        async def main():
+            # the async checkpointer binds to the running loop
+            async with async_sqlite_checkpointer() as cp:
+                app = build_graph(async_nodes=True, checkpointer=cp)
+                if APPROVE:
+                    return await acontinue_after_review(app, RUN_ID, {"approved": True})
+                saved = await app.aget_state(thread_config(RUN_ID))
+                if saved.values and not saved.next:
+                    return finished(saved)
+                return await astream_ticket(app, state, None if saved.next else state)
+        final = asyncio.run(main())
+    else:
+        app = build_graph()
+        if APPROVE:
+            final = continue_after_review(app, RUN_ID, {"approved": True})
         else:
-            print("hitl_required:", False)
-
-        print("selected_files:", safe_get(state_snapshot, "selected_files", None))
-
-        tool_runs = safe_get(state_snapshot, "tool_runs", []) or []
-        if tool_runs:
-            last = tool_runs[-1]
-            print("last_run:", safe_get(last, "run_type", None),
-                safe_get(last, "status", None),
-                safe_get(last, "exit_code", None))
-
-        final = state_snapshot
+            # pending nodes -> resume from the checkpoint instead of starting over
+            saved = app.get_state(thread_config(RUN_ID))
+            if saved.values and not saved.next:
+                final = finished(saved)
+            else:
+                for state_snapshot in app.stream(None if saved.next else state, thread_config(RUN_ID), stream_mode="values"):
+                    print_step(state_snapshot)
+                    final = state_snapshot
 
     print("\nDONE")
     print(final.get("final_report"))
@@ -0,0 +1,88 @@
+from __future__ import annotations
+from typing import Any, Optional
+from functools import lru_cache
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import zlib
+
+from se_assistant.tools import atomic_write, cache_dir
+
+log = logging.getLogger(__name__)
+
+# Content-addressed blob store for the bulky parts of a run (pytest stdout/stderr, diffs,
+# the repo file list). TicketState only carries the short id, so checkpoints and per-step
+# validation stay small; identical blobs (the same failure output every iteration) are
+# stored once. Layout: <cache>/artifacts/<id[:2]>/<id>, zlib-compressed.
+# Blobs are kept until pruning is enabled with SE_ASSISTANT_ARTIFACT_TTL_DAYS: a checkpoint
+# resumed later still needs the stdout, durations and coverage blobs it references.
+TTL_ENV = "SE_ASSISTANT_ARTIFACT_TTL_DAYS"
+
+
+def artifact_ttl_sec() -> Optional[float]:
+    try:
+        days = float(os.environ.get(TTL_ENV, ""))
+    except ValueError:
+        return None
+    return days * 86400 if days > 0 else None
+
+
+def _path(ref: str) -> str:
+    return os.path.join(cache_dir("artifacts", ref[:2]), ref)
+
+def put_text(text: Optional[str]) -> Optional[str]:
+    if not text:
+        return None
+    data = text.encode("utf-8")
+    ref = hashlib.sha256(data).hexdigest()[:32]
+    path = _path(ref)
+    if os.path.exists(path):
+        os.utime(path)  # keep live blobs out of prune_artifacts
+    else:
+        atomic_write(path, zlib.compress(data, 6))
+    return ref
+
+@lru_cache(maxsize=64)
+def _read(ref: str) -> str:
+    # raises on a missing blob, and lru_cache does not cache exceptions: only hits are cached
+    with open(_path(ref), "rb") as fp:
+        return zlib.decompress(fp.read()).decode("utf-8")
+
+def get_text(ref: Optional[str]) -> str:
+    if not ref:
+        return ""
+    try:
+        return _read(ref)
+    except (OSError, zlib.error):
+        log.warning("Artifact %s is missing (pruned?)", ref)
+        return ""
+
+def put_json(obj: Any) -> Optional[str]:
+    return put_text(json.dumps(obj, separators=(",", ":")))
+
+def get_json(ref: Optional[str], default: Any = None) -> Any:
+    text = get_text(ref)
+    return json.loads(text) if text else default
+
+
+def prune_artifacts(max_age_sec: Optional[float] = None) -> None:
+    # Opt-in: without an explicit age or SE_ASSISTANT_ARTIFACT_TTL_DAYS nothing is removed
+    max_age_sec = max_age_sec if max_age_sec is not None else artifact_ttl_sec()
+    if max_age_sec is None:
+        return
+    root = cache_dir("artifacts")
+    cutoff = time.time() - max_age_sec
+    for bucket in os.listdir(root):
+        bdir = os.path.join(root, bucket)
+        for name in os.listdir(bdir) if os.path.isdir(bdir) else []:
+            path = os.path.join(bdir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+        if os.path.isdir(bdir) and not os.listdir(bdir):
+            shutil.rmtree(bdir, ignore_errors=True)
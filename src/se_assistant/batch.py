@@ -0,0 +1,202 @@
+# Batch ticket runner.
+#
+#   python -m se_assistant.batch manifest.jsonl --out results.jsonl --workers 16 --llm-slots 2 --pytest-slots 8
+#
+# Each manifest line is a JSON object with at least "repo_ref" and "task_prompt"; any other
+# TicketState field (timeout_sec, test_runner, patch_candidates, ...) may be given too.
+# Results are appended to --out as each ticket finishes; a throughput summary is printed at the end.
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from se_assistant import limits, routing
+from se_assistant.trace import configure_logging
+from se_assistant.graph import build_graph
+from se_assistant.state import TicketState
+from se_assistant.checkpoint import invoke_ticket, ainvoke_ticket, async_sqlite_checkpointer, checkpoints_enabled
+
+
+def _stable_run_id(ticket: Dict[str, Any], seen: Dict[str, int]) -> str:
+    # Same entry -> same id on every load, so re-running a manifest resumes its checkpoints;
+    # repeated identical entries get their own ids (#1, #2, ...)
+    blob = json.dumps(ticket, sort_keys=True)
+    seen[blob] = seen.get(blob, 0) + 1
+    return hashlib.sha1(f"{blob}#{seen[blob]}".encode("utf-8")).hexdigest()[:8]
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    tickets = []
+    seen: Dict[str, int] = {}
+    with open(path, "r", encoding="utf-8") as fp:
+        for i, line in enumerate(fp, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            t = json.loads(line)
+            if "repo_ref" not in t or "task_prompt" not in t:
+                raise ValueError(f"{path}:{i}: manifest entries need repo_ref and task_prompt")
+            if "run_id" not in t:
+                t["run_id"] = _stable_run_id(t, seen)
+            tickets.append(t)
+    return tickets
+
+def _get(obj, name, default=None):
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+def _result(ticket: Dict[str, Any], final: Any, started: float, error: Optional[str] = None) -> Dict[str, Any]:
+    iteration = _get(final, "iteration") if final is not None else None
+    return {
+        "run_id": ticket["run_id"],
+        "repo_ref": ticket["repo_ref"],
+        "final_status": _get(final, "final_status") if final is not None else "failed",
+        "iterations": _get(iteration, "count", 0) if iteration is not None else 0,
+        "duration_sec": round(time.time() - started, 3),
+        "final_report": _get(final, "final_report") if final is not None else None,
+        "error": error,
+    }
+
+
+def run_ticket(ticket: Dict[str, Any]) -> Dict[str, Any]:
+    # Sync path, used by the process pool (one graph per worker process)
+    started = time.time()
+    try:
+        final = invoke_ticket(_app(), TicketState(**ticket))
+        return _result(ticket, final, started)
+    except Exception as e:
+        return _result(ticket, None, started, error=f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}")
+
+async def arun_ticket(app, ticket: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.time()
+    try:
+        final = await ainvoke_ticket(app, TicketState(**ticket))
+        return _result(ticket, final, started)
+    except Exception as e:
+        return _result(ticket, None, started, error=f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}")
+
+_APP = None
+
+def _app():
+    global _APP
+    if _APP is None:
+        _APP = build_graph()
+    return _APP
+
+def _init_worker(semaphores: Dict[str, Any]) -> None:
+    limits.install(semaphores)
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))  # nearest-rank method
+    return ordered[rank - 1]
+
+def summarize(results: List[Dict[str, Any]], wall_sec: float) -> Dict[str, Any]:
+    fixed = [r for r in results if r["final_status"] == "success"]
+    fix_times = [r["duration_sec"] for r in fixed]
+    iters = [r["iterations"] for r in results]
+    return {
+        "tickets": len(results),
+        "fixed": len(fixed),
+        "errors": sum(1 for r in results if r["error"]),
+        "wall_sec": round(wall_sec, 3),
+        "tickets_per_hour": round(len(results) / wall_sec * 3600, 2) if wall_sec > 0 else None,
+        "time_to_fix_p50_sec": percentile(fix_times, 50),
+        "time_to_fix_p95_sec": percentile(fix_times, 95),
+        "iterations_total": sum(iters),
+        "iterations_mean": round(sum(iters) / len(iters), 2) if iters else None,
+        "iterations_max": max(iters) if iters else None,
+    }
+
+
+async def run_async(tickets: List[Dict[str, Any]], out_path: str, workers: int) -> List[Dict[str, Any]]:
+    if not checkpoints_enabled():
+        return await _run_async(build_graph(async_nodes=True, checkpointer=False), tickets, out_path, workers)
+    async with async_sqlite_checkpointer() as cp:
+        return await _run_async(build_graph(async_nodes=True, checkpointer=cp), tickets, out_path, workers)
+
+async def _run_async(app, tickets: List[Dict[str, Any]], out_path: str, workers: int) -> List[Dict[str, Any]]:
+    gate = asyncio.Semaphore(workers)
+    results: List[Dict[str, Any]] = []
+
+    async def one(t):
+        async with gate:
+            return await arun_ticket(app, t)
+
+    with open(out_path, "a", encoding="utf-8") as out:
+        for fut in asyncio.as_completed([one(t) for t in tickets]):
+            r = await fut
+            results.append(r)
+            out.write(json.dumps(r) + "\n")
+            out.flush()
+            print(f"[{len(results)}/{len(tickets)}] {r['run_id']} {r['final_status']} in {r['duration_sec']}s")
+    return results
+
+def run_processes(tickets: List[Dict[str, Any]], out_path: str, workers: int, llm_slots: Optional[int], pytest_slots: Optional[int]) -> List[Dict[str, Any]]:
+    # Limits have to be shared across worker processes, hence manager-backed semaphores
+    manager = multiprocessing.Manager()
+    semaphores = {}
+    if llm_slots:
+        semaphores["llm"] = manager.BoundedSemaphore(llm_slots)
+    if pytest_slots:
+        semaphores["pytest"] = manager.BoundedSemaphore(pytest_slots)
+    for b in routing.backends().values():
+        if b.max_concurrency:
+            # per-Ollama-backend caps from SE_ASSISTANT_MODELS hold across the whole pool too
+            semaphores[b.slot] = manager.BoundedSemaphore(b.max_concurrency)
+
+    results: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(semaphores,)) as ex, \
+            open(out_path, "a", encoding="utf-8") as out:
+        futures = [ex.submit(run_ticket, t) for t in tickets]
+        for fut in as_completed(futures):
+            r = fut.result()
+            results.append(r)
+            out.write(json.dumps(r) + "\n")
+            out.flush()
+            print(f"[{len(results)}/{len(tickets)}] {r['run_id']} {r['final_status']} in {r['duration_sec']}s")
+    manager.shutdown()
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m se_assistant.batch")
+    ap.add_argument("manifest", help="JSONL file, one ticket per line")
+    ap.add_argument("--out", default="results.jsonl", help="JSONL file results are appended to")
+    ap.add_argument("--mode", choices=["async", "process"], default="async")
+    ap.add_argument("--workers", type=int, default=8, help="tickets in flight at once")
+    ap.add_argument("--llm-slots", type=int, default=None, help="max concurrent LLM calls")
+    ap.add_argument("--pytest-slots", type=int, default=None, help="max concurrent pytest runs")
+    ap.add_argument("--summary", default=None, help="also write the throughput summary to this JSON file")
+    args = ap.parse_args(argv)
+    configure_logging()
+
+    tickets = load_manifest(args.manifest)
+    start = time.time()
+    if args.mode == "async":
+        limits.configure(llm=args.llm_slots, pytest=args.pytest_slots)
+        results = asyncio.run(run_async(tickets, args.out, args.workers))
+    else:
+        results = run_processes(tickets, args.out, args.workers, args.llm_slots, args.pytest_slots)
+
+    summary = summarize(results, time.time() - start)
+    print(json.dumps(summary, indent=2))
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as fp:
+            json.dump(summary, fp, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
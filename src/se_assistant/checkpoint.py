@@ -0,0 +1,141 @@
+from __future__ import annotations
+from typing import Any, Dict, Optional
+from contextlib import asynccontextmanager
+import logging
+import os
+import sqlite3
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from pydantic import BaseModel
+
+from se_assistant import state as state_models
+from se_assistant.state import TicketState
+from se_assistant.tools import cache_dir
+
+log = logging.getLogger(__name__)
+
+# Persistent graph checkpoints: one SQLite file shared by all runs (and batch worker
+# processes), one LangGraph thread per TicketState.run_id. After every node the state is
+# saved, so a crashed run resumes at the node that failed and a HITL stop can be approved
+# and continued without re-scanning the repo or re-running the last test.
+
+
+def checkpoints_enabled() -> bool:
+    return os.environ.get("SE_ASSISTANT_CHECKPOINTS", "1").lower() not in ("0", "false", "off", "no")
+
+def checkpoint_path() -> str:
+    return os.environ.get("SE_ASSISTANT_CHECKPOINT_DB") or os.path.join(cache_dir("checkpoints"), "graph.sqlite")
+
+def thread_config(run_id: str) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": run_id}}
+
+
+def _serde() -> JsonPlusSerializer:
+    # Checkpoints hold our pydantic models; allow exactly those to be deserialized
+    allowed = [(m.__module__, m.__name__) for m in vars(state_models).values()
+               if isinstance(m, type) and issubclass(m, BaseModel) and m.__module__ == state_models.__name__]
+    return JsonPlusSerializer(allowed_msgpack_modules=allowed)
+
+def sqlite_checkpointer(path: Optional[str] = None) -> SqliteSaver:
+    conn = sqlite3.connect(path or checkpoint_path(), check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return SqliteSaver(conn, serde=_serde())
+
+@asynccontextmanager
+async def async_sqlite_checkpointer(path: Optional[str] = None):
+    # AsyncSqliteSaver binds to the running loop and its connection thread must be closed
+    # before the loop is, hence a context manager:
+    #   async with async_sqlite_checkpointer() as cp: app = build_graph(True, checkpointer=cp)
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    async with aiosqlite.connect(path or checkpoint_path(), timeout=30) as conn:
+        yield AsyncSqliteSaver(conn, serde=_serde())
+
+def default_checkpointer(async_nodes: bool):
+    if not checkpoints_enabled():
+        return None
+    if async_nodes:
+        log.warning("Checkpoints off: pass checkpointer= from async_sqlite_checkpointer() to persist async runs.")
+        return None
+    return sqlite_checkpointer()
+
+
+def _resume_point(snapshot) -> Optional[str]:
+    # A saved thread with pending nodes was interrupted (crash, timeout, Ctrl-C)
+    return ",".join(snapshot.next) if snapshot and snapshot.next else None
+
+def invoke_ticket(app, state: TicketState) -> Dict[str, Any]:
+    # Start the ticket, or resume its thread from the last completed node. A finished run is
+    # not started again (its list channels would append to the old history): use a new run_id.
+    config = thread_config(state.run_id)
+    if app.checkpointer is not None:
+        saved = app.get_state(config)
+        at = _resume_point(saved)
+        if at:
+            log.info("Resuming run %s at: %s", state.run_id, at)
+            return app.invoke(None, config)
+        if saved.values:
+            log.info("Run %s already finished; returning its saved state", state.run_id)
+            return saved.values
+    return app.invoke(state, config)
+
+async def ainvoke_ticket(app, state: TicketState) -> Dict[str, Any]:
+    config = thread_config(state.run_id)
+    if app.checkpointer is not None:
+        saved = await app.aget_state(config)
+        at = _resume_point(saved)
+        if at:
+            log.info("Resuming run %s at: %s", state.run_id, at)
+            return await app.ainvoke(None, config)
+        if saved.values:
+            log.info("Run %s already finished; returning its saved state", state.run_id)
+            return saved.values
+    return await app.ainvoke(state, config)
+
+
+def _review_update(values: Dict[str, Any], decision: Dict[str, Any]):
+    # -> (state update, node to resume after) for an approved HITL stop; None when rejected
+    state = TicketState(**values)
+    hitl = state.hitl.model_copy(update={"required": False, "human_decision": decision})
+    if not decision.get("approved"):
+        return {"hitl": state.hitl.model_copy(update={"human_decision": decision})}, None
+
+    update: Dict[str, Any] = {"hitl": hitl, "final_status": None, "final_report": None}
+    extra = int(decision.get("extra_iterations", 2))
+    if state.iteration.count >= state.iteration.max:
+        update["iteration"] = state.iteration.model_copy(update={"max": state.iteration.count + extra})
+
+    last_test = next((r for r in reversed(state.tool_runs) if r.run_type == "test"), None)
+    active = sum(not p.reverted for p in state.patches)
+    if last_test is None or active > last_test.patches_applied:
+        # an (approved) patch is on disk but untested -> continue as if safety had passed it
+        return update, "safety"
+    # the tree is what the last test run saw -> route from its result again
+    return update, "test"
+
+def continue_after_review(app, run_id: str, decision: Dict[str, Any]) -> Dict[str, Any]:
+    # Record the reviewer's decision on a stopped run; {"approved": True} continues the loop
+    # from where it stopped ("extra_iterations" raises the cap when that was the reason).
+    config = thread_config(run_id)
+    snapshot = app.get_state(config)
+    if not snapshot.values:
+        raise ValueError(f"No checkpoint for run {run_id}")
+    update, as_node = _review_update(snapshot.values, decision)
+    if as_node is None:
+        app.update_state(config, update, as_node="synthesis")
+        return app.get_state(config).values
+    app.update_state(config, update, as_node=as_node)
+    return app.invoke(None, config)
+
+async def acontinue_after_review(app, run_id: str, decision: Dict[str, Any]) -> Dict[str, Any]:
+    config = thread_config(run_id)
+    snapshot = await app.aget_state(config)
+    if not snapshot.values:
+        raise ValueError(f"No checkpoint for run {run_id}")
+    update, as_node = _review_update(snapshot.values, decision)
+    if as_node is None:
+        await app.aupdate_state(config, update, as_node="synthesis")
+        return (await app.aget_state(config)).values
+    await app.aupdate_state(config, update, as_node=as_node)
+    return await app.ainvoke(None, config)
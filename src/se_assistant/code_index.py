@@ -0,0 +1,246 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import ast
+import hashlib
+import json
+import os
+import re
+import threading
+
+from se_assistant.tools import cache_dir
+from se_assistant.repo_index import refresh_index
+from se_assistant.pytest_results import parse_traceback_frames
+
+# Static index of the repo's Python sources: module <-> path, resolved import graph,
+# top-level symbols and the test -> source mapping. Per-file parse results are cached on
+# disk keyed by the content hash from repo_index, so only edited files are re-parsed.
+INDEX_VERSION = 1
+
+_PY_LOC_RE = re.compile(r"([\w./\\-]+\.py):(\d+)")
+
+
+def module_name(rel_path: str) -> Optional[str]:
+    p = rel_path.replace("\\", "/")
+    if not p.endswith(".py"):
+        return None
+    parts = p[:-3].split("/")
+    if parts[0] == "src":
+        parts = parts[1:]
+    if parts and parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts) or None
+
+def is_test_file(rel_path: str) -> bool:
+    name = rel_path.replace("\\", "/").rsplit("/", 1)[-1]
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py") or name == "conftest.py")
+
+
+def _parse_file(source: str, module: Optional[str], is_pkg: bool) -> Dict[str, Any]:
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return {"imports": [], "symbols": [], "syntax_error": True}
+    package = (module or "") if is_pkg else (module or "").rpartition(".")[0]
+    imports: List[str] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.extend(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                # from .x import y / from .. import z -> absolute names inside the package
+                parts = package.split(".") if package else []
+                parts = parts[:len(parts) - (node.level - 1)] if node.level > 1 else parts
+                base = ".".join(p for p in parts + ([node.module] if node.module else []) if p)
+            # "base.name" resolves to the submodule when name is one, else to base itself
+            imports.extend(f"{base}.{a.name}" if base else a.name for a in node.names)
+    symbols = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            symbols.append(node.name)
+        elif isinstance(node, ast.Assign):
+            symbols.extend(t.id for t in node.targets if isinstance(t, ast.Name))
+    return {"imports": sorted(set(imports)), "symbols": symbols}
+
+
+class CodeIndex:
+    def __init__(self, repo_ref: str, entries: Dict[str, Dict[str, Any]]):
+        self.repo_ref = repo_ref
+        self.entries = entries
+        self.modules = {e["module"]: p for p, e in entries.items() if e.get("module")}
+        self.imports: Dict[str, List[str]] = {
+            p: [d for d in self._resolve_all(e["imports"]) if d != p] for p, e in entries.items()
+        }
+        self.importers: Dict[str, List[str]] = {}
+        for p, deps in self.imports.items():
+            for d in deps:
+                self.importers.setdefault(d, []).append(p)
+        self.symbols: Dict[str, List[str]] = {}
+        for p, e in entries.items():
+            for s in e["symbols"]:
+                self.symbols.setdefault(s, []).append(p)
+
+    def resolve(self, name: str) -> Optional[str]:
+        # "pkg.mod.func" -> path of the longest prefix that is a repo module
+        parts = name.split(".")
+        for i in range(len(parts), 0, -1):
+            path = self.modules.get(".".join(parts[:i]))
+            if path:
+                return path
+        return None
+
+    def _resolve_all(self, names: Iterable[str]) -> List[str]:
+        return sorted({p for p in (self.resolve(n) for n in names) if p})
+
+    def sources(self) -> List[str]:
+        return sorted(p for p in self.entries if not is_test_file(p))
+
+    def tests(self) -> List[str]:
+        return sorted(p for p in self.entries if is_test_file(p) and not p.endswith("conftest.py"))
+
+    def sources_for_test(self, test_path: str) -> List[str]:
+        return [p for p in self.imports.get(test_path, []) if not is_test_file(p)]
+
+    def tests_importing(self, paths: Iterable[str]) -> List[str]:
+        targets = set(paths)
+        return [t for t in self.tests() if targets & set(self.imports.get(t, []))]
+
+    def repo_path(self, path: str) -> Optional[str]:
+        # Traceback path (relative to rootdir or absolute) -> indexed repo path
+        p = path.replace("\\", "/")
+        root = os.path.abspath(self.repo_ref).replace("\\", "/").rstrip("/") + "/"
+        if p.startswith(root):
+            p = p[len(root):]
+        if p.startswith("./"):
+            p = p[2:]
+        if p in self.entries:
+            return p
+        # site-packages style frames of an installed copy: match on the module path suffix
+        for known in self.entries:
+            if p.endswith("/" + known) or known.endswith("/" + p):
+                return known
+        return None
+
+
+def _index_file(repo_ref: str) -> str:
+    key = hashlib.sha1(os.path.abspath(repo_ref).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir("code_index"), f"{key}.json")
+
+def _load(repo_ref: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(_index_file(repo_ref), "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    return data.get("files", {}) if data.get("version") == INDEX_VERSION else {}
+
+def _save(repo_ref: str, entries: Dict[str, Dict[str, Any]]) -> None:
+    path = _index_file(repo_ref)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump({"version": INDEX_VERSION, "files": entries}, fp)
+    os.replace(tmp, path)
+
+
+_lock = threading.Lock()
+
+def load_code_index(repo_ref: str) -> CodeIndex:
+    files = refresh_index(repo_ref)
+    with _lock:
+        old = _load(repo_ref)
+        entries: Dict[str, Dict[str, Any]] = {}
+        parsed = 0
+        for path, meta in files.items():
+            if meta.get("language") != "python":
+                continue
+            prev = old.get(path)
+            if prev and prev.get("sha1") == meta["sha1"]:
+                entries[path] = prev
+                continue
+            try:
+                with open(os.path.join(repo_ref, path), "r", encoding="utf-8") as fp:
+                    source = fp.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            mod = module_name(path)
+            entry = _parse_file(source, mod, path.endswith("__init__.py"))
+            entry.update({"sha1": meta["sha1"], "module": mod})
+            entries[path] = entry
+            parsed += 1
+        if parsed or set(entries) != set(old):
+            _save(repo_ref, entries)
+    return CodeIndex(repo_ref, entries)
+
+
+def _failure_frames(failure: Dict[str, Any]) -> List[Dict[str, Any]]:
+    frames = failure.get("frames") or []
+    if not frames and failure.get("raw"):
+        frames = parse_traceback_frames(failure["raw"])
+        if not frames:
+            frames = [{"path": m.group(1), "line": int(m.group(2))} for m in _PY_LOC_RE.finditer(failure["raw"])]
+    return frames
+
+def rank_files(index: CodeIndex, failures: List[Dict[str, Any]], test_paths: Iterable[str] = ()) -> List[Tuple[str, float, List[str]]]:
+    # -> [(path, score, reasons)] best first. Frames in repo sources weigh most (innermost
+    # = crash site highest); sources imported by the failing tests add weaker evidence.
+    scores: Dict[str, float] = {}
+    reasons: Dict[str, List[str]] = {}
+
+    def add(path: str, score: float, why: str) -> None:
+        scores[path] = scores.get(path, 0.0) + score
+        if why not in reasons.setdefault(path, []):
+            reasons[path].append(why)
+
+    tests = set(p.replace("\\", "/") for p in test_paths)
+    for f in failures:
+        if f.get("test_file"):
+            tests.add(f["test_file"].replace("\\", "/"))
+        frames = [(index.repo_path(fr["path"]), fr.get("line")) for fr in _failure_frames(f)]
+        frames = [(p, line) for p, line in frames if p and not is_test_file(p)]
+        for depth, (path, line) in enumerate(frames, 1):
+            crash = depth == len(frames)
+            add(path, 1.0 + depth / len(frames) + (1.0 if crash else 0.0),
+                f"{'crash' if crash else 'traceback'} frame {path}:{line}")
+
+    for t in tests:
+        t = index.repo_path(t) or t
+        for src in index.sources_for_test(t):
+            add(src, 0.5, f"imported by {t}")
+
+    return sorted(((p, round(s, 3), reasons[p]) for p, s in scores.items()), key=lambda x: (-x[1], x[0]))
+
+def decisive(ranked: List[Tuple[str, float, List[str]]]) -> bool:
+    # The top file clearly dominates: it is the only candidate, or scores at least twice the runner-up
+    if not ranked:
+        return False
+    if len(ranked) == 1:
+        return True
+    return ranked[0][1] >= 2 * ranked[1][1]
+
+
+# Classes longer than this are shown method by method instead of whole
+MAX_CLASS_LINES = 80
+HEADER_LINES = 30
+
+def definition_spans(source: str) -> List[Tuple[int, int, str]]:
+    # -> [(first_line, last_line, name)] 1-based inclusive, decorators included
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return []
+    spans = []
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        end = node.end_lineno or node.lineno
+        if isinstance(node, ast.ClassDef) and end - start + 1 > MAX_CLASS_LINES:
+            methods = [m for m in node.body if isinstance(m, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            first = min([m.lineno for m in methods] + [end + 1])
+            spans.append((start, min(end, first - 1, start + HEADER_LINES - 1), node.name))
+            for m in methods:
+                m_start = min([m.lineno] + [d.lineno for d in m.decorator_list])
+                spans.append((m_start, m.end_lineno or m.lineno, f"{node.name}.{m.name}"))
+        else:
+            spans.append((start, end, node.name))
+    return spans
@@ -0,0 +1,198 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import logging
+import os
+
+from se_assistant.code_index import definition_spans
+
+log = logging.getLogger(__name__)
+
+# Token-budgeted prompt packing. Each node cuts its context into whole units (a failure, a
+# function, a test, a path), scores them by relevance and the packer keeps the best units
+# that fit the model's budget, so nothing is cut in the middle of a function.
+
+# Rough estimate, deliberately a little pessimistic for code (~3.5 chars/token in practice)
+CHARS_PER_TOKEN = 4
+
+# Context window per model (we also pass it to Ollama as num_ctx) and room kept for the answer
+MODEL_CONTEXT = {"qwen2.5:7b": 8192, "qwen2.5:3b": 8192}
+DEFAULT_CONTEXT = 4096
+RESERVED_OUTPUT = {"file_select": 512, "patch": 2048}
+
+# Source ranges longer than this are split into windows so one huge function cannot
+# crowd out everything else (or be dropped as a whole)
+MAX_CHUNK_LINES = 120
+WINDOW_LINES = 60
+# Log-like chunks (raw pytest output) are clipped head+tail to this share of the budget
+LOG_CHUNK_SHARE = 0.125
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def context_budget(model: str, node: str, override: Optional[int] = None) -> int:
+    # Prompt tokens a node may use: explicit override > SE_ASSISTANT_CONTEXT_TOKENS > model window - reply
+    if override:
+        return override
+    env = os.environ.get("SE_ASSISTANT_CONTEXT_TOKENS")
+    if env:
+        return int(env)
+    return MODEL_CONTEXT.get(model, DEFAULT_CONTEXT) - RESERVED_OUTPUT.get(node, 1024)
+
+def clip_lines(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    head, tail, used = [], [], 0
+    limit = max_tokens * CHARS_PER_TOKEN
+    # keep the start (test header) and, mostly, the end (assertion / exception)
+    for ln in lines:
+        if used + len(ln) > limit // 3:
+            break
+        head.append(ln)
+        used += len(ln) + 1
+    for ln in reversed(lines[len(head):]):
+        if used + len(ln) > limit:
+            break
+        tail.insert(0, ln)
+        used += len(ln) + 1
+    skipped = len(lines) - len(head) - len(tail)
+    return "\n".join(head + [f"... ({skipped} lines elided) ..."] + tail)
+
+
+class Chunk(NamedTuple):
+    section: str
+    text: str
+    score: float
+    order: Tuple
+    tokens: int
+    meta: Any = None
+
+
+class ContextPacker:
+    def __init__(self, node: str, budget: int):
+        self.node = node
+        self.budget = budget
+        self.fixed_tokens = 0
+        self.chunks: List[Chunk] = []
+        self.usage: Dict[str, Tuple[int, int, int, int]] = {}
+
+    def clip(self, text: str) -> str:
+        return clip_lines(text, max(200, int(self.budget * LOG_CHUNK_SHARE)))
+
+    def fixed(self, text: str) -> None:
+        # Always sent (prompt template, task, run info)
+        self.fixed_tokens += estimate_tokens(text)
+
+    def add(self, section: str, text: str, score: float, order: Tuple = (), meta: Any = None, overhead: int = 0) -> None:
+        if text.strip():
+            self.chunks.append(Chunk(section, text, score, order, estimate_tokens(text) + overhead, meta))
+
+    def pack(self) -> Dict[str, List[Chunk]]:
+        left = self.budget - self.fixed_tokens
+        chosen: Dict[str, List[Chunk]] = {}
+        for c in sorted(self.chunks, key=lambda c: (-c.score, c.order)):
+            if c.tokens <= left:
+                chosen.setdefault(c.section, []).append(c)
+                left -= c.tokens
+        for cs in chosen.values():
+            cs.sort(key=lambda c: c.order)
+
+        sections = sorted({c.section for c in self.chunks})
+        for s in sections:
+            offered = [c for c in self.chunks if c.section == s]
+            used = chosen.get(s, [])
+            self.usage[s] = (sum(c.tokens for c in used), sum(c.tokens for c in offered), len(used), len(offered))
+        if log.isEnabledFor(logging.INFO):
+            parts = [f"{s} {u[0]}/{u[1]} tok ({u[2]}/{u[3]})" for s, u in self.usage.items()]
+            log.info("Context [%s] budget %d tok, fixed %d: %s", self.node, self.budget, self.fixed_tokens, ", ".join(parts))
+        return chosen
+
+    def metrics(self) -> Dict[str, float]:
+        out = {f"context.{self.node}.fixed.tokens": self.fixed_tokens}
+        for s, (used, _, _, _) in self.usage.items():
+            out[f"context.{self.node}.{s}.tokens"] = used
+        return out
+
+
+def join_text(chunks: Iterable[Chunk], sep: str = "\n\n") -> str:
+    return sep.join(c.text.strip("\n") for c in chunks)
+
+
+def _ranges(source: str) -> List[Tuple[int, int, str]]:
+    # Definitions plus the module-level code between them, covering every line once
+    src_lines = source.splitlines()
+    n = len(src_lines)
+    out: List[Tuple[int, int, str]] = []
+    cur = 1
+
+    def gap(start: int, end: int) -> None:
+        # blank separator lines stick to the previous range instead of becoming their own chunk
+        if out and not "".join(src_lines[start - 1:end]).strip():
+            out[-1] = (out[-1][0], end, out[-1][2])
+        else:
+            out.append((start, end, "<module>"))
+
+    for start, end, name in sorted(definition_spans(source)):
+        if start > cur:
+            gap(cur, start - 1)
+        out.append((start, end, name))
+        cur = end + 1
+    if cur <= n:
+        gap(cur, n)
+    split = []
+    for start, end, name in out:
+        if end - start + 1 <= MAX_CHUNK_LINES:
+            split.append((start, end, name))
+            continue
+        for s in range(start, end + 1, WINDOW_LINES):
+            split.append((s, min(end, s + WINDOW_LINES - 1), name))
+    return split
+
+def add_source(packer: ContextPacker, section: str, path: str, source: str, rank: int,
+               lines: Iterable[int] = (), names: Iterable[str] = (),
+               hit_score: float = 10.0, name_score: float = 6.0, header_score: float = 4.0, base_score: float = 1.0) -> None:
+    # One chunk per definition / module-level block; traceback lines and named definitions score
+    # highest, the module header next, everything else by distance to the nearest hit.
+    lines, names = set(lines), set(names)
+    src_lines = source.splitlines(keepends=True)
+    ranges = _ranges(source)
+    hits = [ln for ln in lines if 1 <= ln <= len(src_lines)]
+    for start, end, name in ranges:
+        if any(start <= ln <= end for ln in hits):
+            score = hit_score
+        elif name in names or name.split(".")[-1] in names:
+            score = name_score
+        elif start == 1 and name == "<module>":
+            score = header_score
+        else:
+            dist = min((min(abs(ln - start), abs(ln - end)) for ln in hits), default=len(src_lines))
+            score = base_score + 1.0 / (1 + dist / 50)
+        text = "".join(src_lines[start - 1:end])
+        packer.add(section, text, score, order=(rank, start), meta=(path, start, end, len(src_lines)), overhead=6)
+
+def _nl(text: str) -> str:
+    return text if text.endswith("\n") else text + "\n"
+
+def render_sources(chunks: Iterable[Chunk], title: str = "") -> str:
+    # Per file: "=== path (full file | excerpts of N lines) ===" then contiguous runs with line markers
+    by_path: Dict[str, List[Chunk]] = {}
+    for c in chunks:
+        by_path.setdefault(c.meta[0], []).append(c)
+    blocks = []
+    for path, cs in by_path.items():
+        cs.sort(key=lambda c: c.meta[1])
+        total = cs[0].meta[3]
+        runs: List[List[Any]] = []
+        for c in cs:
+            _, start, end, _ = c.meta
+            if runs and runs[-1][1] + 1 == start:
+                runs[-1][1] = end
+                runs[-1][2] += c.text
+            else:
+                runs.append([start, end, c.text])
+        whole = len(runs) == 1 and runs[0][0] == 1 and runs[0][1] == total
+        label = f"full file, {total} lines" if whole else f"excerpts of {total} lines"
+        body = "".join(f"--- lines {a}-{b} ---\n{_nl(t)}" for a, b, t in runs)
+        blocks.append(f"=== {title}{path} ({label}) ===\n{body}")
+    return "\n".join(blocks)
@@ -0,0 +1,186 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import difflib
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+# Compact patch protocol: search/replace hunks, optionally anchored on a line number,
+# or a unified diff that is turned into the same hunks. Hunks are located exactly first,
+# then ignoring whitespace, then fuzzily; every hunk of every file must apply cleanly
+# before anything is returned, so callers write either all files or none.
+FUZZY_MIN_RATIO = 0.9
+
+
+class EditConflict(ValueError):
+    pass
+
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+
+def _diff_path(line: str) -> str:
+    p = line[4:].split("\t", 1)[0].strip()
+    return p[2:] if p[:2] in ("a/", "b/") else p
+
+def parse_unified_diff(text: str) -> List[Dict[str, Any]]:
+    # -> [{"path", "start_line", "search", "replace"}], one per @@ hunk
+    edits: List[Dict[str, Any]] = []
+    path: Optional[str] = None
+    cur: Optional[Dict[str, Any]] = None
+
+    def close():
+        if cur is not None:
+            edits.append({
+                "path": cur["path"], "start_line": cur["start_line"],
+                "search": "".join(cur["old"]), "replace": "".join(cur["new"]),
+            })
+
+    # Lines the current hunk header still promises; until both run out, "--- "/"+++ " lines
+    # are removed/added body lines (e.g. "-- sql comment"), not the next file's header
+    old_left = new_left = 0
+    for line in text.splitlines(keepends=True):
+        in_body = cur is not None and (old_left > 0 or new_left > 0)
+        if line.startswith("--- ") and not in_body:
+            close()
+            cur = None
+            continue
+        if line.startswith("+++ ") and not in_body:
+            path = _diff_path(line)
+            continue
+        m = _HUNK_RE.match(line)
+        if m:
+            close()
+            if path is None:
+                raise EditConflict("diff hunk without a +++ file header")
+            cur = {"path": path, "start_line": int(m.group(1)), "old": [], "new": []}
+            old_left = int(m.group(2) or 1)
+            new_left = int(m.group(3) or 1)
+            continue
+        if cur is None or line.startswith("\\"):
+            continue  # preamble / "\ No newline at end of file"
+        body = line[1:] if line[:1] in (" ", "-", "+") else line
+        if line.startswith("-"):
+            cur["old"].append(body)
+            old_left -= 1
+        elif line.startswith("+"):
+            cur["new"].append(body)
+            new_left -= 1
+        else:
+            cur["old"].append(body)
+            cur["new"].append(body)
+            old_left -= 1
+            new_left -= 1
+    close()
+    return edits
+
+
+def _norm(line: str) -> str:
+    return " ".join(line.split())
+
+def _nearest(starts: List[int], hint: Optional[int]) -> Optional[int]:
+    # Several matches: the line hint decides, otherwise the edit is ambiguous
+    if len(starts) == 1:
+        return starts[0]
+    if hint is None:
+        return None
+    return min(starts, key=lambda s: abs(s - (hint - 1)))
+
+def locate(lines: List[str], search: List[str], hint: Optional[int] = None) -> Tuple[int, str]:
+    # -> (0-based first line of the match, how it matched); raises EditConflict
+    n = len(search)
+    if n == 0:
+        raise EditConflict("empty search block")
+    windows = range(len(lines) - n + 1)
+
+    for how, key in (("exact", lambda s: s.rstrip("\r\n")), ("whitespace", _norm)):
+        wanted = [key(s) for s in search]
+        starts = [i for i in windows if [key(s) for s in lines[i:i + n]] == wanted]
+        if starts:
+            at = _nearest(starts, hint)
+            if at is None:
+                raise EditConflict(f"search block matches {len(starts)} places; add a start_line or more context")
+            return at, how
+
+    wanted = "\n".join(_norm(s) for s in search)
+    best, best_ratio = None, 0.0
+    normed = [_norm(s) for s in lines]
+    sm = difflib.SequenceMatcher()
+    sm.set_seq2(wanted)  # seq2 is the one SequenceMatcher caches
+    for i in windows:
+        sm.set_seq1("\n".join(normed[i:i + n]))
+        # cheap upper bounds first; full ratio() only for plausible windows
+        if sm.real_quick_ratio() < FUZZY_MIN_RATIO or sm.quick_ratio() < FUZZY_MIN_RATIO:
+            continue
+        ratio = sm.ratio()
+        closer = best is not None and hint is not None and abs(i - (hint - 1)) < abs(best - (hint - 1))
+        if ratio > best_ratio or (ratio == best_ratio and closer):
+            best, best_ratio = i, ratio
+    if best is None or best_ratio < FUZZY_MIN_RATIO:
+        raise EditConflict(f"search block not found (nothing {FUZZY_MIN_RATIO:.0%} similar)")
+    return best, f"fuzzy {best_ratio:.2f}"
+
+
+def _indent(s: str) -> str:
+    return s[:len(s) - len(s.lstrip())]
+
+def _reindent(replace: List[str], search: List[str], found: List[str]) -> List[str]:
+    # Matched ignoring indentation: map each search indent to the file's indent on the same line
+    mapping = {}
+    for s, f in zip(search, found):
+        if s.strip() and f.strip():
+            mapping.setdefault(_indent(s), _indent(f))
+    if all(k == v for k, v in mapping.items()):
+        return replace
+    out = []
+    for s in replace:
+        ind = _indent(s)
+        if s.strip() and ind in mapping:
+            s = mapping[ind] + s[len(ind):]
+        out.append(s)
+    return out
+
+def _lines(text: str) -> List[str]:
+    lines = text.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    return lines
+
+def apply_file_edits(path: str, old: Optional[str], edits: List[Dict[str, Any]]) -> str:
+    if old is None:
+        # New file: only a single hunk with an empty search block makes sense
+        if len(edits) != 1 or edits[0].get("search", "").strip():
+            raise EditConflict(f"{path}: file does not exist")
+        return "".join(_lines(edits[0].get("replace", "")))
+
+    lines = _lines(old)
+    spans: List[Tuple[int, int, List[str]]] = []
+    for e in edits:
+        search = _lines(e.get("search", ""))
+        replace = _lines(e.get("replace", ""))
+        hint = e.get("start_line")
+        hint = int(hint) if isinstance(hint, (int, float, str)) and str(hint).strip().isdigit() else None
+        try:
+            at, how = locate(lines, search, hint)
+        except EditConflict as ex:
+            raise EditConflict(f"{path}: {ex}") from None
+        if how != "exact":
+            replace = _reindent(replace, search, lines[at:at + len(search)])
+            log.info("Edit in %s matched at line %d (%s)", path, at + 1, how)
+        spans.append((at, at + len(search), replace))
+
+    spans.sort(key=lambda s: s[0])
+    for (a0, a1, _), (b0, b1, _) in zip(spans, spans[1:]):
+        if b0 < a1:
+            raise EditConflict(f"{path}: overlapping edits at lines {a0 + 1}-{a1} and {b0 + 1}-{b1}")
+    for start, end, replace in reversed(spans):
+        lines[start:end] = replace
+    return "".join(lines)
+
+def apply_edits(sources: Dict[str, Optional[str]], edits: List[Dict[str, Any]]) -> Dict[str, str]:
+    # sources: current content per path (None = missing). -> {path: new content} for every
+    # touched path; raises EditConflict without partial results if any hunk fails.
+    by_path: Dict[str, List[Dict[str, Any]]] = {}
+    for e in edits:
+        by_path.setdefault(e["path"], []).append(e)
+    return {path: apply_file_edits(path, sources.get(path), es) for path, es in by_path.items()}
@@ -0,0 +1,227 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+
+from se_assistant.artifacts import put_text
+from se_assistant.state import TicketState, ToolRun
+from se_assistant.tools import cache_dir, run_cmd, sandbox_python, tail
+from se_assistant.workspace import pythonpath_env
+
+try:
+    import tomllib
+except ImportError:  # Python 3.10
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+log = logging.getLogger(__name__)
+
+# Pool of test environments, shared by every ticket on this machine:
+#   <cache>/envs/<key>/          a venv with the project's dependencies + pytest
+#   <cache>/envs/<key>/env.json  what it was built from; its mtime is the LRU clock
+# key = hash of the base interpreter and the dependency spec (requirements files, the
+# [project] dependencies and test extras of pyproject.toml), so two repos / two tickets with
+# the same dependencies share one env and editing pytest options does not rebuild it. A miss
+# builds offline from a local wheelhouse (pip --no-index --find-links); fill it beforehand,
+# e.g. pip download -d <wheelhouse> pytest -r requirements.txt.
+# A repo that ships its own .venv keeps using it.
+
+REQUIREMENTS_FILES = ("requirements.txt", "requirements-dev.txt", "requirements-test.txt")
+INCLUDE_OPTIONS = ("-r", "--requirement", "-c", "--constraint")
+TEST_EXTRAS = ("test", "tests", "testing", "dev")
+ALWAYS_INSTALL = ("pytest",)
+
+ENV_POOL_SIZE = 8                 # SE_ASSISTANT_ENV_POOL_SIZE; least recently used are evicted
+ENV_MIN_IDLE_SEC = 3600           # never evict an env used this recently (a ticket may be running in it)
+ENV_BUILD_TIMEOUT_SEC = 900
+
+_build_locks: Dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+
+def wheelhouse() -> str:
+    return os.environ.get("SE_ASSISTANT_WHEELHOUSE") or cache_dir("wheels")
+
+def base_python() -> str:
+    # interpreter the pooled venvs are created from
+    return os.environ.get("SE_ASSISTANT_ENV_PYTHON") or sys.executable
+
+def venv_python(env_dir: str) -> str:
+    if os.name == "nt":
+        return os.path.join(env_dir, "Scripts", "python.exe")
+    return os.path.join(env_dir, "bin", "python")
+
+def python_for(state: TicketState) -> str:
+    # The interpreter tests run with; checkpoints from before the pool fall back to the repo's .venv
+    return state.python_path or sandbox_python(state.repo_ref)
+
+def test_env(state: TicketState) -> Optional[Dict[str, str]]:
+    # Environment for test subprocesses (None: inherit ours). A pooled env holds the
+    # dependencies but not the project itself, so the repo root and src/ go on PYTHONPATH
+    if not state.python_path or state.python_path == sandbox_python(state.repo_ref):
+        return None
+    return pythonpath_env(state.repo_ref)
+
+
+def _pyproject_requirements(repo: str) -> List[str]:
+    path = os.path.join(repo, "pyproject.toml")
+    if tomllib is None:
+        log.warning("tomllib/tomli not available; dependencies in %s are not installed", path)
+        return []
+    with open(path, "rb") as fp:
+        project = tomllib.load(fp).get("project", {})
+    reqs = list(project.get("dependencies", []))
+    extras = project.get("optional-dependencies", {})
+    for name in TEST_EXTRAS:
+        reqs += extras.get(name, [])
+    return reqs
+
+def _included_files(name: str, content: str) -> List[str]:
+    # "-r base.txt" / "--constraint=constraints.txt" lines of a requirements file, as repo-relative
+    # paths (pip resolves them against the including file's directory)
+    found = []
+    for line in content.splitlines():
+        parts = line.split("#", 1)[0].replace("=", " ", 1).split() if line.lstrip().startswith("-") else []
+        if len(parts) >= 2 and parts[0] in INCLUDE_OPTIONS and "://" not in parts[1]:
+            path = os.path.normpath(os.path.join(os.path.dirname(name), parts[1])).replace(os.sep, "/")
+            if not os.path.isabs(path) and not path.startswith(".."):
+                found.append(path)
+    return found
+
+def _requirement_files(repo: str, configs: List[str]) -> Dict[str, str]:
+    # the top-level requirements files plus everything they include, by repo-relative path
+    files: Dict[str, str] = {}
+    pending = [name for name in REQUIREMENTS_FILES if name in configs]
+    while pending:
+        name = pending.pop()
+        path = os.path.join(repo, name)
+        if name in files or not os.path.isfile(path):
+            continue  # a missing include is left for pip to report
+        with open(path, "r", encoding="utf-8") as fp:
+            files[name] = fp.read()
+        pending += _included_files(name, files[name])
+    return files
+
+def dependency_spec(repo: str, configs: List[str]) -> Dict[str, Any]:
+    # -> {"requirements": [...], "files": {path: content}}: everything the env is built from,
+    # including files pulled in by -r / -c so editing them changes the env key
+    files = _requirement_files(repo, configs)
+    reqs = list(ALWAYS_INSTALL)
+    if "pyproject.toml" in configs:
+        reqs += _pyproject_requirements(repo)
+    return {"requirements": sorted(set(reqs)), "files": files}
+
+def env_key(spec: Dict[str, Any], python: str) -> str:
+    blob = json.dumps({"python": os.path.realpath(python), "spec": spec}, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:20]
+
+
+def _key_lock(key: str) -> threading.Lock:
+    with _locks_lock:
+        return _build_locks.setdefault(key, threading.Lock())
+
+def _touch(env_dir: str) -> None:
+    try:
+        os.utime(os.path.join(env_dir, "env.json"))
+    except OSError:
+        pass
+
+def _ready(env_dir: str) -> bool:
+    return os.path.exists(os.path.join(env_dir, "env.json")) and os.path.exists(venv_python(env_dir))
+
+def _install_cmd(py: str, spec: Dict[str, Any], tmp: str) -> str:
+    # requirements files (and their -r / -c includes, at the same relative paths) are copied
+    # next to the env so every include resolves without the repo
+    cmd = f'"{py}" -m pip install --disable-pip-version-check --no-input --no-index --find-links "{wheelhouse()}"'
+    for name, content in sorted(spec["files"].items()):
+        path = os.path.join(tmp, *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fp:
+            fp.write(content)
+        if name in REQUIREMENTS_FILES:
+            cmd += f' -r "{path}"'
+    return cmd + "".join(f' "{r}"' for r in spec["requirements"])
+
+def _build(repo: str, spec: Dict[str, Any], env_dir: str) -> ToolRun:
+    # venv + offline install into a temp dir, renamed into place only when both succeeded
+    base = base_python()
+    tmp = f"{env_dir}.tmp-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    steps = [f'"{base}" -m venv "{tmp}"']
+    results = []
+    t0 = time.perf_counter()
+    try:
+        results.append(run_cmd(repo, steps[0], timeout_sec=ENV_BUILD_TIMEOUT_SEC))
+        if results[-1]["status"] == "success":
+            steps.append(_install_cmd(venv_python(tmp), spec, tmp))
+            results.append(run_cmd(repo, steps[-1], timeout_sec=ENV_BUILD_TIMEOUT_SEC))
+        last = results[-1]
+        if last["status"] == "success":
+            with open(os.path.join(tmp, "env.json"), "w", encoding="utf-8") as fp:
+                json.dump({"spec": spec, "python": base, "built": time.time()}, fp, indent=2)
+            try:
+                os.rename(tmp, env_dir)
+            except OSError:
+                pass  # another process built the same env meanwhile; use theirs
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return ToolRun(
+        run_id=str(uuid.uuid4())[:8],
+        run_type="install",
+        command=" && ".join(steps),
+        status=last["status"],
+        exit_code=last["exit_code"],
+        duration_sec=time.perf_counter() - t0,
+        stdout_ref=put_text(tail("\n".join(r["stdout"] for r in results))),
+        stderr_ref=put_text(tail("\n".join(r["stderr"] for r in results))),
+    )
+
+def evict(keep: str, size: Optional[int] = None) -> None:
+    # LRU: drop the least recently used envs beyond the pool size (never `keep` or busy ones)
+    size = size if size is not None else int(os.environ.get("SE_ASSISTANT_ENV_POOL_SIZE", ENV_POOL_SIZE))
+    root = cache_dir("envs")
+    envs = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name != keep and _ready(path):
+            envs.append((os.path.getmtime(os.path.join(path, "env.json")), path))
+    envs.sort()
+    excess = len(envs) + 1 - size
+    cutoff = time.time() - ENV_MIN_IDLE_SEC
+    for used, path in envs[:max(0, excess)]:
+        if used < cutoff:
+            log.info("Evicting test environment %s", os.path.basename(path))
+            shutil.rmtree(path, ignore_errors=True)
+
+def provision(repo: str, configs: List[str]) -> Tuple[Optional[str], Optional[ToolRun]]:
+    # -> (interpreter, install run if an env had to be built); interpreter None = build failed
+    local = sandbox_python(repo)
+    if os.path.exists(local):
+        return local, None
+    spec = dependency_spec(repo, configs)
+    key = env_key(spec, base_python())
+    env_dir = os.path.join(cache_dir("envs"), key)
+    run = None
+    with _key_lock(key):
+        if _ready(env_dir):
+            log.info("Reusing test environment %s", key)
+        else:
+            log.info("Building test environment %s (%d requirements, %s)", key, len(spec["requirements"]),
+                     ", ".join(spec["files"]) or "no requirements files")
+            run = _build(repo, spec, env_dir)
+            log.info("INSTALL %s in %.1fs", run.status, run.duration_sec)
+        ok = _ready(env_dir)
+        if ok:
+            _touch(env_dir)
+    if ok:
+        evict(keep=key)
+    return (venv_python(env_dir) if ok else None), run
@@ -0,0 +1,263 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from se_assistant.tools import cache_dir, read_text, unified_diff
+from se_assistant.transaction import pre_image, snapshot_dir
+
+log = logging.getLogger(__name__)
+
+# Known fixes: normalized failure signature -> files + unified diff of a patch set that made
+# the suite green, with how often replaying it worked. Written by synthesis_agent on success,
+# read by file_selector_agent / patch_agent_llm before they ask a model.
+#
+# A signature is the set of tokens describing the failures (exception type, test name, crash
+# file, traceback files, message shingles with numbers/strings/addresses masked). Lookup is an
+# exact key match first, then MinHash + LSH banding (NUM_PERM hashes in BANDS bands) for
+# near-identical failures, e.g. the same bug on another branch with different line numbers.
+
+NUM_PERM = 64
+BANDS = 16                      # 4 rows per band: pairs with Jaccard ~0.5+ usually share a bucket
+MIN_SIMILARITY = 0.6
+MAX_FIXES = 5000                # oldest unused entries beyond this are dropped
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_MASKS = [
+    (re.compile(r"0x[0-9a-fA-F]+"), "<addr>"),
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "<str>"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "<num>"),
+]
+
+
+def kb_enabled() -> bool:
+    return os.environ.get("SE_ASSISTANT_FIX_KB", "1").lower() not in ("0", "false", "off", "no")
+
+
+class Signature(NamedTuple):
+    key: str                    # exact: same failures up to masked numbers/strings
+    tokens: Set[str]            # for MinHash similarity
+
+
+class KnownFix(NamedTuple):
+    id: int
+    files: List[str]
+    diff: str
+    similarity: float
+    successes: int
+    failures: int
+
+
+def _mask(text: str) -> str:
+    for pattern, repl in _MASKS:
+        text = pattern.sub(repl, text)
+    return " ".join(text.split())
+
+def _shingles(text: str, n: int = 3) -> Iterable[str]:
+    words = _mask(text).split()
+    return (" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1)))
+
+def failure_signature(failures: List[Dict[str, Any]]) -> Optional[Signature]:
+    # failures: ToolRun.failures_parsed (junit entries, or {"raw"} from the fallback parser)
+    tokens: Set[str] = set()
+    exact = set()
+    for f in failures:
+        if not f.get("nodeid"):
+            tokens.update(f"raw:{s}" for s in _shingles(f.get("raw", "")[-2000:]))
+            exact.add(_mask(f.get("raw", "")[-2000:]))
+            continue
+        test = f["nodeid"].split("::")[-1].split("[")[0]
+        message = _mask(f.get("message", ""))
+        tokens.update({f"exc:{f.get('exc_type')}", f"test:{test}", f"testfile:{f.get('test_file')}",
+                       f"crash:{f.get('file')}"})
+        tokens.update(f"frame:{fr['path']}" for fr in f.get("frames", []))
+        tokens.update(f"msg:{s}" for s in _shingles(message))
+        exact.add("|".join([str(f.get("exc_type")), test, str(f.get("file")), message]))
+    if not tokens:
+        return None
+    key = hashlib.sha256("\n".join(sorted(exact)).encode("utf-8")).hexdigest()
+    return Signature(key, tokens)
+
+def minhash(tokens: Set[str]) -> List[int]:
+    hashes = [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big") for t in tokens]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS]
+
+def _buckets(sig: List[int]) -> List[int]:
+    rows = NUM_PERM // BANDS
+    out = []
+    for band in range(BANDS):
+        blob = json.dumps(sig[band * rows:(band + 1) * rows]).encode("utf-8")
+        out.append(int.from_bytes(hashlib.blake2b(blob, digest_size=7).digest(), "big"))  # fits SQLite INTEGER
+    return out
+
+def similarity(a: List[int], b: List[int]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+class FixKB:
+    # SQLite like the response cache, so worker processes and later runs share it
+    def __init__(self, path: Optional[str] = None, max_fixes: int = MAX_FIXES):
+        self.path = path or os.path.join(cache_dir(), "fix_kb.sqlite")
+        self.max_fixes = max_fixes
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS fixes ("
+                " id INTEGER PRIMARY KEY, key TEXT NOT NULL, minhash TEXT NOT NULL, files TEXT NOT NULL,"
+                " diff TEXT NOT NULL, repo TEXT, successes INTEGER NOT NULL DEFAULT 1,"
+                " failures INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS fixes_key ON fixes(key)")
+            db.execute("CREATE TABLE IF NOT EXISTS bands (band INTEGER, bucket INTEGER, fix_id INTEGER)")
+            db.execute("CREATE INDEX IF NOT EXISTS bands_bucket ON bands(band, bucket)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def record(self, sig: Signature, files: List[str], diff: str, repo: Optional[str] = None) -> int:
+        # A fix that worked; the same diff for the same failures only bumps its success count
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute("SELECT id FROM fixes WHERE key = ? AND diff = ?", (sig.key, diff)).fetchone()
+            if row is not None:
+                db.execute("UPDATE fixes SET successes = successes + 1, last_used = ? WHERE id = ?", (now, row[0]))
+                return row[0]
+            mh = minhash(sig.tokens)
+            cur = db.execute(
+                "INSERT INTO fixes(key, minhash, files, diff, repo, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sig.key, json.dumps(mh), json.dumps(files), diff, repo, now, now),
+            )
+            fix_id = cur.lastrowid
+            db.executemany("INSERT INTO bands(band, bucket, fix_id) VALUES (?, ?, ?)",
+                           [(band, bucket, fix_id) for band, bucket in enumerate(_buckets(mh))])
+            self._evict(db)
+            return fix_id
+
+    def report(self, fix_id: int, ok: bool) -> None:
+        # outcome of replaying a known fix on another ticket
+        column = "successes" if ok else "failures"
+        with self._connect() as db:
+            db.execute(f"UPDATE fixes SET {column} = {column} + 1, last_used = ? WHERE id = ?", (time.time(), fix_id))
+
+    def lookup(self, sig: Signature, limit: int = 3, min_similarity: float = MIN_SIMILARITY) -> List[KnownFix]:
+        # Best matches first: similarity, then track record; fixes that failed more often than
+        # they worked are skipped
+        mh = minhash(sig.tokens)
+        with self._connect() as db:
+            ids = {r[0] for r in db.execute("SELECT id FROM fixes WHERE key = ?", (sig.key,))}
+            for band, bucket in enumerate(_buckets(mh)):
+                ids.update(r[0] for r in db.execute("SELECT fix_id FROM bands WHERE band = ? AND bucket = ?", (band, bucket)))
+            if not ids:
+                return []
+            marks = ",".join("?" * len(ids))
+            rows = db.execute(f"SELECT id, key, minhash, files, diff, successes, failures FROM fixes WHERE id IN ({marks})",
+                              list(ids)).fetchall()
+        out = []
+        for fix_id, key, other, files, diff, ok, bad in rows:
+            sim = 1.0 if key == sig.key else similarity(mh, json.loads(other))
+            if sim >= min_similarity and bad <= ok:
+                out.append(KnownFix(fix_id, json.loads(files), diff, sim, ok, bad))
+        out.sort(key=lambda f: (-f.similarity, f.failures - f.successes))
+        return out[:limit]
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        count = db.execute("SELECT COUNT(*) FROM fixes").fetchone()[0]
+        if count <= self.max_fixes:
+            return
+        old = [r[0] for r in db.execute("SELECT id FROM fixes ORDER BY last_used ASC LIMIT ?", (count - self.max_fixes,))]
+        db.executemany("DELETE FROM fixes WHERE id = ?", [(i,) for i in old])
+        db.executemany("DELETE FROM bands WHERE fix_id = ?", [(i,) for i in old])
+
+
+_default: Optional[FixKB] = None
+_default_lock = threading.Lock()
+
+def default_kb() -> FixKB:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = FixKB()
+        return _default
+
+
+# -- ticket helpers ---------------------------------------------------------------
+def _enabled(state: Any) -> bool:
+    return state.fix_kb and kb_enabled()
+
+def _last_test(state: Any):
+    return next((r for r in reversed(state.tool_runs) if r.run_type == "test"), None)
+
+def known_fixes(state: Any) -> List[KnownFix]:
+    # Known fixes for the current failures, best first, that this ticket has not tried yet and
+    # whose files exist in this repo
+    if not _enabled(state):
+        return []
+    last = _last_test(state)
+    if last is None or last.exit_code == 0 or not last.failures_parsed:
+        return []
+    sig = failure_signature(last.failures_parsed)
+    if sig is None:
+        return []
+    tried = {p.known_fix_id for p in state.patches if p.known_fix_id}
+    return [fix for fix in default_kb().lookup(sig, limit=5)
+            if fix.id not in tried and all(os.path.isfile(os.path.join(state.repo_ref, f)) for f in fix.files)]
+
+def next_known_fix(state: Any) -> Optional[KnownFix]:
+    return next(iter(known_fixes(state)), None)
+
+def _net_diff(state: Any, patches: List[Any]) -> str:
+    # one diff from the original files to the fixed ones (patches may edit the same file twice)
+    parts = []
+    for path in sorted({f for p in patches for f in p.files_touched}):
+        first = next(p for p in patches if path in p.files_touched)
+        old_path = pre_image(snapshot_dir(state.run_id, first.patch_id), path)
+        if old_path is not None and not os.path.exists(old_path):
+            return ""  # snapshot pruned
+        old = ""
+        if old_path is not None:
+            with open(old_path, "r", encoding="utf-8") as fp:
+                old = fp.read()
+        parts.append(unified_diff(old, read_text(state.repo_ref, path), path))
+    return "".join(parts)
+
+def record_outcome(state: Any) -> None:
+    # synthesis: report replayed fixes, and remember the patch set of a successful ticket
+    if not _enabled(state):
+        return
+    kb = default_kb()
+    for p in state.patches:
+        if p.known_fix_id:
+            kb.report(p.known_fix_id, ok=state.final_status == "success" and not p.reverted)
+    active = [p for p in state.patches if not p.reverted]
+    if state.final_status != "success" or not active or any(p.known_fix_id for p in active):
+        return
+    failures = state.baseline().get("failures")
+    if not failures:
+        # checkpoints from before baseline_ref: the run may still be in the (capped) history
+        baseline = next((r for r in state.tool_runs if r.run_type == "test" and r.patches_applied == 0
+                         and r.exit_code != 0 and r.failures_parsed), None)
+        failures = baseline.failures_parsed if baseline else None
+    sig = failure_signature(failures) if failures else None
+    diff = _net_diff(state, active)
+    if sig is None or not diff:
+        return
+    files = sorted({f for p in active for f in p.files_touched})
+    fix_id = kb.record(sig, files, diff, repo=os.path.basename(os.path.normpath(state.repo_ref)))
+    log.info("Recorded known fix #%d for %s", fix_id, ", ".join(files))
@@ -1,22 +1,36 @@
 from langgraph.graph import StateGraph, START, END
 from se_assistant.state import TicketState
+from se_assistant.checkpoint import default_checkpointer
+from se_assistant.trace import traced
 
 from se_assistant.nodes.repo_agent import repo_agent
 from se_assistant.nodes.issue_agent import issue_agent
-from se_assistant.nodes.test_agent import test_agent
-from se_assistant.nodes.file_selector_agent import file_selector_agent
-from se_assistant.nodes.patch_agent_llm import patch_agent_llm
+from se_assistant.nodes.test_agent import test_agent, atest_agent
+from se_assistant.nodes.code_agent import code_agent, acode_agent
+from se_assistant.nodes.file_selector_agent import file_selector_agent, afile_selector_agent
+from se_assistant.nodes.patch_agent_llm import patch_agent_llm, apatch_agent_llm
 from se_assistant.nodes.safety_agent import safety_agent
+from se_assistant.nodes.verify_agent import verify_agent
 from se_assistant.nodes.synthesis_agent import synthesis_agent
+from se_assistant.nodes.rollback_agent import rollback_agent, needs_rollback, find_rejected, static_retry
 
 def route_after_test(state: TicketState) -> str:
+    # No test environment could be provisioned (repo node) -> nothing to iterate on
+    if state.hitl.required:
+        state.final_status = "stopped_for_review"
+        return "synthesis"
+
     last_test = next((r for r in reversed(state.tool_runs) if r.run_type == "test"), None)
 
-    # If tests passed -> go to synthesis
-    if last_test and last_test.exit_code == 0:
+    # If the full suite passed -> go to synthesis (a green partial stage is not enough)
+    if last_test and last_test.exit_code == 0 and last_test.scope == "full":
         state.final_status = "success"  # IMPORTANT: use a canonical value
         return "synthesis"
 
+    # The last patch made things worse (or we are about to stop) -> restore snapshots first
+    if needs_rollback(state):
+        return "rollback"
+
     # Tests failed -> continue agent loop (unless HITL or max iters)
     if state.iteration.count >= state.iteration.max:
         state.hitl.required = True
@@ -24,42 +38,97 @@ def route_after_test(state: TicketState) -> str:
         state.final_status = "stopped_for_review"
         return "synthesis"
 
-    return "file_select"
+    return "localize"
 
 
+def route_after_patch(state: TicketState) -> str:
+    newest = state.patches[-1] if state.patches else None
+    if state.hitl.required or (newest and not newest.reverted and newest.iteration == state.iteration.count):
+        return "safety"
+    # Nothing was written this iteration: a test run would only repeat the last one
+    if state.iteration.count >= state.iteration.max:
+        return "rollback"  # stops for review (and keeps or reverts the earlier patches)
+    return "localize"
+
 def route_after_safety(state: TicketState) -> str:
     if state.hitl.required:
+        if needs_rollback(state):
+            return "rollback"
         state.final_status = "stopped_for_review"
         return "synthesis"
+    return "verify"
+
+def route_after_verify(state: TicketState) -> str:
+    # A patch that does not compile / lint / typecheck is undone without spending a test run
+    if find_rejected(state):
+        return "rollback"
     return "test"
 
-def build_graph():
+def route_after_rollback(state: TicketState) -> str:
+    if state.hitl.required:
+        state.final_status = "stopped_for_review"
+        return "synthesis"
+    if static_retry(state):
+        # same files, the diagnostics are in the next patch prompt
+        return "patch"
+    return "localize"
+
+def build_graph(async_nodes: bool = False, checkpointer=None):
+    # async_nodes=True registers the asyncio variants of the LLM/pytest nodes; drive the
+    # result with ainvoke/astream so many tickets can share one event loop.
+    # checkpointer: None = persistent SQLite checkpoints (see checkpoint.py), False = none.
+    # With checkpoints, invoke with checkpoint.thread_config(run_id) or use invoke_ticket().
     g = StateGraph(TicketState)
 
-    g.add_node("repo", repo_agent)
-    g.add_node("issue", issue_agent)
-    g.add_node("test", test_agent)
-    g.add_node("file_select", file_selector_agent)
-    g.add_node("patch", patch_agent_llm)
-    g.add_node("safety", safety_agent)
-    g.add_node("synthesis", synthesis_agent)
+    # every node runs inside a trace span (timings/tokens -> state.metrics and the trace file)
+
+    g.add_node("repo", traced("repo", repo_agent))
+    g.add_node("issue", traced("issue", issue_agent))
+    g.add_node("test", traced("test", atest_agent if async_nodes else test_agent))
+    g.add_node("localize", traced("localize", acode_agent if async_nodes else code_agent))
+    g.add_node("file_select", traced("file_select", afile_selector_agent if async_nodes else file_selector_agent))
+    g.add_node("patch", traced("patch", apatch_agent_llm if async_nodes else patch_agent_llm))
+    g.add_node("safety", traced("safety", safety_agent))
+    g.add_node("verify", traced("verify", verify_agent))
+    g.add_node("rollback", traced("rollback", rollback_agent))
+    g.add_node("synthesis", traced("synthesis", synthesis_agent))
 
     g.add_edge(START, "repo")
     g.add_edge("repo", "issue")
     g.add_edge("issue", "test")
 
     g.add_conditional_edges("test", route_after_test, {
-        "file_select": "file_select",
+        "localize": "localize",
+        "rollback": "rollback",
         "synthesis": "synthesis",
     })
 
+    g.add_edge("localize", "file_select")
     g.add_edge("file_select", "patch")
-    g.add_edge("patch", "safety")
+    g.add_conditional_edges("patch", route_after_patch, {
+        "safety": "safety",
+        "localize": "localize",
+        "rollback": "rollback",
+    })
 
     g.add_conditional_edges("safety", route_after_safety, {
+        "verify": "verify",
+        "rollback": "rollback",
+        "synthesis": "synthesis",
+    })
+
+    g.add_conditional_edges("verify", route_after_verify, {
         "test": "test",
+        "rollback": "rollback",
+    })
+
+    g.add_conditional_edges("rollback", route_after_rollback, {
+        "localize": "localize",
+        "patch": "patch",
         "synthesis": "synthesis",
     })
 
     g.add_edge("synthesis", END)
-    return g.compile()
\ No newline at end of file
+    if checkpointer is None:
+        checkpointer = default_checkpointer(async_nodes)
+    return g.compile(checkpointer=checkpointer or None)
\ No newline at end of file
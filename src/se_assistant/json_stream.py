@@ -0,0 +1,225 @@
+from __future__ import annotations
+from typing import Any, Dict, List
+
+# Incremental JSON validator for streamed model answers. feed() takes the text as it arrives
+# and raises SchemaViolation at the first character that cannot be the start of a document
+# matching the schema (prose before the JSON, a string where an object belongs, a missing
+# required key when the object closes), so a bad answer is dropped after a few tokens
+# instead of after the whole generation. Supports the subset pydantic emits for our models:
+# type (incl. integer), properties, required, additionalProperties: false, items,
+# minItems/maxItems, minimum/maximum, $ref/$defs and anyOf.
+
+_WS = " \t\r\n"
+_NUMBER_CHARS = "0123456789+-.eE"
+_LITERALS = {"t": ("true", "boolean"), "f": ("false", "boolean"), "n": ("null", "null")}
+
+
+class SchemaViolation(ValueError):
+    pass
+
+
+class StreamValidator:
+    def __init__(self, schema: Dict[str, Any]):
+        self.root = schema
+        self.stack: List[Dict[str, Any]] = []
+        self.mode = "value"
+        self.expect: Dict[str, Any] = schema
+        self.buf = ""        # number / literal being read
+        self.target = ""     # literal being matched ("true", ...)
+        self.escape = False
+        self.is_key = False
+        self.integer = False
+        self.number_schema: Dict[str, Any] = {}
+        self.pos = 0
+
+    # -- public -----------------------------------------------------------------
+    def feed(self, text: str) -> None:
+        for ch in text:
+            self._char(ch)
+            self.pos += 1
+
+    def close(self) -> None:
+        # end of stream: the document must be complete
+        if self.mode == "number":
+            self._end_number()
+        if self.mode != "end":
+            self._fail("answer ended before the JSON document was complete")
+
+    # -- helpers ----------------------------------------------------------------
+    def _fail(self, why: str) -> None:
+        raise SchemaViolation(f"{why} (at char {self.pos})")
+
+    def _resolve(self, schema: Dict[str, Any]) -> Dict[str, Any]:
+        while "$ref" in schema:
+            name = schema["$ref"].rsplit("/", 1)[-1]
+            schema = self.root.get("$defs", {}).get(name, {})
+        return schema
+
+    def _choose(self, schema: Dict[str, Any], kind: str) -> Dict[str, Any]:
+        # the (sub)schema that accepts a value of this kind, or SchemaViolation
+        schema = self._resolve(schema)
+        for alt in schema.get("anyOf") or schema.get("oneOf") or []:
+            try:
+                return self._choose(alt, kind)
+            except SchemaViolation:
+                continue
+        if "anyOf" in schema or "oneOf" in schema:
+            self._fail(f"{kind} matches none of the allowed types")
+        allowed = schema.get("type")
+        if allowed is None:
+            return schema
+        allowed = allowed if isinstance(allowed, list) else [allowed]
+        if kind in allowed or (kind == "number" and "integer" in allowed):
+            return schema
+        self._fail(f"expected {' or '.join(allowed)}, got {kind}")
+        return schema
+
+    # -- state machine ----------------------------------------------------------
+    def _char(self, ch: str) -> None:
+        mode = self.mode
+        if mode == "string":
+            self._string_char(ch)
+        elif mode == "number":
+            if ch in _NUMBER_CHARS:
+                if self.integer and ch in ".eE":
+                    self._fail("expected an integer")
+                self.buf += ch
+            else:
+                self._end_number()
+                self._char(ch)
+        elif mode == "literal":
+            self.buf += ch
+            if not self.target.startswith(self.buf):
+                self._fail(f"invalid literal {self.buf!r}")
+            if self.buf == self.target:
+                self._value_done()
+        elif ch in _WS:
+            return
+        elif mode == "value":
+            self._start_value(ch)
+        elif mode == "obj_key":
+            top = self.stack[-1]
+            if ch == '"':
+                self.mode, self.is_key, self.buf = "string", True, ""
+            elif ch == "}" and top["allow_end"]:
+                self._close_object()
+            else:
+                self._fail("expected an object key")
+        elif mode == "obj_colon":
+            if ch != ":":
+                self._fail("expected ':'")
+            self.mode = "value"
+        elif mode == "obj_next":
+            if ch == ",":
+                self.stack[-1]["allow_end"] = False
+                self.mode = "obj_key"
+            elif ch == "}":
+                self._close_object()
+            else:
+                self._fail("expected ',' or '}'")
+        elif mode == "arr_first":
+            if ch == "]":
+                self._close_array()
+            else:
+                self._array_item()
+                self._char(ch)
+        elif mode == "arr_next":
+            if ch == ",":
+                self._array_item()
+            elif ch == "]":
+                self._close_array()
+            else:
+                self._fail("expected ',' or ']'")
+        else:  # "end"
+            self._fail("unexpected text after the JSON document")
+
+    def _start_value(self, ch: str) -> None:
+        if ch == "{":
+            schema = self._choose(self.expect, "object")
+            self.stack.append({"kind": "object", "schema": schema, "keys": set(), "key": None, "allow_end": True})
+            self.mode = "obj_key"
+        elif ch == "[":
+            schema = self._choose(self.expect, "array")
+            self.stack.append({"kind": "array", "schema": schema, "count": 0})
+            self.mode = "arr_first"
+        elif ch == '"':
+            self._choose(self.expect, "string")
+            self.mode, self.is_key, self.buf = "string", False, ""
+        elif ch == "-" or ch.isdigit():
+            schema = self._choose(self.expect, "number")
+            types = schema.get("type")
+            self.integer = types == "integer" or types == ["integer"]
+            self.number_schema = schema
+            self.mode, self.buf = "number", ch
+        elif ch in _LITERALS:
+            word, kind = _LITERALS[ch]
+            self._choose(self.expect, kind)
+            self.mode, self.target, self.buf = "literal", word, ch
+        else:
+            self._fail(f"expected a JSON value, got {ch!r}")
+
+    def _string_char(self, ch: str) -> None:
+        if self.escape:
+            self.escape = False
+        elif ch == "\\":
+            self.escape = True
+        elif ch == '"':
+            if self.is_key:
+                self._key_done(self.buf)
+            else:
+                self._value_done()
+            return
+        if self.is_key:
+            self.buf += ch
+
+    def _key_done(self, key: str) -> None:
+        top = self.stack[-1]
+        props = top["schema"].get("properties", {})
+        if key not in props and top["schema"].get("additionalProperties") is False:
+            self._fail(f"unexpected key {key!r}")
+        top["key"] = key
+        top["keys"].add(key)
+        self.expect = props.get(key, {})
+        self.mode = "obj_colon"
+
+    def _end_number(self) -> None:
+        try:
+            value = float(self.buf)
+        except ValueError:
+            self._fail(f"invalid number {self.buf!r}")
+        schema = self.number_schema
+        if "minimum" in schema and value < schema["minimum"]:
+            self._fail(f"{self.buf} is below the minimum {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            self._fail(f"{self.buf} is above the maximum {schema['maximum']}")
+        self._value_done()
+
+    def _array_item(self) -> None:
+        top = self.stack[-1]
+        top["count"] += 1
+        if "maxItems" in top["schema"] and top["count"] > top["schema"]["maxItems"]:
+            self._fail(f"more than {top['schema']['maxItems']} items")
+        self.expect = top["schema"].get("items", {})
+        self.mode = "value"
+
+    def _close_object(self) -> None:
+        top = self.stack.pop()
+        missing = [k for k in top["schema"].get("required", []) if k not in top["keys"]]
+        if missing:
+            self._fail(f"missing required key(s) {missing}")
+        self._value_done()
+
+    def _close_array(self) -> None:
+        top = self.stack.pop()
+        if top["count"] < top["schema"].get("minItems", 0):
+            self._fail(f"fewer than {top['schema']['minItems']} items")
+        self._value_done()
+
+    def _value_done(self) -> None:
+        if not self.stack:
+            self.mode = "end"
+        elif self.stack[-1]["kind"] == "object":
+            self.mode = "obj_next"
+        else:
+            self.mode = "arr_next"
+
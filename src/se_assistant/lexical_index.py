@@ -0,0 +1,173 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+import builtins
+import hashlib
+import keyword
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from se_assistant.tools import cache_dir
+from se_assistant.repo_index import refresh_index
+
+log = logging.getLogger(__name__)
+
+# Inverted index over the words (identifiers, string literals, docstrings) of the repo's Python
+# sources, scored with BM25. Answers "which files define or mention these names?" for the
+# names in a failure's traceback and assertion message. One SQLite file per repo under
+# cache_dir("lexical_index"); files are re-tokenized only when their content hash changes.
+INDEX_VERSION = 1
+
+K1 = 1.2
+B = 0.75
+DEF_WEIGHT = 3.0                # a file defining a name outranks files that only use it
+MAX_QUERY_TERMS = 32
+MAX_DF_SHARE = 0.25             # terms in more files than this share say nothing; skipped
+
+_WORD_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_PART_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+")
+_PATH_RE = re.compile(r"[\w./\\-]+\.py(?::\d+)?")
+_DEF_RE = re.compile(r"^[ \t]*(?:async[ \t]+)?(?:def|class)[ \t]+(\w+)|^(\w+)[ \t]*(?::[^=\n]*)?=(?!=)", re.M)
+_STOP = ({k.lower() for k in keyword.kwlist}
+         | {b.lower() for b in dir(builtins) if not b[:1].isupper()}
+         | {"self", "cls", "args", "kwargs", "assert", "test", "tests", "the", "and", "for", "with",
+            "this", "that", "where", "not", "none", "true", "false"})
+
+
+@lru_cache(maxsize=1 << 16)
+def terms_of(word: str) -> Tuple[str, ...]:
+    # "parseHTTPDate" -> ("parsehttpdate", "parse", "http", "date"); "value_3" -> ("value_3",)
+    w = word.strip("_")
+    full = w.lower()
+    out = [full] if len(full) >= 3 and full not in _STOP else []
+    parts = [p.lower() for chunk in w.split("_") for p in _PART_RE.findall(chunk)]
+    if len(parts) > 1:
+        out += [p for p in parts if len(p) >= 3 and p not in _STOP and p != full]
+    return tuple(out)
+
+def _words(text: str) -> Iterable[str]:
+    return _WORD_RE.findall(_PATH_RE.sub(" ", text))
+
+def document_terms(source: str) -> Counter:
+    # One regex pass instead of an AST walk (several times faster on a first build): every
+    # word counts, including the ones in strings, docstrings and comments; definitions and
+    # module-level assignments count DEF_WEIGHT times
+    tf: Counter = Counter()
+    for word, n in Counter(_WORD_RE.findall(source)).items():
+        for t in terms_of(word):
+            tf[t] += n
+    for m in _DEF_RE.finditer(source):
+        for t in terms_of(m.group(1) or m.group(2)):
+            tf[t] += DEF_WEIGHT - 1
+    return tf
+
+def failure_terms(failures: List[Dict[str, Any]]) -> Dict[str, float]:
+    # Query from ToolRun.failures_parsed: the message and "E ..." lines count double, the
+    # rest of the traceback (test source lines) and the test name once
+    q: Counter = Counter()
+    for f in failures:
+        strong = [f.get("message") or "", f.get("exc_type") or ""]
+        weak = []
+        if f.get("nodeid"):
+            weak.append(f["nodeid"].split("::")[-1].split("[")[0])
+        for line in (f.get("raw") or "").splitlines():
+            (strong if line.lstrip().startswith("E ") else weak).append(line)
+        for text, weight in (("\n".join(strong), 2.0), ("\n".join(weak), 1.0)):
+            for w in _words(text):
+                for t in terms_of(w):
+                    q[t] += weight
+    return dict(q.most_common(MAX_QUERY_TERMS))
+
+
+class LexicalIndex:
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != str(INDEX_VERSION):
+                db.execute("DROP TABLE IF EXISTS files")
+                db.execute("DROP TABLE IF EXISTS postings")
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(INDEX_VERSION),))
+            db.execute("CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL,"
+                       " sha1 TEXT NOT NULL, length REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT, file_id INTEGER, tf REAL,"
+                       " PRIMARY KEY (term, file_id)) WITHOUT ROWID")
+            db.execute("CREATE INDEX IF NOT EXISTS postings_file ON postings(file_id)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA synchronous=NORMAL")  # a lost update is re-tokenized on the next refresh
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def update(self, repo_ref: str, files: Dict[str, Dict[str, Any]]) -> None:
+        # files: refresh_index() output; re-tokenize Python files whose hash changed
+        t0 = time.perf_counter()
+        wanted = {p: m["sha1"] for p, m in files.items() if m.get("language") == "python"}
+        with self._connect() as db:
+            known = {p: (i, sha) for i, p, sha in db.execute("SELECT id, path, sha1 FROM files")}
+            gone = [p for p in known if p not in wanted]
+            changed = [p for p, sha in wanted.items() if known.get(p, (0, None))[1] != sha]
+            stale = [(known[p][0],) for p in gone + changed if p in known]
+            db.executemany("DELETE FROM postings WHERE file_id = ?", stale)
+            db.executemany("DELETE FROM files WHERE id = ?", stale)
+            for p in changed:
+                try:
+                    with open(os.path.join(repo_ref, p), "r", encoding="utf-8", errors="replace") as fp:
+                        tf = document_terms(fp.read())
+                except OSError:
+                    continue
+                file_id = db.execute("INSERT INTO files(path, sha1, length) VALUES (?, ?, ?)",
+                                     (p, wanted[p], sum(tf.values()))).lastrowid
+                db.executemany("INSERT INTO postings VALUES (?, ?, ?)", [(t, file_id, n) for t, n in tf.items()])
+        if gone or changed:
+            log.info("Lexical index: %d files (%d tokenized, %d removed) in %.2fs",
+                     len(wanted), len(changed), len(gone), time.perf_counter() - t0)
+
+    def search(self, query: Dict[str, float], limit: int = 20) -> List[Tuple[str, float, List[str]]]:
+        # -> [(path, score, matched terms)] best first
+        scores: Dict[str, float] = {}
+        matched: Dict[str, List[str]] = {}
+        with self._connect() as db:
+            n, avgdl = db.execute("SELECT COUNT(*), AVG(length) FROM files").fetchone()
+            if not n:
+                return []
+            for term, weight in query.items():
+                df = db.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if not df or (df > MAX_DF_SHARE * n and n >= 20):
+                    continue
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for path, tf, length in db.execute(
+                        "SELECT f.path, p.tf, f.length FROM postings p JOIN files f ON f.id = p.file_id WHERE p.term = ?", (term,)):
+                    norm = tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / (avgdl or 1.0)))
+                    scores[path] = scores.get(path, 0.0) + weight * idf * norm
+                    matched.setdefault(path, []).append(term)
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:limit]
+        return [(p, round(s, 3), matched[p]) for p, s in ranked]
+
+
+def _index_file(repo_ref: str) -> str:
+    key = hashlib.sha1(os.path.abspath(repo_ref).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir("lexical_index"), f"{key}.sqlite")
+
+_lock = threading.Lock()
+
+def load_lexical_index(repo_ref: str, files: Optional[Dict[str, Dict[str, Any]]] = None) -> LexicalIndex:
+    files = refresh_index(repo_ref) if files is None else files
+    with _lock:
+        index = LexicalIndex(_index_file(repo_ref))
+        index.update(repo_ref, files)
+    return index
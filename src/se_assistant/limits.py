@@ -0,0 +1,76 @@
+from __future__ import annotations
+from typing import Any, Dict, Optional
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import threading
+
+# Process-wide concurrency limits per shared resource ("llm", "pytest", ...).
+# Unconfigured resources are unlimited, so single-ticket runs are unaffected.
+_limits: Dict[str, int] = {}
+_sync: Dict[str, Any] = {}
+_async: Dict[str, asyncio.Semaphore] = {}
+_lock = threading.Lock()
+
+
+def configure(**limits: Optional[int]) -> None:
+    # configure(llm=2, pytest=4); None or 0 removes a limit
+    with _lock:
+        for name, n in limits.items():
+            _sync.pop(name, None)
+            _async.pop(name, None)
+            if n:
+                _limits[name] = int(n)
+            else:
+                _limits.pop(name, None)
+
+def setdefault(name: str, n: Optional[int]) -> None:
+    # Limit a resource unless a limit was already configured or installed for it
+    with _lock:
+        if n and name not in _limits and name not in _sync:
+            _limits[name] = int(n)
+
+def install(semaphores: Dict[str, Any]) -> None:
+    # Use externally created semaphores (e.g. multiprocessing.Manager proxies shared by a process pool)
+    with _lock:
+        _sync.update(semaphores)
+
+def reset() -> None:
+    with _lock:
+        _limits.clear()
+        _sync.clear()
+        _async.clear()
+
+
+def _sync_sem(name: str):
+    with _lock:
+        if name not in _sync and name in _limits:
+            _sync[name] = threading.BoundedSemaphore(_limits[name])
+        return _sync.get(name)
+
+def _async_sem(name: str) -> Optional[asyncio.Semaphore]:
+    with _lock:
+        if name not in _async and name in _limits:
+            _async[name] = asyncio.Semaphore(_limits[name])
+        return _async.get(name)
+
+
+@contextmanager
+def slot(name: str):
+    sem = _sync_sem(name)
+    if sem is None:
+        yield
+        return
+    sem.acquire()
+    try:
+        yield
+    finally:
+        sem.release()
+
+@asynccontextmanager
+async def aslot(name: str):
+    sem = _async_sem(name)
+    if sem is None:
+        yield
+        return
+    async with sem:
+        yield
@@ -0,0 +1,405 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import weakref
+
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_ollama import ChatOllama
+
+from se_assistant import routing, trace
+from se_assistant.json_stream import SchemaViolation, StreamValidator
+from se_assistant.limits import slot, aslot
+from se_assistant.llm_cache import ResponseCache, cache_enabled, default_cache
+from se_assistant.context import DEFAULT_CONTEXT, MODEL_CONTEXT
+from se_assistant.routing import DEFAULT_MODEL, Tier
+
+log = logging.getLogger(__name__)
+
+# One client per (backend, model, temperature, format), reused across calls and tickets so HTTP
+# connections stay open. Async clients hold connections bound to an event loop, so they are
+# pooled per running loop (and dropped with it).
+_pool: Dict[tuple, Any] = {}
+_loop_pools: "weakref.WeakKeyDictionary[Any, Dict[tuple, Any]]" = weakref.WeakKeyDictionary()
+_pool_lock = threading.Lock()
+
+def _current_pool() -> Dict[tuple, Any]:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _pool
+    with _pool_lock:
+        return _loop_pools.setdefault(loop, {})
+
+def structured_enabled() -> bool:
+    # SE_ASSISTANT_STRUCTURED=0 turns off schema-constrained decoding (free-form JSON + repair)
+    return os.environ.get("SE_ASSISTANT_STRUCTURED", "1").lower() not in ("0", "false", "no")
+
+def chat_model(temperature: float = 0.0, model: str = DEFAULT_MODEL, backend: Optional[str] = None,
+               format: Optional[Dict[str, Any]] = None):
+    # format: a JSON schema Ollama constrains decoding to (the answer can only be a matching document)
+    b = routing.backend(backend)
+    key = (b.base_url, model, temperature, json.dumps(format, sort_keys=True) if format else None)
+    pool = _current_pool()
+    with _pool_lock:
+        client = pool.get(key)
+        if client is None:
+            client = pool[key] = ChatOllama(model=model, base_url=b.base_url, temperature=temperature,
+                                            num_ctx=MODEL_CONTEXT.get(model, DEFAULT_CONTEXT),
+                                            client_kwargs={"timeout": b.timeout}, format=format)
+    return client
+
+# Model attributes that change the answer; everything else (client, callbacks, timeout) does not
+_KEY_PARAMS = (
+    "model", "temperature", "top_p", "top_k", "seed", "num_ctx", "num_predict",
+    "repeat_penalty", "mirostat", "mirostat_eta", "mirostat_tau", "stop", "format",
+)
+
+# Run-to-run noise in tool output that must not change the key: pytest timings, object addresses
+_VOLATILE = [
+    (re.compile(r"\bin \d+(?:\.\d+)?s\b"), "in <t>s"),
+    (re.compile(r"\b0x[0-9a-fA-F]{6,}\b"), "0x<addr>"),
+]
+
+def _normalize(text: Any) -> Any:
+    if not isinstance(text, str):
+        return text
+    for pattern, repl in _VOLATILE:
+        text = pattern.sub(repl, text)
+    return text
+
+
+def cache_key(model: Any, messages: List[Any]) -> str:
+    params = {k: getattr(model, k, None) for k in _KEY_PARAMS}
+    params["class"] = type(model).__name__
+    body = {
+        "params": params,
+        "messages": [(getattr(m, "type", ""), _normalize(m.content)) for m in messages],
+    }
+    blob = json.dumps(body, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _chars(messages: List[Any]) -> int:
+    return sum(len(m.content) for m in messages if isinstance(m.content, str))
+
+
+class InvalidAnswer(ValueError):
+    # The model answered but parse() rejected it; raw is kept for JSON repair. aborted: the
+    # stream was cut at a schema violation, so raw is only a prefix and not worth repairing
+    def __init__(self, raw: str, error: Exception, aborted: bool = False):
+        super().__init__(f"{type(error).__name__}: {error}")
+        self.raw = raw
+        self.aborted = aborted
+
+
+class CachedLLM:
+    # One node's view of a chat model: renders the prompt, answers from the response cache
+    # when the exact same (model, params, messages) was seen before, otherwise calls the model
+    # inside the shared "llm" slot and its backend's slot. Hits/misses are counted per node.
+    # With a schema the answer is streamed through a StreamValidator and the call is abandoned
+    # at the first token that cannot lead to a matching document.
+    def __init__(self, node: str, model: Any, enabled: bool = True, cache: Optional[ResponseCache] = None,
+                 backend_slot: str = "llm:" + routing.DEFAULT_BACKEND, schema: Optional[Dict[str, Any]] = None):
+        self.node = node
+        self.model = model
+        self.backend_slot = backend_slot
+        self.schema = schema
+        self.enabled = enabled and cache_enabled()
+        self.cache = cache if cache is not None else (default_cache() if self.enabled else None)
+        self.hits = 0
+        self.misses = 0
+        self.calls = 0
+        self.aborted = 0
+
+    def _lookup(self, messages: List[Any]):
+        if not self.enabled:
+            return None, None
+        key = cache_key(self.model, messages)
+        content = self.cache.get(key)
+        if content is not None:
+            self.hits += 1
+            return key, AIMessage(content=content)
+        self.misses += 1
+        return key, None
+
+    def _finish(self, key: Optional[str], msg: Any, parse: Optional[Callable[[str], Any]],
+                check: Optional[Callable[[Any], Any]]):
+        # Only responses the caller could use are cached, so a rejected answer is never replayed.
+        # A parse error means a malformed answer (InvalidAnswer); check errors (it parsed, but the
+        # caller rejects it: disallowed path, edit that does not apply) propagate unchanged
+        try:
+            out = parse(msg.content) if parse else msg
+        except Exception as e:
+            raise InvalidAnswer(msg.content if isinstance(msg.content, str) else "", e) from e
+        if check:
+            check(out)
+        if key is not None and isinstance(msg.content, str):
+            self.cache.put(key, msg.content)
+        return out
+
+    def _replay(self, hit: Any, parse: Optional[Callable[[str], Any]], check: Optional[Callable[[Any], Any]]):
+        out = parse(hit.content) if parse else hit
+        if check:
+            check(out)  # the repo may have changed since the answer was cached
+        return out
+
+    def _feed(self, validator: StreamValidator, acc: Any, chunk: Any) -> Any:
+        acc = chunk if acc is None else acc + chunk
+        if isinstance(chunk.content, str):
+            validator.feed(chunk.content)
+        return acc
+
+    def _stream(self, messages: List[Any], t0: float):
+        # -> (message so far, seconds to first chunk, SchemaViolation or None)
+        validator, acc, ttft = StreamValidator(self.schema), None, None
+        stream = self.model.stream(messages)
+        try:
+            for chunk in stream:
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+                acc = self._feed(validator, acc, chunk)
+            validator.close()
+        except SchemaViolation as e:
+            return acc or AIMessage(content=""), ttft, e
+        finally:
+            stream.close()  # stops reading the HTTP response, so Ollama stops generating
+        return acc or AIMessage(content=""), ttft, None
+
+    async def _astream(self, messages: List[Any], t0: float):
+        validator, acc, ttft = StreamValidator(self.schema), None, None
+        stream = self.model.astream(messages)
+        try:
+            async for chunk in stream:
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+                acc = self._feed(validator, acc, chunk)
+            validator.close()
+        except SchemaViolation as e:
+            return acc or AIMessage(content=""), ttft, e
+        finally:
+            await stream.aclose()
+        return acc or AIMessage(content=""), ttft, None
+
+    def _abort(self, msg: Any, violation: SchemaViolation) -> InvalidAnswer:
+        self.aborted += 1
+        log.info("[%s] answer stream aborted: %s", self.node, violation)
+        return InvalidAnswer(msg.content if isinstance(msg.content, str) else "", violation, aborted=True)
+
+    def invoke(self, prompt: ChatPromptTemplate, payload: dict, parse: Optional[Callable[[str], Any]] = None,
+               check: Optional[Callable[[Any], Any]] = None):
+        messages = prompt.format_messages(**payload)
+        key, hit = self._lookup(messages)
+        if hit is not None:
+            return self._replay(hit, parse, check)
+        self.calls += 1
+        ttft = violation = None
+        with slot("llm"), slot(self.backend_slot):
+            started, t0 = time.time(), time.perf_counter()
+            if self.schema is None:
+                msg = self.model.invoke(messages)
+            else:
+                msg, ttft, violation = self._stream(messages, t0)
+        trace.record_llm(started, time.perf_counter() - t0, msg, _chars(messages), ttft)
+        if violation is not None:
+            raise self._abort(msg, violation)
+        return self._finish(key, msg, parse, check)
+
+    async def ainvoke(self, prompt: ChatPromptTemplate, payload: dict, parse: Optional[Callable[[str], Any]] = None,
+                      check: Optional[Callable[[Any], Any]] = None):
+        messages = prompt.format_messages(**payload)
+        key, hit = self._lookup(messages)
+        if hit is not None:
+            return self._replay(hit, parse, check)
+        self.calls += 1
+        ttft = violation = None
+        async with aslot("llm"), aslot(self.backend_slot):
+            started, t0 = time.time(), time.perf_counter()
+            if self.schema is None:
+                msg = await self.model.ainvoke(messages)
+            else:
+                msg, ttft, violation = await self._astream(messages, t0)
+        trace.record_llm(started, time.perf_counter() - t0, msg, _chars(messages), ttft)
+        if violation is not None:
+            raise self._abort(msg, violation)
+        return self._finish(key, msg, parse, check)
+
+    def metrics(self) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        if self.enabled:
+            out.update({f"llm_cache.{self.node}.hit": self.hits, f"llm_cache.{self.node}.miss": self.misses})
+        if self.aborted:
+            out[f"llm_route.{self.node}.stream_aborts"] = self.aborted
+        return out
+
+
+def node_llm(state: Any, node: str, temperature: float = 0.0, tier: Optional[Tier] = None,
+             schema: Optional[Dict[str, Any]] = None) -> CachedLLM:
+    # tier: a rung of routing.route(node); default the first one. schema: JSON schema of the
+    # answer, used for constrained decoding + streaming validation unless SE_ASSISTANT_STRUCTURED=0
+    tier = tier or routing.route(node)[0]
+    schema = schema if structured_enabled() else None
+    # sampled (temperature > 0) answers are not cached: every call should draw a fresh one
+    return CachedLLM(node, chat_model(temperature, tier.model, tier.backend.name, format=schema),
+                     enabled=state.llm_cache and temperature == 0, backend_slot=tier.backend.slot, schema=schema)
+
+
+JSON_REPAIR_PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+     "You repair malformed JSON. Return ONLY the corrected JSON value: same keys and content, "
+     "valid syntax, no markdown fences, no commentary."),
+    ("human", "{raw}"),
+])
+# Answers longer than this are regenerated rather than sent to the small repair model
+MAX_REPAIR_CHARS = 12000
+
+
+class ModelLadder:
+    # Walks routing.route(node): a tier's answer is used when it parses (directly or after the
+    # json_repair route fixed its syntax) and accept(answer) holds; otherwise the next tier gets
+    # the same prompt. Unavailable models are marked and skipped. The last tier's parsed answer
+    # is returned even if not accepted. check(answer) may raise to reject an answer outright: the
+    # error propagates to the caller and that answer is not cached. A ladder lives for one node run; every model call after
+    # its first (JSON repair, escalation, the caller's reminder retry) is counted as a retry.
+    def __init__(self, state: Any, node: str, temperature: float = 0.0, schema: Optional[Dict[str, Any]] = None):
+        self.state = state
+        self.node = node
+        self.temperature = temperature
+        self.schema = schema
+        self.tiers = routing.route(node)
+        self.meters: List[Any] = []
+        self.escalations = 0
+        self.repaired = 0
+
+    def _rungs(self, start: int):
+        # -> (is last tier, tier); every answer above tier 0 counts as an escalation
+        for i in range(min(start, len(self.tiers) - 1), len(self.tiers)):
+            if i > 0:
+                self.escalations += 1
+            yield i == len(self.tiers) - 1, self.tiers[i]
+
+    def _llm(self, tier: Tier, node: Optional[str] = None) -> CachedLLM:
+        llm = node_llm(self.state, node or self.node, self.temperature if node is None else 0.0, tier, self.schema)
+        self.meters.append(llm)
+        return llm
+
+    def invoke(self, prompt: ChatPromptTemplate, payload: dict, parse: Callable[[str], Any],
+               accept: Optional[Callable[[Any], bool]] = None, start: int = 0,
+               check: Optional[Callable[[Any], Any]] = None):
+        error: Optional[Exception] = None
+        for last, tier in self._rungs(start):
+            try:
+                out = self._llm(tier).invoke(prompt, payload, parse=parse, check=check)
+            except InvalidAnswer as e:
+                out = None if e.aborted else self.repair(e, parse, check)
+                if out is None:
+                    error = e
+                    continue
+            except Exception as e:
+                if not routing.is_unavailable_error(e):
+                    raise
+                routing.mark_unavailable(tier, e)
+                error = e
+                continue
+            if last or accept is None or accept(out):
+                return out
+            log.info("[%s] %s answer not accepted; escalating", self.node, tier.model)
+        raise error or RuntimeError(f"no model answered for {self.node}")
+
+    async def ainvoke(self, prompt: ChatPromptTemplate, payload: dict, parse: Callable[[str], Any],
+                      accept: Optional[Callable[[Any], bool]] = None, start: int = 0,
+                      check: Optional[Callable[[Any], Any]] = None):
+        error: Optional[Exception] = None
+        for last, tier in self._rungs(start):
+            try:
+                out = await self._llm(tier).ainvoke(prompt, payload, parse=parse, check=check)
+            except InvalidAnswer as e:
+                out = None if e.aborted else await self.arepair(e, parse, check)
+                if out is None:
+                    error = e
+                    continue
+            except Exception as e:
+                if not routing.is_unavailable_error(e):
+                    raise
+                routing.mark_unavailable(tier, e)
+                error = e
+                continue
+            if last or accept is None or accept(out):
+                return out
+            log.info("[%s] %s answer not accepted; escalating", self.node, tier.model)
+        raise error or RuntimeError(f"no model answered for {self.node}")
+
+    def repair(self, bad: InvalidAnswer, parse: Callable[[str], Any], check: Optional[Callable[[Any], Any]] = None):
+        if not bad.raw.strip() or len(bad.raw) > MAX_REPAIR_CHARS:
+            return None
+        rejected: List[Exception] = []
+        try:
+            out = self._llm(routing.route("json_repair")[0], "json_repair").invoke(
+                JSON_REPAIR_PROMPT, {"raw": bad.raw}, parse=parse, check=_recording(check, rejected))
+        except Exception as e:
+            if rejected:
+                raise  # repaired fine, but the caller rejects the content: same as a direct answer
+            log.info("[%s] JSON repair failed: %s", self.node, e)
+            return None
+        self.repaired += 1
+        return out
+
+    async def arepair(self, bad: InvalidAnswer, parse: Callable[[str], Any], check: Optional[Callable[[Any], Any]] = None):
+        if not bad.raw.strip() or len(bad.raw) > MAX_REPAIR_CHARS:
+            return None
+        rejected: List[Exception] = []
+        try:
+            out = await self._llm(routing.route("json_repair")[0], "json_repair").ainvoke(
+                JSON_REPAIR_PROMPT, {"raw": bad.raw}, parse=parse, check=_recording(check, rejected))
+        except Exception as e:
+            if rejected:
+                raise  # repaired fine, but the caller rejects the content: same as a direct answer
+            log.info("[%s] JSON repair failed: %s", self.node, e)
+            return None
+        self.repaired += 1
+        return out
+
+    def metrics(self) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        for m in self.meters:
+            for k, v in m.metrics().items():
+                out[k] = out.get(k, 0) + v
+        calls = sum(m.calls for m in self.meters)
+        if calls:
+            out[f"llm_route.{self.node}.calls"] = calls
+            out[f"llm_route.{self.node}.retries"] = calls - 1
+        if self.escalations:
+            out[f"llm_route.{self.node}.escalations"] = self.escalations
+        if self.repaired:
+            out[f"llm_route.{self.node}.json_repaired"] = self.repaired
+        return out
+
+def _recording(check: Optional[Callable[[Any], Any]], errors: List[Exception]) -> Optional[Callable[[Any], Any]]:
+    # check, remembering what it raised (tells a rejected answer from a failed call)
+    if check is None:
+        return None
+
+    def run(out: Any) -> Any:
+        try:
+            return check(out)
+        except Exception as e:
+            errors.append(e)
+            raise
+    return run
+
+def with_metrics(state: Any, update: Dict[str, Any], meters: List[Any]) -> Dict[str, Any]:
+    # Fold the counters of everything a node used (CachedLLM, ContextPacker, ...) into state.metrics
+    merged = dict(state.metrics)
+    for m in meters:
+        for k, v in m.metrics().items():
+            merged[k] = merged.get(k, 0) + v
+    if merged == state.metrics:
+        return update
+    return {**update, "metrics": merged}
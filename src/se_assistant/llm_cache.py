@@ -0,0 +1,94 @@
+from __future__ import annotations
+from typing import Optional
+from contextlib import contextmanager
+import os
+import sqlite3
+import threading
+import time
+
+from se_assistant.tools import cache_dir
+
+DEFAULT_MAX_BYTES = int(float(os.environ.get("SE_ASSISTANT_LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+DEFAULT_TTL_SEC = float(os.environ.get("SE_ASSISTANT_LLM_CACHE_TTL_DAYS", "7")) * 86400
+
+
+def cache_enabled() -> bool:
+    return os.environ.get("SE_ASSISTANT_LLM_CACHE", "1").lower() not in ("0", "false", "off", "no")
+
+
+class ResponseCache:
+    # Content-addressed LLM response store: key -> response text.
+    # SQLite so several worker processes can share one file; LRU by last access, bounded by
+    # total response bytes, entries older than ttl_sec are treated as misses.
+    def __init__(self, path: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES, ttl_sec: float = DEFAULT_TTL_SEC):
+        self.path = path or os.path.join(cache_dir(), "llm_cache.sqlite")
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_access)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:  # commit / rollback
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute("SELECT content, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl_sec and now - row[1] > self.ttl_sec:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key: str, content: str) -> None:
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses(key, content, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now, now),
+            )
+            self._evict(db, now)
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        if self.ttl_sec:
+            db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_sec,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under 90% of the budget
+        target = int(self.max_bytes * 0.9)
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall():
+            if total <= target:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self) -> None:
+        with self._connect() as db:
+            db.execute("DELETE FROM responses")
+
+
+_default: Optional[ResponseCache] = None
+_default_lock = threading.Lock()
+
+def default_cache() -> ResponseCache:
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ResponseCache()
+        return _default
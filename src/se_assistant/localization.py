@@ -0,0 +1,133 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Tuple
+from collections import Counter
+import json
+import math
+import os
+
+from se_assistant.state import CodeLocation, Hypothesis
+from se_assistant.code_index import definition_spans
+from se_assistant.tools import read_text, shell_join
+
+# Spectrum-based fault localization. pytest_coverage.py records the lines of repo sources each
+# test executes; a line run by many failing and few passing tests is suspicious:
+#   ochiai     ef / sqrt(F * (ef + ep))
+#   tarantula  (ef / F) / (ef / F + ep / P)
+# (ef / ep: failing / passing tests executing the line, F / P: all failing / passing tests).
+#
+# Spectra are kept per test node id, with the content hash of every file the test executed.
+# Later iterations re-run only the failing tests without a spectrum and the tests that
+# executed a file that changed since (a patch, or a rollback of one).
+
+COVERAGE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytest_coverage.py")
+MAX_RERUN_IDS = 100             # beyond this, re-run whole test files instead of node ids
+MAX_HYPOTHESES = 3
+MAX_SUSPICIOUS_LINES = 50
+TIMEOUT_FACTOR = 3              # line tracing slows a test run down
+
+
+def tests_to_run(spectra: Dict[str, Any], failing: List[str], shas: Dict[str, str]) -> List[str]:
+    # pytest args: first time the failing tests' files (their passing neighbours are the
+    # best contrast), afterwards only failing tests without a spectrum and stale spectra
+    if not spectra:
+        return sorted({n.split("::", 1)[0] for n in failing})
+    ids = [n for n in failing if n not in spectra]
+    ids += [n for n, t in spectra.items()
+            if n not in ids and any(shas.get(p) != sha for p, sha in t["shas"].items())]
+    if len(ids) > MAX_RERUN_IDS:
+        return sorted({n.split("::", 1)[0] for n in ids})
+    return ids
+
+def coverage_cmd(python: str, out_path: str, args: List[str]) -> str:
+    return shell_join([python, COVERAGE_SCRIPT, out_path, "-q", "-p", "no:cacheprovider", *args])
+
+def merge_coverage(spectra: Dict[str, Any], out_path: str, shas: Dict[str, str]) -> int:
+    # Fold one pytest_coverage.py report into the spectra; -> tests recorded (0: no report)
+    try:
+        with open(out_path, "r", encoding="utf-8") as fp:
+            report = json.load(fp)
+    except (OSError, ValueError):
+        return 0
+    files = report["files"]
+    for nodeid, t in report["tests"].items():
+        lines = {files[int(i)]: ln for i, ln in t["lines"].items()}
+        spectra[nodeid] = {"outcome": t["outcome"], "lines": lines, "shas": {p: shas.get(p) for p in lines}}
+    return len(report["tests"])
+
+
+def suspiciousness(spectra: Dict[str, Any], formula: str = "ochiai") -> Dict[Tuple[str, int], Tuple[float, int, int]]:
+    # -> {(path, line): (score, ef, ep)} for the lines at least one failing test executed
+    failed = [t for t in spectra.values() if t["outcome"] == "failed"]
+    passed = [t for t in spectra.values() if t["outcome"] == "passed"]
+    if not failed:
+        return {}
+    ef: Counter = Counter((p, ln) for t in failed for p, lines in t["lines"].items() for ln in lines)
+    ep: Counter = Counter((p, ln) for t in passed for p, lines in t["lines"].items() for ln in lines
+                          if (p, ln) in ef)
+    n_f, n_p = len(failed), len(passed)
+    out = {}
+    for key, f in ef.items():
+        p = ep[key]
+        if formula == "tarantula":
+            score = (f / n_f) / (f / n_f + (p / n_p if n_p else 0.0))
+        else:
+            score = f / math.sqrt(n_f * (f + p))
+        out[key] = (round(score, 3), f, p)
+    return out
+
+def _runs(lines: List[int]) -> List[Tuple[int, int]]:
+    out: List[List[int]] = []
+    for ln in sorted(lines):
+        if out and ln <= out[-1][1] + 2:
+            out[-1][1] = ln
+        else:
+            out.append([ln, ln])
+    return [(a, b) for a, b in out]
+
+def hypotheses(repo_ref: str, spectra: Dict[str, Any], formula: str = "ochiai", limit: int = MAX_HYPOTHESES) -> List[Hypothesis]:
+    # One hypothesis per suspicious definition, best first; its locations are the runs of its
+    # top-scoring lines
+    scores = suspiciousness(spectra, formula)
+    n_f = sum(t["outcome"] == "failed" for t in spectra.values())
+    n_p = sum(t["outcome"] == "passed" for t in spectra.values())
+    groups: Dict[Tuple[str, str], Dict[int, Tuple[float, int, int]]] = {}
+    spans: Dict[str, List[Tuple[int, int, str]]] = {}
+    for (path, line), s in scores.items():
+        if path not in spans:
+            try:
+                spans[path] = definition_spans(read_text(repo_ref, path))
+            except (OSError, UnicodeDecodeError):
+                spans[path] = []
+        name = next((n for a, b, n in spans[path] if a <= line <= b), "<module>")
+        groups.setdefault((path, name), {})[line] = s
+
+    ranked = sorted(groups.items(), key=lambda g: (-max(s[0] for s in g[1].values()), g[0]))
+    out = []
+    for rank, ((path, name), lines) in enumerate(ranked[:limit], 1):
+        best = max(s[0] for s in lines.values())
+        top = [ln for ln, s in lines.items() if s[0] == best]
+        _, f, p = lines[top[0]]
+        reason = f"{formula} {best:.2f}: run by {f}/{n_f} failing and {p}/{n_p} passing tests"
+        locs = [CodeLocation(path=path, start_line=a, end_line=b, reason=reason) for a, b in _runs(top)]
+        where = ", ".join(f"{a}-{b}" if a != b else str(a) for a, b in _runs(top))
+        out.append(Hypothesis(
+            id=f"sbfl-{rank}",
+            summary=f"Fault in `{name}` ({path}:{where}): executed by the failing tests, rarely by passing ones",
+            locations=locs,
+            confidence=best,
+        ))
+    return out
+
+def suspicious_lines(spectra: Dict[str, Any], paths: List[str], formula: str = "ochiai",
+                     limit: int = MAX_SUSPICIOUS_LINES) -> List[Tuple[str, int, float]]:
+    # -> [(path, line, score)] in the given files, most suspicious first
+    wanted = set(paths)
+    scores = suspiciousness(spectra, formula)
+    ranked = sorted(((p, ln, s[0]) for (p, ln), s in scores.items() if p in wanted), key=lambda x: (-x[2], x[0], x[1]))
+    return ranked[:limit]
+
+def coverage_score(spectra: Dict[str, Any], failing: List[str]) -> float:
+    # Share of the failing tests whose spectrum executed any repo source line
+    if not failing:
+        return 0.0
+    return sum(bool(spectra.get(n, {}).get("lines")) for n in failing) / len(failing)
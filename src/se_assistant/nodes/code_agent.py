@@ -1,31 +1,111 @@
 from __future__ import annotations
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+import asyncio
+import logging
+import os
+import tempfile
 import uuid
-from se_assistant.state import TicketState, Hypothesis, CodeLocation
+from se_assistant.state import TicketState, ToolRun
+from se_assistant.tools import run_cmd, arun_cmd, tail
+from se_assistant.envs import python_for, test_env
+from se_assistant.repo_index import refresh_index
+from se_assistant.code_index import load_code_index, rank_files, decisive
+from se_assistant.artifacts import get_json, put_json, put_text
+from se_assistant.limits import slot, aslot
+from se_assistant.localization import (
+    coverage_cmd, coverage_score, hypotheses, merge_coverage, tests_to_run, TIMEOUT_FACTOR,
+)
+
+log = logging.getLogger(__name__)
+
+
+def _last_test(state: TicketState):
+    return next((r for r in reversed(state.tool_runs) if r.run_type == "test"), None)
+
+def _plan(state: TicketState) -> Optional[Dict[str, Any]]:
+    # What to trace this time, or None when localization has nothing to add
+    if state.localization == "off":
+        return None
+    last = _last_test(state)
+    if not last or last.exit_code == 0 or not last.failed_tests:
+        return None
+    ranked = rank_files(load_code_index(state.repo_ref), last.failures_parsed)
+    if decisive(ranked) and any("frame" in w for w in ranked[0][2]):
+        # the traceback already points into one source file; file selection needs no spectra
+        log.info("Localization skipped: traceback frames point at %s", ranked[0][0])
+        return None
+    spectra = get_json(state.coverage_ref, {})
+    shas = {p: m["sha1"] for p, m in refresh_index(state.repo_ref).items() if m.get("language") == "python"}
+    return {"spectra": spectra, "shas": shas, "failing": last.failed_tests,
+            "args": tests_to_run(spectra, last.failed_tests, shas)}
+
+def _coverage_run(state: TicketState, plan: Dict[str, Any], cmd: str, res: Dict[str, Any], out_path: str) -> ToolRun:
+    try:
+        recorded = merge_coverage(plan["spectra"], out_path, plan["shas"])
+    finally:
+        for p in (out_path, out_path + ".tmp"):
+            if os.path.exists(p):
+                os.remove(p)
+    log.info("COVERAGE %d test(s) traced, exit_code=%s in %.2fs", recorded, res["exit_code"], res["duration_sec"])
+    return ToolRun(
+        run_id=str(uuid.uuid4())[:8],
+        run_type="coverage",
+        command=cmd,
+        scope="affected",
+        # red tests are expected here; the run failed only if it produced no spectra
+        status=res["status"] if res["status"] == "timeout" or not recorded else "success",
+        exit_code=res["exit_code"],
+        duration_sec=res["duration_sec"],
+        stdout_ref=put_text(tail(res["stdout"])),
+        stderr_ref=put_text(tail(res["stderr"])),
+        patches_applied=sum(not p.reverted for p in state.patches),
+    )
+
+def _result(state: TicketState, plan: Dict[str, Any], run: Optional[ToolRun]) -> Dict[str, Any]:
+    spectra = plan["spectra"]
+    hyps = hypotheses(state.repo_ref, spectra, state.localization)
+    for h in hyps:
+        log.info("Hypothesis %s (%.2f): %s", h.id, h.confidence, h.summary)
+    update: Dict[str, Any] = {
+        "coverage_ref": put_json(spectra),
+        "hypotheses": hyps,
+        "code_locations": [loc for h in hyps for loc in h.locations],
+        "quality": state.quality.model_copy(update={"coverage_score": round(coverage_score(spectra, plan["failing"]), 3)}),
+    }
+    if run is not None:
+        update["tool_runs"] = [run]
+    return update
+
+def _out_path() -> str:
+    fd, path = tempfile.mkstemp(prefix="se_cov_", suffix=".json")
+    os.close(fd)
+    return path
+
 
 def code_agent(state: TicketState) -> Dict[str, Any]:
-    last = state.tool_runs[-1] if state.tool_runs else None
-    hyp = None
-
-    if last and last.status == "fail":
-        joined = (last.stderr_tail or "") + "\n" + (last.stdout_tail or "")
-        if "test_apply_discount_rounds_up" in joined or "apply_discount" in joined:
-            loc = CodeLocation(
-                path="src/sandbox/pricing.py",
-                start_line=1,
-                end_line=999,
-                reason="Failing test suggests rounding/truncation in apply_discount."
-            )
-            hyp = Hypothesis(
-                id=str(uuid.uuid4())[:8],
-                summary="apply_discount truncates instead of rounding; use round(x, 2).",
-                locations=[loc],
-                confidence=0.75
-            )
-
-    if hyp:
-        return {
-            "hypotheses": state.hypotheses + [hyp],
-            "code_locations": state.code_locations + hyp.locations
-        }
-    return {}
+    # Spectrum-based localization (localization.py): ranked Hypothesis / CodeLocation objects
+    # for file selection and the patch prompt
+    plan = _plan(state)
+    if plan is None:
+        return {}
+    run = None
+    if plan["args"]:
+        out_path = _out_path()
+        cmd = coverage_cmd(python_for(state), out_path, plan["args"])
+        with slot("pytest"):
+            res = run_cmd(state.repo_ref, cmd, timeout_sec=state.timeout_sec * TIMEOUT_FACTOR, env=test_env(state))
+        run = _coverage_run(state, plan, cmd, res, out_path)
+    return _result(state, plan, run)
+
+async def acode_agent(state: TicketState) -> Dict[str, Any]:
+    plan = await asyncio.to_thread(_plan, state)
+    if plan is None:
+        return {}
+    run = None
+    if plan["args"]:
+        out_path = _out_path()
+        cmd = coverage_cmd(python_for(state), out_path, plan["args"])
+        async with aslot("pytest"):
+            res = await arun_cmd(state.repo_ref, cmd, timeout_sec=state.timeout_sec * TIMEOUT_FACTOR, env=test_env(state))
+        run = _coverage_run(state, plan, cmd, res, out_path)
+    return await asyncio.to_thread(_result, state, plan, run)
@@ -1,10 +1,29 @@
 from __future__ import annotations
 from typing import List
 from pydantic import BaseModel, Field, conlist
+import asyncio
 import json
-from langchain_ollama import ChatOllama
+import logging
 from langchain_core.prompts import ChatPromptTemplate
 from se_assistant.state import TicketState
+from se_assistant.pytest_results import format_failures
+from se_assistant.llm import ModelLadder, structured_enabled, with_metrics
+from se_assistant.routing import context_model
+from se_assistant.context import ContextPacker, context_budget, join_text
+from se_assistant.code_index import load_code_index, rank_files, decisive, is_test_file
+from se_assistant.lexical_index import load_lexical_index, failure_terms
+from se_assistant.fix_kb import KnownFix, next_known_fix
+
+log = logging.getLogger(__name__)
+
+# A selection less confident than this is re-asked one model up the file_select route
+MIN_CONFIDENCE = 0.5
+# Candidate paths shown to the model
+MAX_CANDIDATES = 20
+# Score the best identifier-search hit adds: above a test import (0.5), below a traceback frame (2+)
+LEXICAL_WEIGHT = 1.0
+# Score a coverage-localized definition adds, times its suspiciousness (see nodes/code_agent.py)
+SBFL_WEIGHT = 2.0
 
 class FileSelectionOut(BaseModel):
     files: conlist(str, min_length=1, max_length=5) = Field(
@@ -13,6 +32,9 @@ class FileSelectionOut(BaseModel):
     confidence: float = Field(ge=0.0, le=1.0)
     rationale: str
 
+# Sent to Ollama as the answer format, so the model can only emit a matching document
+SELECTION_SCHEMA = FileSelectionOut.model_json_schema()
+
 def _allowed(p: str) -> bool:
     low = p.lower()
     low = p.lower().replace("\\", "/")
@@ -41,71 +63,145 @@ def extract_json(text: str) -> str:
         return text[start:end+1]
     return text
 
-def file_selector_agent(state: TicketState) -> dict:
-    last_test = next((r for r in reversed(state.tool_runs) if r.run_type == "test"), None)
-    pytest_out = ""
-    if last_test:
-        pytest_out = (last_test.stderr_tail or "") + "\n" + (last_test.stdout_tail or "")
+PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+        "You are a build-fixing assistant. "
+        "Given pytest output and a repository file list, select the smallest set of files "
+        "most likely related to the failure.\n"
+        "Rules:\n"
+        "- DO NOT select test files under tests/.\n"
+        "- DO NOT select sensitive files (paths containing security, secret, token, auth, .env).\n"
+        "- DO NOT select documentation files (README, *.md).\n"
+        "- Prefer source files under src/.\n"
+        "- Return ONLY valid JSON matching this schema:\n"
+        "{{"
+        "\"files\": [\"path1\", \"path2\"], "
+        "\"confidence\": 0.0, "
+        "\"rationale\": \"...\""
+        "}}\n"
+    ),
+    ("human",
+     "PYTEST OUTPUT:\n{pytest_out}\n\n"
+     "RANKED CANDIDATES (tracebacks, test imports and identifier search; score, evidence):\n{candidates}\n\n"
+     "REPO FILES (paths):\n{repo_files}\n"
+    )
+])
+
+def _last_test(state: TicketState):
+    return next((r for r in reversed(state.tool_runs) if r.run_type == "test"), None)
+
+def _ranked_candidates(state: TicketState) -> list:
+    last_test = _last_test(state)
+    if not last_test or not last_test.failures_parsed:
+        return []
+    index = load_code_index(state.repo_ref)
+    ranked = _with_hypotheses(rank_files(index, last_test.failures_parsed), state)
+    return [r for r in ranked if _allowed(r[0])]
+
+def _with_hypotheses(ranked: list, state: TicketState) -> list:
+    # Spectrum-based localization: the file of each suspicious definition gains up to
+    # SBFL_WEIGHT, so a single clear suspect can make the ranking decisive
+    scores = {p: (s, list(why)) for p, s, why in ranked}
+    seen = set()
+    for h in sorted(state.hypotheses, key=lambda h: -h.confidence):
+        if not h.locations or h.locations[0].path in seen:
+            continue
+        loc = h.locations[0]
+        seen.add(loc.path)
+        score, why = scores.get(loc.path, (0.0, []))
+        scores[loc.path] = (score + SBFL_WEIGHT * h.confidence, why + [f"suspicious {loc.path}:{loc.start_line}-{loc.end_line} ({loc.reason})"])
+    return sorted(((p, round(s, 3), why) for p, (s, why) in scores.items()), key=lambda x: (-x[1], x[0]))
+
+def _shortlist(state: TicketState, ranked: list) -> list:
+    # Static ranking merged with the files defining or mentioning the names in the failures
+    # (BM25 over identifiers, lexical_index.py): breaks ties between test imports and adds
+    # files no traceback points at
+    last_test = _last_test(state)
+    query = failure_terms(last_test.failures_parsed) if last_test else {}
+    hits = load_lexical_index(state.repo_ref).search(query, limit=3 * MAX_CANDIDATES) if query else []
+    hits = [h for h in hits if _allowed(h[0]) and not is_test_file(h[0])]
+    if not hits:
+        return ranked[:MAX_CANDIDATES]
+    scores = {p: (score, list(why)) for p, score, why in ranked}
+    top = hits[0][1]
+    for p, bm25, terms in hits:
+        score, why = scores.get(p, (0.0, []))
+        scores[p] = (score + LEXICAL_WEIGHT * bm25 / top, why + [f"mentions {', '.join(terms[:5])} (bm25={bm25:.1f})"])
+    merged = sorted(((p, round(s, 3), why) for p, (s, why) in scores.items()), key=lambda x: (-x[1], x[0]))
+    return merged[:MAX_CANDIDATES]
+
+def _selection_payload(state: TicketState, shortlist: list, packer: ContextPacker) -> dict:
+    last_test = _last_test(state)
+    if last_test and any(f.get("nodeid") for f in last_test.failures_parsed):
+        # exact node id / file:line / exception per failure, straight from the junit report
+        for i, f in enumerate(last_test.failures_parsed):
+            text = format_failures([f], max_items=1, max_chars=4000)
+            packer.add("pytest_out", packer.clip(text), score=max(5.0, 9.0 - 0.5 * i), order=(i,))
+    elif last_test:
+        packer.add("pytest_out", packer.clip(last_test.stderr_text() + "\n" + last_test.stdout_text()), score=9.0)
 
-    # Build a compact repo file list (paths only)
-    repo_files = [f["path"] for f in state.repo_map.files] if state.repo_map and state.repo_map.files else []
+    for i, (p, score, why) in enumerate(shortlist):
+        packer.add("candidates", f"{p} (score={score:.2f}; {'; '.join(why[:3])})", score=8.0 - 0.1 * i, order=(i,))
+
+    # Compact repo file list (paths only), only when there is no shortlist to go by
+    repo_files = [f["path"] for f in state.repo_map.files()] if state.repo_map and not shortlist else []
     repo_files = [p for p in repo_files if p.lower().replace("\\","/").startswith("src/")]
+    for i, p in enumerate(repo_files):
+        packer.add("repo_files", p, score=2.0, order=(i,))
 
-    model = ChatOllama(model="qwen2.5:7b", temperature=0.0, timeout=60)
-
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system",
-            "You are a build-fixing assistant. "
-            "Given pytest output and a repository file list, select the smallest set of files "
-            "most likely related to the failure.\n"
-            "Rules:\n"
-            "- DO NOT select test files under tests/.\n"
-            "- DO NOT select sensitive files (paths containing security, secret, token, auth, .env).\n"
-            "- DO NOT select documentation files (README, *.md).\n"
-            "- Prefer source files under src/.\n"
-            "- Return ONLY valid JSON matching this schema:\n"
-            "{{"
-            "\"files\": [\"path1\", \"path2\"], "
-            "\"confidence\": 0.0, "
-            "\"rationale\": \"...\""
-            "}}\n"
-        ),
-        ("human",
-         "PYTEST OUTPUT:\n{pytest_out}\n\n"
-         "REPO FILES (paths):\n{repo_files}\n"
-        )
-    ])
-
-    msg = (prompt | model).invoke({
-        "pytest_out": pytest_out[:6000],
-        "repo_files": "\n".join(repo_files[:2000])  # cap to avoid huge prompt
-    })
-
-    raw = msg.content.strip()
-    obj = None
-    for attempt in range(2):
-        try:
-            json_text = extract_json(raw)
-            obj = json.loads(json_text)
-            out = FileSelectionOut.model_validate(obj)
-            break
-        except Exception:
-            if attempt == 0:
-                # retry once with stricter instruction
-                msg = (prompt | model).invoke({
-                    "pytest_out": pytest_out[:6000] + "\n\nREMINDER: output JSON only.",
-                    "repo_files": "\n".join(repo_files[:2000])
-                })
-                raw = msg.content.strip()
-                continue
-            state.hitl.required = True
-            state.hitl.reason = "LLM file selection returned invalid JSON."
-            state.final_status = "stopped_for_review"
-            return {}
-        
+    chosen = packer.pack()
+    return {
+        "pytest_out": join_text(chosen.get("pytest_out", [])),
+        "candidates": join_text(chosen.get("candidates", []), sep="\n") or "(none)",
+        "repo_files": join_text(chosen.get("repo_files", []), sep="\n") or "(omitted: see candidates)",
+    }
+
+def _packer(state: TicketState) -> ContextPacker:
+    packer = ContextPacker("file_select", context_budget(context_model("file_select"), "file_select", state.context_tokens))
+    packer.fixed("".join(m.content for m in PROMPT.format_messages(pytest_out="", candidates="", repo_files="")))
+    return packer
+
+def _parse_selection(raw: str) -> FileSelectionOut:
+    json_text = extract_json(raw.strip())
+    obj = json.loads(json_text)
+    return FileSelectionOut.model_validate(obj)
+
+def _stricter(payload: dict) -> dict:
+    # retry once with stricter instruction
+    return {**payload, "pytest_out": payload["pytest_out"] + "\n\nREMINDER: output JSON only."}
+
+def _attempts() -> int:
+    # With constrained decoding a "JSON only" reminder cannot help; the ladder's escalation is the retry
+    return 1 if structured_enabled() else 2
+
+def _confident(out: FileSelectionOut) -> bool:
+    return out.confidence >= MIN_CONFIDENCE
+
+def _invalid_json(state: TicketState) -> dict:
+    state.hitl.required = True
+    state.hitl.reason = "LLM file selection returned invalid JSON."
+    state.final_status = "stopped_for_review"
+    return {}
+
+def _deterministic_selection(ranked: list) -> FileSelectionOut:
+    path, score, why = ranked[0]
+    from_frames = any("frame" in w for w in why)
+    return FileSelectionOut(
+        files=[path],
+        confidence=0.9 if from_frames else 0.7,
+        rationale=f"deterministic (static index): {'; '.join(why[:3])}",
+    )
+
+def _known_selection(fix: KnownFix) -> FileSelectionOut:
+    return FileSelectionOut(
+        files=fix.files[:5],
+        confidence=round(fix.similarity, 2),
+        rationale=f"known fix #{fix.id} (worked {fix.successes}x for similar failures, similarity {fix.similarity:.2f})",
+    )
+
+def _selection_result(state: TicketState, out: FileSelectionOut) -> dict:
     files = [p for p in out.files if _allowed(p)]
-    print(f"LLM selected files: {out.files} with confidence {out.confidence:.2f}. Allowed files after filtering: {files}")
+    log.info("Selected files: %s with confidence %.2f. Allowed files after filtering: %s", out.files, out.confidence, files)
     if not files:
         state.hitl.required = True
         state.hitl.reason = f"No files selected or all selected files were disallowed by rules. Rationale: {out.rationale}"
@@ -113,7 +209,56 @@ def file_selector_agent(state: TicketState) -> dict:
         return {}
 
     return {
-        "open_questions": state.open_questions + [f"File selection: {out.rationale} (conf={out.confidence:.2f})"],
+        "open_questions": [f"File selection: {out.rationale} (conf={out.confidence:.2f})"],
         # store selected files in state for next node
         "selected_files": out.files,
+        # each trip through file_select starts one repair iteration
+        "iteration": state.iteration.model_copy(update={"count": state.iteration.count + 1, "last_route": "file_select"}),
     }
+
+
+def file_selector_agent(state: TicketState) -> dict:
+    known = next_known_fix(state)
+    if known:
+        return _selection_result(state, _known_selection(known))
+    ranked = _ranked_candidates(state)
+    if decisive(ranked):
+        return _selection_result(state, _deterministic_selection(ranked))
+    shortlist = _shortlist(state, ranked)
+    ladder = ModelLadder(state, "file_select", schema=SELECTION_SCHEMA)
+    packer = _packer(state)
+    payload = _selection_payload(state, shortlist, packer)
+    attempts = _attempts()
+    for attempt in range(attempts):
+        try:
+            # the stricter retry starts one model up the route
+            out = ladder.invoke(PROMPT, payload, parse=_parse_selection, accept=_confident, start=attempt)
+        except Exception:
+            if attempt + 1 < attempts:
+                payload = _stricter(payload)
+                continue
+            return with_metrics(state, _invalid_json(state), [ladder, packer])
+        return with_metrics(state, _selection_result(state, out), [ladder, packer])
+
+async def afile_selector_agent(state: TicketState) -> dict:
+    known = await asyncio.to_thread(next_known_fix, state)
+    if known:
+        return _selection_result(state, _known_selection(known))
+    ranked = await asyncio.to_thread(_ranked_candidates, state)
+    if decisive(ranked):
+        return _selection_result(state, _deterministic_selection(ranked))
+    shortlist = await asyncio.to_thread(_shortlist, state, ranked)
+    ladder = ModelLadder(state, "file_select", schema=SELECTION_SCHEMA)
+    packer = _packer(state)
+    payload = _selection_payload(state, shortlist, packer)
+    attempts = _attempts()
+    for attempt in range(attempts):
+        try:
+            # the stricter retry starts one model up the route
+            out = await ladder.ainvoke(PROMPT, payload, parse=_parse_selection, accept=_confident, start=attempt)
+        except Exception:
+            if attempt + 1 < attempts:
+                payload = _stricter(payload)
+                continue
+            return with_metrics(state, _invalid_json(state), [ladder, packer])
+        return with_metrics(state, _selection_result(state, out), [ladder, packer])
@@ -4,5 +4,4 @@ from se_assistant.state import TicketState
 
 def issue_agent(state: TicketState) -> Dict[str, Any]:
     # For sandbox MVP, assume pytest exists and is the verification signal.
-    state.assumptions.append("Use pytest -q as the primary verification command.")
-    return {}
+    return {"assumptions": ["Use pytest -q as the primary verification command."]}
@@ -1,14 +1,19 @@
 from __future__ import annotations
 from typing import Dict, Any
+import logging
 import uuid
 from se_assistant.state import TicketState, Patch
-from se_assistant.tools import read_text, write_text, unified_diff
+from se_assistant.tools import read_text, unified_diff
+from se_assistant.artifacts import put_text
+from se_assistant.transaction import apply_files, snapshot_dir
+
+log = logging.getLogger(__name__)
 
 def patch_agent(state: TicketState) -> Dict[str, Any]:
     # MVP: implement the known fix for sandbox pricing.py
     target = "src/sandbox/pricing.py"
     old = read_text(state.repo_ref, target)
-    print(f"Current content of {target}:\n{old}\n---\n")
+    log.debug("Current content of %s:\n%s\n---", target, old)
     if "int(discounted * 100" not in old:
         # Nothing to patch (or already fixed)
         return {}
@@ -21,14 +26,15 @@ def patch_agent(state: TicketState) -> Dict[str, Any]:
     diff = unified_diff(old, new, target)
 
     # Apply
-    write_text(state.repo_ref, target, new)
+    patch_id = str(uuid.uuid4())[:8]
+    apply_files(state.repo_ref, snapshot_dir(state.run_id, patch_id), {target: new})
 
     p = Patch(
-        patch_id=str(uuid.uuid4())[:8],
+        patch_id=patch_id,
         summary="Fix rounding bug in apply_discount by using round(..., 2) instead of truncation.",
-        diff_unified=diff,
+        diff_ref=put_text(diff),
         files_touched=[target],
         confidence=0.8
     )
 
-    return {"patches": state.patches + [p]}
+    return {"patches": [p]}
@@ -1,13 +1,33 @@
 from __future__ import annotations
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import logging
 import uuid
 import json
 
-from langchain_ollama import ChatOllama
 from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field
 
 from se_assistant.state import TicketState, Patch
-from se_assistant.tools import read_text, write_text, unified_diff
+from se_assistant.tools import read_text, unified_diff
+from se_assistant.envs import python_for
+from se_assistant.workspace import clone_tree, apply_files, remove_tree, pythonpath_env
+from se_assistant.pytest_shards import run_pytest_processes
+from se_assistant.pytest_results import format_failures
+from se_assistant.limits import slot, aslot
+from se_assistant.llm import CachedLLM, InvalidAnswer, ModelLadder, node_llm, structured_enabled, with_metrics
+from se_assistant.routing import context_model
+from se_assistant.code_index import load_code_index
+from se_assistant.context import ContextPacker, add_source, context_budget, join_text, render_sources
+from se_assistant.edits import EditConflict, apply_edits, parse_unified_diff
+from se_assistant.transaction import apply_files as apply_transaction, snapshot_dir
+from se_assistant.artifacts import get_json, put_text
+from se_assistant.localization import suspicious_lines
+from se_assistant.fix_kb import known_fixes
+
+log = logging.getLogger(__name__)
 
 
 # Keep it strict for the sandbox (you can relax later)
@@ -15,6 +35,23 @@ ALLOWED_PREFIXES = ("src/sandbox/", "src\\sandbox\\")
 DISALLOWED_SUBSTR = ("tests/", "tests\\", "readme", ".md", ".rst", ".txt")
 SENSITIVE_SUBSTR = ("security", "secret", "token", "auth", ".env")
 
+# Diff text shown per rolled-back attempt in the patch prompt
+REVERTED_DIFF_CHARS = 1200
+
+
+class EditOut(BaseModel):
+    path: str
+    start_line: int = Field(ge=1)
+    search: str
+    replace: str
+
+class PatchOut(BaseModel):
+    edits: List[EditOut]
+
+# The answer format of PROMPT, sent to Ollama for constrained decoding. The diff / legacy
+# "updates" protocols are still parsed when structured output is off.
+PATCH_SCHEMA = PatchOut.model_json_schema()
+
 def _norm(p: str) -> str:
     return p.replace("\\", "/")
 
@@ -33,9 +70,18 @@ def _strip_code_fences(s: str) -> str:
     return s
 
 
-def _invoke_llm_json(model: ChatOllama, prompt: ChatPromptTemplate, payload: dict) -> dict:
-    msg = (prompt | model).invoke(payload)
-    raw = msg.content.strip()
+def _invoke_llm_json(llm: CachedLLM, prompt: ChatPromptTemplate, payload: dict, check=None) -> dict:
+    return llm.invoke(prompt, payload, parse=_loads_llm_json, check=check)
+
+async def _ainvoke_llm_json(llm: CachedLLM, prompt: ChatPromptTemplate, payload: dict, check=None) -> dict:
+    return await llm.ainvoke(prompt, payload, parse=_loads_llm_json, check=check)
+
+def _checker(state: TicketState):
+    # Full validation before an answer is cached: a patch we would reject is never replayed
+    return lambda obj: _validated_updates(state, obj)
+
+def _loads_llm_json(content: str) -> dict:
+    raw = content.strip()
 
     # Some models wrap JSON in extra text; try to extract first {...}
     if not raw.startswith("{"):
@@ -60,14 +106,22 @@ def _extract_test_paths(pytest_text: str) -> List[str]:
             out.append(p)
     return out[:2]  # cap
 
-def _compact_failures(text:str, max_chars: int=2500) -> str:
-    t = text.strip()
+_SECTION_RE = re.compile(r"^_{3,} .+ _{3,}$")
 
-    marker = 'FAILURES'
-    i = t.find(marker) 
-    if i != -1: 
-        t = t[i:] 
-    return t[:max_chars]
+def _failure_sections(text: str) -> List[str]:
+    # pytest's FAILURES section split per test ("____ test_x ____" headers)
+    t = text.strip()
+    i = t.find("FAILURES")
+    if i == -1:
+        return [t] if t else []
+    sections: List[List[str]] = []
+    for line in t[i:].splitlines()[1:]:
+        if "short test summary info" in line:
+            break
+        if _SECTION_RE.match(line.strip()) or not sections:
+            sections.append([])
+        sections[-1].append(line)
+    return ["\n".join(sec).strip() for sec in sections if "".join(sec).strip()]
 
 def _best_pytest_text(last_test) -> str:
     if not last_test:
@@ -77,41 +131,115 @@ def _best_pytest_text(last_test) -> str:
     stdout = (getattr(last_test, "stdout", "") or "").strip()
     stderr = (getattr(last_test, "stderr", "") or "").strip()
     if not (stdout or stderr):
-        stdout = (getattr(last_test, "stdout_tail", "") or "").strip()
-        stderr = (getattr(last_test, "stderr_tail", "") or "").strip()
+        stdout = last_test.stdout_text().strip()
+        stderr = last_test.stderr_text().strip()
 
     return (stdout + "\n" + stderr).strip()
 
 
-def _format_failures_parsed(last_test, max_items: int = 12, max_chars: int = 2200) -> str:
+def _failing_test_paths(last_test) -> List[str]:
     items = getattr(last_test, "failures_parsed", None) or []
-    chunks = []
-    for it in items[:max_items]:
-        raw = (it.get("raw") if isinstance(it, dict) else str(it)) or ""
-        raw = raw.strip()
-        if raw:
-            chunks.append(raw)
-    text = "\n\n---\n\n".join(chunks).strip()
-    return text[:max_chars]
-
-
-def patch_agent_llm(state: TicketState) -> Dict[str, Any]:
-    if state.hitl.required:
-        return {}
+    seen, out = set(), []
+    for it in items:
+        tp = it.get("test_file") if isinstance(it, dict) else None
+        if tp and tp not in seen:
+            seen.add(tp)
+            out.append(tp)
+    return out
+
+
+def _pack_context(state: TicketState, last_test, pytest_text: str, targets: List[str], packer: ContextPacker) -> Dict[str, str]:
+    # Failures, read-only tests and sources as scored units; the packer keeps what fits the budget
+    index = load_code_index(state.repo_ref)
+    failures = (last_test.failures_parsed if last_test else None) or []
+    frame_lines: Dict[str, set] = {}
+    names: set = set()
+    for f in failures:
+        for fr in f.get("frames") or []:
+            path = index.repo_path(fr["path"])
+            if path:
+                frame_lines.setdefault(path, set()).add(fr["line"])
+        test = index.repo_path(f.get("test_file") or "")
+        if test in index.entries:
+            names.update(n.rsplit(".", 1)[-1] for n in index.entries[test]["imports"])
+    test_names = {n.split("::")[-1].split("[")[0] for n in (last_test.failed_tests if last_test else [])}
+    # definitions the coverage localization blames count like traceback hits
+    for h in state.hypotheses:
+        for loc in h.locations:
+            frame_lines.setdefault(loc.path, set()).update(range(loc.start_line, loc.end_line + 1))
+
+    for i, sec in enumerate(_failure_sections(pytest_text)):
+        packer.add("failures_compact", packer.clip(sec), score=max(3.0, 8.0 - 0.5 * i), order=(i,))
+    for i, f in enumerate(failures):
+        text = format_failures([f], max_items=1, max_chars=4000, with_raw=False)
+        packer.add("failures_parsed", text, score=max(5.0, 9.0 - 0.5 * i), order=(i,))
+
+    test_paths = _failing_test_paths(last_test) or _extract_test_paths(pytest_text)
+    for rank, tp in enumerate(test_paths):
+        try:
+            source = read_text(state.repo_ref, tp)
+        except FileNotFoundError:
+            continue
+        add_source(packer, "tests", _norm(tp), source, rank, lines=frame_lines.get(_norm(tp), ()), names=test_names,
+                   hit_score=7.0, name_score=7.0, header_score=3.5, base_score=0.3)
 
-    model = ChatOllama(model="qwen2.5:7b", temperature=0.0, timeout=60)
+    sources: Dict[str, str] = {}
+    for rank, path in enumerate(targets):
+        try:
+            source = sources[path] = read_text(state.repo_ref, path)
+        except FileNotFoundError:
+            continue
+        add_source(packer, "files", path, source, rank, lines=frame_lines.get(path, ()), names=names)
+
+    spectra = get_json(state.coverage_ref, {}) if state.localization != "off" else {}
+    for i, (path, line, score) in enumerate(suspicious_lines(spectra, list(sources), state.localization)):
+        src_lines = sources[path].splitlines()
+        code = src_lines[line - 1].strip() if line <= len(src_lines) else ""
+        packer.add("suspicious", f"{path}:{line} ({score:.2f}) {code}", score=8.5 - 0.01 * i, order=(i,))
+
+    chosen = packer.pack()
+    return {
+        "failures_compact": join_text(chosen.get("failures_compact", [])),
+        "failures_parsed": join_text(chosen.get("failures_parsed", []), sep="\n\n---\n\n") or "(none)",
+        "suspicious": join_text(chosen.get("suspicious", []), sep="\n") or "(no coverage data)",
+        "tests": render_sources(chosen.get("tests", []), title="READ-ONLY TEST: "),
+        "files": render_sources(chosen.get("files", [])),
+    }
 
 
+PROMPT = ChatPromptTemplate.from_messages([
+    ("system",
+    "You fix failing pytest tests by editing source files.\n"
+    "STRICT RULES:\n"
+    "- Only modify the provided SOURCE files.\n"
+    "- Tests are READ-ONLY.\n"
+    "- Do NOT modify tests/ or documentation files.\n"
+    "- Make the smallest possible change (minimal diff).\n"
+    "- Output MUST be valid JSON ONLY.\n"
+    "- Return ONLY JSON with top-level key 'edits' (a list). Do NOT return whole files.\n"
+    "- Each edit: {{\"path\": string, \"start_line\": int, \"search\": string, \"replace\": string}}.\n"
+    "- search: a few complete lines copied VERBATIM from the source (same indentation), enough to be unique;\n"
+    "  start_line: the line number where search begins (see the '--- lines a-b ---' markers).\n"
+    "- replace: the new text for exactly those lines.\n"
+    "- If no change:{{\"edits\": []}}.\n"
+    ),
+    ("human",
+    "TASK:\n{task}\n\n"
+    "RUN INFO:\n{run_info}\n\n"
+    "PYTEST FAILURES (FAILURES SECTION):\n{failures_compact}\n\n"
+    "PYTEST FAILURES (PARSED KEY LINES):\n{failures_parsed}\n\n"
+    "READ-ONLY TESTS:\n{tests}\n\n"
+    "SUSPICIOUS LINES (run by the failing tests, rarely by passing ones; path:line (score) code):\n{suspicious}\n\n"
+    "SOURCE FILES (you may modify only these):\n{files}\n"
+    )
+])
+
+def _patch_request(state: TicketState, meters: List[Any]) -> Optional[Tuple[ChatPromptTemplate, dict]]:
+    # Prompt + payload for the patch LLM, or None when HITL had to be raised
     last_test = next((r for r in reversed(state.tool_runs) if r.run_type == "test"), None)
 
     pytest_text = _best_pytest_text(last_test)
-    print("DEBUG pytest_text length:", len(pytest_text))
-
-    # The big compact chunk (FAILURES section)
-    failures_compact = _compact_failures(pytest_text, max_chars=2500)
-
-    # Even cleaner signal: the parsed failures (often includes assert lines)
-    failures_parsed = _format_failures_parsed(last_test)
+    log.debug("pytest_text length: %d", len(pytest_text))
 
     run_info = ""
     if last_test:
@@ -119,22 +247,19 @@ def patch_agent_llm(state: TicketState) -> Dict[str, Any]:
             f"COMMAND: {last_test.command}\n"
             f"STATUS: {last_test.status}\n"
             f"EXIT_CODE: {last_test.exit_code}\n"
-            f"DURATION_SEC: {getattr(last_test, 'duration_sec', '')}\n"
         )
-    test_paths = _extract_test_paths(pytest_text)
-    test_blocks = []
-    for tp in test_paths:
-        try:
-            test_blocks.append(f"=== READ-ONLY TEST: {tp} ===\n{read_text(state.repo_ref, tp)}\n")
-        except FileNotFoundError:
-            pass
+    for p in state.patches:
+        if p.reverted:
+            # attempts that were rolled back (made tests worse, failed static checks); don't repeat them
+            run_info += (f"REVERTED ATTEMPT ({p.revert_reason or 'made tests worse'}):\n"
+                         f"{p.diff_text().strip()[:REVERTED_DIFF_CHARS]}\n")
 
     targets = state.selected_files or []
     if not targets:
         state.hitl.required = True
         state.hitl.reason = "No files selected for patching."
         state.final_status = "stopped_for_review"
-        return {}
+        return None
 
     # Enforce allowed paths at runtime (never trust the model)
     targets = [p for p in targets if _is_allowed_path(p)]
@@ -142,110 +267,330 @@ def patch_agent_llm(state: TicketState) -> Dict[str, Any]:
         state.hitl.required = True
         state.hitl.reason = "Selected files were not allowed (tests/docs/sensitive)."
         state.final_status = "stopped_for_review"
+        return None
+
+    packer = ContextPacker("patch", context_budget(context_model("patch"), "patch", state.context_tokens))
+    meters.append(packer)
+    empty = dict.fromkeys(["failures_compact", "failures_parsed", "tests", "suspicious", "files"], "")
+    packer.fixed("".join(m.content for m in PROMPT.format_messages(task=state.task_prompt, run_info=run_info, **empty)))
+    sections = _pack_context(state, last_test, pytest_text, targets, packer)
+
+    log.info("Invoking LLM for patch generation...")
+    log.debug("TASK: %s\nFAILURE CONTEXT:\n%s\nPARSED FAILURES:\n%s\nREAD-ONLY TESTS:\n%s\nSOURCE FILES:\n%s",
+              state.task_prompt, sections["failures_compact"], sections["failures_parsed"], sections["tests"], sections["files"])
+    payload = {"task": state.task_prompt, "run_info": run_info, **sections}
+
+    return PROMPT, payload
+
+
+def patch_agent_llm(state: TicketState) -> Dict[str, Any]:
+    meters: List[Any] = []
+    return with_metrics(state, _patch_agent(state, meters), meters)
+
+async def apatch_agent_llm(state: TicketState) -> Dict[str, Any]:
+    meters: List[Any] = []
+    return with_metrics(state, await _apatch_agent(state, meters), meters)
+
+
+def _patch_agent(state: TicketState, meters: List[Any]) -> Dict[str, Any]:
+    if state.hitl.required:
+        return {}
+    known = _known_fix_patch(state)
+    if known:
+        return known
+    req = _patch_request(state, meters)
+    if req is None:
         return {}
+    prompt, payload = req
 
-    file_blocks: List[str] = []
-    for path in targets:
+    if state.patch_candidates > 1:
+        return _speculative_patch(state, prompt, payload, meters)
+
+    ladder = ModelLadder(state, "patch", schema=PATCH_SCHEMA)
+    meters.append(ladder)
+    # Try once; if the answer is unusable, retry once with a stronger warning, one model up the route
+    for attempt in range(2):
         try:
-            file_blocks.append(f"=== {path} ===\n{read_text(state.repo_ref, path)}\n")
-        except FileNotFoundError:
-            continue
+            obj = ladder.invoke(prompt, payload, parse=_loads_llm_json, start=attempt, check=_checker(state))
+            return _patch_result(state, obj)
+        except Exception as e:
+            if _retry_after_error(state, payload, attempt, e):
+                continue
+            return {}
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system",
-        "You fix failing pytest tests by editing source files.\n"
-        "STRICT RULES:\n"
-        "- Only modify the provided SOURCE files.\n"
-        "- Tests are READ-ONLY.\n"
-        "- Do NOT modify tests/ or documentation files.\n"
-        "- Make the smallest possible change (minimal diff).\n"
-        "- Output MUST be valid JSON ONLY.\n"
-        "- Return ONLY JSON with top-level key 'updates' (a list).\n"
-        "- Each update: {{\'path\': string, \'content\': string}} where content is the FULL file.\n"
-        "- If no change:{{\"updates\": []}}.\n"
-        ),
-        ("human",
-        "TASK:\n{task}\n\n"
-        "RUN INFO:\n{run_info}\n\n"
-        "PYTEST FAILURES (FAILURES SECTION):\n{failures_compact}\n\n"
-        "PYTEST FAILURES (PARSED KEY LINES):\n{failures_parsed}\n\n"
-        "READ-ONLY TESTS:\n{tests}\n\n"
-        "SOURCE FILES (you may modify only these):\n{files}\n"
-        )
-    ])
-    print("Invoking LLM for patch generation...")
-    print("TASK:", state.task_prompt)
-
-    print("FAILURE CONTEXT:\n", failures_compact)
-    print("PARSED FAILURES:\n", failures_parsed)
-    print("READ-ONLY TESTS:\n", "\n".join(test_blocks[:8000]))
-    print("SOURCE FILES:\n", "\n".join(file_blocks[:12000]))
-    print("\n\n\n")
-    payload = {
-        "task": state.task_prompt,
-        "run_info": run_info,
-        "failures_compact": failures_compact,
-        "failures_parsed": failures_parsed or "(none)",
-        "tests": "\n".join(test_blocks)[:8000],
-        "files": "\n".join(file_blocks)[:12000],
-    }
+async def _apatch_agent(state: TicketState, meters: List[Any]) -> Dict[str, Any]:
+    if state.hitl.required:
+        return {}
+    known = _known_fix_patch(state)
+    if known:
+        return known
+    req = _patch_request(state, meters)
+    if req is None:
+        return {}
+    prompt, payload = req
+
+    if state.patch_candidates > 1:
+        return await _aspeculative_patch(state, prompt, payload, meters)
 
-    # Try once; if JSON fails or fences appear, retry once with stronger warning
+    ladder = ModelLadder(state, "patch", schema=PATCH_SCHEMA)
+    meters.append(ladder)
     for attempt in range(2):
         try:
-            obj = _invoke_llm_json(model, prompt, payload)
-            updates = obj.get("updates", [])
-            if not isinstance(updates, list):
-                raise ValueError("updates must be a list")
-            print(f"LLM returned {len(updates)} updates.")
-            print("LLM updates preview:", updates[:2])  # show first 2 updates for debugging
-            new_patches: List[Patch] = []
-            for u in updates:
-                path = _norm(u.get("path", "")).strip()
-                content = u.get("content", "")
-                if not path or not isinstance(content, str):
-                    continue
-
-                if not _is_allowed_path(path):
-                    raise ValueError(f"LLM attempted to modify disallowed path: {path}")
-
-                content = _strip_code_fences(content)
-                # Also block the stray NO_CHANGE token appearing inside files
-                if "NO_CHANGE" in content.strip().splitlines()[:3]:
-                    raise ValueError("LLM inserted NO_CHANGE into file content.")
-
-                old = read_text(state.repo_ref, path)
-                # Normalize trailing newline
-                new = content if content.endswith("\n") else content + "\n"
-                if old == new:
-                    print(f"\n\n No change for {path}, skipping patch. \n\n")
-                    continue
-
-                diff = unified_diff(old, new, path)
-                print(f"\n\n diff for {path}:\n{diff}\n\n")
-                write_text(state.repo_ref, path, new)
-
-                new_patches.append(Patch(
-                    patch_id=str(uuid.uuid4())[:8],
-                    summary=f"LLM-generated fix for {path}",
-                    diff_unified=diff,
-                    files_touched=[path],
-                    confidence=0.6,
-                ))
-
-            if not new_patches:
-                return {}  # no changes
-
-            return {"patches": state.patches + new_patches}
-
+            obj = await ladder.ainvoke(prompt, payload, parse=_loads_llm_json, start=attempt, check=_checker(state))
+            return _patch_result(state, obj)
         except Exception as e:
-            print(f"Error during LLM patch generation attempt {attempt+1}: {type(e).__name__}: {e}")
-            if attempt == 0:
-                # tighten payload and retry once
-                payload["task"] = state.task_prompt + "\n\nREMINDER: Output JSON only. No markdown. No extra text."
+            if _retry_after_error(state, payload, attempt, e):
                 continue
-
-            state.hitl.required = True
-            state.hitl.reason = f"Patch generation failed/unsafe: {type(e).__name__}: {e}"
-            state.final_status = "stopped_for_review"
             return {}
+
+
+def _known_fix_patch(state: TicketState) -> Optional[Dict[str, Any]]:
+    # Replay a fix that worked for similar failures; the next test run decides (see rollback_agent)
+    for fix in known_fixes(state):
+        try:
+            files = _validated_edits(state, parse_unified_diff(fix.diff))
+        except Exception as e:
+            log.info("Known fix #%d does not apply here: %s: %s", fix.id, type(e).__name__, e)
+            continue
+        if not files:
+            continue
+        log.info("Replaying known fix #%d (similarity %.2f) on %s", fix.id, fix.similarity, ", ".join(files))
+        patches = _apply_updates(state, files, confidence=0.8, summary=f"Known fix #{fix.id}")
+        patches[0].known_fix_id = fix.id
+        return {"patches": patches}
+    return None
+
+def _patch_result(state: TicketState, obj: dict) -> Dict[str, Any]:
+    files = _validated_updates(state, obj)
+    if not files:
+        return {}  # no changes
+
+    new_patches = _apply_updates(state, files, confidence=0.6)
+    return {"patches": new_patches}
+
+def _retry_after_error(state: TicketState, payload: dict, attempt: int, e: Exception) -> bool:
+    log.warning("Error during LLM patch generation attempt %d: %s: %s", attempt + 1, type(e).__name__, e)
+    # A schema-constrained answer that still did not parse already went up the whole model
+    # route; repeating it with a reminder would not change the format
+    if attempt == 0 and not (isinstance(e, InvalidAnswer) and structured_enabled()):
+        # tighten payload and retry once
+        payload["task"] = state.task_prompt + "\n\nREMINDER: Output JSON only. No markdown. No extra text."
+        if isinstance(e, EditConflict):
+            payload["task"] += f"\nYOUR PREVIOUS EDIT DID NOT APPLY ({e}). Copy search lines verbatim from the source."
+        return True
+
+    state.hitl.required = True
+    state.hitl.reason = f"Patch generation failed/unsafe: {type(e).__name__}: {e}"
+    state.final_status = "stopped_for_review"
+    return False
+
+
+def _validated_edits(state: TicketState, edits: Any) -> Dict[str, str]:
+    # search/replace hunks -> {path: new full content}; every hunk must apply or nothing does
+    if not isinstance(edits, list):
+        raise ValueError("edits must be a list")
+    log.info("LLM returned %d edits.", len(edits))
+    clean = []
+    for e in edits:
+        if not isinstance(e, dict):
+            raise ValueError("each edit must be an object")
+        path = _norm(str(e.get("path", ""))).strip()
+        search, replace = e.get("search", ""), e.get("replace", "")
+        if not path or not isinstance(search, str) or not isinstance(replace, str):
+            continue
+        if not _is_allowed_path(path):
+            raise ValueError(f"LLM attempted to modify disallowed path: {path}")
+        replace = _strip_code_fences(replace)
+        if "NO_CHANGE" in replace.strip().splitlines()[:3]:
+            raise ValueError("LLM inserted NO_CHANGE into file content.")
+        clean.append({**e, "path": path, "search": search, "replace": replace})
+
+    sources: Dict[str, Optional[str]] = {}
+    for e in clean:
+        if e["path"] not in sources:
+            try:
+                sources[e["path"]] = read_text(state.repo_ref, e["path"])
+            except FileNotFoundError:
+                sources[e["path"]] = None
+    files = apply_edits(sources, clean)  # EditConflict is a ValueError -> retry / HITL like bad JSON
+    return {p: new for p, new in files.items() if new != sources[p]}
+
+def _validated_updates(state: TicketState, obj: dict) -> Dict[str, str]:
+    # LLM JSON -> {path: new full content}, only for files that actually change.
+    # Raises on anything unsafe; nothing is written here.
+    if isinstance(obj.get("diff"), str):
+        return _validated_edits(state, parse_unified_diff(obj["diff"]))
+    if "edits" in obj:
+        return _validated_edits(state, obj["edits"])
+    # legacy full-file protocol
+    updates = obj.get("updates", [])
+    if not isinstance(updates, list):
+        raise ValueError("updates must be a list")
+    log.info("LLM returned %d updates.", len(updates))
+    log.debug("LLM updates preview: %s", updates[:2])
+    files: Dict[str, str] = {}
+    for u in updates:
+        path = _norm(u.get("path", "")).strip()
+        content = u.get("content", "")
+        if not path or not isinstance(content, str):
+            continue
+
+        if not _is_allowed_path(path):
+            raise ValueError(f"LLM attempted to modify disallowed path: {path}")
+
+        content = _strip_code_fences(content)
+        # Also block the stray NO_CHANGE token appearing inside files
+        if "NO_CHANGE" in content.strip().splitlines()[:3]:
+            raise ValueError("LLM inserted NO_CHANGE into file content.")
+
+        old = _current_text(state, path)
+        # Normalize trailing newline
+        new = content if content.endswith("\n") else content + "\n"
+        if old == new:
+            log.debug("No change for %s, skipping patch.", path)
+            continue
+        files[path] = new
+    return files
+
+def _current_text(state: TicketState, path: str) -> str:
+    try:
+        return read_text(state.repo_ref, path)
+    except FileNotFoundError:
+        return ""  # the patch creates the file
+
+def _apply_updates(state: TicketState, files: Dict[str, str], confidence: float, summary: str = "LLM-generated fix") -> List[Patch]:
+    # One Patch per model answer, written as a single transaction (all files or none) with a
+    # pre-image snapshot so rollback_agent can undo it later
+    patch_id = str(uuid.uuid4())[:8]
+    diffs = []
+    for path, new in files.items():
+        diff = unified_diff(_current_text(state, path), new, path)
+        log.debug("diff for %s:\n%s", path, diff)
+        diffs.append(diff)
+    apply_transaction(state.repo_ref, snapshot_dir(state.run_id, patch_id), files)
+
+    return [Patch(
+        patch_id=patch_id,
+        summary=f"{summary} for {', '.join(files)}",
+        diff_ref=put_text("\n".join(diffs)),
+        files_touched=list(files),
+        confidence=confidence,
+        iteration=state.iteration.count,
+    )]
+
+
+def _candidate_temperature(i: int) -> float:
+    # candidate 0 is the deterministic answer single-shot mode would have produced
+    return min(1.0, 0.3 * i)
+
+def _generate_candidate(state: TicketState, prompt: ChatPromptTemplate, payload: dict, i: int, meters: List[Any]) -> Optional[Dict[str, str]]:
+    llm = node_llm(state, "patch", temperature=_candidate_temperature(i), schema=PATCH_SCHEMA)
+    meters.append(llm)
+    try:
+        return _validated_updates(state, _invoke_llm_json(llm, prompt, payload, _checker(state)))
+    except Exception as e:
+        log.warning("Candidate %d rejected: %s: %s", i, type(e).__name__, e)
+        return None
+
+async def _agenerate_candidate(state: TicketState, prompt: ChatPromptTemplate, payload: dict, i: int, meters: List[Any]) -> Optional[Dict[str, str]]:
+    llm = node_llm(state, "patch", temperature=_candidate_temperature(i), schema=PATCH_SCHEMA)
+    meters.append(llm)
+    try:
+        return _validated_updates(state, await _ainvoke_llm_json(llm, prompt, payload, _checker(state)))
+    except Exception as e:
+        log.warning("Candidate %d rejected: %s: %s", i, type(e).__name__, e)
+        return None
+
+def _speculative_patch(state: TicketState, prompt: ChatPromptTemplate, payload: dict, meters: List[Any]) -> Dict[str, Any]:
+    n = state.patch_candidates
+    with ThreadPoolExecutor(max_workers=n) as ex:
+        # each worker runs in a copy of our context so its LLM calls count towards this node's span
+        futures = [ex.submit(contextvars.copy_context().run, _generate_candidate, state, prompt, payload, i, meters) for i in range(n)]
+        generated = [f.result() for f in futures]
+    with slot("pytest"):
+        return _promote_candidate(state, generated)
+
+async def _aspeculative_patch(state: TicketState, prompt: ChatPromptTemplate, payload: dict, meters: List[Any]) -> Dict[str, Any]:
+    n = state.patch_candidates
+    generated = await asyncio.gather(*(_agenerate_candidate(state, prompt, payload, i, meters) for i in range(n)))
+    # Cloning and the parallel pytest processes are blocking work; keep them off the event loop
+    async with aslot("pytest"):
+        return await asyncio.to_thread(_promote_candidate, state, list(generated))
+
+def _candidate_outcome(r: Dict[str, Any]) -> str:
+    if r["cancelled"]:
+        return "timed out"  # without a green candidate nothing cancels the others
+    if not r["report"]:
+        return "no report"
+    return f"{len(r['report']['failed_ids'])} failing"
+
+def _least_failing(state: TicketState, results: List[Dict[str, Any]]) -> Optional[int]:
+    # Candidate with the fewest failures among those that fix at least one currently failing test
+    # and fail nothing the current tree passes (a strict subset, as in rollback_agent.best_iteration)
+    active = sum(not p.reverted for p in state.patches)
+    current = next((r for r in reversed(state.tool_runs)
+                    if r.run_type == "test" and r.scope == "full" and r.patches_applied == active), None)
+    if current is None or current.status not in ("success", "fail") or current.exit_code not in (0, 1):
+        return None
+    red = set(current.failed_tests)
+    best = None
+    for i, r in enumerate(results):
+        if r["cancelled"] or not r["report"] or r["exit_code"] not in (0, 1):
+            continue
+        failed = set(r["report"]["failed_ids"])
+        if failed < red and (best is None or len(failed) < len(results[best]["report"]["failed_ids"])):
+            best = i
+    return best
+
+def _promote_candidate(state: TicketState, generated: List[Optional[Dict[str, str]]]) -> Dict[str, Any]:
+    n = len(generated)
+    # Drop invalid, empty and duplicate candidates
+    candidates: List[Dict[str, str]] = []
+    for c in generated:
+        if c and c not in candidates:
+            candidates.append(c)
+    if not candidates:
+        if any(c == {} for c in generated):
+            return {}  # the model says nothing needs to change
+        state.hitl.required = True
+        state.hitl.reason = f"Patch generation failed/unsafe for all {n} candidates."
+        state.final_status = "stopped_for_review"
+        return {}
+
+    # Each candidate gets its own private clone of the sandbox; all are tested at once
+    python = python_for(state)
+    workspaces = []
+    try:
+        for c in candidates:
+            ws = clone_tree(state.repo_ref)
+            workspaces.append(ws)
+            apply_files(ws, c)
+        jobs = [{"python": python, "cwd": ws, "args": [], "env": pythonpath_env(ws)} for ws in workspaces]
+        results, _ = run_pytest_processes(jobs, timeout_sec=state.timeout_sec, stop_when=lambda code: code == 0)
+    finally:
+        for ws in workspaces:
+            remove_tree(ws)
+
+    winner = next((i for i, r in enumerate(results) if r["exit_code"] == 0), None)
+    if winner is not None:
+        note = f"candidate {winner + 1}/{len(candidates)} passed the full suite in isolation"
+        confidence = 0.8
+    else:
+        winner = _least_failing(state, results)
+        outcomes = ", ".join(_candidate_outcome(r) for r in results)
+        if winner is None:
+            # nothing is written; route_after_patch skips the test run of the unchanged tree
+            note = f"no candidate passed or improved on the current tree ({outcomes}); nothing promoted"
+            log.info("Speculative patching: %s", note)
+            return {"open_questions": [f"Speculative patching: {note}"]}
+        still = len(results[winner]["report"]["failed_ids"])
+        note = (f"no candidate passed ({outcomes}); promoted candidate {winner + 1} as a partial fix "
+                f"({still} test(s) still failing, no new failures)")
+        confidence = 0.5
+    log.info("Speculative patching: %s", note)
+
+    new_patches = _apply_updates(state, candidates[winner], confidence=confidence, summary="LLM-generated fix (speculative)")
+    return {
+        "patches": new_patches,
+        "open_questions": [f"Speculative patching: {note}"],
+    }
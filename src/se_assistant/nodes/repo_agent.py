@@ -1,18 +1,40 @@
 from __future__ import annotations
 from typing import Dict, Any
-import os
 from se_assistant.state import TicketState, RepoMap
-from se_assistant.tools import list_repo_files
+from se_assistant.repo_index import refresh_index
+from se_assistant.transaction import prune_snapshots
+from se_assistant.artifacts import prune_artifacts, put_json
+from se_assistant.tools import prune_logs
+from se_assistant.envs import REQUIREMENTS_FILES, provision, wheelhouse
 
 def repo_agent(state: TicketState) -> Dict[str, Any]:
-    files = list_repo_files(state.repo_ref)
-    configs = [f for f in files if f in ("pyproject.toml", "package.json", "requirements.txt")]
+    prune_snapshots()
+    prune_artifacts()
+    prune_logs()
+    index = refresh_index(state.repo_ref)
+    files = sorted(index)
+    configs = [f for f in files if f in ("pyproject.toml", "package.json") + REQUIREMENTS_FILES]
     test_framework = "pytest" if "pyproject.toml" in configs else None
 
     repo_map = RepoMap(
-        files=[{"path": f} for f in files],
+        # hashes/mtimes stay in the on-disk index; the list itself lives in the artifact store
+        files_ref=put_json([{"path": f, "size": index[f]["size"], "language": index[f]["language"]} for f in files]),
+        file_count=len(files),
         configs_found=configs,
         test_framework=test_framework,
         entrypoints=[],
     )
-    return {"repo_map": repo_map}
+    update: Dict[str, Any] = {"repo_map": repo_map}
+
+    # interpreter for the test runs: the repo's own .venv, or a pooled env for its dependencies
+    python, install = provision(state.repo_ref, configs)
+    if install is not None:
+        update["tool_runs"] = [install]
+    if python is None:
+        state.hitl.required = True
+        state.hitl.reason = f"Could not build a test environment (see the install run); wheelhouse: {wheelhouse()}"
+        state.final_status = "stopped_for_review"
+        update["hitl"] = state.hitl
+        update["final_status"] = state.final_status
+    update["python_path"] = python
+    return update
@@ -0,0 +1,190 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+import uuid
+
+from se_assistant.state import TicketState, Patch, ToolRun
+from se_assistant.transaction import discard, rollback, snapshot_dir
+
+log = logging.getLogger(__name__)
+
+# Exit codes that mean the suite could not even run (interrupted / internal error / usage error)
+BROKEN_EXIT_CODES = (2, 3, 4)
+
+# Patches failing static checks (verify node) go straight back to the patch model this many
+# times per iteration before the loop starts over at file selection
+MAX_STATIC_RETRIES = 2
+
+
+def _test_runs(state: TicketState) -> List[ToolRun]:
+    return [r for r in state.tool_runs if r.run_type == "test"]
+
+def active_patches(state: TicketState) -> List[Patch]:
+    return [p for p in state.patches if not p.reverted]
+
+def find_regression(state: TicketState) -> Optional[Tuple[ToolRun, str]]:
+    # -> (baseline run, reason) when the newest patch left the tree worse than before it
+    runs = _test_runs(state)
+    if not runs or not active_patches(state):
+        return None
+    last = runs[-1]
+    baseline = next((r for r in reversed(runs[:-1]) if r.patches_applied < last.patches_applied), None)
+    if baseline is None or last.exit_code == 0:
+        return None
+
+    broken = last.status in ("error", "timeout") or last.exit_code in BROKEN_EXIT_CODES
+    if broken and baseline.exit_code in (0, 1):
+        return baseline, f"test run went from exit code {baseline.exit_code} to {last.status} (exit code {last.exit_code})"
+    if baseline.scope == "full":
+        # tests that were green before the patch and are red now
+        new = [t for t in last.failed_tests if t not in set(baseline.failed_tests)]
+        if new:
+            shown = ", ".join(new[:5]) + (" ..." if len(new) > 5 else "")
+            return baseline, f"{len(new)} previously passing test(s) now fail: {shown}"
+    return None
+
+def find_rejected(state: TicketState) -> Optional[ToolRun]:
+    # failed lint/typecheck run of the newest active patch (see verify_agent)
+    active = active_patches(state)
+    if not active:
+        return None
+    newest = active[-1].patch_id
+    return next((r for r in state.tool_runs if r.patch_id == newest and r.status == "fail"), None)
+
+def static_retry(state: TicketState) -> bool:
+    # the newest patch was just rejected by static checks and this iteration has retries left
+    rejected = {r.patch_id for r in state.tool_runs if r.patch_id and r.status == "fail"}
+    if not state.patches or state.patches[-1].patch_id not in rejected:
+        return False
+    iteration = state.patches[-1].iteration
+    return sum(p.iteration == iteration and p.patch_id in rejected for p in state.patches) <= MAX_STATIC_RETRIES
+
+def failed_known_fix(state: TicketState) -> Optional[Patch]:
+    # the newest patch was replayed from the fix knowledge base and its test run is still red
+    active = active_patches(state)
+    runs = _test_runs(state)
+    if not active or not active[-1].known_fix_id or not runs:
+        return None
+    last = runs[-1]
+    return active[-1] if last.patches_applied == len(active) and last.exit_code != 0 else None
+
+def stopping(state: TicketState) -> bool:
+    return state.hitl.required or state.iteration.count >= state.iteration.max
+
+def needs_rollback(state: TicketState) -> bool:
+    if state.revert_on_regression and find_regression(state):
+        return True
+    if failed_known_fix(state):
+        return True
+    return state.revert_on_stop and stopping(state) and bool(active_patches(state))
+
+
+def revert_patches(state: TicketState, patch_ids: List[str], reason: Optional[str] = None) -> Tuple[List[Patch], List[str]]:
+    # Restore the pre-images of the given patches (newest first) -> (reverted patches, restored paths).
+    # state.patches is updated in place too; return the reverted ones as the node update.
+    ordered = [p for p in state.patches if p.patch_id in patch_ids and not p.reverted]
+    dirs = [snapshot_dir(state.run_id, p.patch_id) for p in ordered]
+    restored = rollback(state.repo_ref, dirs)
+    for d in dirs:
+        discard(d)
+    reverted = {p.patch_id: p.model_copy(update={"reverted": True, "revert_reason": reason}) for p in ordered}
+    state.patches = [reverted.get(p.patch_id, p) for p in state.patches]
+    log.info("Rolled back %d patch(es), restored %d file(s): %s", len(ordered), len(restored), restored)
+    return list(reverted.values()), restored
+
+def rollback_to_iteration(state: TicketState, iteration: int, reason: Optional[str] = None) -> Tuple[List[Patch], List[str]]:
+    # Undo every active patch produced after the given repair iteration (0 = original tree)
+    later = [p.patch_id for p in active_patches(state) if p.iteration > iteration]
+    if not later:
+        return [], []
+    return revert_patches(state, later, reason)
+
+def best_iteration(state: TicketState) -> Optional[ToolRun]:
+    # Full test run with the fewest failures whose failed tests were all already red in the
+    # baseline, on a tree that is still reachable (its patches are all active) -> keep on stop
+    baseline = set(state.baseline().get("failed_tests", []))
+    active = active_patches(state)
+    best = None
+    for r in _test_runs(state):
+        if r.scope != "full" or r.status not in ("success", "fail") or r.exit_code not in (0, 1) or r.patches_applied == 0:
+            continue
+        if sum(p.iteration <= r.iteration for p in active) != r.patches_applied:
+            continue
+        failed = set(r.failed_tests)
+        if not failed < baseline:
+            continue
+        if best is None or len(failed) < len(best.failed_tests):
+            best = r
+    return best
+
+def _restored_run(state: TicketState) -> Optional[ToolRun]:
+    # Latest test run made on the tree we just rolled back to, re-stamped as the newest run
+    active = len(active_patches(state))
+    base = next((r for r in reversed(_test_runs(state)) if r.patches_applied == active), None)
+    if base is None:
+        return None
+    return base.model_copy(update={"run_id": str(uuid.uuid4())[:8]})
+
+def rollback_agent(state: TicketState) -> Dict[str, Any]:
+    update: Dict[str, Any] = {}
+    notes: List[str] = []
+    reverted: List[Patch] = []
+    retested = False  # reverted onto a tree with an earlier test run (a rejected patch never had one)
+
+    rejected = find_rejected(state)
+    if rejected:
+        # never tested: the tree goes back to the one the latest test run saw
+        newest = active_patches(state)[-1]
+        done, restored = revert_patches(state, [newest.patch_id], f"failed {rejected.run_type} checks:\n{rejected.stdout_text()}")
+        reverted += done
+        notes.append(f"Reverted patch {newest.patch_id} ({', '.join(restored)}): "
+                     f"{len(rejected.failures_parsed)} new {rejected.run_type} diagnostic(s).")
+
+    regression = find_regression(state) if state.revert_on_regression and not rejected else None
+    if regression:
+        _, reason = regression
+        newest = active_patches(state)[-1]
+        done, restored = revert_patches(state, [newest.patch_id], f"made tests worse: {reason}")
+        reverted += done
+        retested = True
+        notes.append(f"Reverted patch {newest.patch_id} ({', '.join(restored)}): {reason}.")
+
+    known = failed_known_fix(state) if not rejected and not regression else None
+    if known:
+        # a replayed fix gets one test run; the model takes over from the original failures
+        done, restored = revert_patches(state, [known.patch_id], f"known fix #{known.known_fix_id} did not make the suite pass")
+        reverted += done
+        retested = True
+        notes.append(f"Reverted patch {known.patch_id} ({', '.join(restored)}): known fix #{known.known_fix_id} did not make the suite pass.")
+
+    # a static retry is owed only to the patch rejected just now, not when the retry wrote nothing
+    if not state.hitl.required and state.iteration.count >= state.iteration.max and not (rejected and static_retry(state)):
+        state.hitl.required = True
+        state.hitl.reason = "Max iterations reached."
+    if state.hitl.required:
+        update["hitl"] = state.hitl
+        update["final_status"] = "stopped_for_review"
+        best = best_iteration(state) if state.keep_best_on_stop else None
+        if state.revert_on_stop and best is not None:
+            done, restored = rollback_to_iteration(state, best.iteration, "run stopped for review")
+            if done:
+                reverted += done
+                retested = True
+            notes.append(f"Stopped for review: kept the patches of iteration {best.iteration} "
+                         f"({len(best.failed_tests)} of {len(state.baseline().get('failed_tests', []))} baseline failure(s) left), "
+                         f"reverted {len(done)} later patch(es), {len(restored)} file(s) restored.")
+        elif state.revert_on_stop and active_patches(state):
+            ids = [p.patch_id for p in active_patches(state)]
+            done, restored = revert_patches(state, ids, "run stopped for review")
+            reverted += done
+            retested = True
+            notes.append(f"Stopped for review: reverted {len(ids)} patch(es), {len(restored)} file(s) restored to the original tree.")
+
+    if notes:
+        update["patches"] = reverted
+        update["open_questions"] = notes
+        # Later nodes (and a resumed run) see the failures of the restored tree
+        run = _restored_run(state) if retested else None
+        if run is not None:
+            update["tool_runs"] = [run]
+    return update
@@ -13,9 +13,14 @@ def safety_agent(state: TicketState) -> Dict[str, Any]:
 
     for f in touched:
         if any(h in f for h in SENSITIVE_HINTS):
+            decision = state.hitl.human_decision or {}
+            if decision.get("approved"):
+                # a reviewer already approved continuing this run (see checkpoint.continue_after_review)
+                flag = "sensitive_file_approved"
+                return {"safety_ok": True, "risk_flags": [flag] if flag not in state.risk_flags else []}
             return {
                 "safety_ok": False,
-                "risk_flags": state.risk_flags + ["sensitive_file_touched"],
+                "risk_flags": ["sensitive_file_touched"],
                 "hitl": {
                     "required": True,
                     "reason": f"Patch touches sensitive file: {f}",
@@ -1,6 +1,7 @@
 from __future__ import annotations
-from typing import Dict, Any
+from typing import Dict, Any, List
 from se_assistant.state import TicketState
+from se_assistant.fix_kb import record_outcome
 
 def synthesis_agent(state: TicketState) -> Dict[str, Any]:
     last_test = next((r for r in reversed(state.tool_runs) if r.run_type == "test"), None)
@@ -8,7 +9,7 @@ def synthesis_agent(state: TicketState) -> Dict[str, Any]:
     # Authoritative final status derived from last test unless HITL
     if state.hitl.required:
         state.final_status = "stopped_for_review"
-    elif last_test and last_test.exit_code == 0:
+    elif last_test and last_test.exit_code == 0 and last_test.scope == "full":
         state.final_status = "success"
     elif last_test:
         state.final_status = "failed"
@@ -25,27 +26,39 @@ def synthesis_agent(state: TicketState) -> Dict[str, Any]:
     lines.append("")
     if state.hypotheses:
         lines.append("## Diagnosis")
-        for h in state.hypotheses[-2:]:
+        for h in sorted(state.hypotheses, key=lambda h: -h.confidence)[:2]:
             lines.append(f"- {h.summary} (confidence={h.confidence:.2f})")
             for loc in h.locations:
-                lines.append(f"  - Location: `{loc.path}` ({loc.reason})")
+                lines.append(f"  - Location: `{loc.path}:{loc.start_line}-{loc.end_line}` ({loc.reason})")
+        if state.quality.coverage_score:
+            lines.append(f"- Failing tests with coverage data: {state.quality.coverage_score:.0%}")
         lines.append("")
     if state.patches:
         lines.append("## Patch")
         for p in state.patches[-2:]:
-            lines.append(f"- {p.summary} (confidence={p.confidence:.2f})")
+            status = " **(reverted)**" if p.reverted else ""
+            lines.append(f"- {p.summary} (confidence={p.confidence:.2f}){status}")
             lines.append("```diff")
-            lines.append(p.diff_unified.strip()[:3000])
+            lines.append(p.diff_text().strip()[:3000])
             lines.append("```")
         lines.append("")
     lines.append("## Verification")
     if last_test:
         lines.append(f"- Command: `{last_test.command}`")
+        lines.append(f"- Scope: `{last_test.scope}`")
         lines.append(f"- Status: `{last_test.status}` (exit_code={last_test.exit_code})")
+        if last_test.scope != "full":
+            last_full = next((r for r in reversed(state.tool_runs) if r.run_type == "test" and r.scope == "full"), None)
+            lines.append("- Partial verification only; the full suite was not re-run after this stage.")
+            if last_full:
+                lines.append(f"- Last full-suite run: `{last_full.status}` (exit_code={last_full.exit_code})")
         if last_test.status != "success":
             lines.append("- Failures:")
             for f in last_test.failures_parsed:
-                lines.append(f"  - {f.get('raw')}")
+                if f.get("nodeid"):
+                    lines.append(f"  - `{f['nodeid']}` {f.get('exc_type') or ''}: {f.get('message', '')} ({f.get('file')}:{f.get('line')})")
+                else:
+                    lines.append(f"  - {f.get('raw')}")
     else:
         lines.append("- Tests were not executed.")
     lines.append("")
@@ -54,5 +67,83 @@ def synthesis_agent(state: TicketState) -> Dict[str, Any]:
         lines.append("- Safety gate triggered; requires human approval.")
     else:
         lines.append("- No safety flags triggered in this run.")
+    reverted = [p for p in state.patches if p.reverted]
+    if reverted:
+        lines.append(f"- {len(reverted)} patch(es) were rolled back; see open questions for why.")
+        for q in state.open_questions:
+            if q.startswith(("Reverted patch", "Stopped for review: reverted")):
+                lines.append(f"  - {q}")
 
-    return {"final_report": "\n".join(lines)}
+    cache_nodes = sorted({k.split(".")[1] for k in state.metrics if k.startswith("llm_cache.")})
+    if cache_nodes:
+        lines.append("")
+        lines.append("## LLM cache")
+        for node in cache_nodes:
+            hit = int(state.metrics.get(f"llm_cache.{node}.hit", 0))
+            miss = int(state.metrics.get(f"llm_cache.{node}.miss", 0))
+            lines.append(f"- {node}: {hit} hit / {miss} miss")
+
+    route_nodes = sorted({k.split(".")[1] for k in state.metrics if k.startswith("llm_route.")})
+    if route_nodes:
+        lines.append("")
+        lines.append("## LLM calls")
+        for node in route_nodes:
+            m = {k.split(".")[2]: int(v) for k, v in state.metrics.items() if k.startswith(f"llm_route.{node}.")}
+            calls, retries = m.get("calls", 0), m.get("retries", 0)
+            rate = f" ({retries / calls:.0%})" if calls else ""
+            lines.append(f"- {node}: {calls} calls, {retries} retries{rate}, {m.get('escalations', 0)} escalations, "
+                         f"{m.get('json_repaired', 0)} JSON repairs, {m.get('stream_aborts', 0)} aborted streams")
+
+    ctx_nodes = sorted({k.split(".")[1] for k in state.metrics if k.startswith("context.")})
+    if ctx_nodes:
+        lines.append("")
+        lines.append("## Prompt tokens (estimated)")
+        for node in ctx_nodes:
+            prefix = f"context.{node}."
+            parts = {k[len(prefix):-len(".tokens")]: int(v) for k, v in state.metrics.items() if k.startswith(prefix)}
+            detail = ", ".join(f"{s}={n}" for s, n in sorted(parts.items()))
+            lines.append(f"- {node}: {sum(parts.values())} ({detail})")
+
+    timing = _timing_table(state.metrics)
+    if timing:
+        lines.append("")
+        lines.append("## Timing")
+        lines.extend(timing)
+
+    record_outcome(state)
+    return {"final_report": "\n".join(lines), "final_status": state.final_status}
+
+
+_TIMING_COLUMNS = (
+    ("calls", "calls", "{:.0f}"), ("wall_sec", "wall s", "{:.2f}"), ("llm_sec", "LLM s", "{:.2f}"),
+    ("subprocess_sec", "subprocess s", "{:.2f}"), ("llm_prompt_tokens", "prompt tok", "{:.0f}"),
+    ("llm_completion_tokens", "completion tok", "{:.0f}"), ("llm_ttft_sec", "TTFT s (avg)", "{:.2f}"),
+    ("state_bytes", "state KB (max)", "{:.1f}"),
+)
+
+def _timing_table(metrics: Dict[str, float]) -> List[str]:
+    # Markdown table of the per-node counters recorded by trace.traced (node.<name>.<counter>)
+    nodes = []
+    for k in metrics:
+        if k.startswith("node.") and k.endswith(".calls"):
+            nodes.append(k[len("node."):-len(".calls")])
+    if not nodes:
+        return []
+
+    def value(node: str, key: str) -> float:
+        v = metrics.get(f"node.{node}.{key}", 0.0)
+        if key == "llm_ttft_sec":
+            calls = metrics.get(f"node.{node}.llm_calls", 0.0)
+            return v / calls if calls else 0.0
+        return v / 1024 if key == "state_bytes" else v
+
+    out = ["| node | " + " | ".join(h for _, h, _ in _TIMING_COLUMNS) + " |",
+           "|---" * (len(_TIMING_COLUMNS) + 1) + "|"]
+    for node in sorted(nodes, key=lambda n: -metrics.get(f"node.{n}.wall_sec", 0.0)):
+        out.append(f"| {node} | " + " | ".join(fmt.format(value(node, k)) for k, _, fmt in _TIMING_COLUMNS) + " |")
+    total = sum(metrics.get(f"node.{n}.wall_sec", 0.0) for n in nodes)
+    llm = sum(metrics.get(f"node.{n}.llm_sec", 0.0) for n in nodes)
+    sub = sum(metrics.get(f"node.{n}.subprocess_sec", 0.0) for n in nodes)
+    out.append("")
+    out.append(f"Total {total:.2f}s: LLM {llm:.2f}s, subprocesses {sub:.2f}s, other {max(0.0, total - llm - sub):.2f}s.")
+    return out
@@ -1,11 +1,31 @@
 from __future__ import annotations
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import re
+import tempfile
 import uuid
 from se_assistant.state import TicketState, ToolRun
-from se_assistant.tools import run_cmd, tail
+from se_assistant.tools import run_cmd, arun_cmd, tail, cache_dir, shell_join
+from se_assistant.envs import python_for, test_env
+from se_assistant.pytest_results import JUNIT_ARGS, first_failure_watcher, parse_junit_xml
+from se_assistant.warm_runner import run_warm
+from se_assistant.pytest_shards import run_sharded
+from se_assistant.limits import slot, aslot
+from se_assistant.code_index import load_code_index
+from se_assistant.artifacts import put_json, put_text
 import sys
-from pathlib import Path
 
+log = logging.getLogger(__name__)
+
+# Above this many node ids the command line gets too long (cmd.exe caps at ~8k chars)
+MAX_RERUN_IDS = 100
+
+_NOT_FOUND_RE = re.compile(r"^ERROR: (?:file or directory )?not found: ", re.M)
+_SUMMARY_RE = re.compile(r"^(?:FAILED|ERROR) (\S+?)(?: - .*)?$")
+
+# Fallback only: used when pytest died before writing its junit report (timeout, crash)
 def parse_pytest_failures(stdout: str, stderr: str) -> list[dict]:
     text = (stdout or "") + "\n" + (stderr or "")
     lines = text.splitlines()
@@ -18,28 +38,207 @@ def parse_pytest_failures(stdout: str, stderr: str) -> list[dict]:
             out.append({"raw": "\n".join(lines[start:end]).strip()})
     return out[:5]
 
+def parse_failed_nodeids(stdout: str) -> list[str]:
+    # "short test summary info" lines: FAILED tests/test_x.py::test_y - AssertionError
+    out = []
+    for line in (stdout or "").splitlines():
+        m = _SUMMARY_RE.match(line.strip())
+        if m and "::" in m.group(1) and m.group(1) not in out:
+            out.append(m.group(1))
+    return out
 
 
-def test_agent(state: TicketState) -> Dict[str, Any]:
-    
-    repo = Path(state.repo_ref)
-    py = repo / ".venv" / "Scripts" / "python.exe"
-    cmd = f'"{py}" -m pytest -q'
-    res = run_cmd(state.repo_ref, cmd, timeout_sec=state.timeout_sec)
-    print("TEST STDOUT TAIL:", tail(res.get("stdout", ""), 1000))
-    # print("TEST STDERR TAIL:", tail(res.get("stderr", "")), file=sys.stderr)
-    print(" \n\n\n")
-
-    run = ToolRun(
+def find_affected_tests(state: TicketState) -> List[str]:
+    # Test files importing any module touched by a patch so far
+    touched = {f.replace("\\", "/") for p in state.patches for f in p.files_touched if f.endswith(".py")}
+    if not touched:
+        return []
+    return load_code_index(state.repo_ref).tests_importing(touched)
+
+
+def known_durations(state: TicketState) -> Dict[str, float]:
+    # Latest timing per node id across earlier runs (used to balance shards)
+    out: Dict[str, float] = {}
+    for r in state.tool_runs:
+        if r.run_type == "test":
+            out.update(r.test_durations())
+    return out
+
+
+def _pytest_cmd(py: str, args: List[str], junit_path: Optional[str] = None) -> str:
+    extra = [f"--junitxml={junit_path}", *JUNIT_ARGS] if junit_path else []
+    return shell_join([py, "-m", "pytest", "-q", *args, *extra])
+
+def _log_path(state: TicketState, scope: str) -> Optional[str]:
+    if not state.test_log:
+        return None
+    return os.path.join(cache_dir("logs", state.run_id), f"{scope}-{uuid.uuid4().hex[:8]}.log")
+
+def _stream_args(state: TicketState, scope: str) -> Dict[str, Any]:
+    # cold runner: full output to disk, stop at the first red test
+    kw: Dict[str, Any] = {}
+    log_path = _log_path(state, scope)
+    if log_path:
+        kw["log_path"] = log_path
+    if state.test_fail_fast:
+        kw["on_output"] = first_failure_watcher()
+    return kw
+
+def _execute(state: TicketState, scope: str, args: List[str], junit_path: str) -> Dict[str, Any]:
+    py = python_for(state)
+    if state.test_runner == "sharded":
+        if state.test_log:
+            log.warning("test_log is not supported by the sharded runner; shard output is kept in stdout only")
+        workers = state.test_workers or os.cpu_count() or 1
+        res = run_sharded(py, state.repo_ref, args, workers=workers,
+                          durations=known_durations(state), fail_fast=state.test_fail_fast,
+                          timeout_sec=state.timeout_sec, env=test_env(state))
+        log.debug("TEST [%s] shards=%s", scope, res.get("shards"))
+    elif state.test_runner == "warm":
+        changed = sorted({f for p in state.patches for f in p.files_touched})
+        # fail fast inside the worker is pytest's own -x: the worker must survive the stop
+        extra = ["-x"] if state.test_fail_fast else []
+        log_path = _log_path(state, scope)
+        res = run_warm(py, state.repo_ref, ["-q", *extra, *args, f"--junitxml={junit_path}", *JUNIT_ARGS],
+                       changed=changed, timeout_sec=state.timeout_sec, env=test_env(state), log_path=log_path)
+        res["log_path"] = log_path
+        log.debug("TEST [%s] warm=%s reloaded=%s", scope, res.get("warm"), res.get("reloaded", []))
+    else:
+        full_cmd = _pytest_cmd(py, args, junit_path)
+        kw = _stream_args(state, scope)
+        res = run_cmd(state.repo_ref, full_cmd, timeout_sec=state.timeout_sec, env=test_env(state), **kw)
+        res["log_path"] = kw.get("log_path")
+    return res
+
+async def _aexecute(state: TicketState, scope: str, args: List[str], junit_path: str) -> Dict[str, Any]:
+    if state.test_runner != "cold":
+        # warm/sharded manage their own processes with blocking waits; run them off the event loop
+        return await asyncio.to_thread(_execute, state, scope, args, junit_path)
+    py = python_for(state)
+    full_cmd = _pytest_cmd(py, args, junit_path)
+    kw = _stream_args(state, scope)
+    res = await arun_cmd(state.repo_ref, full_cmd, timeout_sec=state.timeout_sec, env=test_env(state), **kw)
+    res["log_path"] = kw.get("log_path")
+    return res
+
+def _junit_path() -> str:
+    fd, junit_path = tempfile.mkstemp(prefix="se_junit_", suffix=".xml")
+    os.close(fd)
+    return junit_path
+
+def _collect(state: TicketState, scope: str, cmd: str, res: Dict[str, Any], junit_path: str) -> ToolRun:
+    stopped = res.get("stopped_early")
+    if stopped:
+        # interrupted at the first failure: what pytest -x reports; its junit file is incomplete
+        res = {**res, "status": "fail", "exit_code": 1}
+    try:
+        report = None if stopped else (res.get("report") or parse_junit_xml(junit_path))
+    finally:
+        try:
+            os.remove(junit_path)
+        except OSError:
+            pass
+    log.info("TEST [%s] %s exit_code=%s in %.2fs%s", scope, res["status"], res["exit_code"], res["duration_sec"],
+             " (stopped at first failure)" if stopped else "")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("TEST [%s] STDOUT TAIL:\n%s", scope, tail(res.get("stdout", ""), 1000))
+
+    durations: Dict[str, float] = {}
+    if report is not None:
+        failures, failed_ids, durations = report["failures"], report["failed_ids"], report["durations"]
+    else:
+        failures = parse_pytest_failures(res.get("stdout", ""), res.get("stderr", ""))
+        failed_ids = parse_failed_nodeids(res.get("stdout", ""))
+
+    return ToolRun(
         run_id=str(uuid.uuid4())[:8],
         run_type="test",
         command=cmd,
+        scope=scope,
         status=res["status"],  # success/fail/timeout/error
         exit_code=res["exit_code"],
         duration_sec=res["duration_sec"],
-        stdout_tail=tail(res["stdout"]),
-        stderr_tail=tail(res["stderr"]),
-        failures_parsed=parse_pytest_failures(res.get("stdout", ""), res.get("stderr", "")),
+        stdout_ref=put_text(tail(res["stdout"])),
+        stderr_ref=put_text(tail(res["stderr"])),
+        failures_parsed=failures,
+        failed_tests=failed_ids,
+        durations_ref=put_json(durations) if durations else None,
+        patches_applied=sum(not p.reverted for p in state.patches),
+        iteration=state.iteration.count,
+        log_path=res.get("log_path"),
     )
 
-    return {"tool_runs": state.tool_runs + [run]}
+def _run_pytest(state: TicketState, scope: str, args: List[str]) -> ToolRun:
+    junit_path = _junit_path()
+    with slot("pytest"):
+        res = _execute(state, scope, args, junit_path)
+    return _collect(state, scope, _pytest_cmd(python_for(state), args), res, junit_path)
+
+async def _arun_pytest(state: TicketState, scope: str, args: List[str]) -> ToolRun:
+    junit_path = _junit_path()
+    async with aslot("pytest"):
+        res = await _aexecute(state, scope, args, junit_path)
+    return _collect(state, scope, _pytest_cmd(python_for(state), args), res, junit_path)
+
+def _stage_green(run: ToolRun) -> bool:
+    # Not red, let the next stage decide: exit code 5 = nothing collected. Exit code 4 is a usage
+    # error; only when pytest says a node id of the "failed" stage is not found (the test was
+    # renamed/removed) does it mean "nothing left to re-run" rather than a broken command.
+    if run.exit_code in (0, 5):
+        return True
+    return (run.scope == "failed" and run.exit_code == 4 and not run.failed_tests
+            and bool(_NOT_FOUND_RE.search(run.stdout_text() + "\n" + run.stderr_text())))
+
+def _next_stage(state: TicketState, runs: List[ToolRun]) -> Optional[Tuple[str, List[str]]]:
+    # (scope, pytest args) of the next verification stage, given the runs made so far in this node
+    if not runs:
+        last_test = next((r for r in reversed(state.tool_runs) if r.run_type == "test"), None)
+        failed_ids = last_test.failed_tests if last_test and last_test.status == "fail" else []
+        staged = (
+            state.test_mode == "staged"
+            and state.patches
+            and 0 < len(failed_ids) <= MAX_RERUN_IDS
+        )
+        # Stage 1: only what was red last time
+        return ("failed", failed_ids) if staged else ("full", [])
+
+    last = runs[-1]
+    if last.scope == "full" or not _stage_green(last):
+        return None
+    if last.scope == "failed":
+        # Stage 2: tests that import the patched modules
+        affected = find_affected_tests(state)
+        if affected:
+            return ("affected", affected)
+    # Stage 3: full suite, only once the cheap stages are green
+    return ("full", [])
+
+
+def _update(state: TicketState, runs: List[ToolRun]) -> Dict[str, Any]:
+    update: Dict[str, Any] = {"tool_runs": runs}
+    if state.baseline_ref is None:
+        # the failures of the untouched tree, for the fix knowledge base and rollback on stop
+        red = next((r for r in runs if r.patches_applied == 0 and r.exit_code != 0 and r.failures_parsed), None)
+        if red is not None:
+            update["baseline_ref"] = put_json({"failures": red.failures_parsed, "failed_tests": red.failed_tests})
+    return update
+
+def test_agent(state: TicketState) -> Dict[str, Any]:
+    if state.hitl.required:
+        return {}  # no test environment
+    runs: List[ToolRun] = []
+    stage = _next_stage(state, runs)
+    while stage:
+        runs.append(_run_pytest(state, *stage))
+        stage = _next_stage(state, runs)
+    return _update(state, runs)
+
+async def atest_agent(state: TicketState) -> Dict[str, Any]:
+    if state.hitl.required:
+        return {}
+    runs: List[ToolRun] = []
+    stage = _next_stage(state, runs)
+    while stage:
+        runs.append(await _arun_pytest(state, *stage))
+        stage = _next_stage(state, runs)
+    return _update(state, runs)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import logging
+import os
+import time
+import uuid
+
+from se_assistant.state import TicketState, Patch, ToolRun
+from se_assistant.static_checks import (
+    check_source, format_diagnostics, new_diagnostics, ruff_available, ruff_check, typecheck,
+)
+from se_assistant.transaction import pre_image, snapshot_dir
+from se_assistant.tools import read_text
+from se_assistant.envs import python_for
+from se_assistant.artifacts import put_text
+from se_assistant.nodes.rollback_agent import active_patches
+
+log = logging.getLogger(__name__)
+
+# Diagnostics kept per run (and shown to the patch model)
+MAX_DIAGNOSTICS = 20
+
+
+def _unchecked_patch(state: TicketState) -> Optional[Patch]:
+    # the newest active patch, unless it was checked already (no new patch this iteration)
+    active = active_patches(state)
+    if not active:
+        return None
+    newest = active[-1]
+    if any(r.patch_id == newest.patch_id for r in state.tool_runs):
+        return None
+    return newest
+
+def _read(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as fp:
+        return fp.read()
+
+def _run(state: TicketState, patch: Patch, run_type: str, command: str, diags: List[Dict[str, Any]], t0: float) -> ToolRun:
+    log.info("VERIFY [%s] patch %s: %d new diagnostic(s) in %.3fs", run_type, patch.patch_id, len(diags), time.perf_counter() - t0)
+    return ToolRun(
+        run_id=str(uuid.uuid4())[:8],
+        run_type=run_type,
+        command=command,
+        status="fail" if diags else "success",
+        exit_code=1 if diags else 0,
+        duration_sec=time.perf_counter() - t0,
+        stdout_ref=put_text(format_diagnostics(diags[:MAX_DIAGNOSTICS])) if diags else None,
+        failures_parsed=diags[:MAX_DIAGNOSTICS],
+        patches_applied=len(active_patches(state)),
+        patch_id=patch.patch_id,
+    )
+
+def _lint(state: TicketState, patch: Patch, files: List[str], olds: Dict[str, Optional[str]]) -> ToolRun:
+    # compile() every file; undefined names from ruff when installed, else the in-process AST pass
+    t0 = time.perf_counter()
+    use_ruff = ruff_available()
+    before: List[Dict[str, Any]] = []
+    after: List[Dict[str, Any]] = []
+    compiled = []
+    for f in files:
+        diags = check_source(read_text(state.repo_ref, f), f, lint=not use_ruff)
+        after += diags
+        if not any(d["code"] == "E999" for d in diags):
+            compiled.append(f)
+        if olds[f]:
+            before += check_source(_read(olds[f]), f, lint=not use_ruff)
+    command = f"compile + undefined names: {' '.join(files)}"
+    if use_ruff and compiled:
+        after += ruff_check(state.repo_ref, compiled)
+        pre = [f for f in compiled if olds[f]]
+        if pre:
+            before += ruff_check(state.repo_ref, [olds[f] for f in pre], pre)
+        command = f"compile + ruff check: {' '.join(files)}"
+    return _run(state, patch, "lint", command, new_diagnostics(before, after), t0)
+
+def _typecheck(state: TicketState, patch: Patch, files: List[str], olds: Dict[str, Optional[str]]) -> Optional[ToolRun]:
+    t0 = time.perf_counter()
+    python = python_for(state)
+    after, command = typecheck(python, state.repo_ref, files)
+    if after is None:
+        log.warning("verify_typecheck is on but mypy is not installed in %s; skipping", python)
+        return None
+    pre = {f: olds[f] for f in files if olds[f]}
+    before = typecheck(python, state.repo_ref, list(pre), shadows=pre)[0] if pre else []
+    return _run(state, patch, "typecheck", command, new_diagnostics(before or [], after), t0)
+
+
+def verify_agent(state: TicketState) -> Dict[str, Any]:
+    # Static checks of the files the newest patch touched, before a pytest run is spent on it.
+    # A failing run sends the patch to rollback and back to the patch model (graph.route_after_verify).
+    patch = _unchecked_patch(state)
+    if patch is None:
+        return {}
+    files = [f.replace("\\", "/") for f in patch.files_touched]
+    files = [f for f in files if f.endswith(".py") and os.path.isfile(os.path.join(state.repo_ref, f))]
+    if not files:
+        return {}
+    snap = snapshot_dir(state.run_id, patch.patch_id)
+    olds = {f: pre_image(snap, f) for f in files}
+
+    runs = [_lint(state, patch, files, olds)]
+    if state.verify_typecheck and runs[0].status == "success":
+        run = _typecheck(state, patch, files, olds)
+        if run is not None:
+            runs.append(run)
+    return {"tool_runs": runs}
@@ -0,0 +1,136 @@
+# Per-test line coverage of the repo's own sources, for spectrum-based fault localization.
+# Run by se_assistant.localization with the *sandbox* interpreter as
+#   python pytest_coverage.py <out.json> <pytest args...>
+# so this file must stay stdlib-only (plus pytest) and must not import se_assistant.
+#
+# Output: {"files": [rel path, ...],
+#          "tests": {nodeid: {"outcome": "passed" | "failed" | "skipped", "lines": {file index: [line, ...]}}}}
+# Test modules, conftest.py and anything in a virtualenv / site-packages are not traced.
+from __future__ import annotations
+import json
+import os
+import sys
+import threading
+
+EXCLUDED_DIRS = {".venv", "venv", ".tox", "site-packages", "dist-packages", ".git", "__pycache__"}
+
+
+def _is_test_file(name: str) -> bool:
+    return name.startswith("test_") or name.endswith("_test.py") or name == "conftest.py"
+
+
+class Tracer:
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root) + os.sep
+        self.rels: dict = {}      # code filename -> repo-relative path, or None when not traced
+        self.hits: dict = {}      # rel path -> set of lines, for the current test
+        self._monitoring = getattr(sys, "monitoring", None)
+
+    def rel(self, filename: str):
+        if filename not in self.rels:
+            path = os.path.realpath(filename)
+            rel = None
+            if path.startswith(self.root) and path.endswith(".py"):
+                parts = path[len(self.root):].split(os.sep)
+                if not EXCLUDED_DIRS.intersection(parts[:-1]) and not _is_test_file(parts[-1]):
+                    rel = "/".join(parts)
+            self.rels[filename] = rel
+        return self.rels[filename]
+
+    # sys.monitoring (3.12+): a line callback that disables itself for code outside the repo
+    def _on_line(self, code, line):
+        rel = self.rel(code.co_filename)
+        if rel is None:
+            return self._monitoring.DISABLE
+        self.hits.setdefault(rel, set()).add(line)
+
+    # sys.settrace: only repo frames get a local (line) tracer
+    def _global(self, frame, event, arg):
+        rel = self.rel(frame.f_code.co_filename)
+        if rel is None:
+            return None
+        lines = self.hits.setdefault(rel, set())
+
+        def local(frame, event, arg):
+            if event == "line":
+                lines.add(frame.f_lineno)
+            return local
+        return local
+
+    def start(self) -> None:
+        self.hits = {}
+        m = self._monitoring
+        if m is not None:
+            try:
+                m.use_tool_id(m.COVERAGE_ID, "se_assistant")
+            except ValueError:  # taken (coverage.py, a debugger): fall back to settrace
+                self._monitoring = m = None
+        if m is not None:
+            m.register_callback(m.COVERAGE_ID, m.events.LINE, self._on_line)
+            m.set_events(m.COVERAGE_ID, m.events.LINE)
+        else:
+            threading.settrace(self._global)
+            sys.settrace(self._global)
+
+    def stop(self) -> dict:
+        m = self._monitoring
+        if m is not None:
+            m.set_events(m.COVERAGE_ID, 0)
+            m.register_callback(m.COVERAGE_ID, m.events.LINE, None)
+            m.free_tool_id(m.COVERAGE_ID)
+            m.restart_events()  # the next test traces the locations disabled in this one again
+        else:
+            sys.settrace(None)
+            threading.settrace(None)
+        return self.hits
+
+
+class Plugin:
+    def __init__(self, out_path: str, root: str):
+        self.out_path = out_path
+        self.tracer = Tracer(root)
+        self.outcomes: dict = {}
+        self.tests: dict = {}
+
+    def pytest_runtest_protocol(self, item, nextitem):
+        # hookwrapper: trace setup, call and teardown of one test
+        self.tracer.start()
+        try:
+            yield
+        finally:
+            hits = self.tracer.stop()
+            self.tests[item.nodeid] = {"outcome": self.outcomes.pop(item.nodeid, "passed"), "hits": hits}
+
+    def pytest_runtest_logreport(self, report):
+        if report.failed:
+            self.outcomes[report.nodeid] = "failed"
+        elif report.skipped and self.outcomes.get(report.nodeid) != "failed":
+            self.outcomes[report.nodeid] = "skipped"
+
+    def pytest_sessionfinish(self, session, exitstatus):
+        files: dict = {}
+        tests = {}
+        for nodeid, t in self.tests.items():
+            lines = {}
+            for rel, hit in t["hits"].items():
+                lines[str(files.setdefault(rel, len(files)))] = sorted(hit)
+            tests[nodeid] = {"outcome": t["outcome"], "lines": lines}
+        tmp = self.out_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fp:
+            json.dump({"files": list(files), "tests": tests}, fp)
+        os.replace(tmp, self.out_path)
+
+
+def main(argv: list) -> int:
+    # run like `python -m pytest`: the repo root, not this file's directory, is sys.path[0],
+    # so this package's modules (trace.py, tools.py, ...) never shadow the repo's
+    sys.path[0] = os.getcwd()
+    import pytest
+    plugin = Plugin(argv[0], os.getcwd())
+    # a plain method cannot carry the hookwrapper marker before pytest is imported
+    Plugin.pytest_runtest_protocol = pytest.hookimpl(hookwrapper=True)(Plugin.pytest_runtest_protocol)
+    return pytest.main(argv[1:], plugins=[plugin])
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,154 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional
+import os
+import re
+import xml.etree.ElementTree as ET
+
+# xunit1 keeps the file/line attributes on <testcase>, which we need for node ids
+JUNIT_ARGS = ["-o", "junit_family=xunit1"]
+
+MAX_FAILURES = 50
+MAX_RAW_CHARS = 1500
+
+# "src/pkg/mod.py:12: ValueError" / "tests/test_x.py:9: " lines in a long traceback
+_FRAME_RE = re.compile(r"^(?P<path>[^\s:][^:]*\.py):(?P<line>\d+):(?: (?P<exc>[A-Za-z_][\w.]*))?\s*$")
+_EXC_PREFIX_RE = re.compile(r"^([A-Za-z_][\w.]*(?:Error|Exception|Exit|Interrupt|Warning|Failed|Failure)):\s")
+# "..F.s   [ 40%]" progress lines of pytest -q (possibly still incomplete)
+_PROGRESS_RE = re.compile(r"^[.sSxXpPFE]+(?:\s+\[\s*\d+%\])?\s*$")
+
+
+def junit_nodeid(case: ET.Element) -> str:
+    name = case.get("name", "")
+    classname = case.get("classname", "")
+    file = (case.get("file") or "").replace("\\", "/")
+    if file:
+        module = file[:-3].replace("/", ".") if file.endswith(".py") else file
+        rest = classname[len(module) + 1:] if classname.startswith(module + ".") else ""
+        parts = [file] + ([p for p in rest.split(".") if p]) + ([name] if name else [])
+        return "::".join(parts)
+    # xunit2 (no file attr): best effort from the dotted classname
+    parts = classname.split(".")
+    for i in range(len(parts), 0, -1):
+        if parts[i - 1].startswith("test"):
+            path = "/".join(parts[:i]) + ".py"
+            return "::".join([path] + parts[i:] + ([name] if name else []))
+    return "::".join(p for p in (classname, name) if p)
+
+def parse_traceback_frames(text: str) -> List[Dict[str, Any]]:
+    frames = []
+    for line in (text or "").splitlines():
+        m = _FRAME_RE.match(line.strip())
+        if m:
+            frames.append({"path": m.group("path").replace("\\", "/"), "line": int(m.group("line"))})
+            if m.group("exc"):
+                frames[-1]["exc_type"] = m.group("exc")
+    return frames
+
+def _exc_type(message: str, frames: List[Dict[str, Any]], text: str) -> Optional[str]:
+    if frames and frames[-1].get("exc_type"):
+        return frames[-1]["exc_type"]
+    m = _EXC_PREFIX_RE.match(message or "")
+    if m:
+        return m.group(1)
+    for line in reversed((text or "").splitlines()):
+        line = line.strip()
+        if line.startswith("E "):
+            m = _EXC_PREFIX_RE.match(line[1:].strip())
+            if m:
+                return m.group(1)
+    if (message or "").startswith("assert"):
+        return "AssertionError"
+    return None
+
+def _failure_entry(case: ET.Element, node: ET.Element) -> Dict[str, Any]:
+    nodeid = junit_nodeid(case)
+    text = node.text or ""
+    message = (node.get("message") or "").strip()
+    frames = parse_traceback_frames(text)
+    crash = frames[-1] if frames else {}
+    test_file = nodeid.split("::", 1)[0]
+    exc_type = _exc_type(message, frames, text)
+    if exc_type and message.startswith(exc_type + ":"):
+        message = message[len(exc_type) + 1:].strip()
+    return {
+        "nodeid": nodeid,
+        "kind": node.tag,                       # failure | error
+        "file": crash.get("path") or test_file,
+        "line": crash.get("line") or (int(case.get("line")) + 1 if case.get("line") else None),
+        "exc_type": exc_type,
+        "message": message.splitlines()[0][:500] if message else "",
+        "test_file": test_file,
+        "frames": [{"path": f["path"], "line": f["line"]} for f in frames],
+        "raw": text.strip()[-MAX_RAW_CHARS:],
+    }
+
+def parse_junit_xml(path: str) -> Optional[Dict[str, Any]]:
+    # Returns None when pytest did not get far enough to write a report
+    if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    try:
+        root = ET.parse(path).getroot()
+    except ET.ParseError:
+        return None
+
+    failures: List[Dict[str, Any]] = []
+    failed_ids: List[str] = []
+    durations: Dict[str, float] = {}
+    total = 0
+    for case in root.iter("testcase"):
+        total += 1
+        nodeid = junit_nodeid(case)
+        try:
+            durations[nodeid] = float(case.get("time") or 0.0)
+        except ValueError:
+            pass
+        for node in list(case):
+            if node.tag in ("failure", "error"):
+                if nodeid not in failed_ids:
+                    failed_ids.append(nodeid)
+                if len(failures) < MAX_FAILURES:
+                    failures.append(_failure_entry(case, node))
+    return {
+        "tests": total,
+        "failures": failures,
+        "failed_ids": failed_ids,
+        "durations": durations,
+    }
+
+
+def first_failure_watcher() -> Callable[[str, str], bool]:
+    # run_cmd on_output callback: True as soon as a pytest -q progress line shows F or E.
+    # Interrupted, pytest still prints the failures so far; its junit report is incomplete.
+    pending = {"line": ""}
+
+    def watch(stream: str, text: str) -> bool:
+        if stream != "stdout":
+            return False
+        lines = (pending["line"] + text).split("\n")
+        pending["line"] = lines[-1]
+        return any(("F" in ln or "E" in ln) and _PROGRESS_RE.match(ln) for ln in lines)
+    return watch
+
+
+def format_failures(failures: List[Dict[str, Any]], max_items: int = 12, max_chars: int = 2200, with_raw: bool = True) -> str:
+    chunks = []
+    for it in failures[:max_items]:
+        if not isinstance(it, dict):
+            chunks.append(str(it))
+            continue
+        if not it.get("nodeid"):
+            # legacy regex-scraped entry
+            chunks.append((it.get("raw") or "").strip())
+            continue
+        head = f"{it['nodeid']}: {it.get('exc_type') or it.get('kind', 'failure')}"
+        if it.get("message"):
+            head += f": {it['message']}"
+        lines = [head, f"  at {it.get('file')}:{it.get('line')}"]
+        frames = it.get("frames") or []
+        if len(frames) > 1:
+            lines.append("  frames: " + " -> ".join(f"{f['path']}:{f['line']}" for f in frames))
+        if with_raw and it.get("raw"):
+            lines.append(it["raw"])
+        chunks.append("\n".join(lines))
+    text = "\n\n---\n\n".join(c for c in chunks if c).strip()
+    return text[:max_chars]
@@ -0,0 +1,179 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import heapq
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from se_assistant import trace
+from se_assistant.pytest_results import JUNIT_ARGS, MAX_FAILURES, parse_junit_xml
+from se_assistant.tools import kill_process_group, process_group_kwargs, run_cmd, shell_join, tail
+
+DEFAULT_TEST_SEC = 0.5   # assumed duration for tests we have never timed
+POLL_SEC = 0.05
+
+
+def collect_nodeids(python: str, repo_ref: str, args: List[str], timeout_sec: int = 60,
+                    env: Optional[Dict[str, str]] = None) -> Optional[List[str]]:
+    # None when collection itself failed: sharding the ids we did get would hide the broken module
+    cmd = shell_join([python, "-m", "pytest", "--collect-only", "-q", "-p", "no:cacheprovider", *args])
+    res = run_cmd(repo_ref, cmd, timeout_sec=timeout_sec, env=env)
+    if res.get("exit_code") != 0:
+        return None
+    return [ln.strip() for ln in (res.get("stdout") or "").splitlines() if "::" in ln and not ln.startswith(" ")]
+
+def plan_shards(nodeids: List[str], n: int, durations: Dict[str, float], whole_files: bool = True) -> List[List[str]]:
+    # Shard by test file so module/class fixtures run once per shard; fall back to node ids
+    # when there are fewer files than workers. whole_files=False (the run selected node ids,
+    # e.g. only the failed tests) still balances per file but emits the ids themselves, so a
+    # shard never widens to tests outside the selection.
+    by_file: Dict[str, List[str]] = {}
+    for nid in nodeids:
+        by_file.setdefault(nid.split("::", 1)[0], []).append(nid)
+    units = list(by_file.items()) if len(by_file) >= n else [(nid, [nid]) for nid in nodeids]
+
+    known = [d for d in durations.values() if d > 0]
+    default = sum(known) / len(known) if known else DEFAULT_TEST_SEC
+    weights = [(sum(durations.get(nid, default) for nid in ids), [unit] if whole_files else ids) for unit, ids in units]
+
+    # Longest-processing-time first onto the least loaded shard
+    n = max(1, min(n, len(units)))
+    heap = [(0.0, i) for i in range(n)]
+    shards: List[List[str]] = [[] for _ in range(n)]
+    for w, members in sorted(weights, key=lambda x: -x[0]):
+        load, i = heapq.heappop(heap)
+        shards[i].extend(members)
+        heapq.heappush(heap, (load + w, i))
+    return [s for s in shards if s]
+
+def combine_exit_codes(codes: List[int]) -> int:
+    # 5 = "no tests collected" in a shard is not an error for the whole run
+    codes = [c for c in codes if c != 5]
+    if not codes:
+        return 5
+    return 0 if all(c == 0 for c in codes) else max(codes)
+
+
+def run_pytest_processes(
+    jobs: List[Dict[str, Any]],
+    timeout_sec: int = 30,
+    stop_when: Optional[Callable[[int], bool]] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    # Runs one pytest process per job ({"args": [...], "cwd": str, "python": str, "env": optional})
+    # concurrently. Once a finished job's exit code satisfies stop_when, the rest are cancelled.
+    # Returns ([{"exit_code", "cancelled", "stdout", "report"}, ...], timed_out)
+    with trace.timed("subprocess", f"pytest x{len(jobs)}"):
+        return _run_pytest_processes(jobs, timeout_sec, stop_when)
+
+def _run_pytest_processes(jobs: List[Dict[str, Any]], timeout_sec: int, stop_when: Optional[Callable[[int], bool]]) -> Tuple[List[Dict[str, Any]], bool]:
+    start = time.time()
+    tmpdir = tempfile.mkdtemp(prefix="se_pytest_")
+    procs = []
+    for i, job in enumerate(jobs):
+        junit = os.path.join(tmpdir, f"junit_{i}.xml")
+        out = open(os.path.join(tmpdir, f"out_{i}.txt"), "w+", encoding="utf-8", errors="replace")
+        # no cacheprovider: concurrent runs would race on .pytest_cache
+        argv = [job["python"], "-m", "pytest", "-q", "-p", "no:cacheprovider", *job["args"], f"--junitxml={junit}", *JUNIT_ARGS]
+        p = subprocess.Popen(argv, cwd=job["cwd"], env=job.get("env"), stdout=out, stderr=subprocess.STDOUT,
+                             **process_group_kwargs())
+        procs.append({"proc": p, "junit": junit, "out": out, "cancelled": False})
+
+    deadline = start + timeout_sec
+    timed_out = False
+    pending = list(procs)
+    while pending:
+        for s in list(pending):
+            code = s["proc"].poll()
+            if code is None:
+                continue
+            pending.remove(s)
+            if stop_when is not None and stop_when(code):
+                for other in pending:
+                    kill_process_group(other["proc"].pid)
+                    other["cancelled"] = True
+        if pending and time.time() > deadline:
+            timed_out = True
+            for s in pending:
+                kill_process_group(s["proc"].pid)
+                s["cancelled"] = True
+        if pending:
+            time.sleep(POLL_SEC)
+
+    results = []
+    for s in procs:
+        s["proc"].wait()
+        s["out"].seek(0)
+        stdout = tail(s["out"].read(), 4000)
+        s["out"].close()
+        results.append({
+            "exit_code": None if s["cancelled"] else s["proc"].returncode,
+            "cancelled": s["cancelled"],
+            "stdout": stdout,
+            "report": parse_junit_xml(s["junit"]),
+        })
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return results, timed_out
+
+
+def run_sharded(
+    python: str,
+    repo_ref: str,
+    args: List[str],
+    workers: int,
+    durations: Optional[Dict[str, float]] = None,
+    fail_fast: bool = False,
+    timeout_sec: int = 30,
+    env: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    # Same result shape as tools.run_cmd plus "report" (merged junit report) and "shards"
+    start = time.time()
+    nodeids = collect_nodeids(python, repo_ref, args, timeout_sec=timeout_sec, env=env)
+    whole_files = not any("::" in a for a in args)
+    shards = plan_shards(nodeids, workers, durations or {}, whole_files=whole_files) if nodeids else []
+    if len(shards) <= 1:
+        shards = [list(args)]
+
+    jobs = [{"python": python, "cwd": repo_ref, "args": shard + (["-x"] if fail_fast else []), "env": env} for shard in shards]
+    # fail_fast: we only need "is it still red?", so the first red shard stops the others
+    stop_when = (lambda code: code not in (0, 5)) if fail_fast else None
+    results, timed_out = run_pytest_processes(jobs, timeout_sec=max(1, int(start + timeout_sec - time.time())), stop_when=stop_when)
+
+    failures: List[Dict[str, Any]] = []
+    failed_ids: List[str] = []
+    merged_durations: Dict[str, float] = {}
+    codes: List[int] = []
+    stdout_parts: List[str] = []
+    have_report = False
+    for i, r in enumerate(results):
+        stdout_parts.append(f"===== shard {i + 1}/{len(results)}{' (cancelled)' if r['cancelled'] else ''} =====\n" + r["stdout"])
+        report = r["report"]
+        if report:
+            have_report = True
+            failures += report["failures"]
+            failed_ids += [n for n in report["failed_ids"] if n not in failed_ids]
+            merged_durations.update(report["durations"])
+        if not r["cancelled"]:
+            codes.append(r["exit_code"])
+
+    dur = time.time() - start
+    if timed_out:
+        status, exit_code = "timeout", None
+    else:
+        exit_code = combine_exit_codes(codes)
+        status = "success" if exit_code == 0 else "fail"
+    return {
+        "status": status,
+        "exit_code": exit_code,
+        "duration_sec": dur,
+        "stdout": "\n".join(stdout_parts),
+        "stderr": "TIMEOUT" if timed_out else "",
+        "shards": len(results),
+        "report": {
+            "tests": len(merged_durations),
+            "failures": failures[:MAX_FAILURES],
+            "failed_ids": failed_ids,
+            "durations": merged_durations,
+        } if have_report else None,
+    }
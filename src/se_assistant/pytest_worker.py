@@ -0,0 +1,176 @@
+# Long-lived pytest runner. Started by se_assistant.warm_runner with the *sandbox*
+# interpreter, so this file must stay stdlib-only (plus pytest) and must not import se_assistant.
+#
+# Protocol: one JSON object per line.
+#   request:  {"args": [...], "changed": ["src/pkg/mod.py", ...], "log_path": optional}  |  {"cmd": "shutdown"}
+#             log_path: where to write the run's full (untruncated) output
+#   response: {"exit_code": int, "output": str, "duration_sec": float, "reloaded": [...]}
+#             {"restart": true, "reason": str}   -> reload not safe, caller must use a fresh process
+from __future__ import annotations
+import io
+import json
+import os
+import sys
+import time
+import tempfile
+
+UNSAFE_BASENAMES = {"conftest.py", "pytest.ini", "setup.cfg", "tox.ini", "pyproject.toml"}
+OUTPUT_TAIL = 20000
+
+
+def _norm(path: str) -> str:
+    return os.path.normcase(os.path.realpath(path))
+
+def _is_test_module(path: str) -> bool:
+    name = os.path.basename(path)
+    return name.startswith("test_") or name.endswith("_test.py")
+
+
+class Worker:
+    def __init__(self, repo: str):
+        self.repo = _norm(repo)
+        self.excluded = tuple(_norm(os.path.join(repo, d)) + os.sep for d in (".venv", "venv", ".tox", "site-packages"))
+        self.stats: dict = {}   # module file -> (mtime_ns, size) as of the end of the last run
+
+    def _repo_file(self, mod) -> str | None:
+        f = getattr(mod, "__file__", None)
+        if not f:
+            return None
+        f = _norm(f)
+        if not f.startswith(self.repo + os.sep) or f.startswith(self.excluded):
+            return None
+        return f
+
+    def _stat(self, path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def invalidate(self, changed: list) -> tuple[list, str | None]:
+        # Returns (purged module names, reason-if-unsafe)
+        changed_files = {_norm(os.path.join(self.repo, c)) for c in changed}
+        for f in changed_files:
+            if os.path.basename(f) in UNSAFE_BASENAMES:
+                return [], f"config/plugin file changed: {os.path.basename(f)}"
+
+        local = {}
+        for name, mod in list(sys.modules.items()):
+            f = self._repo_file(mod) if mod is not None else None
+            if f:
+                local[name] = (mod, f)
+
+        # Anything whose file changed since we last looked counts, not only files_touched
+        for name, (mod, f) in local.items():
+            if self.stats.get(f) is not None and self._stat(f) != self.stats.get(f):
+                changed_files.add(f)
+
+        purge = set()
+        for name, (mod, f) in local.items():
+            if f in changed_files:
+                if not f.endswith(".py"):
+                    return [], f"compiled module changed: {name}"
+                purge.add(name)
+            elif _is_test_module(f):
+                # pytest would otherwise re-use the cached test module (and its stale imports)
+                purge.add(name)
+
+        # Repo modules holding references into purged modules must go too
+        grew = True
+        while grew:
+            grew = False
+            for name, (mod, f) in local.items():
+                if name in purge:
+                    continue
+                for v in list(vars(mod).values()):
+                    owner = v.__name__ if isinstance(v, type(sys)) else getattr(v, "__module__", None)
+                    if owner in purge:
+                        purge.add(name)
+                        grew = True
+                        break
+
+        for name in purge:
+            sys.modules.pop(name, None)
+            parent, _, child = name.rpartition(".")
+            if parent and parent in sys.modules and getattr(sys.modules[parent], child, None) is not None:
+                try:
+                    delattr(sys.modules[parent], child)
+                except AttributeError:
+                    pass
+        return sorted(purge), None
+
+    def snapshot(self) -> None:
+        self.stats = {}
+        for mod in list(sys.modules.values()):
+            f = self._repo_file(mod) if mod is not None else None
+            if f:
+                self.stats[f] = self._stat(f)
+
+
+def main() -> int:
+    # Keep private copies of the pipes; fd 0/1/2 belong to pytest from here on
+    proto_in = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    proto_out = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+    log = tempfile.TemporaryFile()
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(log.fileno(), 1)
+    os.dup2(log.fileno(), 2)
+    sys.stdout = io.TextIOWrapper(os.fdopen(1, "wb", closefd=False), encoding="utf-8", line_buffering=True)
+    sys.stderr = io.TextIOWrapper(os.fdopen(2, "wb", closefd=False), encoding="utf-8", line_buffering=True)
+
+    # Behave like `python -m pytest` from the repo root, not like a script living in se_assistant/
+    sys.path[0] = os.getcwd()
+    import pytest  # the expensive part we want to keep warm
+
+    worker = Worker(os.getcwd())
+    proto_out.write(json.dumps({"ready": True, "pid": os.getpid()}) + "\n")
+
+    for line in proto_in:
+        line = line.strip()
+        if not line:
+            continue
+        req = json.loads(line)
+        if req.get("cmd") == "shutdown":
+            break
+
+        purged, unsafe = worker.invalidate(req.get("changed") or [])
+        if unsafe:
+            proto_out.write(json.dumps({"restart": True, "reason": unsafe}) + "\n")
+            continue
+
+        log.seek(0)
+        log.truncate()
+        start = time.time()
+        try:
+            code = int(pytest.main(list(req.get("args") or [])))
+        except BaseException as e:  # SystemExit from plugins, internal errors...
+            proto_out.write(json.dumps({"restart": True, "reason": f"{type(e).__name__}: {e}"}) + "\n")
+            continue
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        dur = time.time() - start
+        worker.snapshot()
+
+        log.seek(0)
+        output = log.read().decode("utf-8", errors="replace")
+        if req.get("log_path"):
+            try:
+                os.makedirs(os.path.dirname(req["log_path"]) or ".", exist_ok=True)
+                with open(req["log_path"], "w", encoding="utf-8") as fp:
+                    fp.write(output)
+            except OSError:
+                pass  # the log is a convenience; the run itself succeeded
+        proto_out.write(json.dumps({
+            "exit_code": code,
+            "duration_sec": dur,
+            "output": output[-OUTPUT_TAIL:],
+            "reloaded": purged,
+        }) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
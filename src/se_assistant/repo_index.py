@@ -0,0 +1,154 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import stat
+import subprocess
+import threading
+
+from se_assistant import trace
+from se_assistant.tools import cache_dir, list_repo_files
+from se_assistant.workspace import SKIP_DIRS
+
+log = logging.getLogger(__name__)
+
+# Persistent per-repo file index: path -> size, mtime, language, content hash.
+# Stored as one JSON file per repo_ref under cache_dir("repo_index"); refreshes only stat
+# every file and re-hash the ones whose (size, mtime) changed.
+INDEX_VERSION = 1
+
+LANGUAGES = {
+    ".py": "python", ".pyi": "python", ".pyx": "cython",
+    ".js": "javascript", ".jsx": "javascript", ".mjs": "javascript", ".cjs": "javascript",
+    ".ts": "typescript", ".tsx": "typescript",
+    ".java": "java", ".kt": "kotlin", ".go": "go", ".rs": "rust", ".rb": "ruby", ".php": "php",
+    ".c": "c", ".h": "c", ".cc": "cpp", ".cpp": "cpp", ".hpp": "cpp", ".cs": "csharp",
+    ".sh": "shell", ".sql": "sql", ".html": "html", ".css": "css",
+    ".md": "markdown", ".rst": "rst", ".txt": "text",
+    ".toml": "toml", ".yaml": "yaml", ".yml": "yaml", ".json": "json", ".ini": "ini", ".cfg": "ini",
+}
+FILENAMES = {"Dockerfile": "dockerfile", "Makefile": "make"}
+
+
+def language_of(path: str) -> Optional[str]:
+    name = path.rsplit("/", 1)[-1]
+    if name in FILENAMES:
+        return FILENAMES[name]
+    return LANGUAGES.get(os.path.splitext(name)[1].lower())
+
+def _sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _skipped(rel: str) -> bool:
+    return any(part in SKIP_DIRS for part in rel.split("/")[:-1])
+
+
+def _git_files(repo_ref: str) -> Optional[List[str]]:
+    # Tracked + untracked-but-not-ignored files; None when this is not a usable git checkout
+    if not os.path.exists(os.path.join(repo_ref, ".git")):
+        return None
+    try:
+        with trace.timed("subprocess", "git ls-files"):
+            p = subprocess.run(
+                ["git", "-C", repo_ref, "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+                capture_output=True, timeout=60,
+            )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if p.returncode != 0:
+        return None
+    paths = {x for x in p.stdout.decode("utf-8", "surrogateescape").split("\0") if x}
+    return sorted(x for x in paths if not _skipped(x))
+
+def _gitignore_patterns(repo_ref: str) -> List[str]:
+    # Root .gitignore only, without negations; enough for checkouts that have no .git
+    try:
+        with open(os.path.join(repo_ref, ".gitignore"), "r", encoding="utf-8") as fp:
+            lines = fp.read().splitlines()
+    except OSError:
+        return []
+    return [ln.strip() for ln in lines if ln.strip() and not ln.startswith(("#", "!"))]
+
+def _ignored(rel: str, patterns: List[str]) -> bool:
+    parts = rel.split("/")
+    for pat in patterns:
+        anchored = pat.startswith("/")
+        pat = pat.strip("/")
+        if anchored or "/" in pat:
+            # match the path itself or any of its parent directories
+            if any(fnmatch.fnmatch("/".join(parts[:i]), pat) for i in range(1, len(parts) + 1)):
+                return True
+        elif any(fnmatch.fnmatch(part, pat) for part in parts):
+            return True
+    return False
+
+def _walk_files(repo_ref: str) -> List[str]:
+    patterns = _gitignore_patterns(repo_ref)
+    return [f for f in list_repo_files(repo_ref) if not _ignored(f, patterns)]
+
+
+def index_path(repo_ref: str) -> str:
+    key = hashlib.sha1(os.path.abspath(repo_ref).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir("repo_index"), f"{key}.json")
+
+def load_index(repo_ref: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(index_path(repo_ref), "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != INDEX_VERSION or data.get("repo_ref") != os.path.abspath(repo_ref):
+        return {}
+    return data.get("files", {})
+
+def save_index(repo_ref: str, files: Dict[str, Dict[str, Any]]) -> None:
+    path = index_path(repo_ref)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fp:
+        json.dump({"version": INDEX_VERSION, "repo_ref": os.path.abspath(repo_ref), "files": files}, fp)
+    os.replace(tmp, path)  # concurrent runs on the same repo never see a half-written index
+
+
+_lock = threading.Lock()
+
+def refresh_index(repo_ref: str) -> Dict[str, Dict[str, Any]]:
+    # -> {path: {"size", "mtime_ns", "language", "sha1"}} for every non-ignored file
+    with _lock:
+        old = load_index(repo_ref)
+        paths = _git_files(repo_ref)
+        if paths is None:
+            paths = _walk_files(repo_ref)
+
+        files: Dict[str, Dict[str, Any]] = {}
+        changed = 0
+        for rel in paths:
+            full = os.path.join(repo_ref, rel)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue  # tracked but deleted in the worktree
+            if not stat.S_ISREG(st.st_mode):
+                continue  # submodules show up as directories
+            prev = old.get(rel)
+            if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+                files[rel] = prev
+                continue
+            try:
+                sha = _sha1(full)
+            except OSError:
+                continue
+            files[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "language": language_of(rel), "sha1": sha}
+            changed += 1
+
+        if changed or len(files) != len(old):
+            save_index(repo_ref, files)
+        removed = len(set(old) - set(files))
+        log.info("Repo index: %d files (%d hashed, %d reused, %d removed)", len(files), changed, len(files) - changed, removed)
+        return files
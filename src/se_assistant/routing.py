@@ -0,0 +1,130 @@
+from __future__ import annotations
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import json
+import logging
+import os
+import threading
+import time
+
+from se_assistant import limits
+
+log = logging.getLogger(__name__)
+
+# Which model, on which Ollama backend, serves each LLM node. Every route is an escalation
+# ladder: tier 0 answers first and the next tier is asked when the answer is unusable
+# (invalid JSON, low confidence) or the model/backend is unavailable. Override the defaults
+# with SE_ASSISTANT_MODELS (inline JSON or a path to a JSON file):
+#   {"backends": {"local": {"base_url": "http://localhost:11434", "max_concurrency": 2},
+#                 "gpu": {"base_url": "http://gpu-box:11434", "max_concurrency": 4, "timeout": 120}},
+#    "routes": {"file_select": ["local/qwen2.5:3b", "local/qwen2.5:7b"],
+#               "json_repair": ["local/qwen2.5:3b"],
+#               "patch": ["gpu/qwen2.5-coder:14b", "gpu/qwen2.5-coder:32b"]}}
+# A route entry is "backend/model" or just "model" (default backend). max_concurrency caps
+# in-flight calls per backend across all tickets in the process (limits slot "llm:<backend>").
+
+DEFAULT_MODEL = "qwen2.5:7b"
+SMALL_MODEL = "qwen2.5:3b"
+DEFAULT_BACKEND = "local"
+
+DEFAULT_ROUTES: Dict[str, List[str]] = {
+    "file_select": [SMALL_MODEL, DEFAULT_MODEL],
+    "json_repair": [SMALL_MODEL, DEFAULT_MODEL],
+    "patch": [DEFAULT_MODEL],
+}
+
+# A model that 404s / a backend that refuses connections is skipped for this long
+UNAVAILABLE_SEC = 300
+
+
+class Backend(NamedTuple):
+    name: str
+    base_url: str
+    max_concurrency: Optional[int] = None
+    timeout: float = 60.0
+
+    @property
+    def slot(self) -> str:
+        return f"llm:{self.name}"
+
+class Tier(NamedTuple):
+    model: str
+    backend: Backend
+
+
+_config: Optional[Dict[str, Any]] = None
+_unavailable: Dict[Tuple[str, str], float] = {}
+_lock = threading.Lock()
+
+
+def _default_backend() -> Dict[str, Any]:
+    host = os.environ.get("OLLAMA_HOST") or "http://localhost:11434"
+    return {"base_url": host if "://" in host else f"http://{host}"}
+
+def _load() -> Dict[str, Any]:
+    raw = os.environ.get("SE_ASSISTANT_MODELS")
+    if not raw:
+        return {}
+    if raw.lstrip().startswith("{"):
+        return json.loads(raw)
+    with open(raw, "r", encoding="utf-8") as fp:
+        return json.load(fp)
+
+def configure(config: Optional[Dict[str, Any]] = None) -> None:
+    # Programmatic SE_ASSISTANT_MODELS; None re-reads the environment
+    global _config
+    cfg = dict(config if config is not None else _load())
+    backends = {DEFAULT_BACKEND: _default_backend(), **cfg.get("backends", {})}
+    cfg["backends"] = {
+        name: Backend(name, b["base_url"].rstrip("/"), b.get("max_concurrency"), float(b.get("timeout", 60)))
+        for name, b in backends.items()
+    }
+    cfg["routes"] = {**DEFAULT_ROUTES, **cfg.get("routes", {})}
+    for b in cfg["backends"].values():
+        limits.setdefault(b.slot, b.max_concurrency)
+    with _lock:
+        _config = cfg
+        _unavailable.clear()
+
+def _cfg() -> Dict[str, Any]:
+    if _config is None:
+        configure()
+    return _config
+
+def backends() -> Dict[str, Backend]:
+    return _cfg()["backends"]
+
+def backend(name: Optional[str] = None) -> Backend:
+    return backends()[name or DEFAULT_BACKEND]
+
+def _tier(spec: str) -> Tier:
+    # "gpu/qwen2.5-coder:14b" -> backend gpu; model names may contain "/" themselves
+    name, sep, model = spec.partition("/")
+    if sep and name in backends():
+        return Tier(model, backends()[name])
+    return Tier(spec, backend())
+
+def route(node: str) -> List[Tier]:
+    # The node's ladder, skipping tiers marked unavailable (unless that would leave none)
+    specs = _cfg()["routes"].get(node) or [DEFAULT_MODEL]
+    tiers = [_tier(s) for s in specs]
+    now = time.time()
+    with _lock:
+        up = [t for t in tiers if _unavailable.get((t.backend.name, t.model), 0) < now]
+    return up or tiers
+
+def context_model(node: str) -> str:
+    # Prompts are packed once per node, so budget for the smallest window on the ladder
+    from se_assistant.context import DEFAULT_CONTEXT, MODEL_CONTEXT
+    return min((t.model for t in route(node)), key=lambda m: MODEL_CONTEXT.get(m, DEFAULT_CONTEXT))
+
+def mark_unavailable(tier: Tier, error: Exception) -> None:
+    log.warning("Model %s on %s unavailable for %ds: %s: %s", tier.model, tier.backend.name,
+                UNAVAILABLE_SEC, type(error).__name__, error)
+    with _lock:
+        _unavailable[(tier.backend.name, tier.model)] = time.time() + UNAVAILABLE_SEC
+
+def is_unavailable_error(e: Exception) -> bool:
+    # model not pulled on that backend (HTTP 404) or the backend is not reachable
+    if getattr(e, "status_code", None) == 404:
+        return True
+    return isinstance(e, ConnectionError) or type(e).__name__ in ("ConnectError", "ConnectTimeout")
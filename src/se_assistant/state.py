@@ -1,10 +1,42 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, Literal
+from typing import Annotated, Any, Callable, Dict, List, Optional, Literal
 from pydantic import BaseModel, Field
 
+from se_assistant.artifacts import get_json, get_text
+
 TaskType = Literal["bugfix", "refactor", "optimization", "docs"]
 RunStatus = Literal["success", "fail", "timeout", "error"]
-FinalStatus = Literal["completed", "completed_with_warnings", "stopped_for_review", "failed"]
+TestScope = Literal["full", "failed", "affected"]
+FinalStatus = Literal["success", "completed", "completed_with_warnings", "stopped_for_review", "failed"]
+
+# History caps. The list channels of TicketState are reducer channels: nodes return only
+# their new (or changed) items and LangGraph merges them, keeping the newest N, so a step's
+# state size does not grow with the number of iterations.
+MAX_TOOL_RUNS = 24
+MAX_NOTES = 50
+MAX_HYPOTHESES = 10
+
+
+def append_capped(cap: int) -> Callable[[List[Any], List[Any]], List[Any]]:
+    def reduce(left: List[Any], right: List[Any]) -> List[Any]:
+        merged = list(left or []) + list(right or [])
+        return merged[-cap:]
+    return reduce
+
+def upsert_by(key: str, cap: Optional[int] = None) -> Callable[[List[Any], List[Any]], List[Any]]:
+    # Items whose key is already present replace the old entry in place, others are appended
+    def reduce(left: List[Any], right: List[Any]) -> List[Any]:
+        merged = list(left or [])
+        pos = {getattr(x, key): i for i, x in enumerate(merged)}
+        for item in right or []:
+            k = getattr(item, key)
+            if k in pos:
+                merged[pos[k]] = item
+            else:
+                pos[k] = len(merged)
+                merged.append(item)
+        return merged[-cap:] if cap else merged
+    return reduce
 
 class CodeLocation(BaseModel):
     path: str
@@ -21,27 +53,54 @@ class Hypothesis(BaseModel):
 class Patch(BaseModel):
     patch_id: str
     summary: str
-    diff_unified: str
+    diff_ref: Optional[str] = None                              # unified diff, in the artifact store
     files_touched: List[str] = Field(default_factory=list)
     confidence: float = 0.5
+    iteration: int = 0                                          # repair iteration that produced it
+    reverted: bool = False                                      # rolled back (see transaction.py)
+    revert_reason: Optional[str] = None                         # why, shown to the patch model
+    known_fix_id: Optional[int] = None                          # replayed from the fix knowledge base (fix_kb.py)
+
+    def diff_text(self) -> str:
+        return get_text(self.diff_ref)
 
 class ToolRun(BaseModel):
     run_id: str
-    run_type: Literal["install", "test", "lint", "typecheck"]
+    run_type: Literal["install", "test", "lint", "typecheck", "coverage"]
     command: str
+    scope: TestScope = "full"                                   # full suite or a partial stage
     status: RunStatus
     exit_code: Optional[int] = None
     duration_sec: Optional[float] = None
-    stdout_tail: Optional[str] = None
-    stderr_tail: Optional[str] = None
+    stdout_ref: Optional[str] = None                            # output tails, in the artifact store
+    stderr_ref: Optional[str] = None
     failures_parsed: List[Dict[str, Any]] = Field(default_factory=list)
+    failed_tests: List[str] = Field(default_factory=list)       # pytest node ids
+    durations_ref: Optional[str] = None                         # {node id: seconds}, in the artifact store
+    patches_applied: int = 0                                    # active patches when the run started
+    iteration: int = 0                                          # repair iteration the run belongs to
+    log_path: Optional[str] = None                              # full output (TicketState.test_log)
+    patch_id: Optional[str] = None                              # lint/typecheck: the patch that was checked
+
+    def stdout_text(self) -> str:
+        return get_text(self.stdout_ref)
+
+    def stderr_text(self) -> str:
+        return get_text(self.stderr_ref)
+
+    def test_durations(self) -> Dict[str, float]:
+        return get_json(self.durations_ref, {})
 
 class RepoMap(BaseModel):
-    files: List[Dict[str, Any]] = Field(default_factory=list)   # path, language, size
+    files_ref: Optional[str] = None                             # [{path, language, size}], in the artifact store
+    file_count: int = 0
     configs_found: List[str] = Field(default_factory=list)      # pyproject.toml, package.json, ...
     test_framework: Optional[str] = None                        # pytest, jest, ...
     entrypoints: List[str] = Field(default_factory=list)
 
+    def files(self) -> List[Dict[str, Any]]:
+        return get_json(self.files_ref, [])
+
 class HITL(BaseModel):
     required: bool = False
     reason: Optional[str] = None
@@ -71,25 +130,47 @@ class TicketState(BaseModel):
 
     # settings
     timeout_sec: int = 30
+    test_mode: Literal["full", "staged"] = "staged"  # staged: failed ids -> affected tests -> full suite
+    test_runner: Literal["cold", "warm", "sharded"] = "cold"  # warm: long-lived pytest process per repo_ref
+    test_workers: Optional[int] = None               # sharded: parallel pytest processes (default: CPU count)
+    test_fail_fast: bool = False                     # stop at the first red test (sharded: stop all shards)
+    test_log: bool = False                           # tee full pytest output to <cache>/logs/<run_id>/
+    python_path: Optional[str] = None                # test interpreter, set by the repo node (envs.py)
+    verify_typecheck: bool = False                   # also run mypy on patched files before testing
+    patch_candidates: int = 1                        # >1: speculative patches tested in parallel clones
+    llm_cache: bool = True                           # reuse LLM responses for identical prompts (see llm_cache.py)
+    fix_kb: bool = True                              # replay fixes that worked for similar failures (see fix_kb.py)
+    localization: Literal["ochiai", "tarantula", "off"] = "ochiai"  # coverage-based fault localization formula
+    context_tokens: Optional[int] = None             # prompt token budget (default: model window minus reply)
+    revert_on_regression: bool = True                # undo a patch that leaves more tests red than before it
+    revert_on_stop: bool = True                      # undo patches when the run stops for review
+    keep_best_on_stop: bool = True                   # ... except those of the iteration with the fewest failures
 
     # shared context
     repo_map: RepoMap = Field(default_factory=RepoMap)
-    assumptions: List[str] = Field(default_factory=list)
-    open_questions: List[str] = Field(default_factory=list)
-    code_locations: List[CodeLocation] = Field(default_factory=list)
+    assumptions: Annotated[List[str], append_capped(MAX_NOTES)] = Field(default_factory=list)
+    open_questions: Annotated[List[str], append_capped(MAX_NOTES)] = Field(default_factory=list)
+    code_locations: Annotated[List[CodeLocation], append_capped(MAX_NOTES)] = Field(default_factory=list)
+    coverage_ref: Optional[str] = None               # per-test line spectra, in the artifact store (localization.py)
+    baseline_ref: Optional[str] = None               # {failures, failed_tests} of the first red run before any patch, in the artifact store
 
-    # agent outputs
-    hypotheses: List[Hypothesis] = Field(default_factory=list)
-    patches: List[Patch] = Field(default_factory=list)
-    tool_runs: List[ToolRun] = Field(default_factory=list)
+    # agent outputs (return only new items; see append_capped / upsert_by)
+    hypotheses: Annotated[List[Hypothesis], upsert_by("id", MAX_HYPOTHESES)] = Field(default_factory=list)
+    patches: Annotated[List[Patch], upsert_by("patch_id")] = Field(default_factory=list)  # uncapped: rollback needs every snapshot id
+    tool_runs: Annotated[List[ToolRun], upsert_by("run_id", MAX_TOOL_RUNS)] = Field(default_factory=list)
 
     # safety & control
-    risk_flags: List[str] = Field(default_factory=list)
+    risk_flags: Annotated[List[str], append_capped(MAX_NOTES)] = Field(default_factory=list)
     safety_ok: bool = True
     hitl: HITL = Field(default_factory=HITL)
     iteration: Iteration = Field(default_factory=Iteration)
     quality: Quality = Field(default_factory=Quality)
+    metrics: Dict[str, float] = Field(default_factory=dict)
 
     # final
     final_report: Optional[str] = None
     final_status: Optional[FinalStatus] = None
+
+    def baseline(self) -> Dict[str, Any]:
+        # kept apart from tool_runs, whose cap may have dropped the run itself
+        return get_json(self.baseline_ref, {})
@@ -0,0 +1,188 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+import ast
+import builtins
+import json
+import os
+import re
+import shutil
+from collections import Counter
+
+from se_assistant.tools import run_cmd
+
+# Cheap checks of a patched file before any test runs. Diagnostics are dicts
+# {path, line, col, code, message}:
+#   E999  does not compile (syntax / indentation / symbol table errors), via compile()
+#   F821  undefined name: an AST pass with pyflakes-style scoping, or ruff when it is on PATH
+#   mypy  type errors (typecheck(), opt-in: a subprocess, seconds rather than milliseconds)
+# Only diagnostics the patch introduced count: see new_diagnostics().
+
+# pyflakes' "obviously broken" selection: syntax errors, bad comparisons/statements, undefined names
+RUFF_SELECT = "E9,F63,F7,F82"
+
+_SCOPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef,
+           ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+_FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)
+_IMPLICIT = set(dir(builtins)) | {
+    "__name__", "__file__", "__doc__", "__builtins__", "__spec__", "__loader__",
+    "__package__", "__path__", "__annotations__", "__class__", "__qualname__", "__module__",
+}
+
+
+def _diag(path: str, line: int, col: int, code: str, message: str) -> Dict[str, Any]:
+    return {"path": path, "line": line, "col": col, "code": code, "message": message}
+
+def format_diagnostics(diags: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"{d['path']}:{d['line']}:{d['col']}: {d['code']} {d['message']}" for d in diags)
+
+
+# -- undefined names ------------------------------------------------------------
+def _outer_parts(node: ast.AST) -> List[ast.AST]:
+    # parts of a nested scope that are evaluated in the enclosing scope
+    if isinstance(node, _FUNCTIONS):
+        a = node.args
+        parts = list(a.defaults) + [d for d in a.kw_defaults if d is not None]
+        if not isinstance(node, ast.Lambda):
+            args = a.posonlyargs + a.args + a.kwonlyargs + [a.vararg, a.kwarg]
+            parts += node.decorator_list + [x.annotation for x in args if x is not None and x.annotation is not None]
+            if node.returns is not None:
+                parts.append(node.returns)
+        return parts
+    if isinstance(node, ast.ClassDef):
+        return node.decorator_list + node.bases + [k.value for k in node.keywords]
+    return [node.generators[0].iter]
+
+def _inner_parts(node: ast.AST) -> List[ast.AST]:
+    if isinstance(node, (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return list(node.body)
+    if isinstance(node, ast.Lambda):
+        return [node.body]
+    parts = [node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt]
+    for i, g in enumerate(node.generators):
+        parts += [g.target, *g.ifs] + ([g.iter] if i else [])
+    return parts
+
+def _walk_scope(node: ast.AST) -> Iterator[ast.AST]:
+    # every node evaluated in this scope; nested scopes are yielded but not entered
+    stack = _inner_parts(node)
+    while stack:
+        n = stack.pop()
+        yield n
+        stack.extend(_outer_parts(n) if isinstance(n, _SCOPES) else ast.iter_child_nodes(n))
+
+def _bindings(scope: ast.AST, nodes: List[ast.AST]) -> Set[str]:
+    names: Set[str] = set()
+    if isinstance(scope, _FUNCTIONS):
+        a = scope.args
+        names |= {x.arg for x in a.posonlyargs + a.args + a.kwonlyargs + [a.vararg, a.kwarg] if x is not None}
+    for n in nodes:
+        if isinstance(n, ast.Name) and isinstance(n.ctx, (ast.Store, ast.Del)):
+            names.add(n.id)
+        elif isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(n.name)
+        elif isinstance(n, (ast.Import, ast.ImportFrom)):
+            names.update(a.asname or a.name.split(".")[0] for a in n.names)
+        elif isinstance(n, ast.ExceptHandler) and n.name:
+            names.add(n.name)
+        elif isinstance(n, (ast.MatchAs, ast.MatchStar)) and n.name:
+            names.add(n.name)
+        elif isinstance(n, ast.MatchMapping) and n.rest:
+            names.add(n.rest)
+    return names
+
+def _resolves(name: str, stack: List[Tuple[ast.AST, Set[str]]]) -> bool:
+    # class bodies are not visible from the functions defined inside them
+    in_function = False
+    for scope, names in reversed(stack):
+        if isinstance(scope, ast.ClassDef) and in_function:
+            continue
+        if name in names:
+            return True
+        in_function = in_function or isinstance(scope, _FUNCTIONS)
+    return False
+
+def undefined_names(tree: ast.Module, path: str) -> List[Dict[str, Any]]:
+    # Flow-insensitive like pyflakes: a name counts as defined if it is bound anywhere visible
+    known = set(_IMPLICIT)
+    for n in ast.walk(tree):
+        if isinstance(n, ast.ImportFrom) and any(a.name == "*" for a in n.names):
+            return []  # star import: anything may be defined
+        if isinstance(n, (ast.Global, ast.Nonlocal)):
+            known.update(n.names)
+        elif isinstance(n, ast.NamedExpr) and isinstance(n.target, ast.Name):
+            known.add(n.target.id)  # walrus in a comprehension binds in the enclosing scope
+    out: List[Dict[str, Any]] = []
+
+    def check(scope: ast.AST, stack: List[Tuple[ast.AST, Set[str]]]) -> None:
+        nodes = list(_walk_scope(scope))
+        stack = stack + [(scope, _bindings(scope, nodes))]
+        for n in nodes:
+            if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load) and n.id not in known and not _resolves(n.id, stack):
+                out.append(_diag(path, n.lineno, n.col_offset + 1, "F821", f"undefined name '{n.id}'"))
+            elif isinstance(n, _SCOPES):
+                check(n, stack)
+
+    check(tree, [])
+    return sorted(out, key=lambda d: (d["line"], d["col"]))
+
+
+# -- per file -------------------------------------------------------------------
+def check_source(source: str, path: str, lint: bool = True) -> List[Dict[str, Any]]:
+    try:
+        compile(source, path, "exec", dont_inherit=True)
+    except SyntaxError as e:
+        return [_diag(path, e.lineno or 1, e.offset or 1, "E999", f"{type(e).__name__}: {e.msg}")]
+    except ValueError as e:  # e.g. null bytes
+        return [_diag(path, 1, 1, "E999", str(e))]
+    return undefined_names(ast.parse(source, path), path) if lint else []
+
+def ruff_available() -> bool:
+    return shutil.which("ruff") is not None
+
+def ruff_check(cwd: str, files: List[str], labels: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    # labels: the path to report for each file (pre-images are checked from the snapshot dir)
+    labels = labels or files
+    cmd = (f'ruff check --no-cache --isolated --output-format json --select {RUFF_SELECT} '
+           + " ".join(f'"{f}"' for f in files))
+    res = run_cmd(cwd, cmd, timeout_sec=60)
+    try:
+        items = json.loads(res["stdout"] or "[]")
+    except ValueError:
+        return []
+    by_path = {os.path.realpath(os.path.join(cwd, f)): label for f, label in zip(files, labels)}
+    return [_diag(by_path.get(os.path.realpath(i["filename"]), i["filename"]), i["location"]["row"],
+                  i["location"]["column"], i.get("code") or "E999", i["message"]) for i in items]
+
+
+_MYPY_RE = re.compile(r"^(.+?):(\d+):(?:(\d+):)? error: (.*?)(?:\s+\[([\w-]+)\])?$")
+
+def typecheck(python: str, cwd: str, files: List[str], shadows: Optional[Dict[str, str]] = None) -> Tuple[Optional[List[Dict[str, Any]]], str]:
+    # mypy with the test interpreter -> (diagnostics, command); None when mypy is not installed.
+    # shadows: {file: other path} checks the other file's content as that file (pre-images)
+    cmd = (f'"{python}" -m mypy --no-error-summary --no-color-output --show-column-numbers '
+           f'--ignore-missing-imports --follow-imports=silent --no-incremental')
+    for f, shadow in (shadows or {}).items():
+        cmd += f' --shadow-file "{f}" "{shadow}"'
+    cmd += " " + " ".join(f'"{f}"' for f in files)
+    res = run_cmd(cwd, cmd, timeout_sec=120)
+    if "No module named mypy" in res["stderr"]:
+        return None, cmd
+    out = []
+    for line in res["stdout"].splitlines():
+        m = _MYPY_RE.match(line.strip())
+        if m:
+            path, row, col, msg, code = m.groups()
+            out.append(_diag(path.replace("\\", "/"), int(row), int(col or 1), code or "mypy", msg))
+    return out, cmd
+
+def new_diagnostics(before: List[Dict[str, Any]], after: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Diagnostics the patch introduced; matched on (path, code, message) so moved lines do not count
+    seen = Counter((d["path"], d["code"], d["message"]) for d in before)
+    out = []
+    for d in after:
+        key = (d["path"], d["code"], d["message"])
+        if seen[key]:
+            seen[key] -= 1
+        else:
+            out.append(d)
+    return out
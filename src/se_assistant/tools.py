@@ -1,26 +1,77 @@
 from __future__ import annotations
-import os, time, subprocess, difflib
-from typing import Tuple, Optional, List, Dict, Any
+import os, sys, time, signal, subprocess, difflib, asyncio, shutil, threading, codecs, shlex
+from typing import Tuple, Optional, List, Dict, Any, Union, Callable
+
+from se_assistant import trace
 
 
 def list_repo_files(repo_ref: str) -> List[str]:
+    # Plain walk (no .gitignore); VCS data, environments and caches are pruned, not descended into
+    from se_assistant.workspace import SKIP_DIRS
     out = []
-    for root, _, files in os.walk(repo_ref):
-        if ".venv" in root or "__pycache__" in root:
-            continue
+    for root, dirs, files in os.walk(repo_ref):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
         for f in files:
-            out.append(os.path.relpath(os.path.join(root, f), repo_ref))
+            out.append(os.path.relpath(os.path.join(root, f), repo_ref).replace(os.sep, "/"))
     return sorted(out)
 
+def cache_dir(*parts: str) -> str:
+    # Local persistent cache root; override with SE_ASSISTANT_CACHE_DIR
+    root = os.environ.get("SE_ASSISTANT_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "se_assistant")
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+LOG_TTL_SEC = 7 * 86400
+
+def prune_logs(max_age_sec: float = LOG_TTL_SEC) -> None:
+    # <cache>/logs/<run_id>/ directories written by run_cmd(log_path=...) callers
+    root = cache_dir("logs")
+    cutoff = time.time() - max_age_sec
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+def sandbox_python(repo_ref: str) -> str:
+    # Interpreter of the sandbox's own venv (Windows or POSIX layout); envs.py pools one otherwise
+    for parts in (("Scripts", "python.exe"), ("bin", "python")):
+        path = os.path.join(repo_ref, ".venv", *parts)
+        if os.path.exists(path):
+            return path
+    return os.path.join(repo_ref, ".venv", "Scripts", "python.exe")
+
 def read_text(repo_ref: str, rel_path: str) -> str:
     path = os.path.join(repo_ref, rel_path)
     with open(path, "r", encoding="utf-8") as fp:
         return fp.read()
 
+def atomic_write(path: str, content: Union[str, bytes]) -> None:
+    # temp file in the same directory + rename: readers see the old or the new file, never half of one.
+    # The rename also gives the path a fresh inode, so hardlinked copies/snapshots keep the old content.
+    d = os.path.dirname(path) or "."
+    os.makedirs(d, exist_ok=True)
+    tmp = os.path.join(d, f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        if isinstance(content, bytes):
+            with open(tmp, "wb") as fp:
+                fp.write(content)
+        else:
+            with open(tmp, "w", encoding="utf-8") as fp:
+                fp.write(content)
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
 def write_text(repo_ref: str, rel_path: str, content: str) -> None:
-    path = os.path.join(repo_ref, rel_path)
-    with open(path, "w", encoding="utf-8") as fp:
-        fp.write(content)
+    atomic_write(os.path.join(repo_ref, rel_path), content)
 
 def unified_diff(old: str, new: str, file_path: str) -> str:
     old_lines = old.splitlines(True)
@@ -29,51 +80,244 @@ def unified_diff(old: str, new: str, file_path: str) -> str:
         old_lines, new_lines,
         fromfile=f"a/{file_path}",
         tofile=f"b/{file_path}",
-        lineterm=""
     )
-    return "".join(diff)
+    # every line newline-terminated, so the text parses back (edits.parse_unified_diff)
+    return "".join(line if line.endswith("\n") else line + "\n\\ No newline at end of file\n" for line in diff)
+
+# Subprocess output is streamed, not buffered: each pipe is read in chunks into a RingBuffer
+# that keeps only the last max_bytes, optionally tee'd in full to log_path and echoed to the
+# console (SE_ASSISTANT_ECHO=1). on_output(stream, text) sees every decoded chunk; returning
+# True stops the run early (interrupt, then kill). The command runs in its own process group,
+# so a timeout or early stop also ends everything it spawned (pytest under the shell, xdist
+# workers, servers started by tests).
+RING_BYTES = 256 * 1024
+INTERRUPT_GRACE_SEC = 5.0
+READ_CHUNK = 64 * 1024
+
+OutputCallback = Callable[[str, str], Any]
+
+
+def echo_enabled() -> bool:
+    return os.environ.get("SE_ASSISTANT_ECHO", "0").lower() in ("1", "true", "on", "yes")
+
+
+class RingBuffer:
+    def __init__(self, max_bytes: int = RING_BYTES):
+        self.max_bytes = max_bytes
+        self.buf = bytearray()
+        self.dropped = 0
+
+    def write(self, data: bytes) -> None:
+        self.buf += data
+        over = len(self.buf) - self.max_bytes
+        if over > 0:
+            del self.buf[:over]
+            self.dropped += over
+
+    def text(self) -> str:
+        s = self.buf.decode("utf-8", errors="replace")
+        if self.dropped:
+            s = f"[... {self.dropped} bytes dropped ...]\n" + s
+        return s
+
+
+class _Capture:
+    # Where the chunks of both pipes go; feed() is called from reader threads / tasks
+    def __init__(self, max_bytes: int, log_path: Optional[str], on_output: Optional[OutputCallback], echo: bool):
+        self.rings = {"stdout": RingBuffer(max_bytes), "stderr": RingBuffer(max_bytes)}
+        self.decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in self.rings}
+        self.on_output = on_output
+        self.echo = echo
+        self.log = None
+        if log_path:
+            os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+            self.log = open(log_path, "wb")
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+
+    def feed(self, stream: str, data: bytes) -> None:
+        with self.lock:
+            self.rings[stream].write(data)
+            if self.log is not None:
+                self.log.write(data)
+            if not (self.echo or self.on_output):
+                return
+            text = self.decoders[stream].decode(data)
+        if self.echo:
+            (sys.stdout if stream == "stdout" else sys.stderr).write(text)
+        if self.on_output and not self.stop.is_set() and self.on_output(stream, text):
+            self.stop.set()
+
+    def close(self) -> None:
+        if self.log is not None:
+            self.log.close()
+
+    def result(self, status: str, exit_code: Optional[int], start: float, note: str = "") -> Dict[str, Any]:
+        self.close()
+        return {
+            "status": status,
+            "exit_code": exit_code,
+            "duration_sec": time.time() - start,
+            "stdout": self.rings["stdout"].text(),
+            "stderr": self.rings["stderr"].text() + note,
+            "stopped_early": self.stop.is_set(),
+        }
+
+
+def shell_join(argv: List[str]) -> str:
+    # Command line for run_cmd's shell=True: every argument quoted for the platform's shell, so
+    # parametrized node ids ("test_p[a$HOME]", 'test_p[b"c]') reach pytest unchanged
+    if os.name == "nt":
+        return subprocess.list2cmdline(argv)
+    return " ".join(shlex.quote(a) for a in argv)
+
+def process_group_kwargs() -> Dict[str, Any]:
+    # Popen/create_subprocess_* arguments that give the child its own process group
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+def kill_process_group(pid: int, interrupt: bool = False) -> None:
+    # interrupt=True asks politely (pytest still prints its failure summary); otherwise kill the tree
+    try:
+        if os.name == "nt":
+            if interrupt:
+                os.kill(pid, signal.CTRL_BREAK_EVENT)
+            else:
+                subprocess.run(["taskkill", "/T", "/F", "/PID", str(pid)], capture_output=True)
+        else:
+            os.killpg(pid, signal.SIGINT if interrupt else signal.SIGKILL)
+    except OSError:
+        pass  # already gone
+
 
 def run_cmd(
     cwd: str,
     cmd: str,
     timeout_sec: int = 30,
+    max_bytes: int = RING_BYTES,
+    log_path: Optional[str] = None,
+    on_output: Optional[OutputCallback] = None,
+    echo: Optional[bool] = None,
+    env: Optional[Dict[str, str]] = None,
 ) -> Dict[str, Any]:
+    # -> {"status", "exit_code", "duration_sec", "stdout", "stderr", "stopped_early"}
+    # env: the child's environment (default: ours)
+    with trace.timed("subprocess", "run_cmd", cmd=cmd[:300]):
+        cap = _Capture(max_bytes, log_path, on_output, echo_enabled() if echo is None else echo)
+        return _run_cmd(cwd, cmd, timeout_sec, cap, env)
+
+def _pump(pipe, stream: str, cap: _Capture) -> None:
+    for chunk in iter(lambda: pipe.read1(READ_CHUNK), b""):
+        cap.feed(stream, chunk)
+    pipe.close()
+
+def _run_cmd(cwd: str, cmd: str, timeout_sec: int, cap: _Capture, env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
     start = time.time()
     try:
-        p = subprocess.run(
+        p = subprocess.Popen(cmd, cwd=cwd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             env={**(os.environ if env is None else env), "PYTHONUNBUFFERED": "1"}, **process_group_kwargs())
+    except Exception as e:
+        return cap.result("error", None, start, f"{type(e).__name__}: {e}")
+    readers = [threading.Thread(target=_pump, args=(pipe, name, cap), daemon=True)
+               for pipe, name in ((p.stdout, "stdout"), (p.stderr, "stderr"))]
+    for r in readers:
+        r.start()
+
+    deadline = start + timeout_sec
+    timed_out = False
+    stop_at = None
+    while True:
+        try:
+            p.wait(timeout=0.05)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        if time.time() > deadline:
+            timed_out = True
+            kill_process_group(p.pid)
+            p.wait()
+            break
+        if cap.stop.is_set():
+            if stop_at is None:
+                stop_at = time.time()
+                kill_process_group(p.pid, interrupt=True)
+            elif time.time() - stop_at > INTERRUPT_GRACE_SEC:
+                kill_process_group(p.pid)
+    if cap.stop.is_set() or timed_out:
+        kill_process_group(p.pid)  # grandchildren that outlived the shell
+    for r in readers:
+        r.join(timeout=5)
+
+    if timed_out:
+        return cap.result("timeout", None, start, "\nTIMEOUT")
+    return cap.result("success" if p.returncode == 0 else "fail", p.returncode, start)
+
+async def arun_cmd(
+    cwd: str,
+    cmd: str,
+    timeout_sec: int = 30,
+    max_bytes: int = RING_BYTES,
+    log_path: Optional[str] = None,
+    on_output: Optional[OutputCallback] = None,
+    echo: Optional[bool] = None,
+    env: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    # asyncio twin of run_cmd (same result shape), so one event loop can wait on many subprocesses
+    with trace.timed("subprocess", "run_cmd", cmd=cmd[:300]):
+        cap = _Capture(max_bytes, log_path, on_output, echo_enabled() if echo is None else echo)
+        return await _arun_cmd(cwd, cmd, timeout_sec, cap, env)
+
+async def _apump(reader: asyncio.StreamReader, stream: str, cap: _Capture) -> None:
+    while True:
+        chunk = await reader.read(READ_CHUNK)
+        if not chunk:
+            return
+        cap.feed(stream, chunk)
+
+async def _arun_cmd(cwd: str, cmd: str, timeout_sec: int, cap: _Capture, env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    start = time.time()
+    try:
+        p = await asyncio.create_subprocess_shell(
             cmd,
             cwd=cwd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=timeout_sec,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env={**(os.environ if env is None else env), "PYTHONUNBUFFERED": "1"},
+            **process_group_kwargs(),
         )
-        dur = time.time() - start
-        return {
-            "status": "success" if p.returncode == 0 else "fail",
-            "exit_code": p.returncode,
-            "duration_sec": dur,
-            "stdout": p.stdout,
-            "stderr": p.stderr,
-        }
-    except subprocess.TimeoutExpired as e:
-        dur = time.time() - start
-        return {
-            "status": "timeout",
-            "exit_code": None,
-            "duration_sec": dur,
-            "stdout": (e.stdout or ""),
-            "stderr": (e.stderr or "") + "\nTIMEOUT",
-        }
     except Exception as e:
-        dur = time.time() - start
-        return {
-            "status": "error",
-            "exit_code": None,
-            "duration_sec": dur,
-            "stdout": "",
-            "stderr": f"{type(e).__name__}: {e}",
-        }
+        return cap.result("error", None, start, f"{type(e).__name__}: {e}")
+    pumps = asyncio.gather(_apump(p.stdout, "stdout", cap), _apump(p.stderr, "stderr", cap))
+
+    async def stopper() -> None:
+        # early stop requested by on_output: interrupt, then kill after the grace period
+        while not cap.stop.is_set():
+            await asyncio.sleep(0.05)
+        kill_process_group(p.pid, interrupt=True)
+        await asyncio.sleep(INTERRUPT_GRACE_SEC)
+        kill_process_group(p.pid)
+
+    watcher = asyncio.ensure_future(stopper())
+    try:
+        await asyncio.wait_for(p.wait(), timeout=timeout_sec)
+        timed_out = False
+    except asyncio.TimeoutError:
+        timed_out = True
+        kill_process_group(p.pid)
+        await p.wait()
+    finally:
+        watcher.cancel()
+    if cap.stop.is_set() or timed_out:
+        kill_process_group(p.pid)  # grandchildren that outlived the shell
+    try:
+        await asyncio.wait_for(pumps, timeout=5)
+    except asyncio.TimeoutError:
+        pass  # a detached grandchild still holds the pipe; keep what we have
+
+    if timed_out:
+        return cap.result("timeout", None, start, "\nTIMEOUT")
+    return cap.result("success" if p.returncode == 0 else "fail", p.returncode, start)
 
 def tail(s: str, n: int = 20000) -> str:
     if not s:
@@ -0,0 +1,186 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+
+# Per-node instrumentation. build_graph wraps every node with traced(); while a node runs,
+# a Span collects what the layers below it report (LLM calls, subprocesses) through a
+# ContextVar, so nothing is threaded through node signatures. A finished span
+#   - is added to state.metrics as node.<name>.<counter> (summed over iterations), and
+#   - is appended, with its LLM/subprocess children, to <cache>/traces/<run_id>.json in
+#     Chrome trace format (open in chrome://tracing or https://ui.perfetto.dev). The file uses
+#     the JSON array form without the closing "]", which both viewers accept, so each node
+#     only appends its own events instead of rewriting the whole file.
+# SE_ASSISTANT_TRACE=0 turns the trace file off; the metrics are always collected.
+
+log = logging.getLogger(__name__)
+
+# Counters that are levels, not amounts: keep the maximum instead of the sum
+GAUGES = ("state_bytes",)
+
+_current: ContextVar[Optional["Span"]] = ContextVar("se_assistant_span", default=None)
+_file_lock = threading.Lock()
+
+
+def configure_logging(level: Optional[str] = None) -> None:
+    # For entry points (run.py, batch): SE_ASSISTANT_LOG_LEVEL=DEBUG shows prompts and test output
+    level = (level or os.environ.get("SE_ASSISTANT_LOG_LEVEL", "INFO")).upper()
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if level != "DEBUG":
+        logging.getLogger("httpx").setLevel(logging.WARNING)  # one line per Ollama request otherwise
+
+def trace_enabled() -> bool:
+    return os.environ.get("SE_ASSISTANT_TRACE", "1").lower() not in ("0", "false", "off", "no")
+
+def trace_path(run_id: str) -> str:
+    from se_assistant.tools import cache_dir
+    return os.path.join(cache_dir("traces"), f"{run_id}.json")
+
+
+class Span:
+    def __init__(self, name: str):
+        self.name = name
+        self.counters: Dict[str, float] = {}
+        self.children: List[Dict[str, Any]] = []
+        self.ts = time.time()
+        self.t0 = time.perf_counter()
+        self._lock = threading.Lock()  # speculative patching reports from worker threads
+
+    def add(self, key: str, value: float) -> None:
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def child(self, name: str, cat: str, started: float, dur: float, **args: Any) -> None:
+        with self._lock:
+            self.children.append({"name": name, "cat": cat, "ts": started, "dur": dur, "args": args})
+
+@contextmanager
+def timed(cat: str, name: str, **args: Any) -> Iterator[None]:
+    # Time a blocking call made on behalf of the current node (subprocess, ...): adds
+    # <cat>_sec to the node and a child slice to the trace
+    started, t0 = time.time(), time.perf_counter()
+    try:
+        yield
+    finally:
+        span = _current.get()
+        if span is not None:
+            dur = time.perf_counter() - t0
+            span.add(f"{cat}_sec", dur)
+            span.child(name, cat, started, dur, **args)
+
+def record_llm(started: float, dur: float, msg: Any, prompt_chars: int, ttft: Optional[float] = None) -> None:
+    # Token counts and time-to-first-token from the model's own metadata (Ollama reports
+    # prompt_eval_count / eval_count and durations in ns); estimated when it reports nothing.
+    # ttft: measured by the caller when the answer was streamed
+    span = _current.get()
+    if span is None:
+        return
+    usage = getattr(msg, "usage_metadata", None) or {}
+    meta = getattr(msg, "response_metadata", None) or {}
+    content = getattr(msg, "content", "") or ""
+    prompt = usage.get("input_tokens") or meta.get("prompt_eval_count") or prompt_chars // 4
+    completion = usage.get("output_tokens") or meta.get("eval_count") or len(content) // 4
+    if ttft is None and meta.get("prompt_eval_duration") is not None:
+        ttft = ((meta.get("load_duration") or 0) + meta["prompt_eval_duration"]) / 1e9
+    elif ttft is None:
+        ttft = dur  # no streaming info: the whole call is the first token
+    span.add("llm_calls", 1)
+    span.add("llm_sec", dur)
+    span.add("llm_prompt_tokens", prompt)
+    span.add("llm_completion_tokens", completion)
+    span.add("llm_ttft_sec", ttft)
+    span.child("llm", "llm", started, dur, prompt_tokens=prompt, completion_tokens=completion, ttft_sec=round(ttft, 3))
+
+
+def _state_bytes(state: Any) -> int:
+    try:
+        return len(state.model_dump_json())
+    except Exception:
+        return 0
+
+def _finish(name: str, state: Any, span: Span, update: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    update = dict(update or {})
+    span.add("wall_sec", time.perf_counter() - span.t0)
+    span.add("calls", 1)
+    span.counters["state_bytes"] = _state_bytes(state)
+
+    base = update.get("metrics", getattr(state, "metrics", {}) or {})
+    merged = dict(base)
+    for k, v in span.counters.items():
+        key = f"node.{name}.{k}"
+        merged[key] = max(merged.get(key, 0), v) if k in GAUGES else merged.get(key, 0) + v
+    update["metrics"] = merged
+
+    if log.isEnabledFor(logging.INFO):
+        log.info("node %s: %.2fs %s", name, span.counters["wall_sec"],
+                 " ".join(f"{k}={v:.3g}" for k, v in sorted(span.counters.items()) if k not in ("wall_sec", "calls")))
+    if trace_enabled() and getattr(state, "run_id", None):
+        _write_events(state.run_id, name, span)
+    return update
+
+def _write_events(run_id: str, name: str, span: Span) -> None:
+    pid, tid = os.getpid(), zlib.crc32(run_id.encode("utf-8")) % 100000  # one track per run
+    events = [{
+        "name": name, "cat": "node", "ph": "X", "pid": pid, "tid": tid,
+        "ts": int(span.ts * 1e6), "dur": int(span.counters["wall_sec"] * 1e6),
+        "args": {k: round(v, 4) for k, v in span.counters.items()},
+    }]
+    for c in span.children:
+        events.append({"name": c["name"], "cat": c["cat"], "ph": "X", "pid": pid, "tid": tid,
+                       "ts": int(c["ts"] * 1e6), "dur": int(c["dur"] * 1e6), "args": c["args"]})
+    path = trace_path(run_id)
+    with _file_lock:
+        try:
+            with open(path, "a", encoding="utf-8") as fp:
+                if fp.tell() == 0:
+                    fp.write("[\n" + json.dumps({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                                                   "args": {"name": f"run {run_id}"}}) + ",\n")
+                fp.write("".join(json.dumps(e) + ",\n" for e in events))
+        except OSError as e:
+            log.warning("Could not write trace %s: %s", path, e)
+
+def load_trace(run_id: str) -> List[Dict[str, Any]]:
+    # Events of a run's trace file (the array is left open while the run appends to it)
+    try:
+        with open(trace_path(run_id), "r", encoding="utf-8") as fp:
+            text = fp.read().strip()
+    except OSError:
+        return []
+    if not text:
+        return []
+    if text.endswith("]"):
+        text = text[:-1].rstrip()
+    return json.loads(text.rstrip(",") + "]")
+
+def traced(name: str, fn: Callable) -> Callable:
+    # Wrap a graph node (sync or async) in a Span
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def awrapper(state):
+            span = Span(name)
+            token = _current.set(span)
+            try:
+                update = await fn(state)
+            finally:
+                _current.reset(token)
+            return _finish(name, state, span, update)
+        return awrapper
+
+    @functools.wraps(fn)
+    def wrapper(state):
+        span = Span(name)
+        token = _current.set(span)
+        try:
+            update = fn(state)
+        finally:
+            _current.reset(token)
+        return _finish(name, state, span, update)
+    return wrapper
@@ -0,0 +1,124 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+import json
+import logging
+import os
+import shutil
+import time
+
+from se_assistant.tools import atomic_write, cache_dir
+
+log = logging.getLogger(__name__)
+
+# Pre-image snapshots for patches applied to repo_ref, one directory per Patch:
+#   <cache>/snapshots/<run_id>/<patch_id>/manifest.json   {"files": {rel_path: existed_before}}
+#   <cache>/snapshots/<run_id>/<patch_id>/files/<rel_path>
+# Snapshotting is a hardlink to the current inode (atomic_write replaces the path with a new
+# inode, so the link keeps the old bytes); cost and rollback are O(files the patch touched).
+SNAPSHOT_TTL_SEC = 7 * 86400
+
+
+def snapshot_dir(run_id: str, patch_id: str) -> str:
+    return os.path.join(cache_dir("snapshots", run_id), patch_id)
+
+def prune_snapshots(max_age_sec: float = SNAPSHOT_TTL_SEC) -> None:
+    root = cache_dir("snapshots")
+    cutoff = time.time() - max_age_sec
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+class PatchTransaction:
+    # All-or-nothing multi-file write: every file is snapshotted before its first write and,
+    # if anything fails inside the `with` block, the files written so far are restored.
+    def __init__(self, repo_ref: str, snap_dir: str):
+        self.repo_ref = repo_ref
+        self.snap_dir = snap_dir
+        self.manifest: Dict[str, bool] = _load_manifest(snap_dir)
+
+    def __enter__(self) -> "PatchTransaction":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is not None:
+            log.warning("Patch transaction failed (%s: %s); restoring %d file(s)", exc_type.__name__, exc, len(self.manifest))
+            restore(self.repo_ref, self.snap_dir)
+        return False
+
+    def _snapshot(self, rel_path: str) -> None:
+        if rel_path in self.manifest:
+            return  # keep the oldest pre-image
+        src = os.path.join(self.repo_ref, rel_path)
+        existed = os.path.isfile(src)
+        if existed:
+            dst = os.path.join(self.snap_dir, "files", rel_path)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.exists(dst):
+                os.remove(dst)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)  # cache on another filesystem
+        self.manifest[rel_path] = existed
+        _save_manifest(self.snap_dir, self.manifest)
+
+    def write(self, rel_path: str, content: str) -> None:
+        self._snapshot(rel_path)
+        atomic_write(os.path.join(self.repo_ref, rel_path), content)
+
+
+def apply_files(repo_ref: str, snap_dir: str, files: Dict[str, str]) -> None:
+    with PatchTransaction(repo_ref, snap_dir) as tx:
+        for rel_path, content in files.items():
+            tx.write(rel_path, content)
+
+def restore(repo_ref: str, snap_dir: str) -> List[str]:
+    # Put every file recorded in the snapshot back to its pre-patch state -> restored paths
+    manifest = _load_manifest(snap_dir)
+    for rel_path, existed in manifest.items():
+        target = os.path.join(repo_ref, rel_path)
+        if existed:
+            _atomic_copy(os.path.join(snap_dir, "files", rel_path), target)
+        elif os.path.exists(target):
+            os.remove(target)
+    return sorted(manifest)
+
+def rollback(repo_ref: str, snap_dirs: List[str]) -> List[str]:
+    # Undo several patches, newest first, so each pre-image lands on the tree it was taken from
+    restored: List[str] = []
+    for d in reversed(snap_dirs):
+        restored.extend(p for p in restore(repo_ref, d) if p not in restored)
+    return restored
+
+def pre_image(snap_dir: str, rel_path: str) -> Optional[str]:
+    # Path of the file's content before the patch; None if the patch created it
+    if not _load_manifest(snap_dir).get(rel_path):
+        return None
+    return os.path.join(snap_dir, "files", rel_path)
+
+def discard(snap_dir: str) -> None:
+    shutil.rmtree(snap_dir, ignore_errors=True)
+
+
+def _atomic_copy(src: str, dst: str) -> None:
+    # byte-exact and, like atomic_write, a fresh inode (the snapshot link stays untouched)
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    tmp = f"{dst}.{os.getpid()}.restore.tmp"
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+def _load_manifest(snap_dir: str) -> Dict[str, bool]:
+    try:
+        with open(os.path.join(snap_dir, "manifest.json"), "r", encoding="utf-8") as fp:
+            return json.load(fp).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+def _save_manifest(snap_dir: str, manifest: Dict[str, bool]) -> None:
+    os.makedirs(snap_dir, exist_ok=True)
+    atomic_write(os.path.join(snap_dir, "manifest.json"), json.dumps({"files": manifest}))
@@ -0,0 +1,204 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+
+from se_assistant import trace
+from se_assistant.tools import kill_process_group, process_group_kwargs
+
+log = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytest_worker.py")
+
+# Recycle a worker after this many runs to bound leaks from repeated imports
+MAX_RUNS_PER_WORKER = 50
+STARTUP_TIMEOUT_SEC = 60
+
+
+class WarmPytestWorker:
+    def __init__(self, python: str, repo_ref: str, env: Optional[Dict[str, str]] = None):
+        self.python = python
+        self.repo_ref = repo_ref
+        self.env = env
+        self.proc: Optional[subprocess.Popen] = None
+        self.runs = 0
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._eof = False
+        self._io = threading.Lock()  # one request/response pair on the pipes at a time
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self) -> None:
+        self.proc = subprocess.Popen(
+            [self.python, WORKER_SCRIPT],
+            cwd=self.repo_ref,
+            env=self.env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+            **process_group_kwargs(),
+        )
+        self.runs = 0
+        self._lines = queue.Queue()
+        self._eof = False
+        # Pipes are not selectable on Windows, so a reader thread feeds a queue
+        t = threading.Thread(target=self._pump, args=(self.proc, self._lines), daemon=True)
+        t.start()
+        hello = self._read(STARTUP_TIMEOUT_SEC)
+        if not hello or not hello.get("ready"):
+            self.close()
+            raise RuntimeError("warm pytest worker failed to start")
+
+    @staticmethod
+    def _pump(proc: subprocess.Popen, lines: "queue.Queue[Optional[str]]") -> None:
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def _read(self, timeout_sec: float) -> Optional[Dict[str, Any]]:
+        try:
+            line = self._lines.get(timeout=timeout_sec)
+        except queue.Empty:
+            return None
+        if not line:
+            self._eof = True
+            return None
+        return json.loads(line)
+
+    def request(self, args: List[str], changed: List[str], timeout_sec: float,
+                log_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        with self._io:
+            self.proc.stdin.write(json.dumps({"args": args, "changed": changed, "log_path": log_path}) + "\n")
+            self.proc.stdin.flush()
+            self.runs += 1
+            return self._read(timeout_sec)
+
+    def exit_code(self) -> Optional[int]:
+        # None while running; after EOF on stdout give the process a moment to be reaped
+        if self.proc is None:
+            return None
+        if self._eof:
+            try:
+                return self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                return None
+        return self.proc.poll()
+
+    def kill(self) -> None:
+        # the worker and anything its tests spawned
+        if self.proc is None:
+            return
+        kill_process_group(self.proc.pid)
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        self.proc = None
+
+    def close(self) -> None:
+        if self.proc is None:
+            return
+        try:
+            if self.proc.poll() is None:
+                self.proc.stdin.write(json.dumps({"cmd": "shutdown"}) + "\n")
+                self.proc.stdin.flush()
+                self.proc.wait(timeout=5)
+        except Exception:
+            pass
+        self.kill()
+
+
+_WORKERS: Dict[str, WarmPytestWorker] = {}
+_LOCK = threading.Lock()
+
+def _worker_for(python: str, repo_ref: str, fresh: bool = False, env: Optional[Dict[str, str]] = None) -> WarmPytestWorker:
+    key = os.path.abspath(repo_ref)
+    with _LOCK:
+        w = _WORKERS.get(key)
+        if w and (fresh or not w.alive() or w.python != python or w.env != env or w.runs >= MAX_RUNS_PER_WORKER):
+            w.close()
+            w = None
+        if w is None:
+            w = WarmPytestWorker(python, repo_ref, env)
+            w.start()
+            _WORKERS[key] = w
+        return w
+
+def shutdown_workers() -> None:
+    with _LOCK:
+        for w in _WORKERS.values():
+            w.close()
+        _WORKERS.clear()
+
+
+def run_warm(python: str, repo_ref: str, args: List[str], changed: List[str], timeout_sec: int = 30,
+             env: Optional[Dict[str, str]] = None, log_path: Optional[str] = None) -> Dict[str, Any]:
+    # Same result shape as tools.run_cmd, plus "warm" (False when a fresh interpreter had to be used).
+    # log_path: the worker writes the full output there (the returned stdout is a tail)
+    with trace.timed("subprocess", "warm pytest", args=args[:20]):
+        return _run_warm(python, repo_ref, args, changed, timeout_sec, env, log_path)
+
+def _run_warm(python: str, repo_ref: str, args: List[str], changed: List[str], timeout_sec: int,
+              env: Optional[Dict[str, str]] = None, log_path: Optional[str] = None) -> Dict[str, Any]:
+    start = time.time()
+    warm = True
+    try:
+        w = _worker_for(python, repo_ref, env=env)
+        warm = w.runs > 0
+        res = w.request(args, changed, timeout_sec, log_path)
+        if res and res.get("restart"):
+            # Reload was not safe (conftest/config/compiled module changed) -> cold run in a fresh worker
+            log.warning("Warm pytest worker restart: %s", res.get("reason"))
+            w = _worker_for(python, repo_ref, fresh=True, env=env)
+            warm = False
+            res = w.request(args, [], timeout_sec, log_path)
+    except Exception as e:
+        return {
+            "status": "error",
+            "exit_code": None,
+            "duration_sec": time.time() - start,
+            "stdout": "",
+            "stderr": f"{type(e).__name__}: {e}",
+            "warm": False,
+        }
+
+    dur = time.time() - start
+    if res is None or res.get("restart"):
+        # Timed out or died mid-run: never reuse this interpreter
+        with _LOCK:
+            if _WORKERS.get(os.path.abspath(repo_ref)) is w:
+                del _WORKERS[os.path.abspath(repo_ref)]
+        crashed = w.exit_code() if res is None else None
+        w.kill()
+        if res is None and crashed is None:
+            status, stderr = "timeout", "TIMEOUT"
+        else:
+            status, stderr = "error", (f"warm pytest worker exited with code {crashed}" if res is None else str(res.get("reason")))
+        return {
+            "status": status,
+            "exit_code": crashed or None,  # a worker gone mid-run never counts as a pass
+            "duration_sec": dur,
+            "stdout": "",
+            "stderr": stderr,
+            "warm": warm,
+        }
+
+    code = res["exit_code"]
+    return {
+        "status": "success" if code == 0 else "fail",
+        "exit_code": code,
+        "duration_sec": dur,
+        "stdout": res.get("output", ""),
+        "stderr": "",
+        "warm": warm,
+        "reloaded": res.get("reloaded", []),
+    }
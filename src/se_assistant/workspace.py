@@ -0,0 +1,63 @@
+from __future__ import annotations
+from typing import Dict, Optional
+import os
+import shutil
+import tempfile
+
+from se_assistant.tools import atomic_write
+
+# Never cloned: VCS data, environments and caches (tests recreate caches on their own)
+SKIP_DIRS = {".git", ".hg", ".venv", "venv", "node_modules", "__pycache__", ".pytest_cache", ".mypy_cache", ".ruff_cache", ".tox"}
+# Only large non-Python files (datasets, binaries) are hardlinked instead of copied
+LINK_MIN_BYTES = 1 << 20
+
+
+def clone_tree(repo_ref: str, dest: Optional[str] = None) -> str:
+    # Private copy of the sandbox. Sources, tests and other small files are copied, since
+    # a test may open them in place ("r+", "a", truncating writes) and a hardlink would
+    # write through to repo_ref. Large non-Python files are hardlinked to keep cloning
+    # cheap; writing those in place from a candidate's tests is unsafe.
+    dest = dest or tempfile.mkdtemp(prefix="se_ws_")
+    for root, dirs, files in os.walk(repo_ref):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        rel = os.path.relpath(root, repo_ref)
+        target = os.path.join(dest, rel) if rel != "." else dest
+        os.makedirs(target, exist_ok=True)
+        for f in files:
+            src = os.path.join(root, f)
+            dst = os.path.join(target, f)
+            if _linkable(src):
+                try:
+                    os.link(src, dst)
+                    continue
+                except OSError:
+                    pass  # cross-device, FAT, no permission... fall back to a real copy
+            shutil.copy2(src, dst)
+    return dest
+
+def _linkable(path: str) -> bool:
+    if path.endswith((".py", ".pyi")) or os.path.islink(path):
+        return False
+    try:
+        return os.path.getsize(path) >= LINK_MIN_BYTES
+    except OSError:
+        return False
+
+def write_file(workspace: str, rel_path: str, content: str) -> None:
+    # the rename in atomic_write gives the path a new inode, so even a hardlinked file is safe
+    atomic_write(os.path.join(workspace, rel_path), content)
+
+def apply_files(workspace: str, files: Dict[str, str]) -> None:
+    for rel_path, content in files.items():
+        write_file(workspace, rel_path, content)
+
+def remove_tree(workspace: str) -> None:
+    shutil.rmtree(workspace, ignore_errors=True)
+
+def pythonpath_env(workspace: str) -> Dict[str, str]:
+    # Make the clone's sources win over an editable install that points back at repo_ref
+    paths = [os.path.join(workspace, "src"), workspace]
+    paths = [p for p in paths if os.path.isdir(p)]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(paths + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    return env
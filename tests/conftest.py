@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # artifacts, indexes and the LLM cache of each test live in its own directory
+    path = tmp_path / "cache"
+    monkeypatch.setenv("SE_ASSISTANT_CACHE_DIR", str(path))
+    return path
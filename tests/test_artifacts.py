@@ -0,0 +1,23 @@
+import hashlib
+import os
+import time
+
+from se_assistant.artifacts import _path, get_text, prune_artifacts, put_text
+
+
+def test_a_miss_is_not_cached():
+    text = f"stdout {time.time()}"
+    ref = hashlib.sha256(text.encode()).hexdigest()[:32]
+    assert get_text(ref) == ""  # e.g. a ref read before its blob was written
+    assert put_text(text) == ref
+    assert get_text(ref) == text
+
+def test_pruning_is_opt_in(monkeypatch):
+    ref = put_text("old blob")
+    os.utime(_path(ref), (0, 0))
+    prune_artifacts()
+    assert os.path.exists(_path(ref))
+
+    monkeypatch.setenv("SE_ASSISTANT_ARTIFACT_TTL_DAYS", "7")
+    prune_artifacts()
+    assert not os.path.exists(_path(ref))
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from se_assistant import limits
+from se_assistant.nodes.test_agent import atest_agent, test_agent as run_tests
+from se_assistant.state import TicketState
+from se_assistant.tools import arun_cmd
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    (root / "tests").mkdir(parents=True)
+    (root / "tests" / "test_a.py").write_text("def test_ok():\n    assert True\n\ndef test_red():\n    assert 1 == 2\n")
+    return root
+
+def sleeper(sec):
+    return f'"{sys.executable}" -c "import time; time.sleep({sec})"'
+
+
+def test_async_test_node_matches_the_sync_one(repo):
+    st = TicketState(run_id="a", repo_ref=str(repo), task_prompt="fix", python_path=sys.executable)
+    [sync_run] = run_tests(st)["tool_runs"]
+    [async_run] = asyncio.run(atest_agent(st))["tool_runs"]
+    for r in (sync_run, async_run):
+        assert (r.scope, r.status, r.exit_code, r.failed_tests) == ("full", "fail", 1, ["tests/test_a.py::test_red"])
+
+def test_subprocesses_overlap_on_one_loop(tmp_path):
+    async def main():
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(arun_cmd(str(tmp_path), sleeper(1)) for _ in range(4)))
+        return time.perf_counter() - t0, results
+    elapsed, results = asyncio.run(main())
+    assert all(r["status"] == "success" for r in results)
+    assert elapsed < 3  # four 1s commands, run concurrently
+
+def test_async_slots_bound_concurrency(tmp_path):
+    limits.configure(pytest=1)
+    try:
+        async def one():
+            async with limits.aslot("pytest"):
+                return await arun_cmd(str(tmp_path), sleeper(0.3))
+
+        async def main():
+            t0 = time.perf_counter()
+            await asyncio.gather(one(), one(), one())
+            return time.perf_counter() - t0
+        assert asyncio.run(main()) >= 0.9
+    finally:
+        limits.configure(pytest=None)
+
+
+def test_async_graph_fixes_a_synthetic_repo(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(BENCH)
+    import bench_graph
+    import se_assistant.llm as llm
+    from synthetic_repo import build_repo
+    monkeypatch.setattr(llm, "chat_model", llm.chat_model)  # StubLLM.install() replaces it; restore after
+    monkeypatch.setenv("SE_ASSISTANT_TRACE", "0")
+    template = str(tmp_path / "template")
+    build_repo(os.path.join(template, "repo"), n_files=3, n_tests=6, git=False).save(os.path.join(template, "scenario.json"))
+    [ticket] = bench_graph.run_tickets(template, tickets=1, use_async=True, latency=0.0, timeout=120)["tickets"]
+    assert (ticket["status"], ticket["iterations"]) == ("success", 1)
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from se_assistant.batch import load_manifest, percentile, summarize
+
+
+def result(status, duration, iterations, error=None):
+    return {"run_id": "r", "repo_ref": ".", "final_status": status, "iterations": iterations,
+            "duration_sec": duration, "final_report": None, "error": error}
+
+
+def test_percentile_is_nearest_rank():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert percentile(values, 50) == 3.0
+    assert percentile(values, 95) == 5.0
+    assert percentile(values, 0) == 1.0
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert percentile([], 50) is None
+
+def test_summary_counts_fix_times_of_fixed_tickets_only():
+    results = [
+        result("success", 10.0, 1),
+        result("success", 30.0, 3),
+        result("stopped_for_review", 500.0, 5),
+        result("failed", 1.0, 0, error="RuntimeError: boom"),
+    ]
+    s = summarize(results, wall_sec=60.0)
+    assert (s["tickets"], s["fixed"], s["errors"]) == (4, 2, 1)
+    assert s["tickets_per_hour"] == 240.0
+    assert (s["time_to_fix_p50_sec"], s["time_to_fix_p95_sec"]) == (10.0, 30.0)
+    assert (s["iterations_total"], s["iterations_mean"], s["iterations_max"]) == (9, 2.25, 5)
+
+def test_summary_of_nothing():
+    s = summarize([], wall_sec=0.0)
+    assert s["tickets"] == 0 and s["tickets_per_hour"] is None
+    assert s["time_to_fix_p50_sec"] is None and s["iterations_mean"] is None
+
+
+def test_load_manifest(tmp_path):
+    path = tmp_path / "tickets.jsonl"
+    path.write_text(
+        "# comment\n\n"
+        + json.dumps({"repo_ref": "/a", "task_prompt": "fix", "run_id": "keep"}) + "\n"
+        + json.dumps({"repo_ref": "/b", "task_prompt": "fix", "timeout_sec": 5}) + "\n"
+    )
+    first, second = load_manifest(str(path))
+    assert first["run_id"] == "keep"
+    assert second["run_id"] and second["timeout_sec"] == 5
+    # a re-run gets the same ids back, so it resumes from the saved checkpoints
+    assert [t["run_id"] for t in load_manifest(str(path))] == ["keep", second["run_id"]]
+
+def test_load_manifest_ids_identical_entries_apart(tmp_path):
+    path = tmp_path / "tickets.jsonl"
+    entry = json.dumps({"repo_ref": "/a", "task_prompt": "fix"}) + "\n"
+    path.write_text(entry * 2)
+    first, second = load_manifest(str(path))
+    assert first["run_id"] != second["run_id"]
+
+def test_load_manifest_needs_repo_and_prompt(tmp_path):
+    path = tmp_path / "tickets.jsonl"
+    path.write_text(json.dumps({"repo_ref": "/a"}) + "\n")
+    with pytest.raises(ValueError, match=":1:"):
+        load_manifest(str(path))
@@ -0,0 +1,91 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+
+@pytest.fixture(autouse=True)
+def bench_path(monkeypatch):
+    monkeypatch.syspath_prepend(BENCH)
+
+@pytest.fixture
+def scenario(tmp_path):
+    from synthetic_repo import build_repo
+    return build_repo(str(tmp_path / "repo"), n_files=3, n_tests=6, seed=1, wrong_fixes=1, git=False)
+
+def pytest_in(repo):
+    return subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider"], cwd=repo,
+                          capture_output=True, text=True)
+
+
+def test_synthetic_repo_has_one_seeded_bug(scenario):
+    out = pytest_in(scenario.repo)
+    assert out.returncode == 1
+    assert f"{scenario.bug_tests} failed, {6 - scenario.bug_tests} passed" in out.stdout
+    # the scripted patches chain: each search is the previous replace, and only the last one fixes it
+    assert len(scenario.fixes) == 2
+    assert scenario.fixes[0][1] == scenario.fixes[1][0]
+
+def test_last_scripted_fix_makes_the_suite_green(scenario):
+    path = os.path.join(scenario.repo, scenario.bug_path)
+    for search, replace in scenario.fixes:
+        with open(path) as fp:
+            text = fp.read()
+        assert search in text
+        with open(path, "w") as fp:
+            fp.write(text.replace(search, replace))
+    assert pytest_in(scenario.repo).returncode == 0
+
+def test_scenario_round_trip(scenario, tmp_path):
+    from synthetic_repo import Scenario
+    scenario.save(str(tmp_path / "scenario.json"))
+    assert Scenario.load(str(tmp_path / "scenario.json")) == scenario
+
+
+def test_stub_replays_answers_per_node_and_repeats_the_last(scenario):
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from stub_llm import FILE_SELECT_MARKER, StubLLM
+    stub = StubLLM.for_scenario(scenario)
+    select = [SystemMessage(content=f"You {FILE_SELECT_MARKER}."), HumanMessage(content="...")]
+    patch = [SystemMessage(content="You write patches."), HumanMessage(content="...")]
+    assert json.loads(stub.answer(select))["files"] == [scenario.bug_path]
+    answers = [json.loads(stub.answer(patch))["edits"][0]["replace"] for _ in range(3)]
+    assert answers == [scenario.fixes[0][1], scenario.fixes[1][1], scenario.fixes[1][1]]
+    assert stub.calls == {"file_select": 1, "patch": 3}
+
+
+def test_summary_and_regression_check(tmp_path, capsys):
+    import bench_graph
+    assert bench_graph._node_times({"node.patch.wall_sec": 2.0, "node.patch.calls": 1, "llm_cache.x.hit": 3}) == {"patch": 2.0}
+    worker = {"tickets": [
+        {"wall_sec": 2.0, "status": "success", "iterations": 1, "nodes": {"test": 1.0}},
+        {"wall_sec": 4.0, "status": "failed", "iterations": 3, "nodes": {"test": 2.0, "patch": 1.0}},
+    ], "peak_rss_mb": 100.0, "peak_child_rss_mb": None}
+    row = bench_graph._summary(10, "small", 20, 0.5, worker)
+    assert (row["scenario"], row["success"], row["ticket_sec_mean"], row["tickets_per_hour"]) == ("10/small", 1, 3.0, 1200.0)
+    assert row["node_sec_mean"] == {"patch": 0.5, "test": 1.5}
+
+    baseline = tmp_path / "base.json"
+    baseline.write_text(json.dumps({"results": [{**row, "ticket_sec_mean": 2.5}]}))
+    assert bench_graph.compare([row], str(baseline), tolerance=0.25) == 0   # 1.2x
+    assert bench_graph.compare([row], str(baseline), tolerance=0.1) == 1    # regression
+    assert "REGRESSION" in capsys.readouterr().out
+    bench_graph.print_report([row])  # formats without errors, None RSS included
+
+def test_graph_fixes_a_synthetic_repo_with_the_stub(tmp_path, monkeypatch):
+    import bench_graph
+    from synthetic_repo import build_repo
+    template = str(tmp_path / "template")
+    build_repo(os.path.join(template, "repo"), n_files=3, n_tests=6, git=False).save(os.path.join(template, "scenario.json"))
+    import se_assistant.llm as llm
+    monkeypatch.setattr(llm, "chat_model", llm.chat_model)  # StubLLM.install() replaces it; restore after
+    monkeypatch.setenv("SE_ASSISTANT_TRACE", "0")
+    out = bench_graph.run_tickets(template, tickets=1, use_async=False, latency=0.0, timeout=120)
+    [ticket] = out["tickets"]
+    assert ticket["status"] == "success"
+    assert ticket["llm_calls"]["patch"] == 1
+    assert "patch" in ticket["nodes"] and "test" in ticket["nodes"]
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+from langgraph.graph import END, START, StateGraph
+
+from se_assistant.checkpoint import _review_update, invoke_ticket, sqlite_checkpointer, thread_config
+from se_assistant.state import HITL, Iteration, Patch, TicketState, ToolRun
+
+
+def tool_run(run_id, patches_applied=0):
+    return ToolRun(run_id=run_id, run_type="test", command="pytest", status="fail", exit_code=1, patches_applied=patches_applied)
+
+def flaky_graph(checkpointer, calls, crash):
+    # repo -> test -> synthesis; "test" raises while crash[0] is set
+    def repo(state):
+        calls.append("repo")
+        return {"open_questions": ["scanned"]}
+
+    def test(state):
+        calls.append("test")
+        if crash[0]:
+            raise RuntimeError("killed mid-run")
+        return {"tool_runs": [tool_run("t1")]}
+
+    def synthesis(state):
+        calls.append("synthesis")
+        return {"final_status": "success", "final_report": f"{len(state.tool_runs)} run(s)"}
+
+    g = StateGraph(TicketState)
+    for name, fn in (("repo", repo), ("test", test), ("synthesis", synthesis)):
+        g.add_node(name, fn)
+    g.add_edge(START, "repo")
+    g.add_edge("repo", "test")
+    g.add_edge("test", "synthesis")
+    g.add_edge("synthesis", END)
+    return g.compile(checkpointer=checkpointer)
+
+@pytest.fixture
+def saver(tmp_path):
+    return sqlite_checkpointer(str(tmp_path / "graph.sqlite"))
+
+
+def test_crashed_run_resumes_at_the_failed_node(tmp_path, saver):
+    calls, crash = [], [True]
+    state = TicketState(run_id="r1", repo_ref=".", task_prompt="fix")
+    with pytest.raises(RuntimeError):
+        invoke_ticket(flaky_graph(saver, calls, crash), state)
+    assert calls == ["repo", "test"]
+
+    # a new process: fresh graph and checkpointer on the same file
+    crash[0] = False
+    final = invoke_ticket(flaky_graph(sqlite_checkpointer(str(tmp_path / "graph.sqlite")), calls, crash), state)
+    assert calls == ["repo", "test", "test", "synthesis"]  # repo is not run again
+    assert final["final_report"] == "1 run(s)" and final["open_questions"] == ["scanned"]
+    assert isinstance(final["tool_runs"][0], ToolRun)  # our models survive the round trip
+
+def test_finished_run_is_not_started_again(saver):
+    calls = []
+    app = flaky_graph(saver, calls, [False])
+    state = TicketState(run_id="r2", repo_ref=".", task_prompt="fix")
+    invoke_ticket(app, state)
+    again = invoke_ticket(app, state)
+    assert calls == ["repo", "test", "synthesis"]
+    assert again["final_status"] == "success" and len(again["tool_runs"]) == 1
+    assert app.get_state(thread_config("r2")).next == ()
+
+
+def stopped(**kw):
+    return TicketState(run_id="r", repo_ref=".", task_prompt="fix", final_status="stopped_for_review",
+                       hitl=HITL(required=True, reason="max iterations"), **kw).model_dump()
+
+def test_approved_review_continues_from_the_last_test_run():
+    values = stopped(iteration=Iteration(count=5, max=5), tool_runs=[tool_run("t1")])
+    update, node = _review_update(values, {"approved": True})
+    assert node == "test"
+    assert update["iteration"].max == 7 and not update["hitl"].required
+    assert update["final_status"] is None
+
+def test_approved_review_with_an_untested_patch_continues_after_safety():
+    values = stopped(tool_runs=[tool_run("t1")], patches=[Patch(patch_id="p1", summary="fix")])
+    assert _review_update(values, {"approved": True})[1] == "safety"
+
+def test_rejected_review_only_records_the_decision():
+    update, node = _review_update(stopped(), {"approved": False, "note": "no"})
+    assert node is None and update["hitl"].required
+    assert update["hitl"].human_decision == {"approved": False, "note": "no"}
+
+
+def test_run_py_prints_each_step(capsys):
+    import run  # the repo root is on sys.path: tests/ is a package
+    run.print_step({"hitl": {"required": True, "reason": "unsafe"}, "selected_files": ["a.py"],
+                    "tool_runs": [tool_run("t1")]})
+    run.print_step(TicketState(run_id="r", repo_ref=".", task_prompt="fix"))
+    out = capsys.readouterr().out
+    assert out.splitlines() == [
+        "---- step ----", "hitl_required: True", "hitl_reason: unsafe", "selected_files: ['a.py']", "last_run: test fail 1",
+        "---- step ----", "hitl_required: False", "selected_files: []",
+    ]
+
+def test_run_py_shows_a_finished_run_instead_of_restarting(capsys):
+    import run
+    saved = SimpleNamespace(values={"run_id": "r9", "final_report": "done"}, next=())
+    assert run.finished(saved) == {"run_id": "r9", "final_report": "done"}
+    assert "Run r9 already finished" in capsys.readouterr().out
@@ -0,0 +1,63 @@
+import pytest
+
+from se_assistant.code_index import decisive, definition_spans, load_code_index, module_name, rank_files
+
+
+@pytest.fixture
+def index(tmp_path):
+    root = tmp_path / "repo"
+    (root / "src" / "shop").mkdir(parents=True)
+    (root / "tests").mkdir()
+    (root / "src" / "shop" / "__init__.py").write_text("")
+    (root / "src" / "shop" / "pricing.py").write_text("from .tax import rate\n\ndef price(x):\n    return x * rate()\n")
+    (root / "src" / "shop" / "tax.py").write_text("def rate():\n    return 2\n")
+    (root / "src" / "shop" / "cart.py").write_text("def total(items):\n    return sum(items)\n")
+    (root / "tests" / "test_pricing.py").write_text("from shop.pricing import price\n\ndef test_price():\n    assert price(1) == 3\n")
+    (root / "tests" / "test_cart.py").write_text("from shop import cart\n\ndef test_total():\n    assert cart.total([1]) == 1\n")
+    return load_code_index(str(root))
+
+def failure(*frames, test_file="tests/test_pricing.py"):
+    return {"nodeid": f"{test_file}::test_price", "test_file": test_file,
+            "frames": [{"path": p, "line": n} for p, n in frames]}
+
+
+def test_import_graph(index):
+    assert index.imports["src/shop/pricing.py"] == ["src/shop/tax.py"]  # relative import resolved
+    assert index.sources_for_test("tests/test_pricing.py") == ["src/shop/pricing.py"]
+    assert index.sources_for_test("tests/test_cart.py") == ["src/shop/cart.py"]  # "from shop import cart"
+    assert index.tests_importing(["src/shop/pricing.py"]) == ["tests/test_pricing.py"]
+    assert index.symbols["price"] == ["src/shop/pricing.py"]
+
+def test_crash_frame_outranks_callers_and_imports(index):
+    ranked = rank_files(index, [failure(("tests/test_pricing.py", 4), ("src/shop/pricing.py", 4), ("src/shop/tax.py", 2))])
+    assert [p for p, _, _ in ranked] == ["src/shop/tax.py", "src/shop/pricing.py"]
+    (top, top_score, why), (_, second_score, second_why) = ranked
+    assert top_score == 3.0 and "crash frame src/shop/tax.py:2" in why
+    assert second_score == 2.0 and "imported by tests/test_pricing.py" in second_why  # 1.5 frame + 0.5 import
+
+def test_absolute_traceback_paths_map_to_repo_files(index):
+    ranked = rank_files(index, [failure((f"{index.repo_ref}/src/shop/tax.py", 2))])
+    assert ranked[0][0] == "src/shop/tax.py"
+
+def test_without_frames_the_tests_imports_rank(index):
+    ranked = rank_files(index, [], test_paths=["tests/test_cart.py"])
+    assert ranked == [("src/shop/cart.py", 0.5, ["imported by tests/test_cart.py"])]
+
+def test_decisive():
+    assert not decisive([])
+    assert decisive([("a.py", 0.5, [])])
+    assert decisive([("a.py", 3.0, []), ("b.py", 1.5, [])])
+    assert not decisive([("a.py", 3.0, []), ("b.py", 2.0, [])])
+
+
+def test_module_name():
+    assert module_name("src/shop/__init__.py") == "shop"
+    assert module_name("tools/run.py") == "tools.run"
+    assert module_name("README.md") is None
+
+def test_long_classes_are_split_into_methods():
+    body = "".join(f"    def m{i}(self):\n" + "        x = 1\n" * 10 for i in range(8))
+    spans = definition_spans("import os\n\nclass Big:\n    '''doc'''\n" + body + "\ndef f():\n    pass\n")
+    names = [n for _, _, n in spans]
+    assert names[0] == "Big" and names[1:9] == [f"Big.m{i}" for i in range(8)] and names[-1] == "f"
+    assert spans[0][:2] == (3, 4)  # class header up to the first method
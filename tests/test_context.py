@@ -0,0 +1,76 @@
+from se_assistant.context import (
+    CHARS_PER_TOKEN, ContextPacker, add_source, clip_lines, context_budget, estimate_tokens, join_text, render_sources,
+)
+
+SOURCE = (
+    "import math\n\n"
+    "def area(r):\n    return math.pi * r * r\n\n"
+    "def broken(x):\n    return x / 0\n\n"
+    "def unrelated():\n    return 1\n"
+)
+
+
+def tokens(n):
+    return "x" * (n * CHARS_PER_TOKEN)
+
+
+def test_pack_keeps_the_best_chunks_that_fit():
+    p = ContextPacker("patch", budget=100)
+    p.fixed(tokens(20))
+    p.add("failures", tokens(50), score=3.0, order=(0,))
+    p.add("failures", tokens(40), score=2.0, order=(1,))  # no room after the first
+    p.add("failures", tokens(25), score=1.0, order=(2,))  # lower score, but still fits
+    p.add("tests", "   ", score=9.0)                      # blank chunks are never offered
+    chosen = p.pack()
+    assert [c.order for c in chosen["failures"]] == [(0,), (2,)]
+    assert set(chosen) == {"failures"}
+    assert p.usage["failures"] == (75, 115, 2, 3)
+    assert p.metrics() == {"context.patch.fixed.tokens": 20, "context.patch.failures.tokens": 75}
+
+def test_chosen_chunks_come_back_in_document_order():
+    p = ContextPacker("patch", budget=100)
+    p.add("src", "b", score=1.0, order=(0, 2))
+    p.add("src", "a", score=5.0, order=(0, 1))
+    p.add("src", "c", score=9.0, order=(0, 3))
+    assert join_text(p.pack()["src"], sep="") == "abc"
+
+def test_budget_smaller_than_the_fixed_part_packs_nothing():
+    p = ContextPacker("patch", budget=10)
+    p.fixed(tokens(20))
+    p.add("src", "x", score=1.0)
+    assert p.pack() == {}
+
+
+def test_clip_lines_keeps_head_and_tail():
+    text = "\n".join(f"line {i}" for i in range(200))
+    clipped = clip_lines(text, 50)
+    assert estimate_tokens(clipped) <= 50 + 10  # plus the elision marker
+    assert clipped.startswith("line 0\n") and clipped.endswith("line 199")
+    assert "lines elided" in clipped
+    assert clip_lines("short", 50) == "short"
+
+def test_context_budget(monkeypatch):
+    monkeypatch.delenv("SE_ASSISTANT_CONTEXT_TOKENS", raising=False)
+    assert context_budget("qwen2.5:7b", "patch") == 8192 - 2048
+    assert context_budget("unknown", "other") == 4096 - 1024
+    assert context_budget("qwen2.5:7b", "patch", override=500) == 500
+    monkeypatch.setenv("SE_ASSISTANT_CONTEXT_TOKENS", "900")
+    assert context_budget("qwen2.5:7b", "patch") == 900
+
+
+def test_tight_budget_keeps_the_traceback_hit_whole():
+    # room for the hit (15 tokens) and the module header (10), not for the other functions
+    p = ContextPacker("patch", budget=25)
+    add_source(p, "src", "geo.py", SOURCE, rank=0, lines=[7])
+    chosen = p.pack()["src"]
+    assert "def broken(x):\n    return x / 0" in join_text(chosen)
+    assert "def area" not in join_text(chosen) and "def unrelated" not in join_text(chosen)
+    out = render_sources(chosen)
+    assert out.startswith("=== geo.py (excerpts of 10 lines) ===\n--- lines 1-2 ---\nimport math\n")
+    assert "--- lines 6-8 ---\ndef broken" in out
+
+def test_roomy_budget_renders_the_full_file():
+    p = ContextPacker("patch", budget=1000)
+    add_source(p, "src", "geo.py", SOURCE, rank=0, lines=[7])
+    out = render_sources(p.pack()["src"])
+    assert out.startswith("=== geo.py (full file, 10 lines) ===\n--- lines 1-10 ---\n")
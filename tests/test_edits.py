@@ -0,0 +1,99 @@
+import pytest
+
+from se_assistant.edits import EditConflict, apply_edits, apply_file_edits, locate, parse_unified_diff
+from se_assistant.tools import unified_diff
+
+SOURCE = (
+    "def price(x):\n"
+    "    if x < 0:\n"
+    "        return 0\n"
+    "    return x * 2\n"
+    "\n"
+    "def tax(x):\n"
+    "    return x * 2\n"
+)
+
+
+def lines(text):
+    return text.splitlines(keepends=True)
+
+
+def test_locate_exact():
+    assert locate(lines(SOURCE), ["    if x < 0:\n", "        return 0\n"]) == (1, "exact")
+
+def test_locate_ignores_whitespace():
+    assert locate(lines(SOURCE), ["  if x  <  0:\n"]) == (1, "whitespace")
+
+def test_locate_fuzzy():
+    at, how = locate(lines(SOURCE), ["    if x < 0 :\n", "        return 0\n"])
+    assert at == 1 and how.startswith("fuzzy")
+
+def test_locate_ambiguous_needs_hint():
+    search = ["    return x * 2\n"]
+    with pytest.raises(EditConflict, match="matches 2 places"):
+        locate(lines(SOURCE), search)
+    assert locate(lines(SOURCE), search, hint=7) == (6, "exact")
+    assert locate(lines(SOURCE), search, hint=3) == (3, "exact")
+
+def test_locate_not_found():
+    with pytest.raises(EditConflict, match="not found"):
+        locate(lines(SOURCE), ["class Unrelated:\n"])
+    with pytest.raises(EditConflict, match="empty"):
+        locate(lines(SOURCE), [])
+
+
+def test_apply_file_edits_several_hunks():
+    out = apply_file_edits("m.py", SOURCE, [
+        {"search": "        return 0\n", "replace": "        raise ValueError(x)\n"},
+        {"search": "    return x * 2\n", "replace": "    return x * 3\n", "start_line": 7},
+    ])
+    assert "raise ValueError(x)" in out
+    assert out.endswith("def tax(x):\n    return x * 3\n")
+    assert out.count("return x * 2") == 1
+
+def test_apply_file_edits_reindents_whitespace_match():
+    out = apply_file_edits("m.py", SOURCE, [{"search": "if x < 0:\n    return 0\n", "replace": "if x <= 0:\n    return 0\n"}])
+    assert "    if x <= 0:\n        return 0\n" in out
+
+def test_apply_file_edits_rejects_overlap():
+    with pytest.raises(EditConflict, match="overlapping"):
+        apply_file_edits("m.py", SOURCE, [
+            {"search": "def price(x):\n    if x < 0:\n", "replace": ""},
+            {"search": "    if x < 0:\n        return 0\n", "replace": ""},
+        ])
+
+def test_apply_file_edits_new_file():
+    assert apply_file_edits("new.py", None, [{"search": "", "replace": "X = 1"}]) == "X = 1\n"
+    with pytest.raises(EditConflict, match="does not exist"):
+        apply_file_edits("new.py", None, [{"search": "X = 0\n", "replace": "X = 1\n"}])
+
+def test_apply_edits_is_all_or_nothing():
+    sources = {"a.py": SOURCE, "b.py": "Y = 1\n"}
+    with pytest.raises(EditConflict, match="b.py"):
+        apply_edits(sources, [
+            {"path": "a.py", "search": "        return 0\n", "replace": "        return 1\n"},
+            {"path": "b.py", "search": "Z = 1\n", "replace": "Z = 2\n"},
+        ])
+
+
+def test_unified_diff_round_trip():
+    new = SOURCE.replace("return 0", "return None").replace("def tax(x):\n    return x * 2\n", "def tax(x):\n    return x / 10")
+    edits = parse_unified_diff(unified_diff(SOURCE, new, "src/m.py"))
+    assert {e["path"] for e in edits} == {"src/m.py"}
+    assert apply_edits({"src/m.py": SOURCE}, edits)["src/m.py"] == new + "\n"
+
+def test_unified_diff_round_trip_new_file():
+    edits = parse_unified_diff(unified_diff("", "def f():\n    return 1\n", "src/new.py"))
+    assert apply_edits({"src/new.py": None}, edits) == {"src/new.py": "def f():\n    return 1\n"}
+
+def test_parse_unified_diff_needs_file_header():
+    with pytest.raises(EditConflict):
+        parse_unified_diff("@@ -1 +1 @@\n-a\n+b\n")
+
+def test_unified_diff_body_lines_that_look_like_headers():
+    # removing "-- note" and adding "++ total" gives "--- note"/"+++ total" body lines
+    old = "select 1;\n-- note\nselect 2;\n"
+    new = "select 1;\n++ total\nselect 2;\n"
+    edits = parse_unified_diff(unified_diff(old, new, "q.sql") + unified_diff("a\n", "b\n", "other.txt"))
+    assert [e["path"] for e in edits] == ["q.sql", "other.txt"]
+    assert apply_edits({"q.sql": old, "other.txt": "a\n"}, edits) == {"q.sql": new, "other.txt": "b\n"}
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+
+import pytest
+
+from se_assistant import envs
+from se_assistant.envs import dependency_spec, env_key, evict, provision, venv_python
+from se_assistant.tools import cache_dir
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "requirements.txt").write_text("requests==2.31.0\n")
+    (root / "pyproject.toml").write_text(
+        '[project]\nname = "demo"\ndependencies = ["attrs"]\n'
+        '[project.optional-dependencies]\ntest = ["hypothesis"]\ndocs = ["sphinx"]\n'
+    )
+    return root
+
+def fake_env(key, age_sec=0.0):
+    # what _build leaves behind, without a real venv
+    env_dir = os.path.join(cache_dir("envs"), key)
+    os.makedirs(os.path.dirname(venv_python(env_dir)))
+    open(venv_python(env_dir), "w").close()
+    marker = os.path.join(env_dir, "env.json")
+    open(marker, "w").close()
+    used = time.time() - age_sec
+    os.utime(marker, (used, used))
+    return env_dir
+
+
+def test_spec_holds_requirement_files_and_test_extras(repo):
+    spec = dependency_spec(str(repo), ["requirements.txt", "pyproject.toml"])
+    assert spec == {"requirements": ["attrs", "hypothesis", "pytest"],
+                    "files": {"requirements.txt": "requests==2.31.0\n"}}
+
+def test_env_key_changes_only_with_the_spec_or_interpreter(repo):
+    spec = dependency_spec(str(repo), ["requirements.txt", "pyproject.toml"])
+    key = env_key(spec, sys.executable)
+    assert env_key(dependency_spec(str(repo), ["pyproject.toml", "requirements.txt"]), sys.executable) == key
+    assert env_key(spec, "/opt/python3.9/bin/python") != key
+    (repo / "requirements.txt").write_text("requests==2.32.0\n")
+    assert env_key(dependency_spec(str(repo), ["requirements.txt", "pyproject.toml"]), sys.executable) != key
+
+def test_spec_follows_requirement_includes(repo, tmp_path):
+    (repo / "requirements.txt").write_text("-r requirements/base.txt\n--constraint=constraints.txt  # pins\n")
+    (repo / "requirements").mkdir()
+    (repo / "requirements" / "base.txt").write_text("-r common.txt\nrequests\n")
+    (repo / "requirements" / "common.txt").write_text("attrs\n")
+    (repo / "constraints.txt").write_text("requests==2.31.0\n")
+    spec = dependency_spec(str(repo), ["requirements.txt"])
+    assert sorted(spec["files"]) == ["constraints.txt", "requirements.txt",
+                                     "requirements/base.txt", "requirements/common.txt"]
+    key = env_key(spec, sys.executable)
+    (repo / "requirements" / "common.txt").write_text("attrs==23.1.0\n")
+    assert env_key(dependency_spec(str(repo), ["requirements.txt"]), sys.executable) != key
+
+    # copied with their relative paths, so pip resolves the includes away from the repo
+    out = tmp_path / "env"
+    cmd = envs._install_cmd("python", spec, str(out))
+    assert (out / "requirements" / "common.txt").read_text() == "attrs\n"
+    assert cmd.count(" -r ") == 1 and str(out / "requirements.txt") in cmd
+
+
+def test_evict_drops_the_least_recently_used_idle_envs():
+    old, older, recent = fake_env("old", 3 * 3600), fake_env("older", 5 * 3600), fake_env("recent", 60)
+    keep = fake_env("keep", 10 * 3600)
+    evict(keep="keep", size=2)
+    assert not os.path.exists(older) and not os.path.exists(old)
+    assert os.path.exists(recent) and os.path.exists(keep)
+
+def test_evict_never_drops_an_env_in_use():
+    busy = [fake_env(f"busy{i}", 60) for i in range(3)]
+    evict(keep="new", size=1)
+    assert all(os.path.exists(d) for d in busy)
+
+
+def test_ready_env_is_reused_without_a_build(repo, monkeypatch):
+    monkeypatch.setattr(envs, "_build", lambda *a: pytest.fail("env rebuilt"))
+    configs = ["requirements.txt", "pyproject.toml"]
+    env_dir = fake_env(env_key(dependency_spec(str(repo), configs), envs.base_python()), 2 * 3600)
+    python, run = provision(str(repo), configs)
+    assert (python, run) == (venv_python(env_dir), None)
+    # marked as used: it is now the most recent env and safe from eviction
+    assert time.time() - os.path.getmtime(os.path.join(env_dir, "env.json")) < 60
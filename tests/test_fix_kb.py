@@ -0,0 +1,82 @@
+from se_assistant import fix_kb
+from se_assistant.fix_kb import FixKB, failure_signature, minhash, record_outcome, similarity
+from se_assistant.nodes.test_agent import _update
+from se_assistant.state import MAX_TOOL_RUNS, Patch, TicketState, ToolRun
+from se_assistant.transaction import apply_files, snapshot_dir
+
+
+def failure(message="assert 3 == 4", line=12, test="test_price", exc="AssertionError"):
+    return {
+        "nodeid": f"tests/test_pricing.py::{test}",
+        "exc_type": exc,
+        "message": message,
+        "test_file": "tests/test_pricing.py",
+        "file": "src/sandbox/pricing.py",
+        "frames": [{"path": "tests/test_pricing.py", "line": line}, {"path": "src/sandbox/pricing.py", "line": line + 3}],
+    }
+
+
+def test_signature_masks_numbers_strings_and_addresses():
+    a = failure("value 'abc' at 0x7f00 was 3")
+    b = failure("value 'xyz' at 0x1234 was 42", line=99)
+    assert failure_signature([a]).key == failure_signature([b]).key
+    assert failure_signature([a]).key != failure_signature([failure(exc="TypeError")]).key
+
+def test_signature_of_raw_fallback_failures():
+    sig = failure_signature([{"raw": "E   ValueError: bad input 17"}])
+    assert sig is not None and any(t.startswith("raw:") for t in sig.tokens)
+    assert failure_signature([]) is None
+
+def test_minhash_similarity_tracks_jaccard():
+    base = {f"t{i}" for i in range(40)}
+    assert similarity(minhash(base), minhash(set(base))) == 1.0
+    near = similarity(minhash(base), minhash(base - {"t0", "t1"} | {"u0", "u1"}))
+    far = similarity(minhash(base), minhash({f"u{i}" for i in range(40)}))
+    assert near > 0.7 and far < 0.2
+
+def test_lookup_exact_and_near_matches(tmp_path):
+    kb = FixKB(str(tmp_path / "kb.sqlite"))
+    sig = failure_signature([failure()])
+    fix_id = kb.record(sig, ["src/sandbox/pricing.py"], "--- a\n+++ b\n")
+    assert kb.record(sig, ["src/sandbox/pricing.py"], "--- a\n+++ b\n") == fix_id  # same fix: one entry
+
+    exact = kb.lookup(failure_signature([failure("assert 5 == 6")]))
+    assert [(f.id, f.similarity, f.successes) for f in exact] == [(fix_id, 1.0, 2)]
+
+    # same crash from another test: not the same key, but similar enough
+    other = failure(test="test_price_rounding")
+    near = kb.lookup(failure_signature([other]))
+    assert [f.id for f in near] == [fix_id] and 0.6 <= near[0].similarity < 1.0
+
+    assert kb.lookup(failure_signature([failure("no such key", test="test_other", exc="KeyError")])) == []
+
+def test_fix_that_keeps_failing_is_skipped(tmp_path):
+    kb = FixKB(str(tmp_path / "kb.sqlite"))
+    sig = failure_signature([failure()])
+    fix_id = kb.record(sig, ["src/sandbox/pricing.py"], "diff")
+    kb.report(fix_id, ok=False)
+    assert kb.lookup(sig)  # 1 success, 1 failure
+    kb.report(fix_id, ok=False)
+    assert kb.lookup(sig) == []
+
+
+def test_success_is_recorded_after_the_baseline_run_left_the_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(fix_kb, "_default", None)
+    repo = tmp_path / "repo"
+    (repo / "src" / "sandbox").mkdir(parents=True)
+    (repo / "src" / "sandbox" / "pricing.py").write_text("def price(x):\n    return x * 2\n")
+    baseline = ToolRun(run_id="base", run_type="test", command="pytest", status="fail", exit_code=1,
+                       failures_parsed=[failure()], failed_tests=["tests/test_pricing.py::test_price"])
+    st = TicketState(run_id="kb", repo_ref=str(repo), task_prompt="fix")
+    st.baseline_ref = _update(st, [baseline])["baseline_ref"]
+
+    apply_files(str(repo), snapshot_dir("kb", "p1"), {"src/sandbox/pricing.py": "def price(x):\n    return x * 3\n"})
+    st.patches = [Patch(patch_id="p1", summary="fix", files_touched=["src/sandbox/pricing.py"])]
+    # later runs only: the capped history no longer holds the baseline
+    st.tool_runs = [ToolRun(run_id=f"r{i}", run_type="test", command="pytest", status="success", exit_code=0,
+                            patches_applied=1) for i in range(MAX_TOOL_RUNS)]
+    st.final_status = "success"
+    record_outcome(st)
+
+    [fix] = fix_kb.default_kb().lookup(failure_signature([failure()]))
+    assert fix.files == ["src/sandbox/pricing.py"] and "+    return x * 3" in fix.diff
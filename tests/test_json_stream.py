@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from se_assistant.json_stream import SchemaViolation, StreamValidator
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "files": {"type": "array", "items": {"type": "string"}, "minItems": 1, "maxItems": 3},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+        "attempt": {"type": "integer"},
+        "note": {"anyOf": [{"type": "string"}, {"type": "null"}]},
+        "edit": {"$ref": "#/$defs/Edit"},
+    },
+    "required": ["files", "confidence"],
+    "additionalProperties": False,
+    "$defs": {"Edit": {"type": "object", "properties": {"path": {"type": "string"}}, "required": ["path"]}},
+}
+
+
+def validate(text, chunk=3):
+    v = StreamValidator(SCHEMA)
+    for i in range(0, len(text), chunk):
+        v.feed(text[i:i + chunk])
+    v.close()
+
+
+@pytest.mark.parametrize("doc", [
+    {"files": ["src/a.py"], "confidence": 0.5},
+    {"files": ["a", "b"], "confidence": 1, "attempt": 2, "note": None, "edit": {"path": "x \"q\" \\ y"}},
+    {"confidence": 0.25, "note": "é ünïcode", "files": ["a"]},
+])
+def test_valid_documents(doc):
+    validate(json.dumps(doc))
+    validate(json.dumps(doc, indent=2), chunk=1)
+
+@pytest.mark.parametrize("text, why", [
+    ('Sure! {"files": ["a"]', "prose before the JSON"),
+    ('{"files": "a", "confidence": 1}', "string where an array belongs"),
+    ('{"files": ["a"], "extra": 1}', "unknown key"),
+    ('{"files": ["a"]}', "missing required key"),
+    ('{"files": [], "confidence": 1}', "too few items"),
+    ('{"files": ["a","b","c","d"], "confidence": 1}', "too many items"),
+    ('{"files": ["a"], "confidence": 2}', "above maximum"),
+    ('{"files": ["a"], "confidence": 1, "attempt": 1.5}', "integer expected"),
+    ('{"files": ["a"], "confidence": 1, "edit": {}}', "$ref required key"),
+    ('{"files": ["a"], "confidence": tru', "incomplete literal"),
+    ('{"files": ["a"], "confidence": 1', "unterminated"),
+])
+def test_invalid_documents(text, why):
+    with pytest.raises(SchemaViolation):
+        validate(text)
+
+def test_fails_at_first_bad_character():
+    v = StreamValidator(SCHEMA)
+    with pytest.raises(SchemaViolation, match="at char 0"):
+        v.feed("I think")
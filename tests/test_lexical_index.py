@@ -0,0 +1,65 @@
+import hashlib
+
+import pytest
+
+from se_assistant.lexical_index import DEF_WEIGHT, LexicalIndex, document_terms, failure_terms, load_lexical_index, terms_of
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    (root / "pkg").mkdir(parents=True)
+    sources = {
+        "pkg/dates.py": "def parse_http_date(value):\n    return value.strip()\n",
+        "pkg/client.py": "from pkg.dates import parse_http_date\n\ndef fetch(url):\n    return parse_http_date(url)\n",
+        "pkg/pricing.py": "TAX_RATE = 0.2\n\ndef net_price(amount):\n    return amount * (1 + TAX_RATE)\n",
+    }
+    for path, text in sources.items():
+        (root / path).write_text(text)
+    return root
+
+def listing(root, *paths):
+    # the shape refresh_index() returns
+    return {p: {"sha1": hashlib.sha1((root / p).read_bytes()).hexdigest(), "language": "python"} for p in paths}
+
+PATHS = ("pkg/dates.py", "pkg/client.py", "pkg/pricing.py")
+
+
+def test_terms_split_identifiers_and_drop_stop_words():
+    assert terms_of("parseHTTPDate") == ("parsehttpdate", "parse", "http", "date")
+    assert terms_of("TAX_RATE") == ("tax_rate", "tax", "rate")
+    assert terms_of("self") == () and terms_of("id") == ()
+
+def test_definitions_count_extra():
+    tf = document_terms("def net_price(amount):\n    return amount\n")
+    assert tf["net_price"] == DEF_WEIGHT and tf["amount"] == 2
+
+def test_failure_message_outweighs_the_test_name():
+    q = failure_terms([{"nodeid": "tests/test_dates.py::test_header[utc]", "exc_type": "ValueError",
+                        "message": "bad parse_http_date input", "raw": "    fetch(url)\nE   ValueError: bad input"}])
+    assert q["parse_http_date"] == 2.0 and q["header"] == 1.0 and q["fetch"] == 1.0
+    assert "utc" not in q
+
+
+def test_search_ranks_the_definition_first(repo, tmp_path):
+    index = LexicalIndex(str(tmp_path / "lex.sqlite"))
+    index.update(str(repo), listing(repo, *PATHS))
+    ranked = index.search({"parse_http_date": 2.0})
+    assert [p for p, _, _ in ranked] == ["pkg/dates.py", "pkg/client.py"]
+    assert ranked[0][2] == ["parse_http_date"]
+    assert index.search({"nothing_like_this": 1.0}) == []
+
+def test_update_retokenizes_changed_and_drops_removed_files(repo, tmp_path):
+    index = LexicalIndex(str(tmp_path / "lex.sqlite"))
+    index.update(str(repo), listing(repo, *PATHS))
+    (repo / "pkg" / "pricing.py").write_text("def gross_price(amount):\n    return amount\n")
+    index.update(str(repo), listing(repo, "pkg/dates.py", "pkg/pricing.py"))
+    assert index.search({"tax_rate": 1.0}) == []
+    assert [p for p, _, _ in index.search({"gross_price": 1.0})] == ["pkg/pricing.py"]
+    assert [p for p, _, _ in index.search({"fetch": 1.0})] == []
+
+def test_index_persists_per_repo(repo):
+    load_lexical_index(str(repo), listing(repo, *PATHS))
+    # reopened from the cache: nothing to re-tokenize, results unchanged
+    again = load_lexical_index(str(repo), listing(repo, *PATHS))
+    assert [p for p, _, _ in again.search({"net_price": 1.0})] == ["pkg/pricing.py"]
@@ -0,0 +1,108 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+from se_assistant import llm, llm_cache, routing
+from se_assistant.llm import CachedLLM, ModelLadder, cache_key
+from se_assistant.llm_cache import ResponseCache
+from se_assistant.state import TicketState
+
+PROMPT = ChatPromptTemplate.from_messages([("human", "{q}")])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "llm.sqlite"), max_bytes=1000, ttl_sec=60)
+
+
+class FakeModel:
+    # the attributes cache_key reads, plus a scripted invoke()
+    def __init__(self, model, answers, calls):
+        self.model, self.temperature = model, 0.0
+        self.answers, self.calls = list(answers), calls
+
+    def invoke(self, messages):
+        self.calls.append(self.model)
+        return AIMessage(content=self.answers.pop(0))
+
+
+def test_hit_and_miss(cache):
+    assert cache.get("k") is None
+    cache.put("k", "answer")
+    assert cache.get("k") == "answer"
+
+def test_entries_expire_after_the_ttl(cache, clock):
+    cache.put("k", "answer")
+    clock[0] += 59
+    assert cache.get("k") == "answer"
+    clock[0] += 2
+    assert cache.get("k") is None
+
+def test_least_recently_used_entries_are_evicted_first(cache, clock):
+    for key in "abc":
+        cache.put(key, "x" * 300)
+        clock[0] += 1
+    cache.get("a")  # a is now newer than b
+    clock[0] += 1
+    cache.put("d", "x" * 300)  # 1200 bytes > 1000: evict down to 900
+    assert [cache.get(k) is not None for k in "abcd"] == [True, False, True, True]
+
+
+def test_cached_llm_answers_repeats_from_the_cache(cache):
+    calls = []
+    model = FakeModel("m", ['{"a": 1}'], calls)
+    first = CachedLLM("patch", model, cache=cache)
+    assert first.invoke(PROMPT, {"q": "fix"}, parse=json.loads) == {"a": 1}
+    second = CachedLLM("patch", model, cache=cache)
+    assert second.invoke(PROMPT, {"q": "fix"}, parse=json.loads) == {"a": 1}
+    assert calls == ["m"]
+    assert (first.metrics(), second.metrics()) == (
+        {"llm_cache.patch.hit": 0, "llm_cache.patch.miss": 1}, {"llm_cache.patch.hit": 1, "llm_cache.patch.miss": 0})
+
+def test_rejected_answers_are_not_cached(cache):
+    calls = []
+    model = FakeModel("m", ['{"a": 1}', '{"a": 2}'], calls)
+
+    def reject(out):
+        raise ValueError("path not allowed")
+    with pytest.raises(ValueError):
+        CachedLLM("patch", model, cache=cache).invoke(PROMPT, {"q": "fix"}, parse=json.loads, check=reject)
+    assert CachedLLM("patch", model, cache=cache).invoke(PROMPT, {"q": "fix"}, parse=json.loads) == {"a": 2}
+    assert calls == ["m", "m"]
+
+def test_cache_key_ignores_volatile_test_output():
+    model = FakeModel("m", [], [])
+    one = PROMPT.format_messages(q="1 failed in 0.42s at 0x7f3a2b1c9d")
+    two = PROMPT.format_messages(q="1 failed in 1.07s at 0x7f00deadbeef")
+    assert cache_key(model, one) == cache_key(model, two)
+    assert cache_key(model, one) != cache_key(FakeModel("other", [], []), one)
+
+
+def test_ladder_escalates_in_route_order_and_caches_each_rung(monkeypatch, cache):
+    routing.configure({"routes": {"file_select": ["small", "medium", "large"]}})
+    monkeypatch.setattr(llm_cache, "_default", cache)
+    calls = []
+    models = {"small": ['{"confidence": 0.1}'], "medium": ['{"confidence": 0.9}'], "large": []}
+    monkeypatch.setattr(llm, "chat_model", lambda temperature, model, backend, format=None: FakeModel(model, models[model], calls))
+    state = TicketState(run_id="r", repo_ref=".", task_prompt="x")
+    try:
+        def run():
+            lad = ModelLadder(state, "file_select")
+            return lad.invoke(PROMPT, {"q": "which files"}, parse=json.loads, accept=lambda a: a["confidence"] >= 0.5), lad
+        out, lad = run()
+        assert out == {"confidence": 0.9}
+        assert calls == ["small", "medium"] and lad.escalations == 1
+        out, lad = run()  # same prompt: both rungs replay from the cache
+        assert out == {"confidence": 0.9} and calls == ["small", "medium"]
+        assert lad.metrics()["llm_cache.file_select.hit"] == 2
+    finally:
+        routing.configure()
@@ -0,0 +1,61 @@
+import pytest
+
+from se_assistant import localization
+from se_assistant.localization import coverage_score, suspiciousness
+
+
+def spectrum(outcome, lines, shas=None):
+    return {"outcome": outcome, "lines": lines, "shas": shas or {p: "s1" for p in lines}}
+
+SPECTRA = {
+    "t::fail": spectrum("failed", {"a.py": [1, 2, 5]}),
+    "t::pass1": spectrum("passed", {"a.py": [1, 2]}),
+    "t::pass2": spectrum("passed", {"a.py": [1, 3]}),
+    "t::skip": spectrum("skipped", {"a.py": [1, 5]}),
+}
+
+
+def test_ochiai():
+    s = suspiciousness(SPECTRA)
+    # line 5: run by the only failing test and no passing one
+    assert s[("a.py", 5)] == (1.0, 1, 0)
+    assert s[("a.py", 2)] == (pytest.approx(0.707, abs=1e-3), 1, 1)
+    assert s[("a.py", 1)] == (pytest.approx(0.577, abs=1e-3), 1, 2)
+    assert ("a.py", 3) not in s  # never run by a failing test
+
+def test_tarantula():
+    s = suspiciousness(SPECTRA, "tarantula")
+    assert s[("a.py", 5)][0] == 1.0
+    assert s[("a.py", 2)][0] == pytest.approx(0.667, abs=1e-3)
+    assert s[("a.py", 1)][0] == 0.5
+
+def test_no_failing_tests():
+    assert suspiciousness({"t::pass": spectrum("passed", {"a.py": [1]})}) == {}
+
+def test_rerun_selection():
+    shas = {"a.py": "s1"}
+    # first time: the failing tests' files
+    assert localization.tests_to_run({}, ["tests/t.py::fail", "tests/t.py::other"], shas) == ["tests/t.py"]
+    # afterwards: failing tests without a spectrum, and spectra of changed files
+    assert localization.tests_to_run(SPECTRA, ["t::fail", "t::new"], shas) == ["t::new"]
+    assert sorted(localization.tests_to_run(SPECTRA, ["t::fail"], {"a.py": "s2"})) == sorted(SPECTRA)
+
+def test_coverage_score():
+    assert coverage_score(SPECTRA, ["t::fail", "t::missing"]) == 0.5
+    assert coverage_score(SPECTRA, []) == 0.0
+
+def test_coverage_run_of_parametrized_ids(tmp_path):
+    import sys
+    from se_assistant.tools import run_cmd
+    (tmp_path / "test_q.py").write_text(
+        "import pytest\n\n"
+        "@pytest.mark.parametrize('v', ['a$HOME', 'b\"c', 'plain'])\n"
+        "def test_p(v):\n    assert v != 'b\"c'\n"
+    )
+    ids = ["test_q.py::test_p[a$HOME]", 'test_q.py::test_p[b"c]']
+    out = str(tmp_path / "cov.json")
+    res = run_cmd(str(tmp_path), localization.coverage_cmd(sys.executable, out, ids), timeout_sec=60)
+    assert res["exit_code"] == 1, res["stderr"]
+    spectra = {}
+    assert localization.merge_coverage(spectra, out, {}) == 2
+    assert {n: t["outcome"] for n, t in spectra.items()} == {ids[0]: "passed", ids[1]: "failed"}
@@ -0,0 +1,61 @@
+import pytest
+
+from se_assistant.artifacts import get_text
+from se_assistant.edits import EditConflict
+from se_assistant.state import TicketState
+from se_assistant.transaction import restore, snapshot_dir
+from se_assistant.nodes.patch_agent_llm import _patch_result
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    monkeypatch.setenv("SE_ASSISTANT_CACHE_DIR", str(tmp_path / "cache"))
+    repo = tmp_path / "repo"
+    (repo / "src" / "sandbox").mkdir(parents=True)
+    (repo / "tests").mkdir()
+    (repo / "src" / "sandbox" / "pricing.py").write_text("def price(x):\n    return x * 2\n")
+    (repo / "tests" / "test_pricing.py").write_text("def test_price():\n    assert False\n")
+    return TicketState(run_id="t", repo_ref=str(repo), task_prompt="fix")
+
+
+def test_edit_is_written_with_its_diff(state, tmp_path):
+    out = _patch_result(state, {"edits": [{"path": "src/sandbox/pricing.py", "search": "    return x * 2\n", "replace": "    return x * 3\n"}]})
+    [patch] = out["patches"]
+    assert (tmp_path / "repo/src/sandbox/pricing.py").read_text() == "def price(x):\n    return x * 3\n"
+    assert "+    return x * 3" in get_text(patch.diff_ref)
+
+def test_new_file_is_created_and_rolled_back(state, tmp_path):
+    out = _patch_result(state, {"edits": [{"path": "src/sandbox/new_mod.py", "search": "", "replace": "def f():\n    return 1\n"}]})
+    [patch] = out["patches"]
+    new = tmp_path / "repo/src/sandbox/new_mod.py"
+    assert new.read_text() == "def f():\n    return 1\n"
+    assert "+++ b/src/sandbox/new_mod.py" in get_text(patch.diff_ref)
+    restore(state.repo_ref, snapshot_dir(state.run_id, patch.patch_id))
+    assert not new.exists()
+
+def test_unified_diff_answer(state, tmp_path):
+    diff = ("--- a/src/sandbox/pricing.py\n+++ b/src/sandbox/pricing.py\n@@ -1,2 +1,2 @@\n"
+            " def price(x):\n-    return x * 2\n+    return x + 2\n")
+    assert _patch_result(state, {"diff": diff})["patches"]
+    assert "x + 2" in (tmp_path / "repo/src/sandbox/pricing.py").read_text()
+
+@pytest.mark.parametrize("edit, error", [
+    ({"path": "tests/test_pricing.py", "search": "    assert False\n", "replace": "    assert True\n"}, "disallowed path"),
+    ({"path": "src/sandbox/pricing.py", "search": "x * 2", "replace": "```python\nx\n```"}, "code fences"),
+    ({"path": "src/sandbox/pricing.py", "search": "x * 2", "replace": "NO_CHANGE"}, "NO_CHANGE"),
+])
+def test_rejected_answers_write_nothing(state, tmp_path, edit, error):
+    with pytest.raises(ValueError, match=error):
+        _patch_result(state, {"edits": [edit]})
+    assert (tmp_path / "repo/src/sandbox/pricing.py").read_text() == "def price(x):\n    return x * 2\n"
+
+def test_conflicting_edit_writes_nothing(state, tmp_path):
+    with pytest.raises(EditConflict):
+        _patch_result(state, {"edits": [
+            {"path": "src/sandbox/pricing.py", "search": "    return x * 2\n", "replace": "    return x * 3\n"},
+            {"path": "src/sandbox/other.py", "search": "missing", "replace": "x"},
+        ]})
+    assert (tmp_path / "repo/src/sandbox/pricing.py").read_text() == "def price(x):\n    return x * 2\n"
+
+def test_unchanged_answer_is_no_patch(state):
+    assert _patch_result(state, {"edits": [{"path": "src/sandbox/pricing.py", "search": "    return x * 2\n", "replace": "    return x * 2\n"}]}) == {}
@@ -0,0 +1,102 @@
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+from se_assistant.pytest_results import (
+    JUNIT_ARGS, first_failure_watcher, format_failures, junit_nodeid, parse_junit_xml, parse_traceback_frames,
+)
+
+TESTS = '''
+import pytest
+from helper import divide
+
+def test_ok():
+    assert divide(4, 2) == 2
+
+def test_assert():
+    assert divide(1, 1) == 2
+
+def test_crash():
+    divide(1, 0)
+
+class TestGroup:
+    @pytest.mark.parametrize("n", [1, 2])
+    def test_param(self, n):
+        assert n == 1
+
+@pytest.fixture
+def broken():
+    raise RuntimeError("fixture exploded")
+
+def test_error(broken):
+    pass
+'''
+
+
+def run_pytest(tmp_path):
+    (tmp_path / "helper.py").write_text("def divide(a, b):\n    return a / b\n")
+    (tmp_path / "test_sample.py").write_text(TESTS)
+    junit = tmp_path / "junit.xml"
+    subprocess.run([sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", f"--junitxml={junit}", *JUNIT_ARGS],
+                   cwd=tmp_path, capture_output=True)
+    return parse_junit_xml(str(junit))
+
+
+def test_report_from_a_real_run(tmp_path):
+    report = run_pytest(tmp_path)
+    assert report["tests"] == 6
+    assert report["failed_ids"] == [
+        "test_sample.py::test_assert",
+        "test_sample.py::test_crash",
+        "test_sample.py::TestGroup::test_param[2]",
+        "test_sample.py::test_error",
+    ]
+    assert set(report["durations"]) >= {"test_sample.py::test_ok", "test_sample.py::TestGroup::test_param[1]"}
+    by_id = {f["nodeid"]: f for f in report["failures"]}
+
+    crash = by_id["test_sample.py::test_crash"]
+    assert crash["exc_type"] == "ZeroDivisionError"
+    assert crash["file"] == "helper.py" and crash["line"] == 2  # crash site, not the test
+    assert [f["path"] for f in crash["frames"]] == ["test_sample.py", "helper.py"]
+    assert crash["test_file"] == "test_sample.py"
+
+    assert by_id["test_sample.py::test_assert"]["exc_type"] == "AssertionError"
+    error = by_id["test_sample.py::test_error"]
+    assert error["kind"] == "error" and error["exc_type"] == "RuntimeError"
+    assert "fixture exploded" in error["message"] or "fixture exploded" in error["raw"]
+
+def test_missing_or_broken_report(tmp_path):
+    assert parse_junit_xml(str(tmp_path / "none.xml")) is None
+    (tmp_path / "empty.xml").write_text("")
+    assert parse_junit_xml(str(tmp_path / "empty.xml")) is None
+    (tmp_path / "cut.xml").write_text("<testsuites><testsuite><testcase")
+    assert parse_junit_xml(str(tmp_path / "cut.xml")) is None
+
+def test_nodeid_without_file_attribute():
+    case = ET.fromstring('<testcase classname="tests.test_mod.TestX" name="test_y" />')
+    assert junit_nodeid(case) == "tests/test_mod.py::TestX::test_y"
+
+def test_traceback_frames():
+    text = "    f()\n\ntests/test_a.py:9: \n_ _ _\n    raise ValueError(x)\nE   ValueError: 3\n\nsrc/pkg/mod.py:12: ValueError\n"
+    assert parse_traceback_frames(text) == [
+        {"path": "tests/test_a.py", "line": 9},
+        {"path": "src/pkg/mod.py", "line": 12, "exc_type": "ValueError"},
+    ]
+
+
+def test_first_failure_watcher():
+    watch = first_failure_watcher()
+    assert not watch("stdout", "....")
+    assert not watch("stderr", "F")
+    assert not watch("stdout", "..s.   [ 40%]\nFAILED")  # summary line, not progress
+    watch = first_failure_watcher()
+    assert not watch("stdout", "..")
+    assert watch("stdout", "F\n")  # progress line completed across chunks
+
+def test_format_failures(tmp_path):
+    report = run_pytest(tmp_path)
+    text = format_failures(report["failures"], max_items=2, with_raw=False)
+    assert text.startswith("test_sample.py::test_assert: AssertionError")
+    assert "frames: test_sample.py:" in text and "helper.py:2" in text
+    assert "test_param" not in text
+    assert len(format_failures(report["failures"], max_chars=100)) == 100
@@ -0,0 +1,74 @@
+import sys
+
+from se_assistant.pytest_shards import collect_nodeids, combine_exit_codes, plan_shards, run_sharded
+
+
+def ids(files, per_file=2):
+    return [f"tests/test_{f}.py::test_{i}" for f in files for i in range(per_file)]
+
+
+def test_shards_by_file_longest_first():
+    nodeids = ids("abcd")
+    durations = {n: {"a": 4.0, "b": 3.0, "c": 2.0, "d": 1.0}[n[11]] / 2 for n in nodeids}
+    shards = plan_shards(nodeids, 2, durations)
+    assert sorted(sorted(s) for s in shards) == [
+        ["tests/test_a.py", "tests/test_d.py"], ["tests/test_b.py", "tests/test_c.py"]]
+
+def test_unknown_tests_weigh_the_mean_known_duration():
+    # a=1s, b=9s known; c and d count 5s each, so they pair up instead of joining a
+    durations = {"tests/test_a.py::test_0": 1.0, "tests/test_b.py::test_0": 9.0}
+    shards = plan_shards(ids("abcd", per_file=1), 2, durations)
+    assert sorted(sorted(s) for s in shards) == [
+        ["tests/test_a.py", "tests/test_b.py"], ["tests/test_c.py", "tests/test_d.py"]]
+
+def test_fewer_files_than_workers_shards_node_ids():
+    shards = plan_shards(ids("a", per_file=4), 3, {})
+    assert sorted(map(len, shards)) == [1, 1, 2]
+    assert all(s[0].startswith("tests/test_a.py::") for s in shards)
+
+def test_never_more_shards_than_units():
+    assert len(plan_shards(ids("ab", per_file=1), 8, {})) == 2
+    assert plan_shards([], 4, {}) == []
+
+def test_combine_exit_codes():
+    assert combine_exit_codes([0, 0]) == 0
+    assert combine_exit_codes([0, 5]) == 0  # an empty shard is not a failure
+    assert combine_exit_codes([5, 5]) == 5
+    assert combine_exit_codes([0, 1, 2]) == 2
+
+
+def test_run_sharded_merges_the_shard_reports(tmp_path):
+    (tmp_path / "tests").mkdir()
+    for name, body in (("a", "assert True"), ("b", "assert 1 == 2"), ("c", "assert True")):
+        (tmp_path / "tests" / f"test_{name}.py").write_text(f"def test_{name}():\n    {body}\n")
+    res = run_sharded(sys.executable, str(tmp_path), [], workers=2, timeout_sec=60)
+    assert res["shards"] == 2
+    assert (res["status"], res["exit_code"]) == ("fail", 1)
+    assert res["report"]["failed_ids"] == ["tests/test_b.py::test_b"]
+    assert res["report"]["tests"] == 3
+
+def test_selected_node_ids_stay_node_ids():
+    # e.g. the "failed" stage: balanced per file, but a shard never widens to the whole file
+    nodeids = ids("abcd", per_file=3)[::2]
+    shards = plan_shards(nodeids, 2, {}, whole_files=False)
+    assert sorted(n for s in shards for n in s) == sorted(nodeids)
+    for s in shards:
+        files = {n.split("::")[0] for n in s}
+        assert all(n in s for n in nodeids if n.split("::")[0] in files)  # a file's ids share a shard
+
+def test_run_sharded_on_node_ids_runs_only_those_tests(tmp_path):
+    (tmp_path / "tests").mkdir()
+    for name in "abc":
+        (tmp_path / "tests" / f"test_{name}.py").write_text("def test_x():\n    assert True\n\ndef test_y():\n    assert False\n")
+    selected = [f"tests/test_{name}.py::test_y" for name in "abc"]
+    res = run_sharded(sys.executable, str(tmp_path), selected, workers=2, timeout_sec=60)
+    assert res["shards"] == 2
+    assert res["report"]["tests"] == 3
+    assert sorted(res["report"]["failed_ids"]) == selected
+
+
+def test_collect_parametrized_node_ids(tmp_path):
+    (tmp_path / "test_q.py").write_text(
+        "import pytest\n\n@pytest.mark.parametrize('v', ['a$HOME', 'b\"c', 'plain'])\ndef test_p(v):\n    pass\n")
+    ids = ["test_q.py::test_p[a$HOME]", 'test_q.py::test_p[b"c]']
+    assert collect_nodeids(sys.executable, str(tmp_path), ids) == ids
@@ -0,0 +1,72 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from se_assistant import repo_index
+from se_assistant.repo_index import language_of, load_index, refresh_index
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    (root / "pkg").mkdir(parents=True)
+    (root / "pkg" / "a.py").write_text("a = 1\n")
+    (root / "pkg" / "b.py").write_text("b = 1\n")
+    (root / "README.md").write_text("# repo\n")
+    return root
+
+@pytest.fixture
+def hashed(monkeypatch):
+    # paths re-hashed by refresh_index
+    seen = []
+    real = repo_index._sha1
+    monkeypatch.setattr(repo_index, "_sha1", lambda path: seen.append(os.path.basename(path)) or real(path))
+    return seen
+
+
+def test_refresh_hashes_only_changed_files(repo, hashed):
+    first = refresh_index(str(repo))
+    assert sorted(first) == ["README.md", "pkg/a.py", "pkg/b.py"]
+    assert first["pkg/a.py"]["language"] == "python"
+    hashed.clear()
+
+    (repo / "pkg" / "a.py").write_text("a = 22\n")  # changed
+    (repo / "pkg" / "b.py").unlink()                # deleted
+    (repo / "pkg" / "c.py").write_text("c = 1\n")   # new
+    second = refresh_index(str(repo))
+
+    assert sorted(hashed) == ["a.py", "c.py"]  # README.md reused from the index
+    assert sorted(second) == ["README.md", "pkg/a.py", "pkg/c.py"]
+    assert second["pkg/a.py"]["sha1"] != first["pkg/a.py"]["sha1"]
+    assert second["README.md"] == first["README.md"]
+    assert load_index(str(repo)) == second  # persisted
+
+def test_unchanged_tree_hashes_nothing(repo, hashed):
+    refresh_index(str(repo))
+    hashed.clear()
+    refresh_index(str(repo))
+    assert hashed == []
+
+def test_gitignore_and_skip_dirs_without_git(repo):
+    (repo / ".gitignore").write_text("*.log\n/build\n")
+    (repo / "out.log").write_text("x\n")
+    (repo / "build").mkdir()
+    (repo / "build" / "gen.py").write_text("x\n")
+    (repo / "__pycache__").mkdir()
+    (repo / "__pycache__" / "a.pyc").write_bytes(b"\0")
+    assert sorted(refresh_index(str(repo))) == [".gitignore", "README.md", "pkg/a.py", "pkg/b.py"]
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+def test_git_checkout_lists_tracked_and_untracked_files(repo):
+    (repo / ".gitignore").write_text("ignored.txt\n")
+    (repo / "ignored.txt").write_text("x\n")
+    subprocess.run(["git", "init", "-q", str(repo)], check=True)
+    subprocess.run(["git", "-C", str(repo), "add", "pkg/a.py"], check=True)
+    assert sorted(refresh_index(str(repo))) == [".gitignore", "README.md", "pkg/a.py", "pkg/b.py"]
+
+def test_language_of():
+    assert language_of("src/app.tsx") == "typescript"
+    assert language_of("docker/Dockerfile") == "dockerfile"
+    assert language_of("LICENSE") is None
@@ -0,0 +1,65 @@
+import pytest
+
+from se_assistant.artifacts import put_json
+from se_assistant.nodes.rollback_agent import best_iteration, rollback_agent
+from se_assistant.state import HITL, Iteration, Patch, TicketState, ToolRun
+from se_assistant.transaction import apply_files, snapshot_dir
+
+BASELINE = ["tests/test_a.py::test_one", "tests/test_a.py::test_two", "tests/test_a.py::test_three"]
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "mod.py").write_text("v = 0\n")
+    return root
+
+
+def run(iteration, applied, failed):
+    return ToolRun(run_id=f"r{iteration}", run_type="test", command="pytest", status="fail" if failed else "success",
+                   exit_code=1 if failed else 0, failed_tests=failed, patches_applied=applied, iteration=iteration)
+
+def patched(repo, iterations):
+    # one patch per iteration, each writing mod.py, with the full suite run after it
+    patches, runs = [], [run(0, 0, BASELINE)]
+    for i, failed in iterations:
+        pid = f"p{i}"
+        apply_files(str(repo), snapshot_dir("rb", pid), {"mod.py": f"v = {i}\n"})
+        patches.append(Patch(patch_id=pid, summary=f"try {i}", files_touched=["mod.py"], iteration=i))
+        runs.append(run(i, len(patches), failed))
+    return TicketState(run_id="rb", repo_ref=str(repo), task_prompt="fix", patches=patches, tool_runs=runs,
+                       baseline_ref=put_json({"failed_tests": BASELINE}),
+                       iteration=Iteration(count=len(patches), max=len(patches)))
+
+
+def test_stop_keeps_the_iteration_with_the_fewest_failures(repo):
+    st = patched(repo, [(1, BASELINE[1:]), (2, BASELINE[2:]), (3, BASELINE[1:])])
+    assert best_iteration(st).iteration == 2
+
+    update = rollback_agent(st)
+    assert update["final_status"] == "stopped_for_review"
+    assert [p.patch_id for p in update["patches"]] == ["p3"]
+    assert (repo / "mod.py").read_text() == "v = 2\n"
+    # the restored tree is the one iteration 2 tested
+    assert update["tool_runs"][0].failed_tests == BASELINE[2:]
+
+def test_stop_reverts_everything_without_an_improvement(repo):
+    st = patched(repo, [(1, BASELINE), (2, BASELINE + ["tests/test_b.py::test_new"])])
+    assert best_iteration(st) is None
+
+    update = rollback_agent(st)
+    assert sorted(p.patch_id for p in update["patches"]) == ["p1", "p2"]
+    assert (repo / "mod.py").read_text() == "v = 0\n"
+
+def test_run_on_a_reverted_tree_is_not_kept(repo):
+    st = patched(repo, [(1, BASELINE[2:]), (2, BASELINE[1:])])
+    st.patches[0].reverted = True  # iteration 1's tree is gone, even though its run was the best
+    assert best_iteration(st) is None
+
+def test_keep_best_on_stop_off_reverts_everything(repo):
+    st = patched(repo, [(1, BASELINE[1:])])
+    st.keep_best_on_stop = False
+    st.hitl = HITL(required=True, reason="asked for review")
+    rollback_agent(st)
+    assert (repo / "mod.py").read_text() == "v = 0\n"
@@ -0,0 +1,90 @@
+import pytest
+
+from se_assistant import routing
+from se_assistant.llm import InvalidAnswer, ModelLadder
+from se_assistant.state import TicketState
+
+CONFIG = {
+    "backends": {"gpu": {"base_url": "http://gpu-box:11434/", "max_concurrency": 4, "timeout": 120}},
+    "routes": {"patch": ["local/qwen2.5:3b", "gpu/qwen2.5-coder:14b", "hf.co/org/model:q4"]},
+}
+
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch):
+    monkeypatch.delenv("SE_ASSISTANT_MODELS", raising=False)
+    monkeypatch.setenv("OLLAMA_HOST", "ollama:11434")
+    routing.configure(CONFIG)
+    yield
+    monkeypatch.undo()
+    routing.configure()
+
+
+class Answer:
+    # stands in for CachedLLM: returns (or raises) a fixed answer per model
+    def __init__(self, calls, model, answer):
+        self.calls, self.model, self.answer = calls, model, answer
+
+    def invoke(self, prompt, payload, parse, check=None):
+        self.calls.append(self.model)
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+def ladder(monkeypatch, answers):
+    calls = []
+    monkeypatch.setattr(ModelLadder, "_llm", lambda self, tier, node=None: Answer(calls, tier.model, answers[tier.model]))
+    return ModelLadder(TicketState(run_id="r", repo_ref=".", task_prompt="x"), "patch"), calls
+
+class NotFound(Exception):
+    status_code = 404
+
+
+def test_route_entries_name_their_backend():
+    tiers = routing.route("patch")
+    assert [(t.model, t.backend.name) for t in tiers] == [
+        ("qwen2.5:3b", "local"), ("qwen2.5-coder:14b", "gpu"), ("hf.co/org/model:q4", "local")]
+    assert tiers[1].backend.base_url == "http://gpu-box:11434" and tiers[1].backend.timeout == 120
+    assert tiers[0].backend.base_url == "http://ollama:11434"
+
+def test_default_routes_are_kept():
+    assert [t.model for t in routing.route("file_select")] == routing.DEFAULT_ROUTES["file_select"]
+    assert [t.model for t in routing.route("unknown")] == [routing.DEFAULT_MODEL]
+
+def test_unavailable_tiers_are_skipped_unless_none_are_left():
+    tiers = routing.route("patch")
+    routing.mark_unavailable(tiers[0], ConnectionError("refused"))
+    assert routing.route("patch") == tiers[1:]
+    for t in tiers[1:]:
+        routing.mark_unavailable(t, ConnectionError("refused"))
+    assert routing.route("patch") == tiers
+
+
+def test_unaccepted_answer_escalates(monkeypatch):
+    lad, calls = ladder(monkeypatch, {"qwen2.5:3b": {"confidence": 0.1}, "qwen2.5-coder:14b": {"confidence": 0.9},
+                                      "hf.co/org/model:q4": {"confidence": 1.0}})
+    out = lad.invoke(None, {}, parse=None, accept=lambda a: a["confidence"] >= 0.5)
+    assert out == {"confidence": 0.9}
+    assert calls == ["qwen2.5:3b", "qwen2.5-coder:14b"] and lad.escalations == 1
+
+def test_last_tier_answer_is_returned_even_if_not_accepted(monkeypatch):
+    lad, calls = ladder(monkeypatch, {m: {"confidence": 0.1} for m in ("qwen2.5:3b", "qwen2.5-coder:14b", "hf.co/org/model:q4")})
+    assert lad.invoke(None, {}, parse=None, accept=lambda a: False) == {"confidence": 0.1}
+    assert len(calls) == 3
+
+def test_missing_model_is_marked_and_skipped(monkeypatch):
+    lad, calls = ladder(monkeypatch, {"qwen2.5:3b": NotFound("model not found"), "qwen2.5-coder:14b": {"ok": 1},
+                                      "hf.co/org/model:q4": {"ok": 2}})
+    assert lad.invoke(None, {}, parse=None) == {"ok": 1}
+    assert [t.model for t in routing.route("patch")] == ["qwen2.5-coder:14b", "hf.co/org/model:q4"]
+
+def test_aborted_answer_escalates_without_repair(monkeypatch):
+    bad = InvalidAnswer('{"edits": [', ValueError("schema"), aborted=True)
+    lad, calls = ladder(monkeypatch, {"qwen2.5:3b": bad, "qwen2.5-coder:14b": {"ok": 1}, "hf.co/org/model:q4": {"ok": 2}})
+    assert lad.invoke(None, {}, parse=None) == {"ok": 1}
+    assert calls == ["qwen2.5:3b", "qwen2.5-coder:14b"]
+
+def test_other_errors_propagate(monkeypatch):
+    lad, _ = ladder(monkeypatch, {"qwen2.5:3b": RuntimeError("boom"), "qwen2.5-coder:14b": {}, "hf.co/org/model:q4": {}})
+    with pytest.raises(RuntimeError):
+        lad.invoke(None, {}, parse=None)
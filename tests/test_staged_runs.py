@@ -0,0 +1,110 @@
+import sys
+
+import pytest
+
+from se_assistant.artifacts import put_text
+from se_assistant.state import Patch, TicketState, ToolRun
+from se_assistant.nodes.test_agent import MAX_RERUN_IDS, _next_stage, test_agent as run_tests
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    (root / "src" / "sandbox").mkdir(parents=True)
+    (root / "tests").mkdir()
+    (root / "src" / "sandbox" / "__init__.py").write_text("")
+    (root / "src" / "sandbox" / "pricing.py").write_text("def price(x):\n    return x * 2\n")
+    (root / "src" / "sandbox" / "other.py").write_text("def other():\n    return 1\n")
+    (root / "tests" / "test_pricing.py").write_text(
+        "from sandbox.pricing import price\n\n"
+        "def test_double():\n    assert price(2) == 4\n\n"
+        "def test_triple():\n    assert price(2) == 6\n"
+    )
+    (root / "tests" / "test_other.py").write_text("from sandbox.other import other\n\ndef test_other():\n    assert other() == 1\n")
+    return root
+
+
+def run(scope, exit_code, failed=(), stderr=None):
+    return ToolRun(run_id=f"{scope}-{exit_code}", run_type="test", command="pytest", scope=scope,
+                   status="success" if exit_code == 0 else "fail", exit_code=exit_code, failed_tests=list(failed),
+                   stderr_ref=put_text(stderr))
+
+NOT_FOUND = "ERROR: not found: /repo/tests/test_pricing.py::test_triple\n(no match in any of [<Module test_pricing.py>])\n"
+
+def state_for(repo, **kw):
+    kw.setdefault("patches", [Patch(patch_id="p1", summary="fix", files_touched=["src/sandbox/pricing.py"])])
+    return TicketState(run_id="t", repo_ref=str(repo), task_prompt="fix", python_path=sys.executable, **kw)
+
+
+def test_first_run_is_the_full_suite(repo):
+    assert _next_stage(state_for(repo, patches=[]), []) == ("full", [])
+
+def test_after_a_patch_only_the_red_tests_run_first(repo):
+    st = state_for(repo, tool_runs=[run("full", 1, ["tests/test_pricing.py::test_triple"])])
+    assert _next_stage(st, []) == ("failed", ["tests/test_pricing.py::test_triple"])
+
+@pytest.mark.parametrize("kw", [
+    {"test_mode": "full"},
+    {"tool_runs": [run("full", 1, [f"tests/test_x.py::test_{i}" for i in range(MAX_RERUN_IDS + 1)])]},
+    {"tool_runs": [run("full", 1, [])]},
+])
+def test_full_suite_when_staging_does_not_apply(repo, kw):
+    assert _next_stage(state_for(repo, **kw), []) == ("full", [])
+
+def test_stages_escalate_only_while_green(repo):
+    st = state_for(repo)
+    # the affected stage holds the tests importing the patched module, not the others
+    assert _next_stage(st, [run("failed", 0)]) == ("affected", ["tests/test_pricing.py"])
+    assert _next_stage(st, [run("failed", 5)]) == ("affected", ["tests/test_pricing.py"])  # nothing collected
+    assert _next_stage(st, [run("failed", 4, stderr=NOT_FOUND)]) == ("affected", ["tests/test_pricing.py"])  # renamed away
+    assert _next_stage(st, [run("failed", 4, stderr="ERROR: usage: unrecognized arguments")]) is None
+    assert _next_stage(st, [run("failed", 0), run("affected", 4)]) is None
+    assert _next_stage(st, [run("failed", 0), run("affected", 0)]) == ("full", [])
+    assert _next_stage(st, [run("failed", 1)]) is None
+    assert _next_stage(st, [run("failed", 0), run("affected", 1)]) is None
+    assert _next_stage(st, [run("full", 0)]) is None
+
+def test_red_stage_stops_the_node(repo):
+    st = state_for(repo, tool_runs=[run("full", 1, ["tests/test_pricing.py::test_triple"])])
+    runs = run_tests(st)["tool_runs"]
+    assert [(r.scope, r.exit_code, r.failed_tests) for r in runs] == [("failed", 1, ["tests/test_pricing.py::test_triple"])]
+
+def test_green_stages_end_with_the_full_suite(repo):
+    (repo / "tests" / "test_pricing.py").write_text(
+        "from sandbox.pricing import price\n\ndef test_double():\n    assert price(2) == 4\n")
+    st = state_for(repo, tool_runs=[run("full", 1, ["tests/test_pricing.py::test_double"])])
+    runs = run_tests(st)["tool_runs"]
+    assert [(r.scope, r.exit_code) for r in runs] == [("failed", 0), ("affected", 0), ("full", 0)]
+
+def test_a_removed_failing_test_does_not_read_as_red(repo):
+    (repo / "tests" / "test_pricing.py").write_text(
+        "from sandbox.pricing import price\n\ndef test_double():\n    assert price(2) == 4\n")
+    st = state_for(repo, tool_runs=[run("full", 1, ["tests/test_pricing.py::test_triple"])])
+    runs = run_tests(st)["tool_runs"]
+    assert [(r.scope, r.exit_code) for r in runs] == [("failed", 4), ("affected", 0), ("full", 0)]
+
+def test_warm_runner_honours_fail_fast_and_test_log(repo):
+    from se_assistant.warm_runner import shutdown_workers
+    (repo / "tests" / "test_more.py").write_text("def test_a():\n    assert False\n\ndef test_b():\n    assert False\n")
+    st = state_for(repo, patches=[], test_runner="warm", test_fail_fast=True, test_log=True)
+    try:
+        [full] = run_tests(st)["tool_runs"]
+    finally:
+        shutdown_workers()
+    assert full.exit_code == 1
+    assert len(full.failed_tests) == 1  # -x: stopped at the first failure
+    with open(full.log_path) as fp:
+        assert "1 failed" in fp.read()
+
+def test_parametrized_ids_reach_pytest_unmangled(repo):
+    (repo / "tests" / "test_params.py").write_text(
+        "import pytest\n\n"
+        "@pytest.mark.parametrize('v', ['a$HOME', 'b\"c'])\n"
+        "def test_p(v):\n    assert False\n"
+    )
+    red = ["tests/test_params.py::test_p[a$HOME]", 'tests/test_params.py::test_p[b"c]']
+    st = state_for(repo, tool_runs=[run("full", 1, red)])
+    runs = run_tests(st)["tool_runs"]
+    # still red: the stage ran both tests instead of exiting 4 (not found) or 2 (shell syntax error)
+    assert [(r.scope, r.exit_code) for r in runs] == [("failed", 1)]
+    assert sorted(runs[0].failed_tests) == sorted(red)
@@ -0,0 +1,45 @@
+from langgraph.graph import END, START, StateGraph
+
+from se_assistant.state import MAX_TOOL_RUNS, Patch, TicketState, ToolRun, append_capped, upsert_by
+
+
+def tool_run(run_id, exit_code=1):
+    return ToolRun(run_id=run_id, run_type="test", command="pytest", status="fail", exit_code=exit_code)
+
+
+def test_append_capped_keeps_the_newest():
+    reduce = append_capped(3)
+    assert reduce(["a", "b"], ["c", "d"]) == ["b", "c", "d"]
+    assert reduce(None, ["a"]) == ["a"]
+
+def test_upsert_by_replaces_in_place_and_appends_new_keys():
+    reduce = upsert_by("patch_id")
+    old = [Patch(patch_id="p1", summary="one"), Patch(patch_id="p2", summary="two")]
+    merged = reduce(old, [Patch(patch_id="p1", summary="one", reverted=True), Patch(patch_id="p3", summary="three")])
+    assert [(p.patch_id, p.reverted) for p in merged] == [("p1", True), ("p2", False), ("p3", False)]
+
+def test_upsert_by_cap_drops_the_oldest():
+    reduce = upsert_by("run_id", 2)
+    merged = reduce([tool_run("a"), tool_run("b")], [tool_run("a", 0), tool_run("c")])
+    assert [(r.run_id, r.exit_code) for r in merged] == [("b", 1), ("c", 1)]
+
+
+def test_nodes_return_only_new_items():
+    def runs(state):
+        return {"tool_runs": [tool_run(f"r{len(state.tool_runs) + i}") for i in range(MAX_TOOL_RUNS)]}
+
+    def revert(state):
+        return {"patches": [state.patches[0].model_copy(update={"reverted": True})]}
+
+    g = StateGraph(TicketState)
+    g.add_node("runs", runs)
+    g.add_node("revert", revert)
+    g.add_edge(START, "runs")
+    g.add_edge("runs", "revert")
+    g.add_edge("revert", END)
+    start = TicketState(run_id="s", repo_ref=".", task_prompt="x", tool_runs=[tool_run("first")],
+                        patches=[Patch(patch_id="p1", summary="one"), Patch(patch_id="p2", summary="two")])
+    out = g.compile().invoke(start)
+
+    assert len(out["tool_runs"]) == MAX_TOOL_RUNS and out["tool_runs"][0].run_id == "r1"
+    assert [(p.patch_id, p.reverted) for p in out["patches"]] == [("p1", True), ("p2", False)]
@@ -0,0 +1,46 @@
+import ast
+
+from se_assistant.static_checks import undefined_names
+
+
+def names(source):
+    return [(d["line"], d["message"]) for d in undefined_names(ast.parse(source), "m.py")]
+
+
+def test_reports_undefined_names():
+    src = "def f(x):\n    return x + y\n\nprint(zz)\n"
+    assert names(src) == [(2, "undefined name 'y'"), (4, "undefined name 'zz'")]
+    assert all(d["code"] == "F821" for d in undefined_names(ast.parse(src), "m.py"))
+
+def test_bound_names_are_defined():
+    src = (
+        "import os\n"
+        "from typing import List as L\n"
+        "X: L[int] = []\n"
+        "def f(a, *args, b=1, **kw):\n"
+        "    global G\n"
+        "    G = a\n"
+        "    for i, (j, k) in enumerate(args):\n"
+        "        pass\n"
+        "    with open(os.sep) as fp:\n"
+        "        pass\n"
+        "    try:\n"
+        "        pass\n"
+        "    except ValueError as e:\n"
+        "        print(e)\n"
+        "    return [n for n in kw if (m := n)], m, i, j, k, fp, b, G, X, __file__\n"
+        "class C:\n"
+        "    attr = 1\n"
+        "    def g(self):\n"
+        "        return self.attr, C, f\n"
+        "late = lambda: defined_later\n"
+        "defined_later = 1\n"
+    )
+    assert names(src) == []
+
+def test_class_scope_not_visible_in_methods():
+    src = "class C:\n    attr = 1\n    def g(self):\n        return attr\n"
+    assert names(src) == [(4, "undefined name 'attr'")]
+
+def test_star_import_disables_check():
+    assert names("from os import *\nprint(anything)\n") == []
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from se_assistant.tools import RingBuffer, arun_cmd, run_cmd
+
+posix = pytest.mark.skipif(os.name == "nt", reason="POSIX shell commands")
+
+def running(pid):
+    # killed children are orphans; whether anyone reaps them depends on the host's init
+    try:
+        with open(f"/proc/{pid}/stat") as fp:
+            return fp.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+def py(code):
+    return f'"{sys.executable}" -c "{code}"'
+
+
+def test_ring_buffer_keeps_the_tail():
+    ring = RingBuffer(8)
+    ring.write(b"0123")
+    ring.write(b"456789")
+    assert ring.buf == b"23456789" and ring.dropped == 2
+    assert ring.text() == "[... 2 bytes dropped ...]\n23456789"
+
+def test_output_is_capped_but_logged_in_full(tmp_path):
+    log = tmp_path / "logs" / "run.log"
+    res = run_cmd(str(tmp_path), py("import sys; print('x' * 5000); print('tail'); sys.stderr.write('err')"),
+                  max_bytes=100, log_path=str(log))
+    assert (res["status"], res["exit_code"], res["stopped_early"]) == ("success", 0, False)
+    assert res["stdout"].endswith("tail\n") and "bytes dropped" in res["stdout"]
+    assert res["stderr"] == "err"
+    assert len(log.read_bytes()) > 5000
+
+def test_on_output_sees_the_stream_as_it_arrives(tmp_path):
+    seen = []
+    res = run_cmd(str(tmp_path), py("import sys, time; print('a', flush=True); time.sleep(0.2); print('b'); sys.exit(3)"),
+                  on_output=lambda stream, text: seen.append((stream, text)) and False)
+    assert (res["status"], res["exit_code"]) == ("fail", 3)
+    assert "".join(t for s, t in seen if s == "stdout").split() == ["a", "b"]
+
+@posix
+def test_early_stop_interrupts_the_command(tmp_path):
+    t0 = time.time()
+    res = run_cmd(str(tmp_path), py("import time; print('F', flush=True); time.sleep(30)"), timeout_sec=60,
+                  on_output=lambda stream, text: "F" in text)
+    assert res["stopped_early"]
+    assert time.time() - t0 < 10
+
+@posix
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="reads /proc")
+def test_timeout_kills_the_whole_process_group(tmp_path):
+    pid_file = tmp_path / "child.pid"
+    res = run_cmd(str(tmp_path), f"sleep 60 & echo $! > {pid_file}; wait", timeout_sec=1)
+    assert (res["status"], res["exit_code"]) == ("timeout", None)
+    assert res["stderr"].endswith("TIMEOUT")
+    pid = int(pid_file.read_text())
+    for _ in range(50):
+        if not running(pid):
+            break
+        time.sleep(0.1)
+    assert not running(pid)
+
+def test_missing_directory_is_an_error(tmp_path):
+    res = run_cmd(str(tmp_path / "missing"), "echo hi")
+    assert (res["status"], res["exit_code"]) == ("error", None)
+
+
+def test_async_twin_has_the_same_result_shape(tmp_path):
+    res = asyncio.run(arun_cmd(str(tmp_path), py("print('hi')")))
+    assert (res["status"], res["exit_code"], res["stdout"].strip(), res["stopped_early"]) == ("success", 0, "hi", False)
+
+@posix
+def test_async_timeout(tmp_path):
+    res = asyncio.run(arun_cmd(str(tmp_path), "sleep 30", timeout_sec=1))
+    assert (res["status"], res["exit_code"]) == ("timeout", None)
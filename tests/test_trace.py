@@ -0,0 +1,70 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from se_assistant.trace import load_trace, record_llm, timed, trace_path, traced
+
+
+def node(state):
+    with timed("subprocess", "pytest"):
+        time.sleep(0.01)
+    record_llm(time.time() - 0.005, 0.004, SimpleNamespace(content="x" * 40, response_metadata={"eval_count": 7}), prompt_chars=400)
+    return {"note": "done"}
+
+def state(run_id="t1"):
+    return SimpleNamespace(run_id=run_id, metrics={"node.repo.calls": 1}, model_dump_json=lambda: "{}")
+
+
+def test_span_counters_are_summed_into_metrics():
+    wrapped = traced("patch", node)
+    update = wrapped(state())
+    m = update["metrics"]
+    assert update["note"] == "done"
+    assert m["node.repo.calls"] == 1  # other nodes' counters are kept
+    assert (m["node.patch.calls"], m["node.patch.llm_calls"]) == (1, 1)
+    assert (m["node.patch.llm_prompt_tokens"], m["node.patch.llm_completion_tokens"]) == (100, 7)
+    assert m["node.patch.subprocess_sec"] >= 0.01
+    assert m["node.patch.wall_sec"] >= m["node.patch.subprocess_sec"]
+
+def test_async_nodes_are_traced():
+    async def anode(state):
+        return node(state)
+    update = asyncio.run(traced("patch", anode)(state()))
+    assert update["metrics"]["node.patch.llm_calls"] == 1
+
+def test_no_span_outside_a_node():
+    with timed("subprocess", "git"):
+        pass
+    record_llm(time.time(), 0.1, SimpleNamespace(content=""), prompt_chars=0)  # no-op, no error
+
+
+def test_chrome_trace_nests_children_inside_the_node_slice():
+    traced("test", node)(state())
+    traced("patch", node)(state())
+    events = load_trace("t1")
+    assert events[0]["ph"] == "M" and events[0]["args"]["name"] == "run t1"
+    slices = events[1:]
+    assert all(e["ph"] == "X" and {"name", "cat", "pid", "tid", "ts", "dur", "args"} <= set(e) for e in slices)
+    assert [(e["cat"], e["name"]) for e in slices] == [
+        ("node", "test"), ("subprocess", "pytest"), ("llm", "llm"),
+        ("node", "patch"), ("subprocess", "pytest"), ("llm", "llm")]
+    parent = slices[0]
+    for child in slices[1:3]:
+        assert child["tid"] == parent["tid"]
+        assert parent["ts"] <= child["ts"] and child["ts"] + child["dur"] <= parent["ts"] + parent["dur"] + 1
+
+def test_trace_file_is_appended_not_rewritten():
+    traced("repo", node)(state("t2"))
+    with open(trace_path("t2")) as fp:
+        first = fp.read()
+    traced("issue", node)(state("t2"))
+    with open(trace_path("t2")) as fp:
+        both = fp.read()
+    assert both.startswith(first)
+    json.loads(both.rstrip().rstrip(",") + "]")  # the open array is valid once closed
+
+def test_trace_can_be_turned_off(monkeypatch):
+    monkeypatch.setenv("SE_ASSISTANT_TRACE", "0")
+    traced("repo", node)(state("t3"))
+    assert load_trace("t3") == []
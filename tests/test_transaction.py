@@ -0,0 +1,46 @@
+import pytest
+
+from se_assistant.transaction import PatchTransaction, apply_files, pre_image, rollback, snapshot_dir
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    (root / "pkg").mkdir(parents=True)
+    (root / "pkg" / "a.py").write_text("a = 1\n")
+    (root / "pkg" / "b.py").write_text("b = 1\n")
+    return root
+
+
+def test_snapshot_keeps_the_pre_image(repo):
+    snap = snapshot_dir("tx", "p1")
+    apply_files(str(repo), snap, {"pkg/a.py": "a = 2\n", "pkg/new.py": "n = 1\n"})
+    assert (repo / "pkg" / "a.py").read_text() == "a = 2\n"
+    assert open(pre_image(snap, "pkg/a.py")).read() == "a = 1\n"
+    assert pre_image(snap, "pkg/new.py") is None
+
+def test_failed_transaction_restores_the_files_written_so_far(repo):
+    with pytest.raises(RuntimeError):
+        with PatchTransaction(str(repo), snapshot_dir("tx", "p1")) as tx:
+            tx.write("pkg/a.py", "a = 2\n")
+            tx.write("pkg/new.py", "n = 1\n")
+            raise RuntimeError("disk full")
+    assert (repo / "pkg" / "a.py").read_text() == "a = 1\n"
+    assert not (repo / "pkg" / "new.py").exists()
+
+def test_rollback_undoes_patches_newest_first(repo):
+    first, second = snapshot_dir("tx", "p1"), snapshot_dir("tx", "p2")
+    apply_files(str(repo), first, {"pkg/a.py": "a = 2\n"})
+    apply_files(str(repo), second, {"pkg/a.py": "a = 3\n", "pkg/b.py": "b = 3\n", "pkg/new.py": "n = 1\n"})
+
+    assert rollback(str(repo), [first, second]) == ["pkg/a.py", "pkg/b.py", "pkg/new.py"]
+    assert (repo / "pkg" / "a.py").read_text() == "a = 1\n"
+    assert (repo / "pkg" / "b.py").read_text() == "b = 1\n"
+    assert not (repo / "pkg" / "new.py").exists()
+
+def test_rollback_to_an_intermediate_patch(repo):
+    first, second = snapshot_dir("tx", "p1"), snapshot_dir("tx", "p2")
+    apply_files(str(repo), first, {"pkg/a.py": "a = 2\n"})
+    apply_files(str(repo), second, {"pkg/a.py": "a = 3\n"})
+    rollback(str(repo), [second])
+    assert (repo / "pkg" / "a.py").read_text() == "a = 2\n"
@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from se_assistant.warm_runner import run_warm, shutdown_workers
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    (root / "tests").mkdir(parents=True)
+    (root / "tests" / "test_ok.py").write_text("def test_ok():\n    assert True\n")
+    (root / "tests" / "test_red.py").write_text("def test_red():\n    assert False\n")
+    yield root
+    shutdown_workers()
+
+def running(pid):
+    # killed children are orphans; whether anyone reaps them depends on the host's init
+    try:
+        with open(f"/proc/{pid}/stat") as fp:
+            return fp.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+def warm(repo, *args, timeout_sec=30):
+    return run_warm(sys.executable, str(repo), list(args), [], timeout_sec=timeout_sec)
+
+
+def test_second_run_reuses_the_interpreter(repo):
+    first = warm(repo, "tests/test_ok.py")
+    second = warm(repo, "tests/test_red.py")
+    assert (first["status"], first["warm"]) == ("success", False)
+    assert (second["status"], second["exit_code"], second["warm"]) == ("fail", 1, True)
+
+def test_concurrent_requests_each_get_their_own_answer(repo):
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        results = list(ex.map(lambda f: warm(repo, f), ["tests/test_ok.py", "tests/test_red.py"] * 4))
+    assert [r["exit_code"] for r in results] == [0, 1] * 4
+
+def test_crash_is_an_error_with_its_exit_code(repo):
+    (repo / "tests" / "test_crash.py").write_text("import os\n\ndef test_crash():\n    os._exit(3)\n")
+    res = warm(repo, "tests/test_crash.py")
+    assert (res["status"], res["exit_code"]) == ("error", 3)
+    assert warm(repo, "tests/test_ok.py")["status"] == "success"  # a fresh worker takes over
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="reads /proc")
+def test_timeout_kills_what_the_tests_started(repo, tmp_path):
+    pid_file = tmp_path / "child.pid"
+    (repo / "tests" / "test_hang.py").write_text(
+        "import subprocess, time\n\n"
+        "def test_hang():\n"
+        f"    p = subprocess.Popen(['sleep', '60'])\n"
+        f"    open({str(pid_file)!r}, 'w').write(str(p.pid))\n"
+        "    time.sleep(60)\n"
+    )
+    res = warm(repo, "tests/test_hang.py", timeout_sec=3)
+    assert (res["status"], res["exit_code"]) == ("timeout", None)
+    time.sleep(0.2)
+    assert not running(int(pid_file.read_text()))
@@ -0,0 +1,38 @@
+import os
+
+from se_assistant import workspace
+from se_assistant.workspace import apply_files, clone_tree, remove_tree
+
+
+def make_repo(tmp_path):
+    repo = tmp_path / "repo"
+    (repo / "tests").mkdir(parents=True)
+    (repo / ".git").mkdir()
+    (repo / "mod.py").write_text("x = 1\n")
+    (repo / "tests" / "data.txt").write_text("a\n")
+    (repo / ".git" / "HEAD").write_text("ref\n")
+    return repo
+
+def test_in_place_writes_in_a_clone_do_not_reach_the_repo(tmp_path):
+    repo = make_repo(tmp_path)
+    ws = clone_tree(str(repo), str(tmp_path / "ws"))
+    with open(os.path.join(ws, "tests", "data.txt"), "a") as f:
+        f.write("b\n")
+    with open(os.path.join(ws, "mod.py"), "r+") as f:
+        f.write("y")
+    assert (repo / "tests" / "data.txt").read_text() == "a\n"
+    assert (repo / "mod.py").read_text() == "x = 1\n"
+    assert not os.path.exists(os.path.join(ws, ".git"))
+
+def test_large_data_files_are_hardlinked(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace, "LINK_MIN_BYTES", 4)
+    repo = make_repo(tmp_path)
+    (repo / "big.bin").write_bytes(b"0123456789")
+    ws = clone_tree(str(repo), str(tmp_path / "ws"))
+    assert os.path.samefile(os.path.join(ws, "big.bin"), repo / "big.bin")
+    assert not os.path.samefile(os.path.join(ws, "mod.py"), repo / "mod.py")  # .py is always copied
+
+    apply_files(ws, {"big.bin": "new\n"})  # replaced by rename, never through the shared inode
+    assert (repo / "big.bin").read_bytes() == b"0123456789"
+    remove_tree(ws)
+    assert not os.path.exists(ws)